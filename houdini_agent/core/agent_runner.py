@@ -8,7 +8,6 @@ Agent Runner — Agent 循环辅助：标题生成、确认模式、工具调度
 - 工具分类常量（Ask 模式白名单、后台安全工具、静默工具）
 """
 
-import threading
 import queue
 from houdini_agent.qt_compat import QtWidgets, QtCore
 from ..ui.i18n import tr, get_language
@@ -175,7 +174,7 @@ class AgentRunnerMixin:
         
         sdata['_ai_title_generated'] = True  # 标记防止重复
         
-        # 后台线程异步生成标题
+        # 后台异步生成标题（常驻线程池后台车道，可与 web 工具调用重叠）
         def _gen():
             try:
                 title = self._generate_short_title(first_user, first_assistant)
@@ -184,8 +183,7 @@ class AgentRunnerMixin:
             except Exception:
                 pass
         
-        t = threading.Thread(target=_gen, daemon=True)
-        t.start()
+        self.client.submit_background(_gen)
 
     def _generate_short_title(self, user_msg: str, assistant_msg: str) -> str:
         """调用 LLM 生成 ≤10 字的对话标题"""
@@ -223,6 +223,10 @@ class SessionManagerMixin:
         if self._agent_session_id != self._session_id:
             self._save_current_session_state()
         
+        # 后台预摘要只对原会话有效（agent 仍在运行时保留，供其继续使用）
+        if self._agent_session_id is None:
+            self.client.clear_precompact()
+        
         # 加载目标会话
         self._load_session_state(new_session_id)
         
@@ -34,7 +34,7 @@ SKILL_INFO = {
         },
         "max_sample": {
             "type": "integer",
-            "description": "最大采样数（默认 200000，超过时随机采样）",
+            "description": "最大检查数（默认 200000；用于翻转面检测，以及无 numpy 时的法线逐点检查）",
             "required": False,
         },
     },
@@ -68,7 +68,7 @@ def run(node_path, tolerance=0.001, flip_angle_threshold=120.0, max_sample=20000
         node_path: 节点路径
         tolerance: 归一化容差
         flip_angle_threshold: 翻转检测角度阈值（度）
-        max_sample: 最大采样数
+        max_sample: 最大检查数（翻转面检测 / 无 numpy 时的逐点检查）
     """
     import hou  # type: ignore
     import math
@@ -107,115 +107,65 @@ def run(node_path, tolerance=0.001, flip_angle_threshold=120.0, max_sample=20000
             "summary": summary,
         }
 
-    # ---- 获取法线数据 ----
-    try:
-        raw_vals = geo.pointFloatAttribValues("N")
-    except Exception as e:
-        return {"error": f"读取法线数据失败: {e}"}
-
     n_size = n_attrib.size()
     if n_size != 3:
         return {"error": f"法线属性维度异常: 期望 3，实际 {n_size}"}
 
-    total_points = len(raw_vals) // 3
-
-    # 使用 numpy 加速（如果可用）
-    try:
-        import numpy as np
-        use_numpy = True
-    except ImportError:
-        use_numpy = False
-
-    if use_numpy:
-        normals = np.array(raw_vals, dtype=np.float64).reshape((-1, 3))
-
-        # 采样
-        sampled = False
-        max_sample = min(int(max_sample), 500000)
-        if total_points > max_sample:
-            idx = np.random.choice(total_points, max_sample, replace=False)
-            normals_sample = normals[idx]
-            sampled = True
-        else:
-            normals_sample = normals
-
-        # ---- 2. NaN 检测 ----
-        nan_mask = np.isnan(normals_sample).any(axis=1)
-        nan_count = int(nan_mask.sum())
-        if nan_count > 0:
-            issues.append({
-                "type": "NAN_NORMAL",
-                "severity": _SEVERITY["NAN_NORMAL"],
-                "description": _DESCRIPTIONS["NAN_NORMAL"],
-                "count": nan_count,
-                "detail": f"{nan_count} 个点的法线包含 NaN 值",
-            })
+    from houdini_agent.utils.mcp.geo_reader import GeoReader
 
-        # ---- 3. Inf 检测 ----
-        inf_mask = np.isinf(normals_sample).any(axis=1)
-        inf_count = int(inf_mask.sum())
-        if inf_count > 0:
-            issues.append({
-                "type": "INF_NORMAL",
-                "severity": _SEVERITY["INF_NORMAL"],
-                "description": _DESCRIPTIONS["INF_NORMAL"],
-                "count": inf_count,
-                "detail": f"{inf_count} 个点的法线包含 Inf 值",
-            })
+    nan_count = 0
+    inf_count = 0
+    zero_count = 0
+    not_norm_count = 0
+    dev_min, dev_max, dev_sum = math.inf, -math.inf, 0.0
 
-        # 过滤掉 NaN 和 Inf 后再做后续检查
-        valid_mask = ~(nan_mask | inf_mask)
-        valid_normals = normals_sample[valid_mask]
+    if GeoReader.available:
+        # ---- numpy 路径：批量读取 + 分块向量化，全量统计（不采样）----
+        import numpy as np
 
-        if len(valid_normals) > 0:
-            # 计算长度
-            lengths = np.linalg.norm(valid_normals, axis=1)
+        reader = GeoReader(geo)
+        try:
+            normals = reader.read_array("point", "N")
+        except Exception as e:
+            return {"error": f"读取法线数据失败: {e}"}
+        total_points = int(normals.shape[0])
+
+        for chunk in reader.iter_chunks(normals):
+            # ---- 2/3. NaN / Inf 检测 ----
+            nan_mask = np.isnan(chunk).any(axis=1)
+            inf_mask = np.isinf(chunk).any(axis=1)
+            nan_count += int(nan_mask.sum())
+            inf_count += int(inf_mask.sum())
+
+            # 过滤掉 NaN 和 Inf 后再做后续检查
+            valid = chunk[~(nan_mask | inf_mask)].astype(np.float64)
+            if not len(valid):
+                continue
+            lengths = np.sqrt(np.einsum('ij,ij->i', valid, valid))
 
             # ---- 4. 零向量检测 ----
             zero_mask = lengths < 1e-10
-            zero_count = int(zero_mask.sum())
-            if zero_count > 0:
-                issues.append({
-                    "type": "ZERO_NORMAL",
-                    "severity": _SEVERITY["ZERO_NORMAL"],
-                    "description": _DESCRIPTIONS["ZERO_NORMAL"],
-                    "count": zero_count,
-                    "detail": f"{zero_count} 个零向量",
-                })
+            zero_count += int(zero_mask.sum())
 
             # ---- 5. 归一化检测 ----
-            non_zero_lengths = lengths[~zero_mask]
-            if len(non_zero_lengths) > 0:
-                not_normalized = np.abs(non_zero_lengths - 1.0) > tolerance
-                not_norm_count = int(not_normalized.sum())
-                if not_norm_count > 0:
-                    # 统计偏差
-                    deviations = non_zero_lengths[not_normalized]
-                    issues.append({
-                        "type": "NON_NORMALIZED",
-                        "severity": _SEVERITY["NON_NORMALIZED"],
-                        "description": _DESCRIPTIONS["NON_NORMALIZED"],
-                        "count": not_norm_count,
-                        "detail": f"{not_norm_count} 个长度≠{1.0}",
-                        "length_range": [float(deviations.min()), float(deviations.max())],
-                        "length_mean": float(deviations.mean()),
-                    })
-
-        stats = {
-            "nan_count": nan_count,
-            "inf_count": inf_count,
-            "zero_count": zero_count if len(valid_normals) > 0 else 0,
-            "sampled": sampled,
-            "sample_size": len(normals_sample),
-        }
+            non_zero = lengths[~zero_mask]
+            deviations = non_zero[np.abs(non_zero - 1.0) > tolerance]
+            if deviations.size:
+                not_norm_count += int(deviations.size)
+                dev_min = min(dev_min, float(deviations.min()))
+                dev_max = max(dev_max, float(deviations.max()))
+                dev_sum += float(deviations.sum())
+
+        sampled = False
+        sample_size = total_points
 
     else:
         # ---- 纯 Python 路径 (无 numpy) ----
-        nan_count = 0
-        inf_count = 0
-        zero_count = 0
-        not_norm_count = 0
-        lengths_not_norm = []
+        try:
+            raw_vals = geo.pointFloatAttribValues("N")
+        except Exception as e:
+            return {"error": f"读取法线数据失败: {e}"}
+        total_points = len(raw_vals) // 3
 
         for i in range(total_points):
             if i >= max_sample:
@@ -239,50 +189,55 @@ def run(node_path, tolerance=0.001, flip_angle_threshold=120.0, max_sample=20000
                 zero_count += 1
             elif abs(length - 1.0) > tolerance:
                 not_norm_count += 1
-                lengths_not_norm.append(length)
+                dev_min = min(dev_min, length)
+                dev_max = max(dev_max, length)
+                dev_sum += length
 
-        if nan_count > 0:
-            issues.append({
-                "type": "NAN_NORMAL",
-                "severity": _SEVERITY["NAN_NORMAL"],
-                "description": _DESCRIPTIONS["NAN_NORMAL"],
-                "count": nan_count,
-                "detail": f"{nan_count} 个点的法线包含 NaN 值",
-            })
-        if inf_count > 0:
-            issues.append({
-                "type": "INF_NORMAL",
-                "severity": _SEVERITY["INF_NORMAL"],
-                "description": _DESCRIPTIONS["INF_NORMAL"],
-                "count": inf_count,
-                "detail": f"{inf_count} 个点的法线包含 Inf 值",
-            })
-        if zero_count > 0:
-            issues.append({
-                "type": "ZERO_NORMAL",
-                "severity": _SEVERITY["ZERO_NORMAL"],
-                "description": _DESCRIPTIONS["ZERO_NORMAL"],
-                "count": zero_count,
-                "detail": f"{zero_count} 个零向量",
-            })
-        if not_norm_count > 0:
-            issues.append({
-                "type": "NON_NORMALIZED",
-                "severity": _SEVERITY["NON_NORMALIZED"],
-                "description": _DESCRIPTIONS["NON_NORMALIZED"],
-                "count": not_norm_count,
-                "detail": f"{not_norm_count} 个长度≠{1.0}",
-                "length_range": [min(lengths_not_norm), max(lengths_not_norm)] if lengths_not_norm else [],
-                "length_mean": sum(lengths_not_norm) / len(lengths_not_norm) if lengths_not_norm else 0,
-            })
+        sampled = total_points > max_sample
+        sample_size = min(total_points, max_sample)
 
-        stats = {
-            "nan_count": nan_count,
-            "inf_count": inf_count,
-            "zero_count": zero_count,
-            "sampled": total_points > max_sample,
-            "sample_size": min(total_points, max_sample),
-        }
+    if nan_count > 0:
+        issues.append({
+            "type": "NAN_NORMAL",
+            "severity": _SEVERITY["NAN_NORMAL"],
+            "description": _DESCRIPTIONS["NAN_NORMAL"],
+            "count": nan_count,
+            "detail": f"{nan_count} 个点的法线包含 NaN 值",
+        })
+    if inf_count > 0:
+        issues.append({
+            "type": "INF_NORMAL",
+            "severity": _SEVERITY["INF_NORMAL"],
+            "description": _DESCRIPTIONS["INF_NORMAL"],
+            "count": inf_count,
+            "detail": f"{inf_count} 个点的法线包含 Inf 值",
+        })
+    if zero_count > 0:
+        issues.append({
+            "type": "ZERO_NORMAL",
+            "severity": _SEVERITY["ZERO_NORMAL"],
+            "description": _DESCRIPTIONS["ZERO_NORMAL"],
+            "count": zero_count,
+            "detail": f"{zero_count} 个零向量",
+        })
+    if not_norm_count > 0:
+        issues.append({
+            "type": "NON_NORMALIZED",
+            "severity": _SEVERITY["NON_NORMALIZED"],
+            "description": _DESCRIPTIONS["NON_NORMALIZED"],
+            "count": not_norm_count,
+            "detail": f"{not_norm_count} 个长度≠{1.0}",
+            "length_range": [dev_min, dev_max],
+            "length_mean": dev_sum / not_norm_count,
+        })
+
+    stats = {
+        "nan_count": nan_count,
+        "inf_count": inf_count,
+        "zero_count": zero_count,
+        "sampled": sampled,
+        "sample_size": sample_size,
+    }
 
     # ---- 6. 翻转面检测 ----
     if prim_count > 0:
@@ -3,6 +3,7 @@
 
 分析 Houdini 节点几何体的属性统计信息，支持 point/vertex/prim/detail 四种属性类别。
 不指定属性名时返回属性列表，指定时返回统计信息（min/max/mean/std/nan/inf）。
+数值属性通过 GeoReader 批量读取并分块统计全部元素（不再随机采样）。
 """
 
 SKILL_INFO = {
@@ -29,24 +30,30 @@ SKILL_INFO = {
         },
         "max_sample": {
             "type": "integer",
-            "description": "最大采样数（默认 100000，超过时随机采样）",
+            "description": "（已弃用，统计改为分块全量计算，此参数被忽略）",
+            "required": False,
+        },
+        "bins": {
+            "type": "integer",
+            "description": "直方图区间数（默认 0 不输出；多分量属性统计向量长度）",
             "required": False,
         },
     },
 }
 
 
-def run(node_path, attrib_name=None, attrib_class="point", max_sample=100000):
+def run(node_path, attrib_name=None, attrib_class="point", max_sample=100000, bins=0):
     """入口函数
 
     Args:
         node_path: 节点路径
         attrib_name: 属性名（None 则返回属性列表）
         attrib_class: 属性类别 - point/vertex/prim/detail
-        max_sample: 最大采样数
+        max_sample: 已弃用（保留参数以兼容旧调用）
+        bins: 直方图区间数（0 = 不输出）
     """
     import hou  # type: ignore
-    import numpy as np
+    from houdini_agent.utils.mcp.geo_reader import GeoReader
 
     node = hou.node(node_path)
     if not node:
@@ -60,30 +67,22 @@ def run(node_path, attrib_name=None, attrib_class="point", max_sample=100000):
     attrib_map = {
         "point": (
             geo.findPointAttrib,
-            geo.pointFloatAttribValues,
-            geo.pointIntAttribValues,
             geo.pointStringAttribValues,
             geo.intrinsicValue("pointcount"),
         ),
         "vertex": (
             geo.findVertexAttrib,
-            geo.vertexFloatAttribValues,
-            geo.vertexIntAttribValues,
             geo.vertexStringAttribValues,
             geo.intrinsicValue("vertexcount"),
         ),
         "prim": (
             geo.findPrimAttrib,
-            geo.primFloatAttribValues,
-            geo.primIntAttribValues,
             geo.primStringAttribValues,
             geo.intrinsicValue("primitivecount"),
         ),
         "detail": (
             geo.findGlobalAttrib,
             None,
-            None,
-            None,
             1,
         ),
     }
@@ -91,7 +90,7 @@ def run(node_path, attrib_name=None, attrib_class="point", max_sample=100000):
     if attrib_class not in attrib_map:
         return {"error": f"无效的属性类别: {attrib_class}，可选: point, vertex, prim, detail"}
 
-    find_func, float_func, int_func, str_func, elem_count = attrib_map[attrib_class]
+    find_func, str_func, elem_count = attrib_map[attrib_class]
 
     # 如果没有指定属性名，返回属性列表
     if attrib_name is None:
@@ -152,53 +151,40 @@ def run(node_path, attrib_name=None, attrib_class="point", max_sample=100000):
             "value": val,
         }
 
-    # 获取属性值
-    if data_type == "Float":
-        vals = np.array(float_func(attrib_name))
-    elif data_type == "Int":
-        vals = np.array(int_func(attrib_name))
-    else:  # String
-        vals = str_func(attrib_name)
-        unique = list(set(vals))
-        return {
+    # 数值属性：批量读取 + 分块统计
+    if data_type in ("Float", "Int"):
+        reader = GeoReader(geo)
+        stats = reader.attrib_stats(attrib_class, attrib_name)
+        result = {
             "node_path": node_path,
             "name": attrib_name,
-            "type": "String",
-            "count": len(vals),
-            "unique_count": len(unique),
-            "unique_values": unique[:20],
+            "type": data_type,
+            "size": size,
+            "count": stats["count"],
+            "sampled": False,
+            "min": stats["min"],
+            "max": stats["max"],
+            "mean": stats["mean"],
+            "std": stats["std"],
         }
-
-    # 重塑多维属性
-    if size > 1:
-        vals = vals.reshape((-1, size))
-
-    # 采样（大数据量时）
-    max_sample = min(int(max_sample), 500000)
-    n = len(vals) if vals.ndim == 1 else vals.shape[0]
-    sampled = False
-    if n > max_sample:
-        idx = np.random.choice(n, max_sample, replace=False)
-        vals = vals[idx] if vals.ndim == 1 else vals[idx, :]
-        sampled = True
-
-    # 返回统计信息
-    result = {
+        # NaN/Inf 检测（仅 float）
+        if data_type == "Float":
+            result["nan_count"] = stats["nan_count"]
+            result["inf_count"] = stats["inf_count"]
+        if bins and int(bins) > 0:
+            hist = reader.histogram(attrib_class, attrib_name, bins=int(bins))
+            if hist:
+                result["histogram"] = hist
+        return result
+
+    # 字符串属性
+    vals = str_func(attrib_name)
+    unique = list(set(vals))
+    return {
         "node_path": node_path,
         "name": attrib_name,
-        "type": data_type,
-        "size": size,
-        "count": int(n),
-        "sampled": sampled,
-        "min": vals.min(axis=0).tolist() if size > 1 else float(vals.min()),
-        "max": vals.max(axis=0).tolist() if size > 1 else float(vals.max()),
-        "mean": vals.mean(axis=0).tolist() if size > 1 else float(vals.mean()),
-        "std": vals.std(axis=0).tolist() if size > 1 else float(vals.std()),
+        "type": "String",
+        "count": len(vals),
+        "unique_count": len(unique),
+        "unique_values": unique[:20],
     }
-
-    # NaN/Inf 检测（仅 float）
-    if data_type == "Float":
-        result["nan_count"] = int(np.isnan(vals).sum())
-        result["inf_count"] = int(np.isinf(vals).sum())
-
-    return result
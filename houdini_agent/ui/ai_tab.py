@@ -28,6 +28,10 @@ from .i18n import tr, get_language
 from ..utils.ai_client import AIClient, HOUDINI_TOOLS
 from ..utils.mcp import HoudiniMCP
 from ..utils.token_optimizer import TokenOptimizer, TokenBudget, CompressionStrategy
+from ..utils.conversation_index import ConversationIndex
+from ..utils.tool_router import get_tool_router
+from ..utils.tracer import get_tracer, now as _trace_now
+from ..utils.mcp.scene_mirror import get_scene_mirror
 from ..utils.ultra_optimizer import UltraOptimizer
 from .theme_engine import ThemeEngine
 from .font_settings_dialog import FontSettingsDialog
@@ -95,6 +99,7 @@ class AITab(
     _addNodeOperation = QtCore.Signal(str, object)  # (name, result_dict) ★ 直接传 dict，避免 JSON 序列化/反序列化开销
     _addPythonShell = QtCore.Signal(str, str)  # (code, result_json)
     _addSystemShell = QtCore.Signal(str, str)  # (command, result_json)
+    _shellStream = QtCore.Signal(str, str, str, object)  # 增量输出: (kind, source, event, payload)
     _executeToolRequest = QtCore.Signal(str, dict)  # 工具执行请求信号（线程安全）
     _executeToolBatchRequest = QtCore.Signal(list)   # 批量工具执行请求：[(tool_name, kwargs), ...]
     _addThinking = QtCore.Signal(str)  # 思考内容更新信号（线程安全）
@@ -109,7 +114,7 @@ class AITab(
     _toolArgsDelta = QtCore.Signal(str, str, str)   # 流式 VEX 预览: (tool_name, delta, accumulated)
     _showPlanning = QtCore.Signal(str)              # 显示 "Planning..." 进度 (progress_text)
     _createStreamingPlan = QtCore.Signal()           # 创建流式 Plan 预览卡片
-    _updateStreamingPlan = QtCore.Signal(str)        # 更新流式 Plan 预览卡片内容 (accumulated_json)
+    _updateStreamingPlan = QtCore.Signal(list)       # 更新流式 Plan 预览卡片内容 (增量解析事件)
     _renderPlanViewer = QtCore.Signal(dict)          # Plan 模式：在主线程渲染 PlanViewer 卡片
     _updatePlanStep = QtCore.Signal(str, str, str)   # Plan 模式：更新步骤状态 (step_id, status, result_summary)
     _askQuestionRequest = QtCore.Signal()             # Plan 模式：ask_question 请求（参数通过属性传递）
@@ -120,6 +125,7 @@ class AITab(
         self.client = AIClient()
         self.mcp = HoudiniMCP()
         self.mcp.set_stop_event(self.client._stop_event)  # 共享停止事件，使 shell/python 命令可被中断
+        self.mcp.set_output_stream_callback(self._shellStream.emit)  # shell/python 输出实时推送到 UI
         self.client.set_tool_executor(self._execute_tool_with_todo)
         self.client.set_batch_tool_executor(self._execute_tools_batch_in_main_thread)
         
@@ -138,6 +144,8 @@ class AITab(
         self._agent_token_stats: Optional[Dict] = None
         self._agent_todo_list = None       # 运行中 session 的 TodoList
         self._agent_chat_layout = None     # 运行中 session 的 chat_layout
+        # 运行中的 Shell 控件：(kind, 命令/代码) → widget，结束时由 _on_add_*_shell 收尾
+        self._live_shells: Dict[tuple, QtWidgets.QWidget] = {}
         
         # 上下文管理
         self._max_context_messages = 20
@@ -158,8 +166,6 @@ class AITab(
         
         # 静态内容缓存（只计算一次，节省 token 和计算时间）
         self._cached_optimized_system_prompt: Optional[str] = None
-        self._cached_optimized_tools: Optional[List[dict]] = None
-        self._cached_optimized_tools_no_web: Optional[List[dict]] = None
         
         # Token 优化器
         self.token_optimizer = TokenOptimizer()
@@ -170,6 +176,7 @@ class AITab(
         self._plan_phase = 'idle'          # idle | planning | awaiting_confirmation | executing | completed
         self._active_plan_viewer = None    # 当前活跃的 PlanViewer 组件引用
         self._streaming_plan_card = None   # 流式 Plan 预览卡片（生成中临时使用）
+        self._streaming_plan_events = []   # 待应用到流式卡片的增量解析事件（节流批量处理）
         self._plan_manager = None          # PlanManager 实例（延迟初始化）
         
         # ★ 大脑启发式长期记忆系统（延迟初始化，避免阻塞 UI）
@@ -232,6 +239,7 @@ class AITab(
         self._addNodeOperation.connect(self._on_add_node_operation)
         self._addPythonShell.connect(self._on_add_python_shell)
         self._addSystemShell.connect(self._on_add_system_shell)
+        self._shellStream.connect(self._on_shell_stream)
         self._executeToolRequest.connect(self._on_execute_tool_main_thread, QtCore.Qt.BlockingQueuedConnection)
         self._executeToolBatchRequest.connect(self._on_execute_tool_batch_main_thread, QtCore.Qt.BlockingQueuedConnection)
         self._addThinking.connect(self._on_add_thinking)
@@ -253,7 +261,7 @@ class AITab(
         # ── 流式 VEX 预览状态 ──
         self._streaming_preview = None          # 当前的 StreamingCodePreview widget
         self._streaming_preview_tool = ""       # 正在流式预览的工具名
-        self._streaming_last_code = ""          # 上次解析出的完整代码（用于增量 diff）
+        self._args_stream = None                # 当前 tool_call 参数的增量解析状态（见 _feed_tool_args）
         
         # 构建并缓存系统提示词（两个版本：有思考 / 无思考）
         self._system_prompt_think = self._build_system_prompt(with_thinking=True)
@@ -294,6 +302,9 @@ class AITab(
         # ★ 插件系统初始化（延迟 3 秒，不阻塞 UI）
         QtCore.QTimer.singleShot(3000, self._init_plugin_system)
         
+        # ★ 场景事件监听（主线程挂载 hou 回调，驱动只读工具结果缓存失效）
+        QtCore.QTimer.singleShot(0, self._install_scene_monitor)
+        
         # ★ 语言切换时重建系统提示词 + 重新翻译 UI
         from .i18n import language_changed
         language_changed.changed.connect(self._rebuild_system_prompts)
@@ -348,6 +359,30 @@ class AITab(
     # ★ 插件系统 (Hook / Plugin System)
     # ==========================================================
 
+    def _install_scene_monitor(self):
+        """挂载 hou 场景事件回调（失败时缓存退化为按用户轮次失效）"""
+        try:
+            from ..utils.mcp.scene_events import get_scene_monitor
+            get_scene_monitor().install()
+        except Exception as e:
+            print(f"[SceneEvents] 初始化失败: {e}")
+
+    def _prepare_scene_mirror(self):
+        """★ 轮次开始（主线程）：关注用户当前所在网络，构建场景镜像或抽样校验其一致性"""
+        try:
+            from ..utils.mcp.scene_events import get_scene_monitor
+            monitor = get_scene_monitor()
+            monitor.check_unobserved_edits()   # 未关注网络中的手动修改 → 只读缓存作废
+            monitor.focus_editor_networks()
+            mirror = get_scene_mirror()
+            with get_tracer().span('scene_mirror.prepare', cat='context'):
+                if mirror.stats()['built']:
+                    mirror.verify(sample=mirror.VERIFY_SAMPLE)
+                else:
+                    mirror.ensure_built()
+        except Exception as e:
+            print(f"[SceneMirror] 准备失败（只读工具照常走主线程）: {e}")
+
     def _init_plugin_system(self):
         """初始化插件系统：加载插件、设置 UI Bridge、挂载按钮"""
         try:
@@ -1184,7 +1219,9 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
         """显示详细 Token 统计对话框（对齐 Cursor：使用 TokenAnalyticsPanel）"""
         from houdini_agent.ui.cursor_widgets import TokenAnalyticsPanel
         records = getattr(self, '_call_records', []) or []
-        dialog = TokenAnalyticsPanel(records, self._token_stats, parent=self)
+        dialog = TokenAnalyticsPanel(records, self._token_stats, parent=self,
+                                     tool_cache_stats=self.client.get_tool_cache_stats(),
+                                     runtime_stats=self.client.get_runtime_stats())
         dialog.exec_()
         if dialog.should_reset_stats:
             self._reset_token_stats()
@@ -1202,6 +1239,7 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
             'estimated_cost': 0.0,
         }
         self._call_records = []
+        self.client.reset_tool_cache_stats()
         self._update_token_stats_display()
         
         # 显示提示
@@ -1264,6 +1302,7 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
         if running:
             # 锚定 agent 输出目标到当前 session
             self._agent_session_id = self._session_id
+            self.mcp.set_session(self._session_id)
             self._agent_response = self._current_response
             self._agent_scroll_area = self.scroll_area
             self._agent_history = self._conversation_history
@@ -2036,6 +2075,14 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
         except RuntimeError:
             pass  # widget 已被 clear 销毁
         
+        # 仍处于运行中的 Shell 控件（工具结果不会再回来）标记为中断
+        for widget in self._live_shells.values():
+            try:
+                widget.finish(False, error="已中断")
+            except RuntimeError:
+                pass
+        self._live_shells.clear()
+        
         # ★ 确保历史以 assistant 结尾（防止连续 user 消息破坏结构）
         self._ensure_history_ends_with_assistant("[Stopped by user]")
         
@@ -2176,6 +2223,11 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
             if tool_name in self._BG_SAFE_TOOLS:
                 return self._execute_tool_in_bg(tool_name, kwargs)
             
+            # ★ 场景镜像：只读结构查询直接在当前线程应答（无主线程往返）
+            mirrored = self.mcp.execute_mirrored_tool(tool_name, kwargs)
+            if mirrored is not None:
+                return mirrored
+            
             # 其他工具需要在主线程执行（Houdini hou 模块操作）
             return self._execute_tool_in_main_thread(tool_name, kwargs)
         finally:
@@ -2226,6 +2278,7 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
             
             # 发送信号到主线程执行
             # BlockingQueuedConnection 会阻塞直到槽函数执行完成
+            _t_wait = _trace_now()
             self._executeToolRequest.emit(tool_name, kwargs)
             
             # 从队列获取结果（有超时保护）
@@ -2233,9 +2286,11 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
             #   可能需要较长时间。超时后标记主线程忙，防止后续信号堆积。
             try:
                 result = self._tool_result_queue.get(timeout=self._TOOL_MAIN_THREAD_TIMEOUT)
+                get_tracer().record('main_thread.wait', _t_wait, cat='tool', tool=tool_name)
                 # 主线程正常返回 → 清除忙标记
                 self._main_thread_busy = False
-                return result
+                # ★ 主线程只做了必须的 hou 操作，后台部分（如截图编码）在本线程取回
+                return self.mcp.resolve_deferred_result(result)
             except queue.Empty:
                 # ★ 超时：主线程可能仍在执行 cook，标记为忙
                 self._main_thread_busy = True
@@ -2257,6 +2312,20 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
         Returns:
             [result_dict, ...]（与 batch 顺序一致）
         """
+        # ★ 场景镜像能应答的调用不进主线程
+        results = [self.mcp.execute_mirrored_tool(tn, kw) for tn, kw in batch]
+        pending = [i for i, r in enumerate(results) if r is None]
+        if not pending:
+            return results
+        if len(pending) < len(batch):
+            for i, r in zip(pending, self._execute_tools_batch_in_main_thread_raw(
+                    [batch[i] for i in pending])):
+                results[i] = r
+            return results
+        return self._execute_tools_batch_in_main_thread_raw(batch)
+
+    def _execute_tools_batch_in_main_thread_raw(self, batch: list) -> list:
+        """批量发送到主线程执行（不经过场景镜像）"""
         with self._tool_lock:
             while not self._tool_result_queue.empty():
                 try:
@@ -2264,11 +2333,15 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
                 except queue.Empty:
                     break
 
+            _t_wait = _trace_now()
             self._executeToolBatchRequest.emit(batch)
 
             try:
                 results = self._tool_result_queue.get(timeout=60.0)
-                return results if isinstance(results, list) else [results]
+                get_tracer().record('main_thread.wait', _t_wait, cat='tool',
+                                    tool='batch', size=len(batch))
+                results = results if isinstance(results, list) else [results]
+                return [self.mcp.resolve_deferred_result(r) for r in results]
             except queue.Empty:
                 return [{"success": False, "error": tr('ai.main_exec_timeout')}] * len(batch)
 
@@ -2282,6 +2355,7 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
         needs_cook = any(tn in self._COOK_BEFORE_READ_TOOLS for tn, _ in batch)
         if needs_cook:
             self._cook_displayed_nodes_if_manual()
+            get_scene_mirror().clear_cook_pending()
         
         results = []
         for tool_name, kwargs in batch:
@@ -2433,24 +2507,28 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
         except Exception:
             pass
 
-    @QtCore.Slot(dict)
-    def _show_plan_generation_progress(self, accumulated: str):
-        """从 create_plan 的流式参数中提取进度信息并显示 Planning... 状态"""
-        import re as _re
-        # 统计已出现的 step id
-        step_ids = _re.findall(r'"id"\s*:\s*"(step-\d+)"', accumulated)
-        # 尝试提取 title
-        title_match = _re.search(r'"title"\s*:\s*"([^"]{1,30})', accumulated)
-        title_part = title_match.group(1) if title_match else ""
-
-        # 检查是否已进入 architecture 部分
-        has_arch = '"architecture"' in accumulated
-        arch_nodes = _re.findall(r'"id"\s*:\s*"(?!step-)([^"]+)"', accumulated)
-
-        if has_arch and arch_nodes:
-            progress = f"architecture ({len(arch_nodes)} nodes)"
-        elif step_ids:
-            progress = f"step {len(step_ids)}"
+    def _show_plan_generation_progress(self, st: dict, events: list):
+        """从 create_plan 参数的增量解析事件中累计进度信息并显示 Planning... 状态"""
+        from ..utils.streaming_json import KEY, CHUNK, VALUE
+        for ev in events:
+            path = ev.path
+            if ev.kind == CHUNK and path == ('title',):
+                # 标题边生成边显示（最多 30 字）
+                if len(st['plan_title']) < 30:
+                    st['plan_title'] = (st['plan_title'] + ev.value)[:30]
+            elif ev.kind == KEY and path == ('architecture',):
+                st['plan_has_arch'] = True
+            elif ev.kind == VALUE and path and path[-1] == 'id' and isinstance(ev.value, str):
+                if ev.value.startswith('step-'):
+                    st['plan_steps'] += 1
+                elif st['plan_has_arch']:
+                    st['plan_arch_nodes'] += 1
+
+        title_part = st['plan_title']
+        if st['plan_has_arch'] and st['plan_arch_nodes']:
+            progress = f"architecture ({st['plan_arch_nodes']} nodes)"
+        elif st['plan_steps']:
+            progress = f"step {st['plan_steps']}"
             if title_part:
                 progress = f"「{title_part}」 {progress}"
         elif title_part:
@@ -2458,7 +2536,9 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
         else:
             progress = ""
 
-        self._showPlanning.emit(progress)
+        if progress != st.get('plan_progress'):
+            st['plan_progress'] = progress
+            self._showPlanning.emit(progress)
 
     @QtCore.Slot()
     def _on_create_streaming_plan(self):
@@ -2471,19 +2551,22 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
 
             card = StreamingPlanCard(parent=self.chat_container)
             self._streaming_plan_card = card
+            self._streaming_plan_events = []
             self.chat_layout.insertWidget(self.chat_layout.count() - 1, card)
             self._scroll_to_bottom(force=True)
         except Exception as e:
             print(f"[Plan] Create streaming card error: {e}")
 
-    @QtCore.Slot(str)
-    def _on_update_streaming_plan(self, accumulated: str):
-        """主线程：将流式 JSON 碎片增量渲染到流式 Plan 卡片
+    @QtCore.Slot(list)
+    def _on_update_streaming_plan(self, events: list):
+        """主线程：将 create_plan 参数的增量解析事件渲染到流式 Plan 卡片
 
-        使用简单的节流策略：缓存最新数据，通过 singleShot 延迟处理，
-        避免每个 token 都触发正则解析和 UI 更新。
+        使用简单的节流策略：累积事件，通过 singleShot 延迟批量应用，
+        避免每个 token 都触发 UI 更新。
         """
-        self._streaming_plan_acc = accumulated
+        if not events:
+            return
+        self._streaming_plan_events.extend(events)
         if not getattr(self, '_streaming_plan_timer_active', False):
             self._streaming_plan_timer_active = True
             QtCore.QTimer.singleShot(150, self._flush_streaming_plan)
@@ -2493,12 +2576,13 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
         self._streaming_plan_timer_active = False
         if self._streaming_plan_card is None:
             return
-        acc = getattr(self, '_streaming_plan_acc', '')
-        if not acc:
+        events = self._streaming_plan_events
+        if not events:
             return
+        self._streaming_plan_events = []
         try:
             old_count = self._streaming_plan_card._rendered_step_count
-            self._streaming_plan_card.update_from_accumulated(acc)
+            self._streaming_plan_card.apply_stream_events(events)
             new_count = self._streaming_plan_card._rendered_step_count
             if new_count > old_count:
                 self._scroll_to_bottom()
@@ -2566,6 +2650,8 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
         agent_params['plan_executing'] = True     # 标记为 Plan 执行阶段
         agent_params['plan_data'] = plan_data
         
+        self._prepare_scene_mirror()
+        
         # 后台线程执行
         thread = threading.Thread(
             target=self._run_agent, args=(agent_params,), daemon=True
@@ -2763,6 +2849,8 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
         # 在 Agent 运行期间保持 Manual 模式，防止 cook 阻塞主线程
         # 模式恢复在 Agent 结束时统一处理（_restore_update_mode）
         if tool_name in self._COOK_TRIGGERING_TOOLS:
+            # 错误状态要等下一次读取前的 cook 才会刷新 → 场景镜像暂停应答
+            get_scene_mirror().mark_cook_pending()
             try:
                 import hou  # type: ignore
                 if hou.updateModeSetting() != hou.updateMode.Manual:
@@ -2775,6 +2863,7 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
         # 确保 AI 能看到修改后的最新结果（而非 stale 数据）
         if tool_name in self._COOK_BEFORE_READ_TOOLS:
             self._cook_displayed_nodes_if_manual()
+            get_scene_mirror().clear_cook_pending()
         
         # ★ 对不自带 checkpoint 追踪的修改工具，做 before/after 快照
         should_snapshot = (
@@ -3129,6 +3218,67 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
         
         return '\n'.join(cleaned).strip()
 
+    def _get_tool_bundle(self, mode: str, use_web: bool, supports_vision: bool):
+        """当前请求模式的工具定义包（ToolRegistry 按版本缓存，返回的列表不得修改）"""
+        from ..utils.tool_registry import get_tool_registry
+        return get_tool_registry().schema_bundle(
+            (mode, bool(use_web), bool(supports_vision)),
+            lambda: self._build_tool_list(mode, use_web, supports_vision),
+        )
+
+    def _build_tool_list(self, mode: str, use_web: bool, supports_vision: bool) -> List[dict]:
+        """构建指定模式下发送给模型的工具定义（仅在注册表版本变化后调用）"""
+        if mode == 'plan_planning':
+            # ★ Plan 规划阶段：只读工具 + create_plan + ask_question
+            base = [t for t in HOUDINI_TOOLS
+                    if t['function']['name'] in self._PLAN_PLANNING_TOOLS]
+            base += [PLAN_TOOL_CREATE, PLAN_TOOL_ASK_QUESTION]
+        elif mode == 'plan_executing':
+            # ★ Plan 执行阶段：完整工具 + update_plan_step
+            base = list(HOUDINI_TOOLS) + [PLAN_TOOL_UPDATE_STEP]
+        elif mode == 'ask':
+            # ★ Ask 模式：只保留只读/查询工具
+            base = [t for t in HOUDINI_TOOLS
+                    if t['function']['name'] in self._ASK_MODE_TOOLS]
+        else:
+            # ★ Agent 模式：全量工具（子集选择由 SemanticToolRouter 在 agent loop 中完成）
+            base = list(HOUDINI_TOOLS)
+        if not use_web:
+            base = [t for t in base
+                    if t['function']['name'] not in ('web_search', 'fetch_webpage')]
+        tools = UltraOptimizer.optimize_tool_definitions(base)
+
+        # ★ 合并外部工具（HookManager 插件工具 + ToolRegistry Skill 工具）
+        try:
+            from ..utils.hooks import get_hook_manager as _ghm_tools
+            tools += _ghm_tools().get_external_tools()
+        except Exception:
+            pass
+        try:
+            from ..utils.tool_registry import get_tool_registry
+            # 获取 ToolRegistry 中 source=skill 的工具（避免与上面重复）
+            _existing_names = {t.get('function', {}).get('name', '') for t in tools}
+            for meta in list(get_tool_registry()._tools.values()):
+                if meta.source == "skill" and meta.enabled and meta.name not in _existing_names:
+                    tools.append(meta.schema)
+        except Exception:
+            pass
+
+        # ★ 非视觉模型：capture_viewport 降级为仅保存文件（不注入图片）
+        # 不再移除工具——AI 仍可截图保存让用户自行查看
+        if not supports_vision:
+            import copy
+            for i, _t in enumerate(tools):
+                if _t.get('function', {}).get('name') == 'capture_viewport':
+                    _t_copy = copy.deepcopy(_t)
+                    _t_copy['function']['description'] = (
+                        "截取当前 Houdini 3D 视口快照并保存到文件。"
+                        "当前模型不支持图片分析，截图将保存到 output_path 指定的路径供用户查看。"
+                        "必须指定 output_path 参数。"
+                    )
+                    tools[i] = _t_copy
+        return tools
+
     def _manage_context(self):
         """管理上下文长度 — Cursor 风格轮次裁剪
         
@@ -3183,16 +3333,14 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
         
         old_tokens = current_tokens
         
-        # --- 按 user 消息划分轮次 ---
-        rounds = []       # [[msg, msg, ...], ...]
-        current_round = []
-        for m in history:
-            if m.get('role') == 'user' and current_round:
-                rounds.append(current_round)
-                current_round = []
-            current_round.append(m)
-        if current_round:
-            rounds.append(current_round)
+        # --- 按 user 消息划分轮次（结构索引跨调用常驻，只增量索引新消息）---
+        index = getattr(self, '_history_index', None)
+        if index is None:
+            index = self._history_index = ConversationIndex()
+        index.sync(history)
+        # 轮次以 user 消息为分界；首条 system 消息（如旧轮次裁剪提示）归入第一轮
+        starts = [0] + [p for p in index.user_positions if p > 0]
+        rounds = [history[s:e] for s, e in zip(starts, starts[1:] + [len(history)])]
         
         if len(rounds) <= 2:
             return  # 只有 1-2 轮，不裁剪
@@ -3200,16 +3348,19 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
         # --- 第一遍：压缩旧轮次的 tool 结果（保留最近 60%）---
         n_rounds = len(rounds)
         protect_n = max(2, int(n_rounds * 0.6))
-        for r_idx in range(n_rounds - protect_n):
-            for m in rounds[r_idx]:
-                if m.get('role') == 'tool':
-                    c = m.get('content') or ''
-                    if len(c) > 200:
-                        m['content'] = self.client._summarize_tool_content(c, 200) if hasattr(self.client, '_summarize_tool_content') else c[:200] + '...[summary]'
-        
-        # 重新计算
+        protect_from = starts[n_rounds - protect_n]
+        for i in index.tool_positions:
+            if i >= protect_from:
+                break
+            m = history[i]
+            c = m.get('content') or ''
+            if len(c) > 200:
+                m['content'] = self.client._summarize_tool_content(c, 200) if hasattr(self.client, '_summarize_tool_content') else c[:200] + '...[summary]'
+        
+        # 重新计算（逐轮计数，第二遍裁剪时直接扣减）
+        round_tokens = [self.token_optimizer.calculate_message_tokens(rnd) for rnd in rounds]
+        new_tokens = sum(round_tokens)
         compressed = [m for rnd in rounds for m in rnd]
-        new_tokens = self.token_optimizer.calculate_message_tokens(compressed)
         
         if new_tokens < context_limit * self.token_optimizer.budget.compression_threshold:
             # 压缩 tool 就够了
@@ -3223,13 +3374,14 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
         
         # --- 第二遍：删除最早的完整轮次，直到低于阈值 ---
         target = int(context_limit * 0.65)  # 目标降到 65%
-        while len(rounds) > 2:
-            # 删除最早的轮次
-            removed = rounds.pop(0)
-            compressed = [m for rnd in rounds for m in rnd]
-            new_tokens = self.token_optimizer.calculate_message_tokens(compressed)
+        n_drop = 0
+        while n_rounds - n_drop > 2:
+            # 删除最早的轮次（扣减其 token 数，无需重新计算全部消息）
+            new_tokens -= round_tokens[n_drop]
+            n_drop += 1
             if new_tokens <= target:
                 break
+        rounds = rounds[n_drop:]
         
         # 在头部插入摘要提示
         summary_note = {
@@ -3503,6 +3655,8 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
         # 保存模型选择
         self._save_model_preference()
         
+        self._prepare_scene_mirror()
+        
         # 后台执行（传递参数而不是直接访问控件）
         thread = threading.Thread(target=self._run_agent, args=(agent_params,), daemon=True)
         thread.start()
@@ -3537,6 +3691,10 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
         # ★ 存储 Think 开关状态，供 _drain_tag_buffer / _on_thinking_chunk 使用
         self._think_enabled = use_think
         
+        # ★ 耗时追踪：每个用户轮次一个 trace 文件（关闭时近乎零开销）
+        _tracer = get_tracer()
+        _tracer.begin_turn(f"{provider}/{model}")
+        
         try:
             # ========================================
             # 🔥 Cache 优化：保持消息前缀稳定
@@ -3693,20 +3851,22 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
                             user_last_msg = raw_content
                         break
             if user_last_msg:
-                rag_context = self._auto_rag_retrieve(
-                    user_last_msg,
-                    scene_context=scene_context,
-                    conversation_len=len(self._conversation_history),
-                )
+                with _tracer.span('rag.retrieve', cat='context'):
+                    rag_context = self._auto_rag_retrieve(
+                        user_last_msg,
+                        scene_context=scene_context,
+                        conversation_len=len(self._conversation_history),
+                    )
                 if rag_context:
                     messages.append({'role': 'system', 'content': rag_context})
             
             # 4. ★ 长期记忆激活（"我想起来了"机制）
             # 在 RAG 文档之后、上下文提醒之前注入
             if user_last_msg:
-                memory_context = self._activate_long_term_memory(
-                    user_last_msg, scene_context=scene_context
-                )
+                with _tracer.span('memory.activate', cat='context'):
+                    memory_context = self._activate_long_term_memory(
+                        user_last_msg, scene_context=scene_context
+                    )
                 if memory_context:
                     messages.append({'role': 'system', 'content': memory_context})
             
@@ -3898,83 +4058,16 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
                 cleaned_messages.append(clean_msg)
             messages = cleaned_messages
             
-            # 使用缓存的优化后工具定义（只计算一次）
+            # ★ 工具定义包：按 ToolRegistry 版本缓存（精简 / 合并外部工具 / 视觉降级只在注册表变化后重建）
             if plan_mode and not plan_executing:
-                # ★ Plan 规划阶段：只读工具 + create_plan + ask_question
-                plan_filtered = [t for t in HOUDINI_TOOLS
-                                 if t['function']['name'] in self._PLAN_PLANNING_TOOLS]
-                plan_filtered.append(PLAN_TOOL_CREATE)
-                plan_filtered.append(PLAN_TOOL_ASK_QUESTION)
-                if not use_web:
-                    plan_filtered = [t for t in plan_filtered
-                                     if t['function']['name'] not in ('web_search', 'fetch_webpage')]
-                tools = UltraOptimizer.optimize_tool_definitions(plan_filtered)
-            elif plan_mode and plan_executing:
-                # ★ Plan 执行阶段：完整工具 + update_plan_step
-                exec_tools = list(HOUDINI_TOOLS) + [PLAN_TOOL_UPDATE_STEP]
-                if not use_web:
-                    exec_tools = [t for t in exec_tools
-                                  if t['function']['name'] not in ('web_search', 'fetch_webpage')]
-                tools = UltraOptimizer.optimize_tool_definitions(exec_tools)
+                _tool_mode = 'plan_planning'
+            elif plan_mode:
+                _tool_mode = 'plan_executing'
             elif not use_agent:
-                # ★ Ask 模式：只保留只读/查询工具
-                ask_filtered = [t for t in HOUDINI_TOOLS
-                                if t['function']['name'] in self._ASK_MODE_TOOLS]
-                if not use_web:
-                    ask_filtered = [t for t in ask_filtered
-                                    if t['function']['name'] not in ('web_search', 'fetch_webpage')]
-                tools = UltraOptimizer.optimize_tool_definitions(ask_filtered)
+                _tool_mode = 'ask'
             else:
-                # ★ Agent 模式：使用全量工具
-                # 注意：不做意图过滤。Agent 需要多轮迭代，可能先查询再创建再验证，
-                # 意图过滤会导致后续迭代缺少必要工具（如 capture_viewport、create_node 等）。
-                if use_web:
-                    if self._cached_optimized_tools is None:
-                        self._cached_optimized_tools = UltraOptimizer.optimize_tool_definitions(HOUDINI_TOOLS)
-                    tools = self._cached_optimized_tools
-                else:
-                    if self._cached_optimized_tools_no_web is None:
-                        filtered = [t for t in HOUDINI_TOOLS if t['function']['name'] not in ('web_search', 'fetch_webpage')]
-                        self._cached_optimized_tools_no_web = UltraOptimizer.optimize_tool_definitions(filtered)
-                    tools = self._cached_optimized_tools_no_web
-            
-            # ★ 合并外部工具（HookManager 插件工具 + ToolRegistry Skill 工具）
-            try:
-                from ..utils.hooks import get_hook_manager as _ghm_tools
-                _ext = _ghm_tools().get_external_tools()
-                if _ext:
-                    tools = list(tools) + _ext
-            except Exception:
-                pass
-            try:
-                from ..utils.tool_registry import get_tool_registry
-                _reg = get_tool_registry()
-                # 获取 ToolRegistry 中 source=skill 的工具（避免与上面重复）
-                _existing_names = {t.get('function', {}).get('name', '') for t in tools}
-                for meta in _reg._tools.values():
-                    if meta.source == "skill" and meta.enabled and meta.name not in _existing_names:
-                        tools = list(tools) if not isinstance(tools, list) else tools
-                        tools.append(meta.schema)
-            except Exception:
-                pass
-            
-            # ★ 非视觉模型：capture_viewport 降级为仅保存文件（不注入图片）
-            # 不再移除工具——AI 仍可截图保存让用户自行查看
-            if not supports_vision:
-                _degraded_tools = []
-                for _t in tools:
-                    if _t.get('function', {}).get('name') == 'capture_viewport':
-                        import copy
-                        _t_copy = copy.deepcopy(_t)
-                        _t_copy['function']['description'] = (
-                            "截取当前 Houdini 3D 视口快照并保存到文件。"
-                            "当前模型不支持图片分析，截图将保存到 output_path 指定的路径供用户查看。"
-                            "必须指定 output_path 参数。"
-                        )
-                        _degraded_tools.append(_t_copy)
-                    else:
-                        _degraded_tools.append(_t)
-                tools = _degraded_tools
+                _tool_mode = 'agent'
+            tools = self._get_tool_bundle(_tool_mode, use_web, supports_vision).tools
             
             # ★ Plan 模式的静默工具集合（不在 UI 中显示的工具）
             _silent = self._SILENT_TOOLS | self._PLAN_SILENT_TOOLS if plan_mode else self._SILENT_TOOLS
@@ -4078,6 +4171,8 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
                     supports_vision=supports_vision,
                     tools_override=tools,
                     context_limit=context_limit,
+                    tool_router=get_tool_router(),  # ★ 按相关性发送工具子集（embedder 未就绪时发送全量）
+                    router_session=self._session_id,  # ★ 每个会话的已发送工具集合只增不减
                     on_content=lambda c: self._on_content_with_limit(c),
                     on_thinking=lambda t: self._on_thinking_chunk(t),
                     on_tool_call=lambda n, a: (
@@ -4173,6 +4268,8 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
                 error_detail = f"{type(e).__name__}: {str(e)}"
                 print(f"[AI Tab Error] {traceback.format_exc()}")  # 控制台输出
                 self._agentError.emit(error_detail)
+        finally:
+            _tracer.end_turn()
 
     def _add_tool_result(self, name: str, result: dict, arguments: dict = None):
         """添加工具结果到执行流程（自动压缩长结果）"""
@@ -4327,38 +4424,48 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
 
     @QtCore.Slot(str, str, str)
     def _on_tool_args_delta(self, tool_name: str, delta: str, accumulated: str):
-        """主线程 slot：处理 tool_call 参数增量，流式预览 VEX 代码 / Plan 生成进度"""
+        """主线程 slot：处理 tool_call 参数增量，流式预览 VEX 代码 / Plan 生成进度
+
+        参数由 StreamingJSONParser 增量解析，每个 delta 只处理新到达的字符。
+        """
         try:
             # ★ Plan 模式：create_plan 参数流式 → 创建/更新流式卡片
             if tool_name == 'create_plan':
                 # 首次收到 create_plan 参数 → 立即创建流式卡片
                 if self._streaming_plan_card is None:
                     self._on_create_streaming_plan()
-                self._show_plan_generation_progress(accumulated)
-                self._updateStreamingPlan.emit(accumulated)
+                st, events = self._feed_tool_args(tool_name, delta, accumulated)
+                self._show_plan_generation_progress(st, events)
+                self._updateStreamingPlan.emit(events)
                 return
 
             if tool_name not in self._VEX_TOOLS:
                 return
 
+            st, events = self._feed_tool_args(tool_name, delta, accumulated)
+            from ..utils.streaming_json import CHUNK, VALUE
+            # create_wrangle_node → "vex_code" 字段；set_node_parameter → "value" 字段
+            code_path = ('vex_code',) if tool_name == 'create_wrangle_node' else ('value',)
+            for ev in events:
+                if ev.kind == CHUNK and ev.path == code_path:
+                    st['code_parts'].append(ev.value)
+                    st['code_len'] += len(ev.value)
+                    if '\n' in ev.value:
+                        st['code_multiline'] = True
+                elif ev.kind == VALUE and ev.path == ('param_name',):
+                    st['param_name'] = str(ev.value).lower()
+
             # set_node_parameter 只对 VEX/代码参数做流式预览
+            # （param_name 还没出现时先继续，等能确认不是 VEX 参数再停止）
             if tool_name == 'set_node_parameter':
-                # 尝试从已累积的 JSON 中提取 param_name
-                import re as _re
-                m = _re.search(r'"param_name"\s*:\s*"([^"]*)"', accumulated)
-                if m:
-                    param_name = m.group(1).lower()
-                    if param_name not in self._VEX_PARAM_NAMES:
-                        return
-                # 如果 param_name 还没出现，暂不创建预览（等到能确认是 VEX 参数再说）
+                if st['param_name'] is not None and st['param_name'] not in self._VEX_PARAM_NAMES:
+                    return
 
-            # 从不完整的 JSON 中增量提取 VEX 代码
-            code = self._extract_vex_from_partial_json(tool_name, accumulated)
-            if not code:
+            if not st['code_len']:
                 return
             
             # 对于 set_node_parameter，只有代码超过一定长度才显示预览（避免为 "1.5" 这种值创建预览）
-            if tool_name == 'set_node_parameter' and len(code) < 10 and '\n' not in code:
+            if tool_name == 'set_node_parameter' and st['code_len'] < 10 and not st['code_multiline']:
                 return
 
             # 如果还没有 StreamingCodePreview，则创建
@@ -4368,62 +4475,40 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
                     return
                 self._streaming_preview = StreamingCodePreview(tool_name, parent=resp)
                 self._streaming_preview_tool = tool_name
-                self._streaming_last_code = ""
+                st['code_shown'] = 0
                 resp.details_layout.addWidget(self._streaming_preview)
                 self._scroll_agent_to_bottom()
 
-            # 更新预览（StreamingCodePreview 内部做增量追加）
-            self._streaming_preview.update_code(code)
-            self._streaming_last_code = code
+            # 只追加尚未显示的片段
+            parts = st['code_parts']
+            if st['code_shown'] < len(parts):
+                self._streaming_preview.append_code(''.join(parts[st['code_shown']:]))
+                st['code_shown'] = len(parts)
         except RuntimeError:
             pass  # widget 已被销毁
 
-    def _extract_vex_from_partial_json(self, tool_name: str, accumulated: str) -> str:
-        """从不完整的 JSON 字符串中增量提取 VEX 代码字段
-        
-        create_wrangle_node → 提取 "vex_code" 字段
-        set_node_parameter  → 提取 "value" 字段
-        """
-        import re as _re
-        # 确定要提取的字段名
-        if tool_name == 'create_wrangle_node':
-            field_pattern = r'"vex_code"\s*:\s*"'
-        else:
-            field_pattern = r'"value"\s*:\s*"'
+    def _feed_tool_args(self, tool_name: str, delta: str, accumulated: str):
+        """将参数 delta 喂给当前 tool_call 的增量解析器，返回 (状态 dict, 事件列表)
 
-        m = _re.search(field_pattern, accumulated)
-        if not m:
-            return ""
-        start = m.end()
-
-        # 从 start 开始，解析 JSON 字符串内容（处理转义字符）
-        result_chars = []
-        i = start
-        while i < len(accumulated):
-            ch = accumulated[i]
-            if ch == '\\' and i + 1 < len(accumulated):
-                next_ch = accumulated[i + 1]
-                if next_ch == 'n':
-                    result_chars.append('\n')
-                elif next_ch == 't':
-                    result_chars.append('\t')
-                elif next_ch == '"':
-                    result_chars.append('"')
-                elif next_ch == '\\':
-                    result_chars.append('\\')
-                elif next_ch == '/':
-                    result_chars.append('/')
-                elif next_ch == 'r':
-                    result_chars.append('\r')
-                else:
-                    result_chars.append(next_ch)
-                i += 2
-            elif ch == '"':
-                break  # 字符串字面量结束
-            else:
-                result_chars.append(ch)
-                i += 1
-        return ''.join(result_chars)
+        新的 tool_call（工具名变化或 accumulated 与已消费长度不连续）会重建解析器，
+        并从 accumulated 开头重新解析。
+        """
+        from ..utils.streaming_json import StreamingJSONParser
+        st = self._args_stream
+        if (st is None or st['tool'] != tool_name
+                or len(accumulated) - len(delta) != st['fed']):
+            st = self._args_stream = {
+                'tool': tool_name, 'parser': StreamingJSONParser(), 'fed': 0,
+                # VEX 预览
+                'code_parts': [], 'code_len': 0, 'code_multiline': False,
+                'code_shown': 0, 'param_name': None,
+                # Plan 进度
+                'plan_title': '', 'plan_steps': 0, 'plan_arch_nodes': 0,
+                'plan_has_arch': False, 'plan_progress': None,
+            }
+            delta = accumulated
+        st['fed'] += len(delta)
+        return st, st['parser'].feed(delta)
 
     def _finalize_streaming_preview(self):
         """流式预览结束：移除预览 widget（ParamDiffWidget 会接替展示正式 diff）"""
@@ -4435,7 +4520,7 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
                 pass
             self._streaming_preview = None
             self._streaming_preview_tool = ""
-            self._streaming_last_code = ""
+            self._args_stream = None
 
     @QtCore.Slot(str, str)
     def _on_add_node_operation(self, name: str, result: dict):
@@ -4902,6 +4987,26 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
             
             clean_output = '\n'.join(clean_parts).strip()
             
+            # ★ 已有流式控件：输出已实时显示，只需收尾（状态 / 耗时 / 错误）
+            live = self._live_shells.pop(('python', code), None)
+            if live is not None:
+                # 错误信息中的 "[部分输出]" 已经流式显示过，"执行时间" 放到 header
+                if raw_output and error.startswith(f"[部分输出]\n{raw_output}"):
+                    error = error[len(f"[部分输出]\n{raw_output}"):]
+                err_lines = []
+                for line in error.strip().split('\n'):
+                    time_match = re.match(r'^执行时间:\s*([\d.]+)s$', line.strip())
+                    if time_match:
+                        exec_time = float(time_match.group(1))
+                    else:
+                        err_lines.append(line)
+                try:
+                    live.finish(success, exec_time, error='\n'.join(err_lines) if not success else '')
+                    self._scroll_agent_to_bottom()
+                    return
+                except RuntimeError:
+                    pass  # 流式控件已被销毁，退回完整创建
+            
             widget = PythonShellWidget(
                 code=code,
                 output=clean_output,
@@ -4937,6 +5042,7 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
             # 从输出中提取执行时间和退出码
             exec_time = 0.0
             exit_code = 0
+            has_exit_code = False
             stdout_parts = []
 
             for line in raw_output.split('\n'):
@@ -4947,6 +5053,7 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
                     exec_time = float(time_match.group(1))
                 if code_match:
                     exit_code = int(code_match.group(1))
+                    has_exit_code = True
                 if time_match or code_match:
                     continue
                 # 分离 stdout / stderr
@@ -4958,6 +5065,17 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
 
             clean_output = '\n'.join(stdout_parts).strip()
 
+            # ★ 已有流式控件：输出已实时显示，只需收尾（退出码 / 耗时 / 中断信息）
+            live = self._live_shells.pop(('shell', command), None)
+            if live is not None:
+                try:
+                    live.finish(success, exec_time, error=error,
+                                exit_code=exit_code if has_exit_code else None)
+                    self._scroll_agent_to_bottom()
+                    return
+                except RuntimeError:
+                    pass  # 流式控件已被销毁，退回完整创建
+
             widget = SystemShellWidget(
                 command=command,
                 output=clean_output,
@@ -4973,6 +5091,41 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
         except RuntimeError:
             pass  # widget 已被 clear 销毁
 
+    @QtCore.Slot(str, str, str, object)
+    def _on_shell_stream(self, kind: str, source: str, event: str, payload: object):
+        """execute_shell / execute_python 的增量输出：start 时创建运行中控件，chunk 追加输出
+        
+        shell 在后台线程执行，信号排队到主线程；python 在主线程执行，信号直接调用本槽，
+        此时事件循环被占用，追加后手动处理布局请求并重绘控件，输出才能实时可见。
+        """
+        key = (kind, source)
+        try:
+            if event == 'start':
+                resp = self._agent_response or self._current_response
+                if not resp:
+                    return
+                if kind == 'python':
+                    widget = PythonShellWidget(code=source, running=True, parent=resp)
+                    resp.add_shell_widget(widget)
+                else:
+                    widget = SystemShellWidget(command=source, cwd=(payload or {}).get('cwd', ''),
+                                               running=True, parent=resp)
+                    resp.add_sys_shell_widget(widget)
+                self._live_shells[key] = widget
+                self._scroll_agent_to_bottom()
+            elif event == 'chunk':
+                widget = self._live_shells.get(key)
+                if widget is None:
+                    return
+                widget.append_output(payload.get('text', ''), payload.get('stream') == 'stderr')
+            else:
+                return
+            if kind == 'python':
+                QtWidgets.QApplication.sendPostedEvents(None, QtCore.QEvent.LayoutRequest)
+                widget.repaint()
+        except RuntimeError:
+            self._live_shells.pop(key, None)  # widget 已被 clear 销毁
+
     def _on_stop(self):
         self.client.request_stop()
 
@@ -5010,6 +5163,10 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
         self._conversation_history.clear()
         self._context_summary = ""
         self._current_response = None
+        self._live_shells.clear()
+        if self._agent_session_id is None:
+            self.client.clear_precompact()
+        get_tool_router().forget_session(self._session_id)
         self._token_stats = {
             'input_tokens': 0, 'output_tokens': 0,
             'reasoning_tokens': 0,
@@ -5313,11 +5470,49 @@ SideFX Labs Node Usage Rules (MUST follow strictly):
             except Exception:
                 pass
 
+        # 工具结果分页缓存
+        try:
+            pc = self.mcp.get_page_cache_stats()
+            lines.append(f"\n**分页缓存:**")
+            lines.append(f"  - 条目: {pc['entries']}（{pc['bytes'] / 1048576:.1f}/{pc['max_bytes'] / 1048576:.0f} MB）")
+            lines.append(f"  - 翻页命中: {pc['hits']}/{pc['hits'] + pc['misses']}（{pc['hit_rate']:.0%}）")
+            lines.append(f"  - 淘汰: {pc['evictions']}，过期: {pc['expirations']}")
+        except Exception:
+            pass
+
         self._add_user_message("[/status]")
         resp = self._add_ai_response()
         resp.set_content("\n".join(lines))
         resp.finalize()
 
+    def _slash_trace(self):
+        """/trace — 开关耗时追踪"""
+        tracer = get_tracer()
+        tracer.set_enabled(not tracer.enabled)
+        if tracer.enabled:
+            content = (f"⏱ **耗时追踪已开启**\n\n每个用户轮次写出一个 trace 文件到 `{tracer.trace_dir}`"
+                       f"（{tracer.fmt}，可拖入 chrome://tracing 或 ui.perfetto.dev 查看）。"
+                       f"\n使用 `/trace_stats` 查看各阶段 p50/p95。")
+        else:
+            content = "⏱ **耗时追踪已关闭**"
+        self._add_user_message("[/trace]")
+        resp = self._add_ai_response()
+        resp.set_content(content)
+        resp.finalize()
+
+    def _slash_trace_stats(self):
+        """/trace_stats — 显示各 span 的 p50 / p95 耗时"""
+        tracer = get_tracer()
+        lines = ["📈 **耗时统计**（按累计耗时排序）\n", tracer.format_summary()]
+        if not tracer.enabled:
+            lines.append("\n追踪未开启，使用 `/trace` 开启。")
+        elif tracer.last_trace_path:
+            lines.append(f"\n最近 trace: `{tracer.last_trace_path}`")
+        self._add_user_message("[/trace_stats]")
+        resp = self._add_ai_response()
+        resp.set_content("\n".join(lines))
+        resp.finalize()
+
     def _slash_export(self):
         """/export — 导出训练数据"""
         self._on_export_training_data()
@@ -1710,6 +1710,16 @@ class StreamingCodePreview(QtWidgets.QWidget):
         # 记录上次已显示的代码长度，只追加增量
         self._last_len = 0
 
+    def append_code(self, chunk: str):
+        """追加一段新到达的代码（增量解析器直接给出 delta）"""
+        if not chunk:
+            return
+        self._last_len += len(chunk)
+        self._code_area.moveCursor(QtGui.QTextCursor.End)
+        self._code_area.insertPlainText(chunk)
+        sb = self._code_area.verticalScrollBar()
+        sb.setValue(sb.maximum())
+
     def update_code(self, full_code: str):
         """用完整代码字符串更新显示（增量追加新部分）"""
         if len(full_code) > self._last_len:
@@ -2417,7 +2427,7 @@ class StreamingPlanCard(QtWidgets.QWidget):
 
     生命周期：
     1. 创建时只有标题骨架 + STREAMING 标签
-    2. on_tool_args_delta 驱动 update_from_accumulated()，逐步渲染标题 → 概述 → 步骤
+    2. on_tool_args_delta 的增量解析事件驱动 apply_stream_events()，逐步渲染标题 → 概述 → 步骤
     3. 工具执行完毕后，调用 finalize_with_data(plan_data) 原地补充：
        - 步骤详情（sub_steps, tools, risk, deps, expected, fallback, notes）
        - DAG 架构图
@@ -2513,51 +2523,46 @@ class StreamingPlanCard(QtWidgets.QWidget):
         self._rendered_step_count = 0
         self._current_title = ""
         self._current_overview = ""
+        self._stream_steps = {}   # step 下标 -> 已解析字段 {id, title, description}
 
     # ==================================================================
     # 流式阶段 API — 由 on_tool_args_delta 驱动
     # ==================================================================
 
-    def update_from_accumulated(self, accumulated: str):
-        """从 create_plan 的不完整 JSON 中增量提取并渲染内容。"""
+    def apply_stream_events(self, events: list):
+        """应用 create_plan 参数的增量解析事件（StreamingJSONParser），只处理新到达的字段。"""
         if self._finalized:
             return
-        import re as _re
-
-        # 提取 title
-        m_title = _re.search(r'"title"\s*:\s*"((?:[^"\\]|\\.)*)"', accumulated)
-        if m_title and m_title.group(1) != self._current_title:
-            self._current_title = m_title.group(1)
-            self._title_lbl.setText(self._current_title)
-
-        # 提取 overview
-        m_ov = _re.search(r'"overview"\s*:\s*"((?:[^"\\]|\\.)*)"', accumulated)
-        if m_ov and m_ov.group(1) != self._current_overview:
-            self._current_overview = m_ov.group(1)
-            self._overview_lbl.setText(self._current_overview)
-            self._overview_lbl.setVisible(True)
-
-        # 匹配 steps 数组中的每个 step 对象
-        steps_match = _re.search(r'"steps"\s*:\s*\[', accumulated)
-        if not steps_match:
-            return
-
-        steps_json_start = steps_match.end()
-        step_pattern = _re.compile(
-            r'\{\s*"id"\s*:\s*"(step-\d+)"\s*,\s*'
-            r'"(?:title|description)"\s*:\s*"((?:[^"\\]|\\.)*)"',
-        )
-        all_steps = list(step_pattern.finditer(accumulated, steps_json_start))
-
-        # 仅渲染新出现的 step
-        for i in range(self._rendered_step_count, len(all_steps)):
-            m = all_steps[i]
-            self._add_streaming_step(m.group(1), m.group(2))
-            self._rendered_step_count += 1
-
-        # 检查是否进入 architecture 部分
-        if '"architecture"' in accumulated:
-            self._loading_lbl.setText("  ⋯ generating architecture...")
+        from ..utils.streaming_json import KEY, VALUE
+
+        for ev in events:
+            path = ev.path
+            if ev.kind == KEY:
+                # 进入 architecture 部分
+                if path == ('architecture',):
+                    self._loading_lbl.setText("  ⋯ generating architecture...")
+                continue
+            if ev.kind != VALUE:
+                continue
+            if path == ('title',):
+                self._current_title = str(ev.value)
+                self._title_lbl.setText(self._current_title)
+            elif path == ('overview',):
+                self._current_overview = str(ev.value)
+                self._overview_lbl.setText(self._current_overview)
+                self._overview_lbl.setVisible(True)
+            elif (len(path) == 3 and path[0] == 'steps' and isinstance(path[1], int)
+                    and path[2] in ('id', 'title', 'description')):
+                step = self._stream_steps.setdefault(path[1], {})
+                if step.get('_rendered'):
+                    continue
+                step[path[2]] = str(ev.value)
+                text = step.get('title') or step.get('description')
+                if step.get('id') and text:
+                    # id 与 title/description 都到齐 → 渲染该步骤
+                    step['_rendered'] = True
+                    self._add_streaming_step(step['id'], text)
+                    self._rendered_step_count += 1
 
     def _add_streaming_step(self, step_id: str, text: str):
         """流式阶段：添加一行简化版步骤"""
@@ -4570,15 +4575,89 @@ class _CollapsibleShellOutput(QtWidgets.QWidget):
         return super().eventFilter(obj, event)
 
 
+class _LiveShellOutput(QtWidgets.QPlainTextEdit):
+    """运行中的 Shell 输出 — 增量追加 stdout / stderr
+    
+    - 只保留最近 _MAX_LINES 行（UI 侧环形缓冲，长时间输出不会拖垮文档）
+    - 停留在底部时自动跟随滚动；用户上翻查看时不打断
+    """
+
+    _MAX_LINES = 2000
+    _VISIBLE_LINES = 10
+
+    def __init__(self, variant: str = "python", parent=None):
+        super().__init__(parent)
+        self.setReadOnly(True)
+        self.setLineWrapMode(QtWidgets.QPlainTextEdit.NoWrap)
+        self.setMaximumBlockCount(self._MAX_LINES)
+        self.setObjectName("shellLiveOutput")
+        self.setProperty("variant", variant)
+        fm = self.fontMetrics()
+        line_h = fm.lineSpacing() if fm.lineSpacing() > 0 else 17
+        self.setFixedHeight(self._VISIBLE_LINES * line_h + 16)
+        self._out_fmt = QtGui.QTextCharFormat()
+        self._err_fmt = QtGui.QTextCharFormat()
+        self._err_fmt.setForeground(QtGui.QColor(CursorTheme.ACCENT_RED))
+
+    def append_chunk(self, text: str, is_error: bool = False):
+        if not text:
+            return
+        # 进度条类输出（\r 回到行首）按换行处理
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+        sb = self.verticalScrollBar()
+        at_bottom = sb.value() >= sb.maximum() - 4
+        cursor = QtGui.QTextCursor(self.document())
+        cursor.movePosition(QtGui.QTextCursor.End)
+        cursor.insertText(text, self._err_fmt if is_error else self._out_fmt)
+        if at_bottom:
+            sb.setValue(sb.maximum())
+
+
+class _LiveShellMixin:
+    """Shell 控件的运行中模式：先创建控件，输出流式追加，结束时更新状态"""
+
+    def _init_live(self, layout, variant: str):
+        self._live_out = _LiveShellOutput(variant, self)
+        layout.addWidget(self._live_out)
+
+    def append_output(self, text: str, is_error: bool = False):
+        live = getattr(self, '_live_out', None)
+        if live is not None:
+            live.append_chunk(text, is_error)
+
+    def finish(self, success: bool, exec_time: float = 0.0, error: str = "",
+               exit_code: Optional[int] = None):
+        """执行结束：更新状态 / 耗时，追加错误信息"""
+        if error and error.strip():
+            self.append_output(('\n' if self._live_out.toPlainText() else '') + error.strip(), True)
+        if exit_code is not None:
+            status_text, ok = f"exit {exit_code}", exit_code == 0
+        else:
+            status_text, ok = ("ok" if success else "err"), success
+        self._status_lbl.setText(status_text)
+        self._status_lbl.setObjectName("shellStatusOk" if ok else "shellStatusErr")
+        if exec_time > 0:
+            self._time_lbl.setText(f"{exec_time:.2f}s")
+            self._time_lbl.setVisible(True)
+        self.setProperty("state", "ok" if success else "error")
+        for w in (self._status_lbl, self):
+            w.style().unpolish(w)
+            w.style().polish(w)
+
+
 # ============================================================
 # Python Shell 执行窗口
 # ============================================================
 
-class PythonShellWidget(QtWidgets.QFrame):
-    """Python Shell 执行结果 — 显示代码 + 输出 + 错误"""
+class PythonShellWidget(_LiveShellMixin, QtWidgets.QFrame):
+    """Python Shell 执行结果 — 显示代码 + 输出 + 错误
+    
+    running=True 时为运行中模式：输出经 append_output() 流式追加，结束后调用 finish()。
+    """
     
     def __init__(self, code: str, output: str = "", error: str = "",
-                 exec_time: float = 0.0, success: bool = True, parent=None):
+                 exec_time: float = 0.0, success: bool = True,
+                 running: bool = False, parent=None):
         super().__init__(parent)
         self.setObjectName("PythonShellWidget")
         
@@ -4601,14 +4680,18 @@ class PythonShellWidget(QtWidgets.QFrame):
         
         hl.addStretch()
         
-        if exec_time > 0:
-            time_lbl = QtWidgets.QLabel(f"{exec_time:.2f}s")
-            time_lbl.setObjectName("shellTimeLbl")
-            hl.addWidget(time_lbl)
+        self._time_lbl = QtWidgets.QLabel(f"{exec_time:.2f}s")
+        self._time_lbl.setObjectName("shellTimeLbl")
+        self._time_lbl.setVisible(exec_time > 0)
+        hl.addWidget(self._time_lbl)
         
-        status_lbl = QtWidgets.QLabel("ok" if success else "err")
-        status_lbl.setObjectName("shellStatusOk" if success else "shellStatusErr")
-        hl.addWidget(status_lbl)
+        if running:
+            self._status_lbl = QtWidgets.QLabel("run")
+            self._status_lbl.setObjectName("shellStatusRun")
+        else:
+            self._status_lbl = QtWidgets.QLabel("ok" if success else "err")
+            self._status_lbl.setObjectName("shellStatusOk" if success else "shellStatusErr")
+        hl.addWidget(self._status_lbl)
         
         layout.addWidget(header)
         
@@ -4631,6 +4714,11 @@ class PythonShellWidget(QtWidgets.QFrame):
         code_widget.setFixedHeight(code_h)
         layout.addWidget(code_widget)
         
+        # ---- 运行中：流式输出区域 ----
+        if running:
+            self._init_live(layout, "python")
+            return
+        
         # ---- 输出区域（可折叠）----
         has_output = bool(output and output.strip())
         has_error = bool(error and error.strip())
@@ -4652,12 +4740,16 @@ class PythonShellWidget(QtWidgets.QFrame):
             layout.addWidget(err_label)
 
 
-class SystemShellWidget(QtWidgets.QFrame):
-    """System Shell 执行结果 — 显示命令 + stdout/stderr + 退出码"""
+class SystemShellWidget(_LiveShellMixin, QtWidgets.QFrame):
+    """System Shell 执行结果 — 显示命令 + stdout/stderr + 退出码
+    
+    running=True 时为运行中模式：输出经 append_output() 流式追加，结束后调用 finish()。
+    """
 
     def __init__(self, command: str, output: str = "", error: str = "",
                  exit_code: int = 0, exec_time: float = 0.0,
-                 success: bool = True, cwd: str = "", parent=None):
+                 success: bool = True, cwd: str = "", running: bool = False,
+                 parent=None):
         super().__init__(parent)
         self.setObjectName("SystemShellWidget")
 
@@ -4688,14 +4780,18 @@ class SystemShellWidget(QtWidgets.QFrame):
 
         hl.addStretch()
 
-        if exec_time > 0:
-            time_lbl = QtWidgets.QLabel(f"{exec_time:.2f}s")
-            time_lbl.setObjectName("shellTimeLbl")
-            hl.addWidget(time_lbl)
+        self._time_lbl = QtWidgets.QLabel(f"{exec_time:.2f}s")
+        self._time_lbl.setObjectName("shellTimeLbl")
+        self._time_lbl.setVisible(exec_time > 0)
+        hl.addWidget(self._time_lbl)
 
-        code_lbl = QtWidgets.QLabel(f"exit {exit_code}")
-        code_lbl.setObjectName("shellStatusOk" if exit_code == 0 else "shellStatusErr")
-        hl.addWidget(code_lbl)
+        if running:
+            self._status_lbl = QtWidgets.QLabel("run")
+            self._status_lbl.setObjectName("shellStatusRun")
+        else:
+            self._status_lbl = QtWidgets.QLabel(f"exit {exit_code}")
+            self._status_lbl.setObjectName("shellStatusOk" if exit_code == 0 else "shellStatusErr")
+        hl.addWidget(self._status_lbl)
 
         layout.addWidget(header)
 
@@ -4723,6 +4819,11 @@ class SystemShellWidget(QtWidgets.QFrame):
         cmd_widget.setFixedHeight(cmd_h)
         layout.addWidget(cmd_widget)
 
+        # ---- 运行中：流式输出区域 ----
+        if running:
+            self._init_live(layout, "system")
+            return
+
         # ---- 输出区域（可折叠）----
         has_output = bool(output and output.strip())
         has_error = bool(error and error.strip())
@@ -5508,6 +5609,8 @@ SLASH_COMMANDS = [
     ("skills",    "⚡",  "技能列表",     "List Skills",      "列出所有可用 Skill",         "List all available skills",    "scene"),
     # ── 工具 ──
     ("status",    "📊",  "系统状态",     "System Status",    "查看记忆/成长/上下文统计",   "View memory/growth/context stats", "tool"),
+    ("trace",     "⏱",  "耗时追踪",     "Tracing",          "开关每轮耗时追踪（写出 Chrome trace）", "Toggle per-turn tracing (Chrome trace export)", "tool"),
+    ("trace_stats","📈", "耗时统计",     "Trace Stats",      "查看各阶段耗时 p50/p95",    "Show p50/p95 per traced span",  "tool"),
     ("export",    "💾",  "导出训练",     "Export Training",  "导出对话为训练数据",         "Export conversation as training data", "tool"),
     ("image",     "🖼",  "附加图片",     "Attach Image",     "从文件选择图片附加到消息",   "Select image to attach",       "tool"),
     ("help",      "❓",  "帮助",         "Help",             "显示所有可用斜杠命令",       "Show all available commands",   "tool"),
@@ -6446,7 +6549,8 @@ class TokenAnalyticsPanel(QtWidgets.QDialog):
         "Output", "Think", "Total", "延迟", "费用", "",
     ]
 
-    def __init__(self, call_records: list, token_stats: dict, parent=None):
+    def __init__(self, call_records: list, token_stats: dict, parent=None,
+                 tool_cache_stats: dict = None, runtime_stats: dict = None):
         super().__init__(parent)
         self.setWindowTitle("Token 使用分析")
         self.setMinimumSize(920, 560)
@@ -6458,7 +6562,8 @@ class TokenAnalyticsPanel(QtWidgets.QDialog):
         root.setSpacing(12)
 
         # ---- 摘要卡片 ----
-        root.addWidget(self._build_summary(call_records, token_stats))
+        root.addWidget(self._build_summary(call_records, token_stats,
+                                           tool_cache_stats, runtime_stats))
 
         # ---- 调用明细表 ----
         root.addWidget(self._build_table(call_records), 1)
@@ -6488,7 +6593,8 @@ class TokenAnalyticsPanel(QtWidgets.QDialog):
         self.accept()
 
     # -------- 摘要区 --------
-    def _build_summary(self, records, stats) -> QtWidgets.QWidget:
+    def _build_summary(self, records, stats, tool_cache_stats=None,
+                       runtime_stats=None) -> QtWidgets.QWidget:
         card = QtWidgets.QFrame()
         card.setObjectName("tokenSummaryCard")
         grid = QtWidgets.QGridLayout(card)
@@ -6554,8 +6660,80 @@ class TokenAnalyticsPanel(QtWidgets.QDialog):
             bar.setFixedHeight(8)
             grid.addWidget(bar, 2, 0, 1, len(metrics))
 
+        # 只读工具结果缓存（跨轮次复用，场景变化即失效）
+        if tool_cache_stats:
+            tc_metrics = [
+                ("Tool Cache Hit",  f"{tool_cache_stats.get('hits', 0)}",   "#10b981"),
+                ("Tool Cache Miss", f"{tool_cache_stats.get('misses', 0)}", CursorTheme.TEXT_SECONDARY),
+                ("Tool Hit Rate",   f"{tool_cache_stats.get('hit_rate', 0.0) * 100:.1f}%", "#10b981"),
+                ("Invalidated",     f"{tool_cache_stats.get('invalidations', 0)}", CursorTheme.ACCENT_ORANGE),
+            ]
+            self._add_metric_row(grid, 3, tc_metrics)
+
+        # 运行时指标：工具线程池车道排队 / 主机限流等待
+        row = 5
+        for rt_metrics in self._runtime_metric_rows(runtime_stats or {}):
+            self._add_metric_row(grid, row, rt_metrics)
+            row += 2
+
         return card
 
+    @staticmethod
+    def _add_metric_row(grid, row: int, metrics: list):
+        """在 row / row+1 两行放置一组 (标签, 数值, 颜色) 指标"""
+        for col, (label, value, color) in enumerate(metrics):
+            lbl = QtWidgets.QLabel(label)
+            lbl.setObjectName("tokenMetricLabel")
+            lbl.setAlignment(QtCore.Qt.AlignCenter)
+            grid.addWidget(lbl, row, col)
+
+            val = QtWidgets.QLabel(value)
+            val.setObjectName("tokenMetricValue")
+            val.setStyleSheet(f"color:{color};")
+            val.setAlignment(QtCore.Qt.AlignCenter)
+            grid.addWidget(val, row + 1, col)
+
+    @staticmethod
+    def _runtime_metric_rows(runtime_stats: dict) -> list:
+        """把 AIClient.get_runtime_stats() 转成若干指标行"""
+        rows = []
+        pool = runtime_stats.get('tool_pool') or {}
+        if pool:
+            metrics = []
+            for lane, title in (('web', 'Web'), ('shell', 'Shell'), ('general', 'Bg')):
+                st = pool.get(lane)
+                if not st:
+                    continue
+                metrics.append((f"{title} Q/Run", f"{st.get('queued', 0)}/{st.get('running', 0)}",
+                                CursorTheme.TEXT_SECONDARY))
+                metrics.append((f"{title} Wait", f"{st.get('avg_wait', 0.0) * 1000:.0f}ms",
+                                CursorTheme.ACCENT_ORANGE))
+            held = sum(st.get('host_held', 0) for st in pool.values())
+            metrics.append(("Host Held", f"{held}", CursorTheme.ACCENT_ORANGE))
+            rows.append(metrics)
+        engines = runtime_stats.get('web_engines') or {}
+        if engines:
+            metrics = []
+            for name, st in sorted(engines.items()):
+                title = {'brave': 'Brave', 'duckduckgo': 'DDG'}.get(name, name)
+                metrics.append((f"{title} Latency", f"{st.get('latency', 0.0) * 1000:.0f}ms",
+                                CursorTheme.TEXT_SECONDARY))
+                metrics.append((f"{title} OK", f"{st.get('success', 0.0) * 100:.0f}%", "#10b981"))
+                metrics.append((f"{title} Calls", f"{int(st.get('calls', 0))}",
+                                CursorTheme.ACCENT_BLUE))
+            rows.append(metrics)
+        router = runtime_stats.get('tool_router') or {}
+        if router.get('requests'):
+            rows.append([
+                ("Tools Routed",  f"{router.get('routed', 0)}/{router.get('requests', 0)}",
+                 CursorTheme.ACCENT_BLUE),
+                ("Schema Saved",  TokenAnalyticsPanel._fmt_k(router.get('schema_tokens_saved', 0)),
+                 "#10b981"),
+                ("Set Grown",     f"{router.get('grown', 0)}", CursorTheme.TEXT_SECONDARY),
+                ("Router Miss",   f"{router.get('misses', 0)}", CursorTheme.ACCENT_ORANGE),
+            ])
+        return rows
+
     # -------- 明细表 --------
     def _build_table(self, records) -> QtWidgets.QWidget:
         container = QtWidgets.QFrame()
@@ -9,11 +9,18 @@ import sys
 import json
 import ssl
 import time
+import hashlib
+import threading
 import re
 from typing import List, Dict, Optional, Any, Callable, Generator, Tuple
 from urllib.parse import quote_plus
 
 from shared.common_utils import load_config, save_config
+from .tool_result_cache import ToolResultCache
+from .web_cache import WebCache
+from .streaming_json import StreamingToolCallExtractor
+from .conversation_index import ConversationIndex, ToolResultDedup
+from .tracer import get_tracer, now as _trace_now
 
 # 强制使用本地 lib 目录中的依赖库
 _lib_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'lib')
@@ -37,7 +44,7 @@ except ImportError:
 # ============================================================
 
 class WebSearcher:
-    """联网搜索工具 - 多引擎自动降级（Brave → DuckDuckGo）+ 缓存"""
+    """联网搜索工具 - 多引擎对冲并发 / 自动降级（Brave、DuckDuckGo）+ 缓存"""
     
     # Brave Search（免费 HTML 抓取，Svelte SSR，结果质量好）
     BRAVE_URL = "https://search.brave.com/search"
@@ -57,18 +64,51 @@ class WebSearcher:
         'Accept-Encoding': 'gzip, deflate',
     }
 
-    # 搜索结果缓存：key -> (timestamp, result)
-    _search_cache: Dict[str, tuple] = {}
-    _CACHE_TTL = 300  # 5 分钟
-
-    # 网页正文缓存：url -> (timestamp, text_lines)
-    _page_cache: Dict[str, tuple] = {}
-    _PAGE_CACHE_TTL = 600  # 10 分钟
+    # 搜索结果缓存：有界 LRU + TTL，磁盘持久化（类级共享，首次实例化时创建）
+    _search_cache: Optional[WebCache] = None
+    _CACHE_TTL = 1800  # 30 分钟
+    _SEARCH_CACHE_MAX = 256
+
+    # 网页正文缓存：url -> text_lines（翻页复用 + 跨会话复用文档页）
+    _page_cache: Optional[WebCache] = None
+    _PAGE_CACHE_TTL = 86400  # 24 小时
+    _PAGE_CACHE_MAX = 128
+
+    # 按引擎复用的 HTTP Session（连接池 + Keep-Alive，避免每次搜索重新 TLS 握手）
+    _sessions: Dict[str, Any] = {}
+    _sessions_lock = threading.Lock()
+
+    # ★ 引擎统计（类级共享）：engine -> {latency: EWMA 秒, success: EWMA 成功率, calls}
+    # 用于自适应决定哪个引擎先发、第二个引擎的对冲延迟
+    _ENGINES = ('brave', 'duckduckgo')
+    _engine_stats: Dict[str, Dict[str, float]] = {}
+    _engine_stats_lock = threading.Lock()
+    _STATS_ALPHA = 0.3          # EWMA 平滑系数
+    _ENOUGH_RESULTS = 3         # 首个引擎返回 ≥ 该数量（或 max_results）即视为足够
+    _DEFAULT_HEDGE_DELAY = 1.5  # 统计不足时的对冲延迟（秒）：首选引擎通常在此之前返回，不会每次双发
+    _STEAL_AFTER = 0.05         # 已发出的引擎排队超过该时间仍未开始 → 改在当前线程执行
 
     # Trafilatura 可用性
     _HAS_TRAFILATURA = False
     
-    def __init__(self):
+    def __init__(self, hedged: bool = True, merge: bool = False,
+                 brave_url: Optional[str] = None, duckduckgo_url: Optional[str] = None,
+                 pool_getter: Optional[Callable[[], Any]] = None):
+        """
+        Args:
+            hedged: 多引擎并发对冲（False 时按统计顺序逐个降级）
+            merge: 对冲模式下等待所有引擎并合并去重结果
+            brave_url / duckduckgo_url: 覆盖引擎地址（本地替身服务器测试用）
+            pool_getter: 返回 AIClient 常驻工具线程池（_AsyncToolPool）的函数；
+                对冲请求提交到其 web 车道。未提供时退化为逐个降级
+        """
+        self.hedged = hedged
+        self.merge = merge
+        self._pool_getter = pool_getter
+        if brave_url:
+            self.BRAVE_URL = brave_url
+        if duckduckgo_url:
+            self.DUCKDUCKGO_URL = duckduckgo_url
         # 检测 trafilatura 可用性（只检测一次）
         if not WebSearcher._HAS_TRAFILATURA:
             try:
@@ -76,6 +116,30 @@ class WebSearcher:
                 WebSearcher._HAS_TRAFILATURA = True
             except ImportError:
                 pass
+        if WebSearcher._search_cache is None:
+            WebSearcher._search_cache = WebCache(
+                'search', self._SEARCH_CACHE_MAX, self._CACHE_TTL)
+            WebSearcher._page_cache = WebCache(
+                'pages', self._PAGE_CACHE_MAX, self._PAGE_CACHE_TTL)
+
+    @classmethod
+    def _session(cls, engine: str):
+        """获取指定引擎的持久化 Session（'brave' / 'duckduckgo' / 'page'）"""
+        sess = cls._sessions.get(engine)
+        if sess is None:
+            with cls._sessions_lock:
+                sess = cls._sessions.get(engine)
+                if sess is None:
+                    from requests.adapters import HTTPAdapter
+                    sess = requests.Session()
+                    sess.headers.update(cls._HEADERS)
+                    # 网页抓取面向多个主机，需要更多连接池
+                    adapter = HTTPAdapter(pool_connections=16 if engine == 'page' else 2,
+                                          pool_maxsize=8)
+                    sess.mount('https://', adapter)
+                    sess.mount('http://', adapter)
+                    cls._sessions[engine] = sess
+        return sess
     # ------------------------------------------------------------------
     # 编码修复：requests 默认 ISO-8859-1 会导致中文乱码
     # ------------------------------------------------------------------
@@ -135,40 +199,239 @@ class WebSearcher:
     # 搜索（带缓存 + 三级降级）
     # ------------------------------------------------------------------
 
-    def search(self, query: str, max_results: int = 5, timeout: int = 10) -> Dict[str, Any]:
-        """执行网络搜索（缓存 + 多引擎自动降级）
+    def search(self, query: str, max_results: int = 5, timeout: int = 10,
+               hedged: Optional[bool] = None, merge: Optional[bool] = None) -> Dict[str, Any]:
+        """执行网络搜索（缓存 + 多引擎对冲 / 降级）
         
-        优先级：缓存 → Brave 抓取 → DuckDuckGo 抓取
-        任一引擎成功且有结果即返回，否则尝试下一个。
+        优先级：缓存 → 引擎（按延迟 / 成功率统计排序）
+        - 对冲模式：首选引擎先发，对冲延迟到期（或首选失败）后并发第二个引擎，
+          任一引擎返回足够结果即返回；merge=True 时等待全部引擎并合并去重
+        - 降级模式：逐个尝试，任一引擎成功且有结果即返回
         """
+        hedged = self.hedged if hedged is None else hedged
+        merge = self.merge if merge is None else merge
+
         # --- 缓存查找 ---
-        cache_key = f"{query}|{max_results}"
-        cached = self._search_cache.get(cache_key)
-        if cached:
-            ts, cached_result = cached
-            if (time.time() - ts) < self._CACHE_TTL:
-                cached_result = dict(cached_result)
-                cached_result['source'] = cached_result.get('source', '') + '(cached)'
-                return cached_result
-
-        errors = []
-        
-        # 1. Brave Search（免费 HTML 抓取，结果质量好）
-        result = self._search_brave(query, max_results, timeout)
-        if result.get('success') and result.get('results'):
-            self._search_cache[cache_key] = (time.time(), result)
-            return result
-        errors.append(f"Brave: {result.get('error', 'no results')}")
-        
-        # 2. DuckDuckGo（备用）
-        result = self._search_duckduckgo(query, max_results, timeout)
-        if result.get('success') and result.get('results'):
-            self._search_cache[cache_key] = (time.time(), result)
+        # ★ 合并结果与单引擎结果不同，按模式分别缓存，互不覆盖
+        mode = 'merge' if hedged and merge else 'first'
+        cache_key = f"{query}|{max_results}|{mode}"
+        cached_result = self._search_cache.get(cache_key)
+        if cached_result:
+            cached_result = dict(cached_result)
+            cached_result['source'] = cached_result.get('source', '') + '(cached)'
+            return cached_result
+
+        order = self._engine_order()
+        if hedged and len(order) > 1 and self._pool_getter is not None:
+            result, errors = self._search_hedged(order, query, max_results, timeout, merge)
+        else:
+            result, errors = None, []
+            for engine in order:
+                r = self._run_engine(engine, query, max_results, timeout)
+                if r.get('success') and r.get('results'):
+                    result = r
+                    break
+                errors.append(f"{engine}: {r.get('error', 'no results')}")
+
+        if result:
+            self._search_cache.put(cache_key, result)
             return result
-        errors.append(f"DDG: {result.get('error', 'no results')}")
-        
         return {"success": False, "error": f"All engines failed: {'; '.join(errors)}", "results": []}
 
+    # ---------- 引擎调度（对冲 + 自适应排序） ----------
+
+    def _run_engine(self, engine: str, query: str, max_results: int, timeout: int) -> Dict[str, Any]:
+        """执行单个引擎并记录延迟 / 成功率"""
+        fn = self._search_brave if engine == 'brave' else self._search_duckduckgo
+        t0 = time.time()
+        try:
+            result = fn(query, max_results, timeout)
+        except Exception as e:
+            result = {"success": False, "error": str(e), "results": []}
+        self._record_engine(engine, bool(result.get('success') and result.get('results')),
+                            time.time() - t0)
+        return result
+
+    @classmethod
+    def _record_engine(cls, engine: str, ok: bool, latency: float):
+        a = cls._STATS_ALPHA
+        with cls._engine_stats_lock:
+            st = cls._engine_stats.get(engine)
+            if st is None:
+                cls._engine_stats[engine] = {'latency': latency, 'success': 1.0 if ok else 0.0, 'calls': 1}
+                return
+            st['latency'] = (1 - a) * st['latency'] + a * latency
+            st['success'] = (1 - a) * st['success'] + a * (1.0 if ok else 0.0)
+            st['calls'] += 1
+
+    @classmethod
+    def _engine_order(cls) -> List[str]:
+        """按"期望成功耗时"（延迟 / 成功率）排序；无统计的引擎保持默认顺序"""
+        with cls._engine_stats_lock:
+            def _score(item):
+                idx, engine = item
+                st = cls._engine_stats.get(engine)
+                if st is None:
+                    return (0, idx)
+                return (st['latency'] / max(st['success'], 0.05), idx)
+            ranked = sorted(enumerate(cls._ENGINES), key=_score)
+        return [engine for _, engine in ranked]
+
+    @classmethod
+    def _hedge_delay(cls, engine: str, timeout: float) -> float:
+        """第二个引擎的对冲延迟
+
+        - 统计不足：使用默认延迟（不让每次早期搜索都双发）
+        - 首选引擎不稳定（成功率 < 0.8）：默认延迟的一半
+        - 首选引擎稳定：等它约 1.5 个典型延迟
+        """
+        cap = timeout / 4
+        with cls._engine_stats_lock:
+            st = cls._engine_stats.get(engine)
+            if st is None or st['calls'] < 3:
+                return min(cls._DEFAULT_HEDGE_DELAY, cap)
+            if st['success'] < 0.8:
+                return min(cls._DEFAULT_HEDGE_DELAY / 2, cap)
+            return min(st['latency'] * 1.5, cap)
+
+    @classmethod
+    def engine_stats(cls) -> Dict[str, Dict[str, float]]:
+        """各引擎延迟 / 成功率统计快照"""
+        with cls._engine_stats_lock:
+            return {k: dict(v) for k, v in cls._engine_stats.items()}
+
+    def _engine_host(self, engine: str) -> Optional[str]:
+        """引擎地址的主机名（工具线程池按主机限流的键）"""
+        from urllib.parse import urlparse
+        url = self.BRAVE_URL if engine == 'brave' else self.DUCKDUCKGO_URL
+        try:
+            return urlparse(url).netloc.lower() or None
+        except Exception:
+            return None
+
+    def _search_hedged(self, order: List[str], query: str, max_results: int,
+                       timeout: int, merge: bool) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+        """对冲搜索：返回 (结果或 None, 错误列表)
+
+        各引擎提交到工具线程池的 web 车道（按引擎主机限流）。
+        本调用自身通常也运行在 web 车道上：已发出的引擎排队超过 _STEAL_AFTER 仍未开始时，
+        取消其中一个改在当前线程执行，车道占满时也不会互相等待。
+        """
+        import concurrent.futures
+        pool = self._pool_getter()
+        enough = min(max_results, self._ENOUGH_RESULTS)
+        t_start = time.time()
+        deadline = t_start + timeout
+        delay = self._hedge_delay(order[0], timeout)
+
+        futures: Dict[Any, str] = {}
+        launched = 0
+        t_launch = t_start
+        ok_results: Dict[str, Dict[str, Any]] = {}
+        errors: List[str] = []
+
+        def _launch():
+            nonlocal launched, t_launch
+            engine = order[launched]
+            launched += 1
+            t_launch = time.time()
+            fut = pool.submit('web', self._run_engine, engine, query, max_results, timeout,
+                              host=self._engine_host(engine))
+            futures[fut] = engine
+
+        def _collect(engine: str, r: Dict[str, Any]):
+            if r.get('success') and r.get('results'):
+                ok_results[engine] = r
+            else:
+                errors.append(f"{engine}: {r.get('error', 'no results')}")
+
+        _launch()
+        pending = set(futures)
+        while True:
+            now = time.time()
+            if launched < len(order) and now < deadline and (now - t_start >= delay or not pending):
+                # 对冲延迟到期 / 已发出的引擎全部失败 → 发出下一个引擎
+                _launch()
+                pending = {f for f in futures if not f.done()}
+                continue
+            if not pending or now >= deadline:
+                break
+            idle = not any(f.running() for f in pending)
+            if idle and now - t_launch >= self._STEAL_AFTER:
+                stolen = next((f for f in pending if f.cancel()), None)
+                if stolen is not None:
+                    pending.discard(stolen)
+                    _collect(futures[stolen],
+                             self._run_engine(futures[stolen], query, max_results, timeout))
+                    if not merge and self._pick_enough(order, ok_results, enough):
+                        break
+                    continue
+            wait_t = deadline - now
+            if launched < len(order):
+                wait_t = min(wait_t, max(0.0, t_start + delay - now))
+            if idle:
+                wait_t = min(wait_t, self._STEAL_AFTER)
+            done, pending = concurrent.futures.wait(
+                pending, timeout=wait_t, return_when=concurrent.futures.FIRST_COMPLETED)
+            for fut in done:
+                if not fut.cancelled():
+                    _collect(futures[fut], fut.result())
+            if not merge and self._pick_enough(order, ok_results, enough):
+                break
+
+        for fut in pending:
+            fut.cancel()    # 尚未开始的对冲请求不再发出
+        if not merge:
+            r = self._pick_enough(order, ok_results, enough)
+            if r:
+                return r, errors
+        if not ok_results:
+            if pending:
+                errors.append(f"timeout after {timeout}s")
+            return None, errors
+        ranked = [ok_results[e] for e in order if e in ok_results]
+        if merge and len(ranked) > 1:
+            return self._merge_results(ranked, query, max_results), errors
+        # 结果不足 enough：取条数最多的
+        return max(ranked, key=lambda r: len(r['results'])), errors
+
+    @staticmethod
+    def _pick_enough(order: List[str], ok_results: Dict[str, Dict[str, Any]],
+                     enough: int) -> Optional[Dict[str, Any]]:
+        """按引擎优先级返回第一个结果数足够的引擎结果"""
+        for engine in order:
+            r = ok_results.get(engine)
+            if r and len(r['results']) >= enough:
+                return r
+        return None
+
+    @staticmethod
+    def _merge_results(ranked: List[Dict[str, Any]], query: str, max_results: int) -> Dict[str, Any]:
+        """按引擎优先级交错合并多个引擎的结果，URL 去重"""
+        from urllib.parse import urlparse
+
+        def _norm(url: str) -> str:
+            try:
+                p = urlparse(url)
+                host = p.netloc.lower()
+                if host.startswith('www.'):
+                    host = host[4:]
+                return f"{host}{p.path.rstrip('/')}?{p.query}"
+            except Exception:
+                return url
+
+        merged, seen = [], set()
+        lists = [r['results'] for r in ranked]
+        for i in range(max(len(l) for l in lists)):
+            for items in lists:
+                if i < len(items) and len(merged) < max_results:
+                    key = _norm(items[i].get('url', ''))
+                    if key not in seen:
+                        seen.add(key)
+                        merged.append(items[i])
+        return {"success": True, "query": query, "results": merged,
+                "source": '+'.join(r.get('source', '') for r in ranked)}
+
     # ---------- Brave Search ----------
 
     def _search_brave(self, query: str, max_results: int, timeout: int) -> Dict[str, Any]:
@@ -177,8 +440,8 @@ class WebSearcher:
             return {"success": False, "error": "requests not installed", "results": []}
         try:
             params = {'q': query, 'source': 'web'}
-            response = requests.get(
-                self.BRAVE_URL, params=params, headers=self._HEADERS, timeout=timeout,
+            response = self._session('brave').get(
+                self.BRAVE_URL, params=params, timeout=timeout,
             )
             response.raise_for_status()
             page_html = self._fix_encoding(response)
@@ -288,10 +551,9 @@ class WebSearcher:
             return {"success": False, "error": "requests not installed", "results": []}
         
         try:
-            response = requests.post(
+            response = self._session('duckduckgo').post(
                 self.DUCKDUCKGO_URL,
                 data={'q': query, 'b': '', 'kl': 'cn-zh'},
-                headers=self._HEADERS,
                 timeout=timeout,
             )
             response.raise_for_status()
@@ -373,13 +635,11 @@ class WebSearcher:
 
         try:
             # --- 页面缓存查找（翻页时复用已抓取的内容） ---
-            cached = self._page_cache.get(url)
-            if cached:
-                ts, cached_lines = cached
-                if (time.time() - ts) < self._PAGE_CACHE_TTL:
-                    return self._paginate_lines(url, cached_lines, start_line, max_lines)
+            cached_lines = self._page_cache.get(url)
+            if cached_lines:
+                return self._paginate_lines(url, cached_lines, start_line, max_lines)
 
-            response = requests.get(url, headers=self._HEADERS, timeout=timeout)
+            response = self._session('page').get(url, timeout=timeout)
             response.raise_for_status()
             
             # 修正编码（防乱码核心）
@@ -411,12 +671,9 @@ class WebSearcher:
                 if cleaned:
                     lines.append(cleaned)
 
-            # 缓存此页面（翻页时复用）
-            self._page_cache[url] = (time.time(), lines)
-            # 限制缓存大小
-            if len(self._page_cache) > 50:
-                oldest_key = min(self._page_cache, key=lambda k: self._page_cache[k][0])
-                del self._page_cache[oldest_key]
+            # 缓存此页面（翻页时复用，LRU 淘汰 + 磁盘持久化）
+            if lines:
+                self._page_cache.put(url, lines)
 
             return self._paginate_lines(url, lines, start_line, max_lines)
 
@@ -527,6 +784,10 @@ HOUDINI_TOOLS = [
                         "type": "string",
                         "description": "指定 NetworkBox 名称以查看其内部详细节点和连接。留空则显示概览（box 摘要 + 未分组节点）。"
                     },
+                    "since": {
+                        "type": "string",
+                        "description": "上次结果末尾的快照令牌（如 'ns3'）。传入后只返回此后新增/删除/修改的节点和连接（无变化时仅一行）；令牌过期或属于其他网络 / box 时自动返回完整结构。"
+                    },
                     "page": {
                         "type": "integer",
                         "description": "页码（从1开始），结果较多时翻页查看后续内容"
@@ -684,7 +945,7 @@ HOUDINI_TOOLS = [
         "type": "function",
         "function": {
             "name": "semantic_search_nodes",
-            "description": "通过自然语言描述搜索合适的节点类型。例如：'我需要在表面上随机分布点'会找到 scatter 节点。当你不确定用什么节点时使用此工具。",
+            "description": "通过自然语言描述搜索合适的节点类型。例如：'我需要在表面上随机分布点'会找到 scatter 节点。结果按相关性排序，包含已加载的自定义 HDA。当你不确定用什么节点时使用此工具。",
             "parameters": {
                 "type": "object",
                 "properties": {
@@ -724,7 +985,8 @@ HOUDINI_TOOLS = [
                 "type": "object",
                 "properties": {
                     "include_params": {"type": "boolean", "description": "是否包含参数详情，默认 true"},
-                    "include_geometry": {"type": "boolean", "description": "是否包含几何体信息，默认 false"}
+                    "include_geometry": {"type": "boolean", "description": "是否包含几何体信息，默认 false"},
+                    "attrib_stats": {"type": "boolean", "description": "include_geometry 时统计数值属性范围 / NaN / Inf（全量读取属性，大几何体较慢），默认 false"}
                 },
                 "required": []
             }
@@ -790,14 +1052,18 @@ HOUDINI_TOOLS = [
         "type": "function",
         "function": {
             "name": "find_nodes_by_param",
-            "description": "在网络中搜索具有特定参数值的节点。类似 grep 搜索。",
+            "description": "在网络中搜索具有特定参数值的节点。类似 grep 搜索。可组合 value / pattern / min / max 条件，结果分页。",
             "parameters": {
                 "type": "object",
                 "properties": {
                     "network_path": {"type": "string", "description": "搜索的网络路径，留空使用当前网络"},
                     "param_name": {"type": "string", "description": "参数名"},
                     "value": {"type": ["string", "number"], "description": "要匹配的值（可选，留空则列出所有有此参数的节点）"},
-                    "recursive": {"type": "boolean", "description": "是否递归搜索子网络，默认 true"}
+                    "pattern": {"type": "string", "description": "正则表达式，匹配参数值的字符串形式（可选）"},
+                    "min": {"type": "number", "description": "数值下限（含，可选）"},
+                    "max": {"type": "number", "description": "数值上限（含，可选）"},
+                    "recursive": {"type": "boolean", "description": "是否递归搜索子网络，默认 true"},
+                    "page": {"type": "integer", "description": "页码（从1开始），匹配节点较多时翻页查看"}
                 },
                 "required": ["param_name"]
             }
@@ -1345,6 +1611,10 @@ HOUDINI_TOOLS = [
                     "output_path": {
                         "type": "string",
                         "description": "可选：保存截图到指定文件路径（如 $HIP/snapshot.jpg）。未指定时截图仅传给模型做视觉分析。"
+                    },
+                    "max_tokens": {
+                        "type": "integer",
+                        "description": "发送给你的图片 token 预算，默认425（截图按此降采样，文件仍保存原分辨率）；需要看清细节时可调高（不会超过截图分辨率本身）"
                     }
                 },
                 "required": []
@@ -1363,6 +1633,342 @@ except Exception as _e:
     print(f"[AIClient] ToolRegistry 注册失败 (非致命): {_e}")
 
 
+# ============================================================
+# 推测执行：流式响应尚未结束时提前执行只读工具
+# ============================================================
+
+class _AsyncToolPool:
+    """AIClient 持有的常驻工具线程池（跨迭代 / 跨轮次复用）
+
+    分道执行，互不阻塞：
+      - web:     web_search / fetch_webpage，按主机限流（同一主机最多 host_limit 个并发）
+      - shell:   execute_shell，独立车道，长命令不占用 web 槽位
+      - general: 推测执行的 Houdini 只读工具、会话标题生成等后台任务
+
+    主机限流在提交时进行：同一主机的并发已满时任务留在该主机的等待队列里，
+    不进入车道、不占用线程；前一个同主机任务结束时再放行下一个。
+    被限流的主机因此不会堵住其他主机的请求（无队头阻塞）。
+
+    每条车道记录排队深度（已提交未开始，含主机等待队列）、运行数、峰值排队与平均等待时间。
+    """
+
+    _WEB_TOOLS = frozenset({'web_search', 'fetch_webpage'})
+    _SHELL_TOOLS = frozenset({'execute_shell'})
+
+    def __init__(self, web_workers: int = 8, shell_workers: int = 4,
+                 general_workers: int = 4, host_limit: int = 2):
+        import concurrent.futures
+        self._lanes = {
+            'web': concurrent.futures.ThreadPoolExecutor(
+                max_workers=web_workers, thread_name_prefix='tool-web'),
+            'shell': concurrent.futures.ThreadPoolExecutor(
+                max_workers=shell_workers, thread_name_prefix='tool-shell'),
+            'general': concurrent.futures.ThreadPoolExecutor(
+                max_workers=general_workers, thread_name_prefix='tool-bg'),
+        }
+        self._host_limit = host_limit
+        self._host_active: Dict[str, int] = {}
+        self._host_waiting: Dict[str, Any] = {}    # 主机 → deque[(lane, job)]
+        self._lock = threading.Lock()
+        self._stats = {lane: {'submitted': 0, 'started': 0, 'finished': 0,
+                              'peak_queued': 0, 'wait_total': 0.0, 'host_held': 0}
+                       for lane in self._lanes}
+
+    @classmethod
+    def lane_for(cls, tool_name: str) -> str:
+        if tool_name in cls._WEB_TOOLS:
+            return 'web'
+        if tool_name in cls._SHELL_TOOLS:
+            return 'shell'
+        return 'general'
+
+    @staticmethod
+    def host_for(tool_name: str, arguments: dict) -> Optional[str]:
+        """限流主机键：fetch_webpage 取 URL 主机名
+
+        web_search 不在工具级限流：一次搜索会访问多个引擎，
+        对冲请求由 WebSearcher 以各引擎主机为键提交到 web 车道。
+        """
+        if tool_name == 'fetch_webpage':
+            from urllib.parse import urlparse
+            try:
+                return urlparse(str(arguments.get('url', ''))).netloc.lower() or None
+            except Exception:
+                return None
+        return None
+
+    def submit(self, lane: str, fn: Callable, *args, host: Optional[str] = None):
+        """提交任务到指定车道，返回 Future（主机并发已满时先进入该主机的等待队列）"""
+        import concurrent.futures
+        from collections import deque
+        st = self._stats[lane]
+        t_submit = time.time()
+        future = concurrent.futures.Future()
+
+        def _run():
+            if not future.set_running_or_notify_cancel():
+                self._finish(lane, host, started=False)
+                return
+            with self._lock:
+                st['started'] += 1
+                st['wait_total'] += time.time() - t_submit
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                self._finish(lane, host, started=True)
+
+        with self._lock:
+            st['submitted'] += 1
+            queued = st['submitted'] - st['started']
+            if queued > st['peak_queued']:
+                st['peak_queued'] = queued
+            if host is not None:
+                if self._host_active.get(host, 0) >= self._host_limit:
+                    self._host_waiting.setdefault(host, deque()).append((lane, _run))
+                    st['host_held'] += 1
+                    return future
+                self._host_active[host] = self._host_active.get(host, 0) + 1
+        self._lanes[lane].submit(_run)
+        return future
+
+    def _finish(self, lane: str, host: Optional[str], started: bool):
+        """任务结束（或在排队中被取消）：放行同主机的下一个等待任务"""
+        nxt = None
+        with self._lock:
+            st = self._stats[lane]
+            if started:
+                st['finished'] += 1
+            else:
+                # 已取消的任务不计入等待时间，直接视为开始即结束
+                st['started'] += 1
+                st['finished'] += 1
+            if host is not None:
+                waiting = self._host_waiting.get(host)
+                if waiting:
+                    nxt = waiting.popleft()
+                    self._stats[nxt[0]]['host_held'] -= 1
+                    if not waiting:
+                        del self._host_waiting[host]
+                else:
+                    left = self._host_active.get(host, 1) - 1
+                    if left > 0:
+                        self._host_active[host] = left
+                    else:
+                        self._host_active.pop(host, None)
+        if nxt is not None:
+            # 名额直接转交给下一个同主机任务
+            self._lanes[nxt[0]].submit(nxt[1])
+
+    def submit_tool(self, tool_name: str, arguments: dict, fn: Callable, *args):
+        """按工具名自动选择车道和限流主机"""
+        return self.submit(self.lane_for(tool_name), fn, *args,
+                           host=self.host_for(tool_name, arguments))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各车道排队 / 运行指标快照"""
+        with self._lock:
+            out = {}
+            for lane, st in self._stats.items():
+                started = st['started']
+                out[lane] = {
+                    'queued': st['submitted'] - started,
+                    'host_held': st['host_held'],
+                    'running': started - st['finished'],
+                    'completed': st['finished'],
+                    'peak_queued': st['peak_queued'],
+                    'avg_wait': (st['wait_total'] / started) if started else 0.0,
+                }
+            return out
+
+    def shutdown(self):
+        for ex in self._lanes.values():
+            ex.shutdown(wait=False, cancel_futures=True)
+
+
+class _SpeculativeToolRunner:
+    """在模型仍在流式输出时，提前执行参数已完整的只读工具调用
+
+    - offer_partial(): tool_args_delta 到达时检查参数 JSON 是否已完整，完整即提交
+    - offer():         工具调用定稿（或 Anthropic content_block_stop）时提交
+    - take():          本轮 tool_calls 定稿后按签名取回结果（阻塞等待）
+    - cancel():        停止 / 重试时丢弃所有未取回的任务
+
+    只对本轮"只读前缀"推测：一旦流中出现非只读工具，后续调用不再推测，
+    保证不会读到尚未执行的写操作之前的旧状态。
+    """
+
+    def __init__(self, pool: '_AsyncToolPool', run_fn: Callable[[str, dict], dict],
+                 eligible: frozenset, stop_event,
+                 skip_fn: Optional[Callable[[str], bool]] = None):
+        self._pool = pool
+        self._run_fn = run_fn
+        self._eligible = eligible
+        self._stop_event = stop_event
+        self._skip_fn = skip_fn
+        self._futures: Dict[str, Any] = {}        # signature -> Future
+        self._timing: Dict[str, Tuple[float, float]] = {}  # signature -> (start, end)
+        self._offered_idx: set = set()            # 已提交的流式 index
+        self._consumed: List[str] = []            # 本轮已取回的签名
+        self._barrier = False                     # 出现非只读工具后停止推测
+
+    @staticmethod
+    def signature(name: str, args: dict) -> str:
+        return f"{name}:{json.dumps(args, sort_keys=True)}"
+
+    def offer_partial(self, index: Any, name: str, accumulated: str):
+        """流式参数增量：参数 JSON 闭合且可解析时提交"""
+        if self._barrier or index in self._offered_idx or not name:
+            return
+        if name not in self._eligible:
+            self._barrier = True
+            return
+        acc = accumulated.rstrip()
+        if not acc.endswith('}'):
+            return
+        try:
+            args = json.loads(acc)
+        except (json.JSONDecodeError, ValueError):
+            return
+        if isinstance(args, dict):
+            self._offered_idx.add(index)
+            self.offer(name, args)
+
+    def offer(self, name: str, args: dict):
+        """提交单个工具调用（同一签名只提交一次）"""
+        if self._barrier:
+            return
+        if name not in self._eligible:
+            self._barrier = True
+            return
+        sig = self.signature(name, args)
+        if sig in self._futures or (self._skip_fn and self._skip_fn(sig)):
+            return
+
+        def _job():
+            if self._stop_event.is_set():
+                return {"success": False, "error": "用户已请求停止"}
+            t0 = time.time()
+            try:
+                return self._run_fn(name, args)
+            except Exception as e:
+                return {"success": False, "error": str(e)}
+            finally:
+                self._timing[sig] = (t0, time.time())
+
+        self._futures[sig] = self._pool.submit_tool(name, args, _job)
+
+    def take(self, name: str, args: dict) -> Optional[dict]:
+        """取回推测结果；未推测或已取消返回 None（调用方走常规执行）"""
+        sig = self.signature(name, args)
+        fut = self._futures.pop(sig, None)
+        if fut is None or fut.cancelled():
+            return None
+        try:
+            result = fut.result()
+        except Exception:
+            return None
+        if self._stop_event.is_set():
+            return None
+        self._consumed.append(sig)
+        return result
+
+    def overlap_seconds(self, stream_end: float) -> float:
+        """已取回的推测调用与流式生成重叠的时长（即本轮节省的墙钟时间）"""
+        saved = 0.0
+        for sig in self._consumed:
+            span = self._timing.get(sig)
+            if span:
+                saved += max(0.0, min(span[1], stream_end) - span[0])
+        return saved
+
+    @property
+    def consumed_count(self) -> int:
+        return len(self._consumed)
+
+    def cancel(self):
+        """丢弃所有未取回的任务（未开始的直接取消，运行中的结果被忽略）"""
+        for fut in self._futures.values():
+            fut.cancel()
+        self._futures.clear()
+
+
+class _PreCompactor:
+    """提前摘要：上下文越过低水位后，在后台为最老的轮次生成 LLM 摘要
+
+    - maybe_start(): 每轮迭代前调用，上下文 ≥ WATERMARK 时异步摘要 rounds[:-KEEP_RECENT]
+    - lookup():      压缩阶段取回覆盖最长前缀的摘要（正在生成的会等待其完成）
+    - 摘要按其覆盖的消息对象序列（id）精确匹配：之后的分级压缩只会原地修改这些
+      消息的内容，不影响匹配；消息被替换 / 删除则不再命中，回退为同步摘要
+    """
+
+    WATERMARK = 0.55      # 低水位：上下文占 context_limit 的比例
+    KEEP_RECENT = 3       # 与 _llm_summarize_history 一致：保留最近 3 轮完整
+    MIN_ROUNDS = 6        # 与 _smart_compress_in_loop 第 4 步的触发条件一致
+    MAX_ENTRIES = 4
+    WAIT_TIMEOUT = 20.0   # 压缩阶段等待进行中摘要的最长时间
+
+    def __init__(self, pool: '_AsyncToolPool', summarize_fn: Callable[[list], Optional[str]]):
+        self._pool = pool
+        self._summarize = summarize_fn
+        self._lock = threading.Lock()
+        self._entries: List[Dict[str, Any]] = []
+
+    @staticmethod
+    def _key(rounds: list) -> tuple:
+        return tuple(id(m) for rnd in rounds for m in rnd)
+
+    def maybe_start(self, rounds: list) -> bool:
+        """为 rounds[:-KEEP_RECENT] 启动后台摘要（已有相同覆盖或有任务在跑时跳过）"""
+        if len(rounds) < self.MIN_ROUNDS:
+            return False
+        target = rounds[:-self.KEEP_RECENT]
+        key = self._key(target)
+        with self._lock:
+            for e in self._entries:
+                if e['key'] == key or not e['future'].done():
+                    return False
+            entry = {
+                'key': key,
+                'n_rounds': len(target),
+                'msgs': [m for rnd in target for m in rnd],  # 持有引用，保证 id 不被复用
+                'summary': None,
+            }
+            entry['future'] = self._pool.submit('general', self._run, entry, list(target))
+            self._entries.append(entry)
+            if len(self._entries) > self.MAX_ENTRIES:
+                self._entries.pop(0)
+        print(f"[AI Client] 📝 上下文越过 {int(self.WATERMARK * 100)}% 水位，后台预摘要 {len(target)} 轮")
+        return True
+
+    def _run(self, entry: Dict[str, Any], rounds: list):
+        t0 = time.time()
+        entry['summary'] = self._summarize(rounds)
+        if entry['summary']:
+            print(f"[AI Client] 📝 预摘要完成: {entry['n_rounds']} 轮, {time.time() - t0:.1f}s")
+
+    def lookup(self, rounds: list) -> Tuple[int, Optional[str]]:
+        """返回 (覆盖的轮数, 摘要)；无可用摘要返回 (0, None)"""
+        with self._lock:
+            candidates = sorted(self._entries, key=lambda e: -e['n_rounds'])
+        for e in candidates:
+            k = e['n_rounds']
+            if k > len(rounds) or self._key(rounds[:k]) != e['key']:
+                continue
+            try:
+                e['future'].result(timeout=self.WAIT_TIMEOUT)
+            except Exception:
+                continue
+            if e['summary']:
+                return k, e['summary']
+        return 0, None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
 # ============================================================
 # AI 客户端
 # ============================================================
@@ -1405,7 +2011,7 @@ class AIClient:
             'custom': self._read_api_key('custom'),
         }
         self._ssl_context = self._create_ssl_context()
-        self._web_searcher = WebSearcher()
+        self._web_searcher = WebSearcher(pool_getter=self._get_tool_pool)
         self._tool_executor: Optional[Callable[[str, dict], dict]] = None
         self._batch_tool_executor: Optional[Callable[[list], list]] = None
         
@@ -1426,7 +2032,29 @@ class AIClient:
         # 停止控制（使用 threading.Event 保证线程安全）
         import threading
         self._stop_event = threading.Event()
-    
+
+        # ★ 常驻工具线程池（web / shell / 后台分道，延迟创建，跨迭代复用）
+        self._tool_pool: Optional[_AsyncToolPool] = None
+        self._tool_pool_lock = threading.Lock()
+        
+        # ★ 会话级只读工具结果缓存（按场景版本号失效）
+        self._tool_result_cache = ToolResultCache()
+        
+        # ★ Anthropic 协议增量转换缓存（每条消息只转换一次，见 _build_anthropic_request）
+        from collections import OrderedDict
+        self._anth_msg_cache: "OrderedDict[bytes, tuple]" = OrderedDict()  # 指纹 → (kind, payload, 字节数)
+        self._anth_digest_memo: "OrderedDict[int, tuple]" = OrderedDict()  # id(msg) → (msg, 内容引用, 摘要, 字节数)
+        self._anth_msg_cache_bytes = 0
+        self._anth_digest_memo_bytes = 0
+        self._anth_tools_cache: Optional[tuple] = None   # (工具 dict 列表, 转换结果)
+        # 各会话上次请求的消息指纹（判断不变前缀）：(调用方, 首条消息指纹) → fps
+        self._anth_prev_fps: "OrderedDict[tuple, List[tuple]]" = OrderedDict()
+        self._anth_cache_lock = threading.Lock()
+        self._anthropic_prompt_cache = self._load_prompt_cache_flag()
+        
+        # ★ 提前摘要（上下文越过低水位后后台生成，压缩时直接拼接）
+        self._precompactor: Optional[_PreCompactor] = None
+
     def request_stop(self):
         """请求停止当前请求（线程安全）"""
         self._stop_event.set()
@@ -1439,6 +2067,19 @@ class AIClient:
         """检查是否请求了停止（线程安全）"""
         return self._stop_event.is_set()
 
+    def get_tool_cache_stats(self) -> Dict[str, Any]:
+        """只读工具结果缓存的命中统计（供 Token 分析面板显示）"""
+        return self._tool_result_cache.stats()
+
+    def clear_precompact(self):
+        """丢弃后台预摘要（切换 / 清空会话时调用：摘要只对原会话的消息有效）"""
+        if self._precompactor is not None:
+            self._precompactor.clear()
+
+    def reset_tool_cache_stats(self):
+        """重置只读工具结果缓存的命中统计（缓存条目保留）"""
+        self._tool_result_cache.reset_stats()
+
     def set_tool_executor(self, executor: Callable[..., dict]):
         """设置工具执行器
         
@@ -1454,6 +2095,77 @@ class AIClient:
         """
         self._batch_tool_executor = executor
 
+    # ----------------------------------------------------------
+    # 推测执行：流式生成期间提前运行只读工具
+    # ----------------------------------------------------------
+
+    # 可推测执行的工具：无副作用、结果只取决于参数和当前场景
+    # （perf_start_profile / capture_viewport 等有副作用或开销大的不参与）
+    _SPECULATIVE_TOOLS = frozenset({
+        'get_network_structure', 'get_node_parameters', 'list_children',
+        'read_selection', 'search_node_types', 'semantic_search_nodes',
+        'find_nodes_by_param', 'get_node_inputs', 'check_errors',
+        'search_local_doc', 'get_houdini_node_doc', 'list_skills',
+        'get_node_positions', 'list_network_boxes',
+        'web_search', 'fetch_webpage',
+    })
+
+    def _get_tool_pool(self) -> '_AsyncToolPool':
+        """获取常驻工具线程池（延迟创建，线程安全）"""
+        if self._tool_pool is None:
+            with self._tool_pool_lock:
+                if self._tool_pool is None:
+                    self._tool_pool = _AsyncToolPool()
+        return self._tool_pool
+
+    def get_tool_pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        """常驻工具线程池各车道的排队深度 / 等待时间指标"""
+        return self._get_tool_pool().stats()
+
+    def get_runtime_stats(self) -> Dict[str, Any]:
+        """运行时指标汇总（供 Token 分析面板显示）"""
+        from .tool_router import get_tool_router
+        return {
+            'tool_pool': self.get_tool_pool_stats(),
+            'web_engines': WebSearcher.engine_stats(),
+            'tool_router': get_tool_router().stats(),
+        }
+
+    def submit_background(self, fn: Callable, *args):
+        """在常驻线程池的后台车道执行任务（如会话标题生成），返回 Future"""
+        return self._get_tool_pool().submit('general', fn, *args)
+
+    def _execute_async_tool(self, tool_name: str, arguments: dict) -> dict:
+        """执行可在后台线程运行的工具（web_search / fetch_webpage / execute_shell）"""
+        if tool_name == 'web_search':
+            return self._execute_web_search(arguments)
+        if tool_name == 'fetch_webpage':
+            return self._execute_fetch_webpage(arguments)
+        return self._tool_executor(tool_name, **arguments)
+
+    def _run_async_tools(self, calls: list) -> list:
+        """在常驻线程池中并发执行 [(tool_name, arguments), ...]，按原顺序返回结果"""
+        pool = self._get_tool_pool()
+        futures = [pool.submit_tool(tname, targs, self._execute_async_tool, tname, targs)
+                   for tname, targs in calls]
+        results = []
+        for fut in futures:
+            try:
+                results.append(fut.result())
+            except Exception as e:
+                results.append({"success": False, "error": str(e)})
+        return results
+
+    def _run_speculative_tool(self, tool_name: str, arguments: dict) -> dict:
+        """执行单个推测调用：web 工具在线程池内直接执行，Houdini 只读工具走批量执行器"""
+        if tool_name in _AsyncToolPool._WEB_TOOLS:
+            return self._execute_async_tool(tool_name, arguments)
+        if self._batch_tool_executor:
+            results = self._batch_tool_executor([(tool_name, arguments)])
+            if results:
+                return results[0]
+        return self._tool_executor(tool_name, **arguments)
+
     # ----------------------------------------------------------
     # 工具结果分页：按行分段，让 AI 自主判断是否需要更多
     # ----------------------------------------------------------
@@ -1579,32 +2291,30 @@ class AIClient:
     # ----------------------------------------------------------
 
     @staticmethod
-    def _strip_image_content(messages: list, keep_recent_user: int = 0) -> int:
+    def _strip_image_content(messages: list, keep_recent_user: int = 0,
+                             index: Optional[ConversationIndex] = None) -> int:
         """就地剥离消息中的 image_url 内容，将多模态 content 转为纯文本
 
         Args:
             messages: 消息列表（就地修改）
             keep_recent_user: 保留最近 N 条 user 消息的图片（0 = 全部剥离）
+            index: 跨迭代复用的结构索引（None 时临时构建）
 
         Returns:
             剥离的图片数量
         """
         stripped = 0
+        index = (index or ConversationIndex()).sync(messages)
 
-        # 找出最近 N 条 user 消息的索引（从后往前）
-        protected_indices: set = set()
-        if keep_recent_user > 0:
-            count = 0
-            for i in range(len(messages) - 1, -1, -1):
-                if messages[i].get('role') == 'user':
-                    protected_indices.add(i)
-                    count += 1
-                    if count >= keep_recent_user:
-                        break
+        # 最近 N 条 user 消息的图片受保护
+        protected_indices = set(index.recent_user_positions(keep_recent_user))
 
-        for idx, msg in enumerate(messages):
+        # ★ 只访问索引记录的含图片消息，无需遍历全部消息
+        for idx in list(index.image_positions):
+            msg = messages[idx]
             content = msg.get('content')
             if not isinstance(content, list):
+                index.discard_image(idx)
                 continue
             if idx in protected_indices:
                 continue
@@ -1629,15 +2339,41 @@ class AIClient:
                 else:
                     combined = '[图片已移除]'
                 msg['content'] = combined
+                index.discard_image(idx)
 
         return stripped
 
+    @staticmethod
+    def _image_in_context(messages: list, url: str) -> bool:
+        """图片（data URL）是否仍在上下文中（未被 _strip_image_content 剥离 / 未被压缩掉）"""
+        for msg in reversed(messages):
+            content = msg.get('content')
+            if not isinstance(content, list):
+                continue
+            for part in content:
+                if (isinstance(part, dict) and part.get('type') == 'image_url'
+                        and (part.get('image_url') or {}).get('url') == url):
+                    return True
+        return False
+
+    @classmethod
+    def _viewport_attachment(cls, result: dict, messages: list,
+                             supports_vision: bool) -> Optional[str]:
+        """capture_viewport 结果需附加的图片 data URL；视口未变化且上一张仍在上下文中时返回 None"""
+        if not supports_vision or not isinstance(result, dict) or not result.get('_viewport_image'):
+            return None
+        url = f"data:{result.get('_image_media_type', 'image/jpeg')};base64,{result['_viewport_image']}"
+        if result.get('_viewport_unchanged') and cls._image_in_context(messages, url):
+            return None
+        return url
+
     # ----------------------------------------------------------
     # 渐进式裁剪
     # ----------------------------------------------------------
 
     def _progressive_trim(self, working_messages: list, tool_calls_history: list,
-                          trim_level: int = 1, supports_vision: bool = True) -> list:
+                          trim_level: int = 1, supports_vision: bool = True,
+                          index: Optional[ConversationIndex] = None) -> list:
         """渐进式裁剪上下文，根据 trim_level 逐步加大裁剪力度
 
         Cursor 风格核心原则:
@@ -1654,38 +2390,27 @@ class AIClient:
         """
         if not working_messages:
             return working_messages
+        index = (index or ConversationIndex()).sync(working_messages)
 
         # ── 第 0 步：剥离图片（base64 图片是 413 的主因）──
         if not supports_vision or trim_level >= 3:
             # 非视觉模型 或 重度裁剪：剥离所有图片
-            n_stripped = self._strip_image_content(working_messages, keep_recent_user=0)
+            n_stripped = self._strip_image_content(working_messages, keep_recent_user=0, index=index)
         elif trim_level == 2:
             # 中度裁剪：只保留最近 1 条 user 消息的图片
-            n_stripped = self._strip_image_content(working_messages, keep_recent_user=1)
+            n_stripped = self._strip_image_content(working_messages, keep_recent_user=1, index=index)
         else:
             # 轻度裁剪：保留最近 2 条 user 消息的图片
-            n_stripped = self._strip_image_content(working_messages, keep_recent_user=2)
+            n_stripped = self._strip_image_content(working_messages, keep_recent_user=2, index=index)
 
         if n_stripped > 0:
             print(f"[AI Client] 裁剪: 剥离了 {n_stripped} 张图片")
 
-        sys_msg = working_messages[0] if working_messages[0].get('role') == 'system' else None
-        body = working_messages[1:] if sys_msg else working_messages[:]
-
-        if not body:
+        # --- 划分轮次：以 user 消息为分界（来自索引）---
+        sys_msg, rounds = index.split(working_messages)
+        if not rounds:
             return working_messages
 
-        # --- 划分轮次：以 user 消息为分界 ---
-        rounds = []  # [[msg, msg, ...], ...]
-        current_round = []
-        for m in body:
-            if m.get('role') == 'user' and current_round:
-                rounds.append(current_round)
-                current_round = []
-            current_round.append(m)
-        if current_round:
-            rounds.append(current_round)
-
         if trim_level <= 1:
             # 轻度：只压缩非最近 30% 轮次的 tool 结果
             n_rounds = len(rounds)
@@ -1941,45 +2666,35 @@ class AIClient:
     })
 
     @classmethod
-    def _mark_stale_tool_results(cls, working_messages: list) -> int:
+    def _mark_stale_tool_results(cls, working_messages: list,
+                                 index: Optional[ConversationIndex] = None,
+                                 protected: frozenset = frozenset()) -> int:
         """检测并压缩过时的工具结果。
 
         当同一个查询工具以相同/重叠参数被多次调用时，早期的结果已过时
         （AI 已有更新的数据）。将早期结果替换为简短标记以节省 token。
+        protected: 被去重引用（[Same] / [Diff]）的基准消息 id()，其内容是较新结果的唯一来源，不标记。
 
         Returns:
             被标记为过时的工具结果数量
         """
-        # 收集 tool 消息的 (tool_call_id → 工具名, 参数) 映射
-        # 需要从 assistant 的 tool_calls 中提取工具名和参数
-        tc_id_to_info: Dict[str, Tuple[str, str]] = {}  # tc_id → (tool_name, key_arg)
-        for msg in working_messages:
-            if msg.get('role') == 'assistant' and 'tool_calls' in msg:
-                for tc in msg.get('tool_calls', []):
-                    tc_id = tc.get('id', '')
-                    fn = tc.get('function', {})
-                    name = fn.get('name', '')
-                    args_str = fn.get('arguments', '{}')
-                    # 提取关键参数（通常是 node_path 或 network_path）
-                    try:
-                        args = json.loads(args_str)
-                    except Exception:
-                        args = {}
-                    key_arg = args.get('node_path', '') or args.get('network_path', '') or args.get('box_name', '')
-                    if tc_id and name:
-                        tc_id_to_info[tc_id] = (name, key_arg)
+        index = (index or ConversationIndex()).sync(working_messages)
 
-        # 从后往前扫描 tool 消息，记录每个 (tool_name, key_arg) 最后出现的位置
-        latest_seen: Dict[str, int] = {}  # "(tool_name):(key_arg)" → 最后出现的消息索引
+        # 按索引中的 tool 消息位置 → (工具名, 关键参数)
         tool_msg_indices = []
-        for i, msg in enumerate(working_messages):
-            if msg.get('role') == 'tool':
-                tc_id = msg.get('tool_call_id', '')
-                info = tc_id_to_info.get(tc_id)
-                if info:
-                    tool_msg_indices.append((i, info[0], info[1]))
+        for i in index.tool_positions:
+            tc_id = working_messages[i].get('tool_call_id', '')
+            name = index.tool_name(tc_id)
+            if not name:
+                continue
+            # 提取关键参数（通常是 node_path 或 network_path）
+            args = index.tool_args(tc_id)
+            key_arg = args.get('node_path', '') or args.get('network_path', '') or args.get('box_name', '')
+            tool_msg_indices.append((i, name, key_arg))
+
+        # 从后往前记录每个 (tool_name, key_arg) 最后出现的位置
+        latest_seen: Dict[str, int] = {}  # "(tool_name):(key_arg)" → 最后出现的消息索引
 
-        # 反向记录最后出现位置
         for idx, tool_name, key_arg in reversed(tool_msg_indices):
             sig = f"{tool_name}:{key_arg}"
             if sig not in latest_seen:
@@ -1991,7 +2706,7 @@ class AIClient:
             if tool_name not in cls._STALEABLE_TOOLS:
                 continue
             sig = f"{tool_name}:{key_arg}"
-            if sig in latest_seen and latest_seen[sig] != idx:
+            if sig in latest_seen and latest_seen[sig] != idx and id(working_messages[idx]) not in protected:
                 # 此消息不是最新的 → 过时
                 content = working_messages[idx].get('content', '')
                 if content and not content.startswith('[Stale]'):
@@ -2002,6 +2717,113 @@ class AIClient:
 
         return stale_count
 
+    @staticmethod
+    def _repair_dedup_refs(dedup: ToolResultDedup, working_messages: list):
+        """压缩 / 裁剪后：基准消息已被改写或移出上下文的 [Same] / [Diff] 引用还原为完整结果"""
+        restored = dedup.repair(working_messages)
+        if restored:
+            print(f"[AI Client] ♻️ {restored} 个去重引用的基准结果已被压缩，引用已还原为完整结果")
+
+    # ----------------------------------------------------------
+    # ★ 工具结果相关性排序（压缩阶段优先处理与当前目标无关的结果）
+    # ----------------------------------------------------------
+
+    _RELEVANCE_MAX_CANDIDATES = 48   # 每次最多为最近 48 个候选打分，更早的按年龄排在最前
+    _RELEVANCE_TEXT_CHARS = 512      # 每条结果只取前 512 字符编码
+    _RELEVANCE_VEC_CACHE_MAX = 512
+    _relevance_vec_cache: "OrderedDict[str, Any]" = None  # 文本哈希 → 向量（跨迭代复用）
+    _relevance_vec_lock = threading.Lock()  # ★ 缓存为类级共享，多个会话线程会并发读写 / 淘汰
+
+    @staticmethod
+    def _message_text(msg: dict) -> str:
+        content = msg.get('content') or ''
+        if isinstance(content, list):
+            return ' '.join(p.get('text', '') for p in content
+                            if isinstance(p, dict) and p.get('type') == 'text')
+        return content if isinstance(content, str) else ''
+
+    def _relevance_query(self, working_messages: list, index: ConversationIndex) -> str:
+        """当前目标 = 最近的 user 消息 + 最近一条有文字的 assistant 消息（计划 / 思路）"""
+        parts = []
+        if index.user_positions:
+            parts.append(self._message_text(working_messages[index.user_positions[-1]])[:1000])
+        for m in reversed(working_messages):
+            if m.get('role') == 'assistant':
+                text = self._message_text(m)
+                if text.strip():
+                    parts.append(text[:1000])
+                    break
+        return '\n'.join(parts)
+
+    def _rank_by_relevance(self, working_messages: list, positions: list,
+                           index: ConversationIndex) -> list:
+        """按与当前目标的相关性升序排列 tool 消息下标（最不相关的在前）
+
+        - embedder 未加载 / numpy 不可用时保持原顺序（按年龄，最老在前）并在后台预热
+        - 只为最近 _RELEVANCE_MAX_CANDIDATES 个候选打分，更早的候选保持年龄顺序排在最前
+        - 向量按文本哈希缓存，同一结果跨迭代只编码一次；打分为一次矩阵乘法
+        """
+        if len(positions) < 2:
+            return positions
+        try:
+            from .embedding import get_embedder_if_loaded
+            embedder = get_embedder_if_loaded()
+        except Exception:
+            return positions  # numpy / embedding 模块不可用
+        if embedder is None:
+            try:
+                from .embedding import get_embedder
+                self.submit_background(get_embedder)  # 预热，下次压缩可用
+            except Exception:
+                pass
+            return positions
+
+        query = self._relevance_query(working_messages, index)
+        if not query.strip():
+            return positions
+        try:
+            import hashlib
+            import numpy as np
+            from collections import OrderedDict
+
+            head = positions[:-self._RELEVANCE_MAX_CANDIDATES]
+            scored = positions[-self._RELEVANCE_MAX_CANDIDATES:]
+            texts = []
+            for i in scored:
+                m = working_messages[i]
+                name = index.tool_name(m.get('tool_call_id', ''))
+                texts.append(f"{name}: {self._message_text(m)[:self._RELEVANCE_TEXT_CHARS]}")
+            keys = [hashlib.md5(t.encode('utf-8', 'ignore')).hexdigest() for t in texts]
+            # ★ 命中在锁内快照：之后其他线程淘汰缓存也不影响本次打分
+            with AIClient._relevance_vec_lock:
+                cache = AIClient._relevance_vec_cache
+                if cache is None:
+                    cache = AIClient._relevance_vec_cache = OrderedDict()
+                vec_of = {}
+                for k in dict.fromkeys(keys):
+                    v = cache.get(k)
+                    if v is not None:
+                        cache.move_to_end(k)
+                        vec_of[k] = v
+            missing = [k for k in dict.fromkeys(keys) if k not in vec_of]
+            if missing:
+                # 编码在锁外进行（可能较慢），完成后再写回缓存
+                text_of = dict(zip(keys, texts))
+                fresh = dict(zip(missing, embedder.encode_batch([text_of[k] for k in missing])))
+                vec_of.update(fresh)
+                with AIClient._relevance_vec_lock:
+                    cache.update(fresh)
+                    while len(cache) > self._RELEVANCE_VEC_CACHE_MAX:
+                        cache.popitem(last=False)
+            matrix = np.stack([vec_of[k] for k in keys])
+            scores = embedder.batch_cosine_similarity(embedder.encode(query), matrix)
+            # 稳定排序：分数相同时较老的在前
+            order = sorted(range(len(scored)), key=lambda j: (float(scores[j]), j))
+            return head + [scored[j] for j in order]
+        except Exception as e:
+            print(f"[AI Client] 相关性打分失败，按年龄顺序压缩: {e}")
+            return positions
+
     # ----------------------------------------------------------
     # ★ 主动式上下文压缩（agent_loop 内使用）
     # ----------------------------------------------------------
@@ -2035,23 +2857,57 @@ class AIClient:
                     total += len(fn.get('name', '')) + len(fn.get('arguments', '')) // 3 + 8
             total += 4  # 消息格式开销
 
-        # 工具定义 token（每个工具 ~100-200 tokens）
+        # 工具定义 token（每个工具 ~100-200 tokens；按列表对象缓存，同一轮迭代不重复序列化）
         if tools:
-            for t in tools:
-                fn = t.get('function', {})
-                total += len(fn.get('description', '')) // 4
-                params = fn.get('parameters', {})
-                total += len(json.dumps(params)) // 4 if params else 0
-                total += 30  # 函数结构开销
+            from .tool_registry import estimate_tools_tokens
+            total += estimate_tools_tokens(tools)
 
         return total
 
+    @staticmethod
+    def _split_rounds(messages: list, index: Optional[ConversationIndex] = None) -> tuple:
+        """拆分为 (系统消息或 None, 轮次列表)，轮次以 user 消息为分界"""
+        return (index or ConversationIndex()).sync(messages).split(messages)
+
+    def _summary_model(self, model: str = '', provider: str = '') -> tuple:
+        """摘要使用的 (model, provider)：优先 deepseek-chat，否则用当前模型"""
+        if self._get_api_key('deepseek'):
+            return 'deepseek-chat', 'deepseek'
+        return model or 'gpt-5.2', provider or 'openai'
+
+    def _get_precompactor(self) -> '_PreCompactor':
+        if self._precompactor is None:
+            from houdini_agent.utils.token_optimizer import LLMSummarizer
+
+            def _summarize(rounds):
+                m, p = self._summary_model()
+                return LLMSummarizer.summarize_rounds(ai_client=self, rounds=rounds, model=m, provider=p)
+
+            self._precompactor = _PreCompactor(self._get_tool_pool(), _summarize)
+        return self._precompactor
+
+    def _maybe_precompact(self, working_messages: list, est_tokens: int, context_limit: int,
+                          index: Optional[ConversationIndex] = None):
+        """上下文越过低水位（但未到压缩阈值）时，后台提前摘要最老的轮次"""
+        if est_tokens < context_limit * _PreCompactor.WATERMARK:
+            return
+        try:
+            _, rounds = self._split_rounds(working_messages, index)
+            self._get_precompactor().maybe_start(rounds)
+        except Exception as e:
+            print(f"[AI Client] 预摘要启动失败: {e}")
+
     def _smart_compress_in_loop(self, working_messages: list,
                                 tool_calls_history: list,
                                 context_limit: int,
-                                supports_vision: bool = True) -> list:
+                                supports_vision: bool = True,
+                                index: Optional[ConversationIndex] = None,
+                                dedup: Optional[ToolResultDedup] = None) -> list:
         """主动式上下文压缩，在 agent loop 内每轮迭代前调用。
 
+        dedup 非空时，被 [Same] / [Diff] 引用的基准消息不做过时标记 / 分级压缩；
+        裁剪掉基准消息后由调用方 dedup.repair() 还原引用消息。
+
         分层压缩策略：
         1. 标记过时工具结果 → 替换为简短标记
         2. 对旧轮次工具结果做分级压缩（按工具类型）
@@ -2067,9 +2923,13 @@ class AIClient:
             return working_messages
 
         target = int(context_limit * 0.75)  # 压缩目标：75% 容量
+        # ★ 结构索引：跨迭代常驻时只需增量索引新消息，各步骤共用
+        index = (index or ConversationIndex()).sync(working_messages)
+
+        protected = frozenset(dedup.protected_ids()) if dedup is not None else frozenset()
 
         # ── 第 1 步：标记过时的工具结果 ──
-        stale_count = self._mark_stale_tool_results(working_messages)
+        stale_count = self._mark_stale_tool_results(working_messages, index, protected)
         if stale_count > 0:
             print(f"[AI Client] 🔄 标记了 {stale_count} 个过时工具结果")
 
@@ -2078,7 +2938,7 @@ class AIClient:
             return working_messages
 
         # ── 第 2 步：剥离旧轮次图片 ──
-        n_stripped = self._strip_image_content(working_messages, keep_recent_user=2)
+        n_stripped = self._strip_image_content(working_messages, keep_recent_user=2, index=index)
         if n_stripped > 0:
             print(f"[AI Client] 🖼 剥离了 {n_stripped} 张旧图片")
             current = self._estimate_messages_tokens(working_messages)
@@ -2086,50 +2946,34 @@ class AIClient:
                 return working_messages
 
         # ── 第 3 步：分级压缩旧轮次的工具结果 ──
-        sys_msg = working_messages[0] if working_messages[0].get('role') == 'system' else None
-        body = working_messages[1:] if sys_msg else working_messages[:]
-
-        # 划分轮次（以 user 消息为分界）
-        rounds: list = []
-        cur_round: list = []
-        for m in body:
-            if m.get('role') == 'user' and cur_round:
-                rounds.append(cur_round)
-                cur_round = []
-            cur_round.append(m)
-        if cur_round:
-            rounds.append(cur_round)
+        sys_msg, rounds = index.split(working_messages)
 
         n_rounds = len(rounds)
         protect_n = max(2, n_rounds // 2)  # 保护最近 50% 的轮次
 
-        # 从最老的轮次开始，使用分级压缩
-        # 先从 assistant.tool_calls 中提取工具名映射
-        tc_id_to_name: Dict[str, str] = {}
-        for m in body:
-            if m.get('role') == 'assistant' and 'tool_calls' in m:
-                for tc in m.get('tool_calls', []):
-                    tc_id = tc.get('id', '')
-                    fn_name = tc.get('function', {}).get('name', '')
-                    if tc_id and fn_name:
-                        tc_id_to_name[tc_id] = fn_name
-
-        for r_idx in range(n_rounds - protect_n):
-            for m in rounds[r_idx]:
-                if m.get('role') == 'tool':
-                    c = m.get('content') or ''
-                    if len(c) > 200:
-                        # 获取工具名（从 tool_call_id 反查）
-                        tc_id = m.get('tool_call_id', '')
-                        t_name = tc_id_to_name.get(tc_id, '')
-                        m['content'] = self._tiered_compress_tool(t_name, c, 200)
-
-        current = self._estimate_messages_tokens(
-            ([sys_msg] if sys_msg else []) + [m for rnd in rounds for m in rnd]
-        )
+        # ★ 按与当前目标的相关性从低到高分级压缩（只访问索引中的 tool 消息），达到目标即停
+        if n_rounds > protect_n:
+            protect_from = index.round_starts[n_rounds - protect_n]
+            candidates = [i for i in index.tool_positions
+                          if i < protect_from and len(working_messages[i].get('content') or '') > 200
+                          and id(working_messages[i]) not in protected]
+            n_compressed = 0
+            for i in self._rank_by_relevance(working_messages, candidates, index):
+                if current <= target:
+                    break
+                m = working_messages[i]
+                c = m['content']
+                # 获取工具名（从 tool_call_id 反查）
+                t_name = index.tool_name(m.get('tool_call_id', ''))
+                m['content'] = self._tiered_compress_tool(t_name, c, 200)
+                current -= (len(c) - len(m['content'])) // 3
+                n_compressed += 1
+            if n_compressed < len(candidates):
+                print(f"[AI Client] 🎯 按相关性压缩了 {n_compressed}/{len(candidates)} 个旧工具结果")
+
+        current = self._estimate_messages_tokens(working_messages)
         if current <= target:
-            body = [m for rnd in rounds for m in rnd]
-            return ([sys_msg] if sys_msg else []) + body
+            return working_messages
 
         # ── 第 4 步：仍超限 → 尝试 LLM 摘要（如果轮次足够多） ──
         if len(rounds) >= 6:
@@ -2145,11 +2989,13 @@ class AIClient:
                 print(f"[AI Client] LLM 摘要失败，回退裁剪: {e}")
 
         # ── 第 5 步：仍超限 → 裁剪最老的轮次 ──
-        while len(rounds) > 2 and current > target:
-            rounds.pop(0)
-            current = self._estimate_messages_tokens(
-                ([sys_msg] if sys_msg else []) + [m for rnd in rounds for m in rnd]
-            )
+        # 每轮 token 数只估算一次，逐轮扣减（避免每删一轮就重新估算全部消息）
+        round_tokens = index.round_token_counts(working_messages, self._estimate_messages_tokens)
+        n_drop = 0
+        while n_rounds - n_drop > 2 and current > target:
+            current -= round_tokens[n_drop]
+            n_drop += 1
+        rounds = rounds[n_drop:]
 
         body = [m for rnd in rounds for m in rnd]
         result = ([sys_msg] if sys_msg else []) + body
@@ -2197,20 +3043,8 @@ class AIClient:
         try:
             from houdini_agent.utils.token_optimizer import LLMSummarizer
 
-            # 分离系统消息和正文
-            sys_msg = working_messages[0] if working_messages[0].get('role') == 'system' else None
-            body = working_messages[1:] if sys_msg else working_messages[:]
-
-            # 划分轮次
-            rounds = []
-            cur = []
-            for m in body:
-                if m.get('role') == 'user' and cur:
-                    rounds.append(cur)
-                    cur = []
-                cur.append(m)
-            if cur:
-                rounds.append(cur)
+            # 分离系统消息和正文，划分轮次
+            sys_msg, rounds = self._split_rounds(working_messages)
 
             n_rounds = len(rounds)
             if n_rounds < 4:
@@ -2220,20 +3054,23 @@ class AIClient:
             to_summarize = rounds[:-3]
             to_keep = rounds[-3:]
 
-            # 确定摘要模型（优先用 deepseek-chat，否则用当前模型）
-            summary_model = 'deepseek-chat'
-            summary_provider = 'deepseek'
-            # 检查是否有 deepseek key
-            if not self._get_api_key('deepseek'):
-                summary_model = model or 'gpt-5.2'
-                summary_provider = provider or 'openai'
-
-            summary_text = LLMSummarizer.summarize_rounds(
-                ai_client=self,
-                rounds=to_summarize,
-                model=summary_model,
-                provider=summary_provider,
-            )
+            # ★ 优先使用后台预生成的摘要（覆盖最老的若干轮，未覆盖的轮次保留原文）
+            covered, summary_text = (0, None)
+            if self._precompactor is not None:
+                covered, summary_text = self._precompactor.lookup(to_summarize)
+            if summary_text:
+                to_summarize = rounds[:covered]
+                to_keep = rounds[covered:]
+                print(f"[AI Client] ⚡ 使用预生成摘要（覆盖 {covered} 轮），无需同步等待 LLM")
+            else:
+                # 确定摘要模型（优先用 deepseek-chat，否则用当前模型）
+                summary_model, summary_provider = self._summary_model(model, provider)
+                summary_text = LLMSummarizer.summarize_rounds(
+                    ai_client=self,
+                    rounds=to_summarize,
+                    model=summary_model,
+                    provider=summary_provider,
+                )
 
             if not summary_text:
                 print("[AI Client] LLM 摘要生成失败，使用裁剪策略")
@@ -2610,114 +3447,181 @@ class AIClient:
     # ============================================================
 
     @staticmethod
-    def _convert_messages_to_anthropic(messages: List[Dict[str, Any]]) -> tuple:
-        """将 OpenAI 格式的消息列表转换为 Anthropic Messages API 格式。
+    def _convert_message_to_anthropic(msg: Dict[str, Any]) -> tuple:
+        """将单条 OpenAI 格式消息转换为 Anthropic 片段（纯函数，结果可按内容缓存）。
         
         Returns:
-            (system_text, anthropic_messages)
-            - system_text: 系统提示（Anthropic 要求单独传 system 参数）
-            - anthropic_messages: Anthropic 格式的 messages 列表
+            (kind, payload)
+            - ('system', text)
+            - ('user', str | content_blocks)
+            - ('assistant', content_blocks)
+            - ('tool', tool_result_block)   由组装阶段并入 user 消息
+            - ('skip', None)                未知角色
         """
-        system_text = ""
-        anthropic_msgs: List[Dict[str, Any]] = []
+        role = msg.get('role', '')
         
-        for msg in messages:
-            role = msg.get('role', '')
-            
-            if role == 'system':
-                # Anthropic 的 system 不在 messages 里，单独传
-                system_text += (("\n\n" if system_text else "") + (msg.get('content', '') or ''))
-                continue
-            
-            if role == 'user':
-                content = msg.get('content', '')
-                # 支持 OpenAI 多模态格式: content 可能是 list
-                if isinstance(content, list):
-                    # 转换 OpenAI 多模态格式 → Anthropic 格式
-                    anth_content = []
-                    for part in content:
-                        if part.get('type') == 'text':
-                            anth_content.append({'type': 'text', 'text': part['text']})
-                        elif part.get('type') == 'image_url':
-                            url = part.get('image_url', {}).get('url', '')
-                            if url.startswith('data:'):
-                                # data:image/png;base64,xxxx
-                                import re as _re
-                                m = _re.match(r'data:(image/\w+);base64,(.+)', url, _re.DOTALL)
-                                if m:
-                                    anth_content.append({
-                                        'type': 'image',
-                                        'source': {
-                                            'type': 'base64',
-                                            'media_type': m.group(1),
-                                            'data': m.group(2),
-                                        }
-                                    })
-                            else:
+        if role == 'system':
+            # Anthropic 的 system 不在 messages 里，单独传
+            return 'system', (msg.get('content', '') or '')
+        
+        if role == 'user':
+            content = msg.get('content', '')
+            # 支持 OpenAI 多模态格式: content 可能是 list
+            if isinstance(content, list):
+                # 转换 OpenAI 多模态格式 → Anthropic 格式
+                anth_content = []
+                for part in content:
+                    if part.get('type') == 'text':
+                        anth_content.append({'type': 'text', 'text': part['text']})
+                    elif part.get('type') == 'image_url':
+                        url = part.get('image_url', {}).get('url', '')
+                        if url.startswith('data:'):
+                            # data:image/png;base64,xxxx
+                            import re as _re
+                            m = _re.match(r'data:(image/\w+);base64,(.+)', url, _re.DOTALL)
+                            if m:
                                 anth_content.append({
                                     'type': 'image',
-                                    'source': {'type': 'url', 'url': url}
+                                    'source': {
+                                        'type': 'base64',
+                                        'media_type': m.group(1),
+                                        'data': m.group(2),
+                                    }
                                 })
-                    anthropic_msgs.append({'role': 'user', 'content': anth_content})
-                else:
-                    anthropic_msgs.append({'role': 'user', 'content': str(content or '')})
-                continue
-            
-            if role == 'assistant':
-                content_blocks: List[Dict[str, Any]] = []
-                text = msg.get('content')
-                if text:
-                    content_blocks.append({'type': 'text', 'text': str(text)})
-                # tool_calls → tool_use blocks
-                for tc in (msg.get('tool_calls') or []):
-                    func = tc.get('function', {})
-                    try:
-                        input_obj = json.loads(func.get('arguments', '{}'))
-                    except (json.JSONDecodeError, ValueError):
-                        input_obj = {}
-                    content_blocks.append({
-                        'type': 'tool_use',
-                        'id': tc.get('id', ''),
-                        'name': func.get('name', ''),
-                        'input': input_obj,
-                    })
-                if not content_blocks:
-                    content_blocks.append({'type': 'text', 'text': ''})
-                anthropic_msgs.append({'role': 'assistant', 'content': content_blocks})
-                continue
-            
-            if role == 'tool':
-                # OpenAI tool result → Anthropic tool_result (放在 user 消息中)
-                tool_result_block = {
-                    'type': 'tool_result',
-                    'tool_use_id': msg.get('tool_call_id', ''),
-                    'content': str(msg.get('content', '')),
-                }
+                        else:
+                            anth_content.append({
+                                'type': 'image',
+                                'source': {'type': 'url', 'url': url}
+                            })
+                return 'user', anth_content
+            return 'user', str(content or '')
+        
+        if role == 'assistant':
+            content_blocks: List[Dict[str, Any]] = []
+            text = msg.get('content')
+            if text:
+                content_blocks.append({'type': 'text', 'text': str(text)})
+            # tool_calls → tool_use blocks
+            for tc in (msg.get('tool_calls') or []):
+                func = tc.get('function', {})
+                try:
+                    input_obj = json.loads(func.get('arguments', '{}'))
+                except (json.JSONDecodeError, ValueError):
+                    input_obj = {}
+                content_blocks.append({
+                    'type': 'tool_use',
+                    'id': tc.get('id', ''),
+                    'name': func.get('name', ''),
+                    'input': input_obj,
+                })
+            if not content_blocks:
+                content_blocks.append({'type': 'text', 'text': ''})
+            return 'assistant', content_blocks
+        
+        if role == 'tool':
+            # OpenAI tool result → Anthropic tool_result (放在 user 消息中)
+            return 'tool', {
+                'type': 'tool_result',
+                'tool_use_id': msg.get('tool_call_id', ''),
+                'content': str(msg.get('content', '')),
+            }
+        
+        return 'skip', None
+
+    @staticmethod
+    def _anthropic_refs(msg: Dict[str, Any]) -> tuple:
+        """参与指纹的内容对象（字符串不可变：对象未被替换即内容未变）"""
+        refs: List[Any] = [msg.get('role', ''), msg.get('tool_call_id', '')]
+        content = msg.get('content')
+        if isinstance(content, list):
+            for p in content:
+                if isinstance(p, dict):
+                    refs.append(p.get('type'))
+                    refs.append(p.get('text') or (p.get('image_url') or {}).get('url', ''))
+        else:
+            refs.append(content)
+        for tc in (msg.get('tool_calls') or ()):
+            func = tc.get('function') or {}
+            refs.extend((tc.get('id', ''), func.get('name', ''), func.get('arguments', '{}')))
+        return tuple(refs)
+
+    def _anthropic_fingerprint(self, msg: Dict[str, Any]) -> Tuple[bytes, int]:
+        """消息指纹：(blake2b 内容摘要, 内容字节数估算)（调用方持有 _anth_cache_lock）
+
+        按对象身份记忆摘要：同一消息对象且各内容字符串未被替换时直接复用，
+        历史消息每轮不必重新计算摘要。
+        """
+        refs = self._anthropic_refs(msg)
+        memo = self._anth_digest_memo
+        key = id(msg)
+        hit = memo.get(key)
+        if (hit is not None and hit[0] is msg and len(hit[1]) == len(refs)
+                and all(a is b for a, b in zip(hit[1], refs))):
+            memo.move_to_end(key)
+            return hit[2], hit[3]
+        h = hashlib.blake2b(digest_size=16)
+        size = 0
+        for ref in refs:
+            data = ref if isinstance(ref, str) else repr(ref)
+            size += len(data)
+            h.update(data.encode('utf-8', 'surrogatepass'))
+            h.update(b'\x00')
+        digest = h.digest()
+        # 记忆中持有消息对象的强引用，id 不会被复用
+        if hit is not None:
+            self._anth_digest_memo_bytes -= hit[3]
+        memo[key] = (msg, refs, digest, size)
+        memo.move_to_end(key)
+        self._anth_digest_memo_bytes += size
+        # ★ 按条数和字节数双重限制：base64 截图消息单条可达数 MB
+        while memo and (len(memo) > self._ANTH_MSG_CACHE_MAX
+                        or self._anth_digest_memo_bytes > self._ANTH_CACHE_MAX_BYTES):
+            self._anth_digest_memo_bytes -= memo.popitem(last=False)[1][3]
+        return digest, size
+
+    @classmethod
+    def _assemble_anthropic(cls, converted: List[tuple]) -> tuple:
+        """将逐条转换结果组装为 (system_text, anthropic_messages, 每条消息的来源指纹)。
+        
+        converted: [(fingerprint, kind, payload), ...]
+        组装阶段只创建新的 list / dict，不修改缓存中的转换结果。
+        """
+        system_text = ""
+        anthropic_msgs: List[Dict[str, Any]] = []
+        fps: List[tuple] = []
+        
+        for fp, kind, payload in converted:
+            if kind == 'system':
+                system_text += (("\n\n" if system_text else "") + payload)
+            elif kind == 'tool':
                 # 如果上一条也是 user（连续的 tool results），合并到同一条 user 消息
                 if anthropic_msgs and anthropic_msgs[-1]['role'] == 'user':
                     last_content = anthropic_msgs[-1]['content']
                     if isinstance(last_content, list):
-                        last_content.append(tool_result_block)
+                        anthropic_msgs[-1]['content'] = last_content + [payload]
                     else:
                         anthropic_msgs[-1]['content'] = [
                             {'type': 'text', 'text': last_content},
-                            tool_result_block,
+                            payload,
                         ]
+                    fps[-1] = fps[-1] + (fp,)
                 else:
-                    anthropic_msgs.append({
-                        'role': 'user',
-                        'content': [tool_result_block],
-                    })
-                continue
+                    anthropic_msgs.append({'role': 'user', 'content': [payload]})
+                    fps.append((fp,))
+            elif kind in ('user', 'assistant'):
+                anthropic_msgs.append({'role': kind, 'content': payload})
+                fps.append((fp,))
         
         # Anthropic 要求消息以 user 开头，如果第一条是 assistant 则补一条 user
         if anthropic_msgs and anthropic_msgs[0]['role'] == 'assistant':
             anthropic_msgs.insert(0, {'role': 'user', 'content': '请继续。'})
+            fps.insert(0, ('__continue__',))
         
         # Anthropic 要求角色严格交替（user/assistant/user/...）
         # 合并连续相同角色的消息
         merged: List[Dict[str, Any]] = []
-        for m in anthropic_msgs:
+        merged_fps: List[tuple] = []
+        for m, fp in zip(anthropic_msgs, fps):
             if merged and merged[-1]['role'] == m['role']:
                 # 合并内容
                 prev_content = merged[-1]['content']
@@ -2732,9 +3636,24 @@ class AIClient:
                 if not isinstance(curr_content, list):
                     curr_content = [curr_content]
                 merged[-1]['content'] = prev_content + curr_content
+                merged_fps[-1] = merged_fps[-1] + fp
             else:
                 merged.append(m)
+                merged_fps.append(fp)
+        
+        return system_text, merged, merged_fps
+
+    @classmethod
+    def _convert_messages_to_anthropic(cls, messages: List[Dict[str, Any]]) -> tuple:
+        """将 OpenAI 格式的消息列表转换为 Anthropic Messages API 格式（无缓存）。
         
+        Returns:
+            (system_text, anthropic_messages)
+            - system_text: 系统提示（Anthropic 要求单独传 system 参数）
+            - anthropic_messages: Anthropic 格式的 messages 列表
+        """
+        converted = [(None,) + cls._convert_message_to_anthropic(m) for m in messages]
+        system_text, merged, _ = cls._assemble_anthropic(converted)
         return system_text, merged
 
     @staticmethod
@@ -2756,6 +3675,122 @@ class AIClient:
             })
         return anthropic_tools
 
+    _ANTH_MSG_CACHE_MAX = 4096
+    _ANTH_CACHE_MAX_BYTES = 32 * 1024 * 1024   # 转换缓存 / 摘要记忆各自的内容字节上限
+    _ANTH_PREV_FPS_MAX = 16      # 保留不变前缀基线的会话数
+
+    @staticmethod
+    def _load_prompt_cache_flag() -> bool:
+        """配置项 anthropic_prompt_cache（houdini_ai.ini，默认开启）"""
+        try:
+            cfg, _ = load_config('ai', dcc_type='houdini')
+            return (cfg or {}).get('anthropic_prompt_cache', 'true').strip().lower() != 'false'
+        except Exception:
+            return True
+
+    def set_anthropic_prompt_cache(self, enabled: bool, persist: bool = False):
+        """开关 Anthropic 协议请求的 cache_control 断点（提示词缓存）"""
+        self._anthropic_prompt_cache = bool(enabled)
+        if persist:
+            cfg, _ = load_config('ai', dcc_type='houdini')
+            cfg = cfg or {}
+            cfg['anthropic_prompt_cache'] = 'true' if enabled else 'false'
+            save_config('ai', cfg, dcc_type='houdini')
+
+    def _build_anthropic_request(self, messages: List[Dict[str, Any]],
+                                 tools: Optional[List[dict]], scope: str = 'agent') -> tuple:
+        """增量构建 Anthropic 请求的 (system, messages, tools)。
+        
+        - 每条消息按内容指纹缓存转换结果，Agent 每轮只转换新增 / 被修改（如压缩）的消息
+        - 工具列表按工具 dict 对象缓存，未变化时直接复用
+        - 在不变前缀末尾、最新消息末尾、system 和工具列表末尾放置 cache_control 断点，
+          让 Anthropic 协议的中转站命中提示词缓存
+        - 不变前缀基线按 (scope, 首条消息指纹) 分别保存：多个会话、以及标题生成 /
+          摘要等非流式调用（scope='chat'）互不覆盖
+        """
+        converted = []
+        fresh = 0
+        with self._anth_cache_lock:
+            cache = self._anth_msg_cache
+            for msg in messages:
+                fp, size = self._anthropic_fingerprint(msg)
+                hit = cache.get(fp)
+                if hit is None:
+                    hit = self._convert_message_to_anthropic(msg) + (size,)
+                    cache[fp] = hit
+                    self._anth_msg_cache_bytes += size
+                    fresh += 1
+                else:
+                    cache.move_to_end(fp)
+                converted.append((fp,) + hit[:2])
+            while cache and (len(cache) > self._ANTH_MSG_CACHE_MAX
+                             or self._anth_msg_cache_bytes > self._ANTH_CACHE_MAX_BYTES):
+                self._anth_msg_cache_bytes -= cache.popitem(last=False)[1][2]
+            
+            anth_tools = None
+            if tools:
+                cached_tools = self._anth_tools_cache
+                if (cached_tools is not None and len(cached_tools[0]) == len(tools)
+                        and all(a is b for a, b in zip(cached_tools[0], tools))):
+                    anth_tools = cached_tools[1]
+                else:
+                    anth_tools = self._convert_tools_to_anthropic(tools)
+                    self._anth_tools_cache = (list(tools), anth_tools)
+            
+        system_text, anth_messages, fps = self._assemble_anthropic(converted)
+        
+        # 与本会话上次请求相同的前缀长度
+        conv_key = (scope, fps[0] if fps else ())
+        with self._anth_cache_lock:
+            prev_fps = self._anth_prev_fps.pop(conv_key, [])
+            self._anth_prev_fps[conv_key] = fps
+            while len(self._anth_prev_fps) > self._ANTH_PREV_FPS_MAX:
+                self._anth_prev_fps.popitem(last=False)
+        stable = 0
+        for a, b in zip(fps, prev_fps):
+            if a != b:
+                break
+            stable += 1
+        if fresh:
+            print(f"[AI Client] Anthropic 转换: {fresh}/{len(messages)} 条新消息，不变前缀 {stable} 条")
+        
+        system_payload: Any = system_text
+        if self._anthropic_prompt_cache:
+            _cc = {'type': 'ephemeral'}
+            if system_text:
+                system_payload = [{'type': 'text', 'text': system_text, 'cache_control': _cc}]
+            if anth_tools:
+                anth_tools = anth_tools[:-1] + [dict(anth_tools[-1], cache_control=_cc)]
+            # 最多 4 个断点：tools / system / 不变前缀末尾 / 最新消息末尾
+            for idx in {stable - 1, len(anth_messages) - 1}:
+                if 0 <= idx < len(anth_messages):
+                    anth_messages[idx] = self._with_cache_control(anth_messages[idx])
+        
+        return system_payload, anth_messages, anth_tools
+
+    @staticmethod
+    def _with_cache_control(msg: Dict[str, Any]) -> Dict[str, Any]:
+        """返回在最后一个非空内容块上加了 cache_control 的消息副本"""
+        content = msg['content']
+        if isinstance(content, str):
+            content = [{'type': 'text', 'text': content}] if content else []
+        blocks = list(content)
+        for i in range(len(blocks) - 1, -1, -1):
+            blk = blocks[i]
+            if blk.get('type') == 'text' and not blk.get('text'):
+                continue
+            blocks[i] = dict(blk, cache_control={'type': 'ephemeral'})
+            return {'role': msg['role'], 'content': blocks}
+        return msg
+
+    @staticmethod
+    def _with_note(msg: Dict[str, Any], note: str) -> Dict[str, Any]:
+        """返回在末尾追加了一段文本的消息副本（原消息可能属于会话历史，不就地修改）"""
+        content = msg.get('content')
+        if isinstance(content, list):
+            return dict(msg, content=list(content) + [{'type': 'text', 'text': note}])
+        return dict(msg, content=f"{content or ''}\n\n{note}")
+
     def _chat_stream_anthropic(self,
                                 messages: List[Dict[str, Any]],
                                 model: str,
@@ -2773,8 +3808,8 @@ class AIClient:
         """
         api_url = self._get_api_url(provider, model)
         
-        # 消息转换
-        system_text, anth_messages = self._convert_messages_to_anthropic(messages)
+        # 消息转换（增量缓存 + cache_control 断点）
+        system_text, anth_messages, anth_tools = self._build_anthropic_request(messages, tools)
         
         payload: Dict[str, Any] = {
             'model': model,
@@ -2794,8 +3829,8 @@ class AIClient:
             payload['thinking'] = {'type': 'enabled', 'budget_tokens': min(max_tokens or 16384, 10000)}
         
         # 工具
-        if tools:
-            payload['tools'] = self._convert_tools_to_anthropic(tools)
+        if anth_tools:
+            payload['tools'] = anth_tools
             if tool_choice == 'auto':
                 payload['tool_choice'] = {'type': 'auto'}
             elif tool_choice == 'none':
@@ -3063,7 +4098,8 @@ class AIClient:
                         timeout: int = 60) -> Dict[str, Any]:
         """Anthropic Messages 协议的非流式 Chat。"""
         api_url = self._get_api_url(provider, model)
-        system_text, anth_messages = self._convert_messages_to_anthropic(messages)
+        system_text, anth_messages, anth_tools = self._build_anthropic_request(
+            messages, tools, scope='chat')
         
         payload: Dict[str, Any] = {
             'model': model,
@@ -3074,8 +4110,8 @@ class AIClient:
             payload['temperature'] = min(max(temperature, 0.0), 1.0)
         if system_text:
             payload['system'] = system_text
-        if tools:
-            payload['tools'] = self._convert_tools_to_anthropic(tools)
+        if anth_tools:
+            payload['tools'] = anth_tools
             if tool_choice == 'auto':
                 payload['tool_choice'] = {'type': 'auto'}
         
@@ -3673,7 +4709,9 @@ class AIClient:
                           on_tool_args_delta: Optional[Callable[[str, str, str], None]] = None,
                           on_iteration_start: Optional[Callable[[int], None]] = None,
                           on_plan_incomplete: Optional[Callable[[], Optional[str]]] = None,
-                          context_limit: int = 128000) -> Dict[str, Any]:
+                          context_limit: int = 128000,
+                          tool_router=None,
+                          router_session: str = '') -> Dict[str, Any]:
         """流式 Agent Loop
         
         Args:
@@ -3691,6 +4729,8 @@ class AIClient:
                                 agent loop 会将其注入为 user 消息并继续迭代。
                                 如果 Plan 已全部完成或不需要续接，返回 None。
             context_limit: 上下文 token 上限（默认 128000），用于主动压缩判断
+            tool_router: SemanticToolRouter，给定时按相关性只发送工具子集
+            router_session: 会话 ID，工具路由按会话保持已发送集合（只增不减）
         
         Returns:
             {"ok": bool, "content": str, "final_content": str,
@@ -3700,13 +4740,20 @@ class AIClient:
             return {'ok': False, 'error': '未设置工具执行器', 'content': '', 'tool_calls_history': [], 'iterations': 0}
         
         working_messages = list(messages)
+        # ★ 消息结构索引（轮次 / 工具调用配对 / 图片位置），跨迭代增量维护，供各压缩步骤共用
+        _conv_index = ConversationIndex()
+        _tracer = get_tracer()  # ★ 耗时追踪（关闭时近乎零开销）
         
         # ── 预处理：非视觉模型剥离所有 image_url 内容 ──
         if not supports_vision:
-            n_stripped = self._strip_image_content(working_messages, keep_recent_user=0)
+            n_stripped = self._strip_image_content(working_messages, keep_recent_user=0, index=_conv_index)
             if n_stripped > 0:
                 print(f"[AI Client] 非视觉模型 ({model})：已剥离 {n_stripped} 张图片")
         
+        # ★ 内容寻址去重：重复 / 近似的工具结果只保留最新一份完整内容
+        _result_dedup = ToolResultDedup()
+        _result_dedup.seed(working_messages, _conv_index)
+        
         initial_msg_count = len(working_messages)  # 跟踪初始消息数量，用于提取新消息链
         tool_calls_history = []
         call_records = []  # 每次 API 调用的详细记录（对齐 Cursor）
@@ -3718,6 +4765,21 @@ class AIClient:
         # 此处不再重复合并，避免工具重复。
         effective_tools = tools_override if tools_override is not None else HOUDINI_TOOLS
         
+        # ★ 语义工具路由：只发送相关工具子集，被省略的工具仅列出名称（调用时再补发定义）
+        _all_tools_by_name = {t.get('function', {}).get('name', ''): t for t in effective_tools}
+        _omitted_tools: List[str] = []
+        if tool_router is not None:
+            effective_tools, _omitted_tools = tool_router.select(
+                effective_tools, working_messages, _conv_index, session=router_session)
+            if _omitted_tools:
+                # 提示附在本轮最后一条 user 消息末尾（副本）：不改动历史前缀，提示词缓存保持命中
+                for _ui in range(len(working_messages) - 1, -1, -1):
+                    if working_messages[_ui].get('role') == 'user':
+                        working_messages[_ui] = self._with_note(
+                            working_messages[_ui], tool_router.omitted_note(_omitted_tools))
+                        break
+        _sent_tool_names = {t.get('function', {}).get('name', '') for t in effective_tools}
+        
         # 累积 usage 统计（用于 cache 命中率统计）
         total_usage = {
             'prompt_tokens': 0,
@@ -3737,14 +4799,18 @@ class AIClient:
         server_error_retries = 0    # 连续服务端错误重试计数
         max_server_retries = 3      # 最多重试 3 次服务端错误
         
-        # ★ Cursor 风格：同轮去重缓存
-        # 如果 AI 在同一 turn 中用相同参数调用相同工具，直接返回缓存结果
-        # key: "tool_name:sorted_args_json" → value: result dict
-        _turn_dedup_cache: Dict[str, dict] = {}
+        # ★ 会话级只读工具结果缓存（跨迭代 / 跨用户轮次）
+        # 如果 AI 用相同参数调用相同查询工具且场景未变化，直接返回缓存结果
+        # key: "tool_name:sorted_args_json"，按场景版本号精确失效
+        _tool_cache = self._tool_result_cache
+        _tool_cache.begin_turn()
         
         # ★ 消息清洗 dirty 标志（避免每轮都 O(n) 遍历消息列表）
         _needs_sanitize = True
         
+        # ★ 推测执行累计节省的墙钟时间（秒）
+        _spec_saved_total = 0.0
+        
         while iteration < max_iterations:
             # 检查停止请求
             if self._stop_event.is_set():
@@ -3772,10 +4838,21 @@ class AIClient:
             should_abort = False  # 不可恢复错误标志
             abort_error = ""
             _round_content_started = False  # ★ 标记本轮是否已发出首个 content chunk
+            # 本轮请求前的场景版本号：本轮只读结果以此版本写入缓存
+            # （流式期间或本轮写操作导致的场景变化会使其立即过期）
+            _scene_v0 = _tool_cache.scene_version()
+            
+            # ★ 推测执行：参数完整的只读工具在流式输出期间即开始执行
+            _spec = _SpeculativeToolRunner(
+                self._get_tool_pool(), self._run_speculative_tool,
+                self._SPECULATIVE_TOOLS, self._stop_event,
+                skip_fn=_tool_cache.contains,
+            )
             
             # 发送前清洗消息（仅在新增 tool 消息后才需要，避免无谓的 O(n) 遍历）
             if _needs_sanitize:
                 working_messages = self._sanitize_working_messages(working_messages)
+                self._repair_dedup_refs(_result_dedup, working_messages)
                 _needs_sanitize = False
             
             # 诊断：仅打印消息数量摘要（完整内容通过"导出训练数据"功能获取）
@@ -3787,15 +4864,20 @@ class AIClient:
             
             # ★ 主动式上下文压缩（每轮迭代前，从第 4 轮开始检查）
             # 不等到 context_length_exceeded 错误才压缩，而是提前检测并压缩
-            if iteration > 3 and len(working_messages) > 15:
-                est_tokens = self._estimate_messages_tokens(working_messages, effective_tools)
-                if est_tokens > context_limit * 0.85:
-                    print(f"[AI Client] ⚠️ 上下文 ~{est_tokens} tokens（阈值 {int(context_limit * 0.85)}），启动主动压缩")
+            # 预摘要水位（55%）每轮都检查：长会话首轮就可能已越过水位
+            est_tokens = self._estimate_messages_tokens(working_messages, effective_tools)
+            if (iteration > 3 and len(working_messages) > 15
+                    and est_tokens > context_limit * 0.85):
+                print(f"[AI Client] ⚠️ 上下文 ~{est_tokens} tokens（阈值 {int(context_limit * 0.85)}），启动主动压缩")
+                with _tracer.span('context.compress', est_tokens=est_tokens):
                     working_messages = self._smart_compress_in_loop(
                         working_messages, tool_calls_history,
-                        context_limit, supports_vision
+                        context_limit, supports_vision, index=_conv_index, dedup=_result_dedup
                     )
-                    _needs_sanitize = True
+                    self._repair_dedup_refs(_result_dedup, working_messages)
+                _needs_sanitize = True
+            else:
+                self._maybe_precompact(working_messages, est_tokens, context_limit, _conv_index)
             
             # ★ 通知 UI 新一轮 API 请求即将开始（用于显示 "Generating..." 状态）
             if on_iteration_start:
@@ -3811,6 +4893,7 @@ class AIClient:
                 pass
             
             # 流式请求
+            _t_req, _t_first = _trace_now(), None
             for chunk in self.chat_stream(
                 messages=working_messages,
                 model=model,
@@ -3821,8 +4904,11 @@ class AIClient:
                 tool_choice='auto',
                 enable_thinking=enable_thinking
             ):
+                if _t_first is None:
+                    _t_first = _trace_now()
                 # 检查停止请求
                 if self._stop_event.is_set():
+                    _spec.cancel()
                     return {
                         'ok': False,
                         'error': '用户停止了请求',
@@ -3839,6 +4925,7 @@ class AIClient:
                 chunk_type = chunk.get('type')
                 
                 if chunk_type == 'stopped':
+                    _spec.cancel()
                     return {
                         'ok': False,
                         'error': '用户停止了请求',
@@ -3897,11 +4984,24 @@ class AIClient:
                             chunk.get('delta', ''),
                             chunk.get('accumulated', ''),
                         )
+                    _spec.offer_partial(
+                        chunk.get('index'),
+                        chunk.get('name', ''),
+                        chunk.get('accumulated', ''),
+                    )
                 
                 elif chunk_type == 'tool_call':
                     tc = chunk.get('tool_call')
                     print(f"[AI Client] Tool call: {tc.get('function', {}).get('name', 'unknown')}")
                     round_tool_calls.append(tc)
+                    # Anthropic 协议在 content_block_stop 即产出 tool_call（早于消息结束）
+                    _fn = tc.get('function', {})
+                    try:
+                        _spec_args = json.loads(_fn.get('arguments') or '{}')
+                    except (json.JSONDecodeError, ValueError):
+                        _spec_args = None
+                    if isinstance(_spec_args, dict):
+                        _spec.offer(_fn.get('name', ''), _spec_args)
                 
                 elif chunk_type == 'error':
                     error_msg = chunk.get('error', '')
@@ -3956,8 +5056,9 @@ class AIClient:
                             working_messages = self._progressive_trim(
                                 working_messages, tool_calls_history,
                                 trim_level=server_error_retries,  # 逐次加大裁剪力度
-                                supports_vision=supports_vision
+                                supports_vision=supports_vision, index=_conv_index
                             )
+                            self._repair_dedup_refs(_result_dedup, working_messages)
                             cleanup_count = old_len - len(working_messages)
                             
                         elif is_server_transient or is_compress_fail:
@@ -3974,8 +5075,9 @@ class AIClient:
                                 working_messages = self._progressive_trim(
                                     working_messages, tool_calls_history,
                                     trim_level=server_error_retries - 1,  # 比上下文超限更温和
-                                    supports_vision=supports_vision
+                                    supports_vision=supports_vision, index=_conv_index
                                 )
+                                self._repair_dedup_refs(_result_dedup, working_messages)
                                 cleanup_count = old_len - len(working_messages)
                             
                         else:
@@ -4040,13 +5142,21 @@ class AIClient:
                     })
                     break
             
+            _stream_end = time.time()
+            if _tracer.enabled:
+                _t_end = _trace_now()
+                _tracer.record('llm.ttft', _t_req, _t_first or _t_end, cat='llm', iteration=iteration)
+                _tracer.record('llm.stream', _t_first or _t_end, _t_end, cat='llm', iteration=iteration)
+            
             # 错误恢复：跳过本轮剩余逻辑，重新请求 API
             if should_retry:
+                _spec.cancel()
                 full_content += round_content
                 continue  # 正确地重新进入 while 循环
             
             # 不可恢复错误：返回
             if should_abort:
+                _spec.cancel()
                 return {
                     'ok': False,
                     'error': abort_error,
@@ -4059,8 +5169,18 @@ class AIClient:
                     'usage': total_usage
                 }
             
+            # ★ 工具路由补发：回复中用 [需要工具: …] 显式请求了未附带定义的工具 → 之后的请求追加其定义
+            _requested = (tool_router.requested_tools(round_content, _omitted_tools)
+                          if tool_router is not None else [])
+            for _rt in _requested:
+                tool_router.record_miss(_rt, router_session)
+                _omitted_tools.remove(_rt)
+                _sent_tool_names.add(_rt)
+                effective_tools = list(effective_tools) + [_all_tools_by_name[_rt]]
+            
             # 如果没有工具调用，完成
             if not round_tool_calls:
+                _spec.cancel()
                 # ★ Plan 续接检测：AI 输出了纯文本，但 Plan 可能还有未完成步骤
                 # 通过回调询问 UI 层 Plan 是否已完成
                 _plan_resume_msg = None
@@ -4069,6 +5189,8 @@ class AIClient:
                         _plan_resume_msg = on_plan_incomplete()
                     except Exception as _pe:
                         print(f"[AI Client] on_plan_incomplete error: {_pe}")
+                if not _plan_resume_msg and _requested:
+                    _plan_resume_msg = f"[工具] 已附带 {', '.join(_requested)} 的定义，请继续完成任务。"
                 
                 if _plan_resume_msg:
                     # Plan 尚未完成 → 将 AI 的当前回复存入历史，注入提醒消息，继续循环
@@ -4171,16 +5293,23 @@ class AIClient:
                 except:
                     arguments = {}
                 parsed_calls.append((tool_id, tool_name, arguments, tool_call))
+                # ★ 路由漏选：调用了未发送定义的工具 → 照常执行，并为后续迭代补发其 schema
+                if tool_name not in _sent_tool_names and tool_name in _all_tools_by_name:
+                    _sent_tool_names.add(tool_name)
+                    effective_tools = list(effective_tools) + [_all_tools_by_name[tool_name]]
+                    if tool_name in _omitted_tools:
+                        _omitted_tools.remove(tool_name)
+                    if tool_router is not None:
+                        tool_router.record_miss(tool_name, router_session)
 
             # ★ 同轮去重：纯查询类工具用相同参数重复调用时直接返回缓存
             # 只对无副作用的查询工具去重（execute_python/run_skill/web_search 等有副作用的不去重）
             _DEDUP_TOOLS = frozenset({
                 'get_network_structure', 'get_node_parameters', 'list_children',
-                'read_selection', 'search_node_types', 'semantic_search_nodes',
+                'search_node_types', 'semantic_search_nodes',
                 'find_nodes_by_param', 'check_errors', 'search_local_doc',
                 'get_houdini_node_doc', 'get_node_inputs', 'list_skills',
-                'perf_stop_and_report',
-            })
+            })   # read_selection（选择变化无事件）/ perf_stop_and_report（消费性能报告）不缓存
             
             # 分离可并行工具（web + shell）和 Houdini 工具（需主线程串行）
             _ASYNC_TOOL_NAMES = frozenset({'web_search', 'fetch_webpage', 'execute_shell'})
@@ -4191,43 +5320,44 @@ class AIClient:
             results_ordered = [None] * len(parsed_calls)
             dedup_flags = [False] * len(parsed_calls)  # 标记哪些是缓存命中
 
-            # --- 先检查去重缓存 ---
+            # --- 先检查会话级结果缓存（场景版本号未变化才命中） ---
             for idx, (tid, tname, targs, _tc) in enumerate(parsed_calls):
-                dedup_key = f"{tname}:{json.dumps(targs, sort_keys=True)}"
-                if tname in _DEDUP_TOOLS and dedup_key in _turn_dedup_cache:
+                if tname not in _DEDUP_TOOLS:
+                    continue
+                _cached = _tool_cache.get(tname, targs)
+                if _cached is not None:
                     # ★ 缓存命中：直接返回之前的结果
-                    results_ordered[idx] = _turn_dedup_cache[dedup_key]
+                    results_ordered[idx] = _cached
                     dedup_flags[idx] = True
-                    print(f"[AI Client] ♻️ 同轮去重命中: {tname}({json.dumps(targs, ensure_ascii=False)[:80]})")
+                    print(f"[AI Client] ♻️ 结果缓存命中: {tname}({json.dumps(targs, ensure_ascii=False)[:80]})")
 
-            # 分离未缓存的调用
+            # --- 取回推测执行结果（流式期间已开始执行的只读工具） ---
+            for idx, (tid, tname, targs, _tc) in enumerate(parsed_calls):
+                if results_ordered[idx] is None:
+                    results_ordered[idx] = _spec.take(tname, targs)
+            _spec.cancel()  # 未被最终调用列表采用的推测任务直接丢弃
+            if _spec.consumed_count:
+                _spec_saved = _spec.overlap_seconds(_stream_end)
+                _spec_saved_total += _spec_saved
+                if call_records and call_records[-1].get('iteration') == iteration:
+                    call_records[-1]['speculative_calls'] = _spec.consumed_count
+                    call_records[-1]['speculative_saved'] = round(_spec_saved, 3)
+                print(f"[AI Client] ⚡ 推测执行命中 {_spec.consumed_count} 个只读工具，"
+                      f"本轮节省 {_spec_saved:.2f}s（累计 {_spec_saved_total:.2f}s）")
+
+            # 分离未缓存的调用（去重命中 / 推测命中的已有结果）
             uncached_async = [(i, pc) for i, pc in enumerate(parsed_calls) 
-                             if pc[1] in _ASYNC_TOOL_NAMES and not dedup_flags[i]]
+                             if pc[1] in _ASYNC_TOOL_NAMES and results_ordered[i] is None]
             uncached_houdini = [(i, pc) for i, pc in enumerate(parsed_calls) 
-                               if pc[1] not in _ASYNC_TOOL_NAMES and not dedup_flags[i]]
-
-            # --- 并行执行未缓存的 async 工具（web + shell） ---
-            if len(uncached_async) > 1:
-                import concurrent.futures
-                def _exec_async(idx_pc):
-                    idx, (tid, tname, targs, _tc) = idx_pc
-                    if tname == 'web_search':
-                        return idx, self._execute_web_search(targs)
-                    elif tname == 'fetch_webpage':
-                        return idx, self._execute_fetch_webpage(targs)
-                    else:  # execute_shell
-                        return idx, self._tool_executor(tname, **targs)
-                with concurrent.futures.ThreadPoolExecutor(max_workers=min(4, len(uncached_async))) as pool:
-                    for idx, result in pool.map(_exec_async, uncached_async):
-                        results_ordered[idx] = result
-            elif len(uncached_async) == 1:
-                idx, (tid, tname, targs, _tc) = uncached_async[0]
-                if tname == 'web_search':
-                    results_ordered[idx] = self._execute_web_search(targs)
-                elif tname == 'fetch_webpage':
-                    results_ordered[idx] = self._execute_fetch_webpage(targs)
-                else:  # execute_shell
-                    results_ordered[idx] = self._tool_executor(tname, **targs)
+                               if pc[1] not in _ASYNC_TOOL_NAMES and results_ordered[i] is None]
+
+            _t_tools = _trace_now()
+            # --- 并行执行未缓存的 async 工具（web + shell，常驻线程池分道 + 按主机限流） ---
+            if uncached_async:
+                async_results = self._run_async_tools(
+                    [(tname, targs) for _, (_, tname, targs, _) in uncached_async])
+                for (idx, _), result in zip(uncached_async, async_results):
+                    results_ordered[idx] = result
 
             # --- 执行未缓存的 Houdini 工具（需主线程） ---
             # ★ 只读工具批量执行：减少 N 次信号往返为 1 次
@@ -4263,6 +5393,9 @@ class AIClient:
             for idx, (tid, tname, targs, _tc) in mutating_calls:
                 results_ordered[idx] = self._tool_executor(tname, **targs)
 
+            _tracer.record('tools.execute', _t_tools, cat='tool', iteration=iteration,
+                           calls=len(uncached_async) + len(uncached_houdini))
+
             # ★ 早期终止：跳过冗余查询
             # 当已执行的工具结果已提供足够信息时，跳过剩余同类查询
             _early_skip_count = 0
@@ -4312,29 +5445,12 @@ class AIClient:
                     print(f"[AI Client] ⏭️ 早期终止: 跳过 {_early_skip_count} 个冗余查询")
             
             # --- 缓存维护 ---
-            # 如果本轮有操作类工具（创建/删除/连接节点等），清除网络结构相关缓存
-            # 因为操作改变了网络状态，之前缓存的查询结果可能已过期
-            _NETWORK_MUTATING_TOOLS = frozenset({
-                'create_node', 'create_nodes_batch', 'delete_node', 'connect_nodes',
-                'create_wrangle_node', 'copy_node', 'set_display_flag', 'undo_redo',
-            })
-            has_mutation = any(
-                pc[1] in _NETWORK_MUTATING_TOOLS 
-                for idx_m, pc in enumerate(parsed_calls) 
-                if not dedup_flags[idx_m]
-            )
-            if has_mutation:
-                # 清除 get_network_structure / list_children / check_errors 的缓存
-                keys_to_remove = [k for k in _turn_dedup_cache 
-                                  if k.startswith(('get_network_structure:', 'list_children:', 'check_errors:'))]
-                for k in keys_to_remove:
-                    del _turn_dedup_cache[k]
-            
-            # 将新执行的查询工具结果写入去重缓存
+            # 将新执行的查询工具结果写入会话缓存（以本轮请求前的场景版本号标记）
+            # 无需手动清理：写操作 / hou 事件会递增场景版本号，旧条目自动过期
             for idx, (tid, tname, targs, _tc) in enumerate(parsed_calls):
-                if not dedup_flags[idx] and tname in _DEDUP_TOOLS and results_ordered[idx]:
-                    dedup_key = f"{tname}:{json.dumps(targs, sort_keys=True)}"
-                    _turn_dedup_cache[dedup_key] = results_ordered[idx]
+                _res = results_ordered[idx]
+                if not dedup_flags[idx] and tname in _DEDUP_TOOLS and _res and _res.get('success'):
+                    _tool_cache.put(tname, targs, _res, _scene_v0)
 
             # --- 统一处理结果（保持原始顺序） ---
             should_break_tool_limit = False
@@ -4373,28 +5489,37 @@ class AIClient:
                 
                 # ★ 去重命中时追加提示，引导 AI 不要再重复调用
                 if dedup_flags[i]:
-                    result_content = f"[缓存] 本轮已用相同参数调用过此工具，以下是之前的结果（无需再次调用）:\n{result_content}"
+                    result_content = f"[缓存] 场景未变化，此前已用相同参数调用过此工具，以下是之前的结果（无需再次调用）:\n{result_content}"
 
-                working_messages.append({
+                # ★ 视口未变化且上一张截图仍在上下文中：不重复附加同一张图片
+                _img_url = self._viewport_attachment(result, working_messages, supports_vision)
+                if supports_vision and result.get('_viewport_unchanged') and _img_url is None:
+                    result_content += "\n（与上一张截图相同，图片见上文，未重复附加）"
+
+                _tool_msg = {
                     'role': 'tool',
                     'tool_call_id': tool_id,
                     'content': result_content
-                })
+                }
+                # 去重只改写这条新消息，较早的消息保持不变（不破坏提示词缓存前缀）
+                if result.get('success') and not dedup_flags[i]:
+                    _saved = _result_dedup.add(_tool_msg, tool_name)
+                    if _saved > 0:
+                        print(f"[AI Client] ♻️ {tool_name} 结果与此前副本重复/近似，已改写为引用（-{_saved} 字符）")
+                working_messages.append(_tool_msg)
                 _needs_sanitize = True  # 新增 tool 消息，下轮需要清洗
 
                 # ★ 视口截图注入：如果工具返回了 _viewport_image，
                 # 追加一条包含图片的 user 消息，让模型可以视觉分析
-                if supports_vision and result.get('_viewport_image'):
-                    _img_b64 = result['_viewport_image']
-                    _img_mt = result.get('_image_media_type', 'image/jpeg')
+                if _img_url:
                     working_messages.append({
                         'role': 'user',
                         'content': [
                             {"type": "text", "text": "[viewport snapshot attached — please analyze the current viewport state, check for visual issues or confirm the result is correct]"},
-                            {"type": "image_url", "image_url": {"url": f"data:{_img_mt};base64,{_img_b64}"}}
+                            {"type": "image_url", "image_url": {"url": _img_url}}
                         ]
                     })
-                    print(f"[AI Client] 📸 视口截图已注入消息 ({len(_img_b64)//1024}KB base64)")
+                    print(f"[AI Client] 📸 视口截图已注入消息 ({len(result['_viewport_image'])//1024}KB base64)")
 
             if should_break_tool_limit:
                 return {
@@ -4638,50 +5763,17 @@ class AIClient:
 """
     
     def _parse_json_tool_calls(self, content: str) -> List[Dict]:
-        """从文本内容中解析 JSON 格式的工具调用（改进版：支持多种格式）"""
+        """从完整文本内容中解析 JSON 格式的工具调用（支持多种格式与任意嵌套参数）"""
         import re
         
-        tool_calls = []
-        
-        # 1. 清理XML标签（如果AI错误输出了XML格式）
+        # 清理XML标签（如果AI错误输出了XML格式）
         content = re.sub(r'</?tool_call[^>]*>', '', content)
         content = re.sub(r'<arg_key>([^<]+)</arg_key>\s*<arg_value>([^<]+)</arg_value>', r'"\1": "\2"', content)
         
-        # 2. 匹配 ```json ... ``` 代码块
-        json_blocks = re.findall(r'```(?:json)?\s*\n?({[^`]+})\s*\n?```', content, re.DOTALL)
-        
-        # 3. 如果没有代码块，尝试直接匹配JSON对象
-        if not json_blocks:
-            # 尝试匹配独立的JSON对象（不在代码块中）
-            json_pattern = r'\{\s*"(?:tool|name)"\s*:\s*"[^"]+"\s*,\s*"(?:args|arguments)"\s*:\s*\{[^}]+\}\s*\}'
-            json_blocks = re.findall(json_pattern, content, re.DOTALL)
-        
-        for block in json_blocks:
-            try:
-                # 清理可能的格式问题
-                block = block.strip()
-                # 修复常见的JSON格式错误
-                block = re.sub(r',\s*}', '}', block)  # 移除末尾多余逗号
-                block = re.sub(r',\s*]', ']', block)  # 移除数组末尾多余逗号
-                
-                data = json.loads(block)
-                if 'tool' in data:
-                    tool_calls.append({
-                        'name': data['tool'],
-                        'arguments': data.get('args', data.get('arguments', {}))
-                    })
-                elif 'name' in data:
-                    # 兼容 {"name": "xxx", "arguments": {...}} 格式
-                    tool_calls.append({
-                        'name': data['name'],
-                        'arguments': data.get('arguments', data.get('args', {}))
-                    })
-            except (json.JSONDecodeError, KeyError) as e:
-                # 记录解析失败但不中断
-                print(f"[AI Client] JSON解析失败: {e}, 内容: {block[:100]}")
-                continue
-        
-        return tool_calls
+        # 括号平衡扫描：代码块内外的 {"tool"/"name": ..., "args"/"arguments": {...}} 均可识别
+        extractor = StreamingToolCallExtractor()
+        extractor.feed(content)
+        return extractor.calls
     
     def agent_loop_json_mode(self,
                               messages: List[Dict[str, Any]],
@@ -4700,7 +5792,9 @@ class AIClient:
                               on_tool_args_delta: Optional[Callable[[str, str, str], None]] = None,
                               on_iteration_start: Optional[Callable[[int], None]] = None,
                               on_plan_incomplete: Optional[Callable[[], Optional[str]]] = None,
-                              context_limit: int = 128000) -> Dict[str, Any]:
+                              context_limit: int = 128000,
+                              tool_router=None,
+                              router_session: str = '') -> Dict[str, Any]:
         """JSON 模式 Agent Loop（用于不支持 Function Calling 的模型）"""
         
         if not self._tool_executor:
@@ -4710,9 +5804,21 @@ class AIClient:
         # 注意：外部插件工具已在 ai_tab._run_agent 中合并到 tools_override，
         # 此处不再重复合并，避免工具重复。
         effective_tools = tools_override if tools_override is not None else HOUDINI_TOOLS
+        _conv_index = ConversationIndex()  # ★ 消息结构索引（跨迭代增量维护）
+        _tracer = get_tracer()  # ★ 耗时追踪（关闭时近乎零开销）
+        
+        # ★ 语义工具路由：系统提示只描述相关工具子集，其余工具仅列出名称
+        _all_tool_names = {t.get('function', {}).get('name', '') for t in effective_tools}
+        _omitted_tools: List[str] = []
+        if tool_router is not None:
+            effective_tools, _omitted_tools = tool_router.select(
+                effective_tools, list(messages), session=router_session)
+        _sent_tool_names = {t.get('function', {}).get('name', '') for t in effective_tools}
         
         # 添加 JSON 模式系统提示
         json_system_prompt = self._get_json_mode_system_prompt(effective_tools)
+        if _omitted_tools:
+            json_system_prompt += '\n\n' + tool_router.omitted_note(_omitted_tools)
         working_messages = []
         
         # 处理消息，在第一个 system 消息后追加 JSON 模式说明
@@ -4732,7 +5838,7 @@ class AIClient:
         
         # ── 预处理：非视觉模型剥离所有 image_url 内容 ──
         if not supports_vision:
-            n_stripped = self._strip_image_content(working_messages, keep_recent_user=0)
+            n_stripped = self._strip_image_content(working_messages, keep_recent_user=0, index=_conv_index)
             if n_stripped > 0:
                 print(f"[AI Client] 非视觉模型 ({model})：已剥离 {n_stripped} 张图片")
         
@@ -4774,15 +5880,19 @@ class AIClient:
             round_content = ""
             
             # ★ 主动式上下文压缩（从第 4 轮开始检查，替代旧的简单截断逻辑）
-            if iteration > 3 and len(working_messages) > 15:
-                est_tokens = self._estimate_messages_tokens(working_messages, effective_tools)
-                if est_tokens > context_limit * 0.85:
-                    print(f"[AI Client] ⚠️ JSON模式上下文 ~{est_tokens} tokens（阈值 {int(context_limit * 0.85)}），启动主动压缩")
+            # 预摘要水位（55%）每轮都检查
+            _check_compress = iteration > 3 and len(working_messages) > 15
+            est_tokens = self._estimate_messages_tokens(working_messages, effective_tools)
+            if _check_compress and est_tokens > context_limit * 0.85:
+                print(f"[AI Client] ⚠️ JSON模式上下文 ~{est_tokens} tokens（阈值 {int(context_limit * 0.85)}），启动主动压缩")
+                with _tracer.span('context.compress', est_tokens=est_tokens):
                     working_messages = self._smart_compress_in_loop(
                         working_messages, tool_calls_history,
-                        context_limit, supports_vision
+                        context_limit, supports_vision, index=_conv_index
                     )
-            elif iteration > 1 and len(working_messages) > 20:
+            else:
+                self._maybe_precompact(working_messages, est_tokens, context_limit, _conv_index)
+            if not _check_compress and iteration > 1 and len(working_messages) > 20:
                 # 轻量级防御：仅在未触发主动压缩时做简单截断
                 protect_start = max(1, len(working_messages) - 6)
                 for i, m in enumerate(working_messages):
@@ -4801,7 +5911,15 @@ class AIClient:
             if on_iteration_start:
                 on_iteration_start(iteration)
             
+            # ★ 流式工具调用提取：JSON 对象一闭合即解析，只读工具在生成期间推测执行
+            _extractor = StreamingToolCallExtractor()
+            _spec = _SpeculativeToolRunner(
+                self._get_tool_pool(), self._run_speculative_tool,
+                self._SPECULATIVE_TOOLS, self._stop_event,
+            )
+            
             # 流式请求（不传 tools 参数）
+            _t_req, _t_first = _trace_now(), None
             for chunk in self.chat_stream(
                 messages=working_messages,
                 model=model,
@@ -4811,7 +5929,10 @@ class AIClient:
                 tools=None,  # JSON 模式不使用原生工具
                 tool_choice=None
             ):
+                if _t_first is None:
+                    _t_first = _trace_now()
                 if self._stop_event.is_set():
+                    _spec.cancel()
                     return {
                         'ok': False, 'error': '用户停止了请求',
                         'content': full_content + round_content,
@@ -4827,6 +5948,8 @@ class AIClient:
                     round_content += content
                     if on_content:
                         on_content(content)
+                    for _tc in _extractor.feed(content):
+                        _spec.offer(_tc['name'], _tc['arguments'])
                 
                 elif chunk_type == 'thinking':
                     thinking_text = chunk.get('content', '')
@@ -4834,6 +5957,7 @@ class AIClient:
                         on_thinking(thinking_text)
                 
                 elif chunk_type == 'error':
+                    _spec.cancel()
                     err_msg = chunk.get('error', '')
                     err_lower = err_msg.lower()
                     
@@ -4867,7 +5991,7 @@ class AIClient:
                             working_messages = self._progressive_trim(
                                 working_messages, tool_calls_history,
                                 trim_level=server_error_retries,
-                                supports_vision=supports_vision
+                                supports_vision=supports_vision, index=_conv_index
                             )
                         else:
                             # 临时服务器错误：等待，第2次开始才裁剪
@@ -4879,7 +6003,7 @@ class AIClient:
                                 working_messages = self._progressive_trim(
                                     working_messages, tool_calls_history,
                                     trim_level=server_error_retries - 1,
-                                    supports_vision=supports_vision
+                                    supports_vision=supports_vision, index=_conv_index
                                 )
                         break  # 退出 for，回到 while 重试
                     return {
@@ -4938,11 +6062,18 @@ class AIClient:
             # 清理其他可能的XML标签
             cleaned_content = re.sub(r'<[^>]+>', '', cleaned_content)  # 清理所有剩余的XML标签
             
-            # 解析 JSON 工具调用
-            tool_calls = self._parse_json_tool_calls(cleaned_content)
+            _stream_end = time.time()
+            if _tracer.enabled:
+                _t_end = _trace_now()
+                _tracer.record('llm.ttft', _t_req, _t_first or _t_end, cat='llm', iteration=iteration)
+                _tracer.record('llm.stream', _t_first or _t_end, _t_end, cat='llm', iteration=iteration)
+            
+            # 解析 JSON 工具调用（优先使用流式提取结果；XML 等非 JSON 格式回退整段解析）
+            tool_calls = _extractor.calls or self._parse_json_tool_calls(cleaned_content)
             
             # 如果没有工具调用，检查是否完成
             if not tool_calls:
+                _spec.cancel()
                 # 清理后的内容添加到full_content（只添加一次，避免重复）
                 if cleaned_content.strip():
                     # 检查是否与已有内容重复（避免重复添加）
@@ -4999,30 +6130,27 @@ class AIClient:
             # 结果槽位
             exec_results = [None] * len(tool_calls)
 
-            # 并行 async 工具（web + shell）
-            if len(async_tc) > 1:
-                import concurrent.futures
-                def _exec_async_json(idx_tc):
-                    idx, tc = idx_tc
-                    tname, targs = tc['name'], tc['arguments']
-                    if tname == 'web_search':
-                        return idx, self._execute_web_search(targs)
-                    elif tname == 'fetch_webpage':
-                        return idx, self._execute_fetch_webpage(targs)
-                    else:  # execute_shell
-                        return idx, self._tool_executor(tname, **targs)
-                with concurrent.futures.ThreadPoolExecutor(max_workers=min(4, len(async_tc))) as pool:
-                    for idx, res in pool.map(_exec_async_json, async_tc):
-                        exec_results[idx] = res
-            elif len(async_tc) == 1:
-                idx, tc = async_tc[0]
-                tname, targs = tc['name'], tc['arguments']
-                if tname == 'web_search':
-                    exec_results[idx] = self._execute_web_search(targs)
-                elif tname == 'fetch_webpage':
-                    exec_results[idx] = self._execute_fetch_webpage(targs)
-                else:  # execute_shell
-                    exec_results[idx] = self._tool_executor(tname, **targs)
+            # 取回生成期间已推测执行的只读工具结果
+            for idx, tc in enumerate(tool_calls):
+                exec_results[idx] = _spec.take(tc['name'], tc['arguments'])
+            _spec.cancel()
+            if _spec.consumed_count:
+                _spec_saved = _spec.overlap_seconds(_stream_end)
+                if call_records and call_records[-1].get('iteration') == iteration:
+                    call_records[-1]['speculative_calls'] = _spec.consumed_count
+                    call_records[-1]['speculative_saved'] = round(_spec_saved, 3)
+                print(f"[AI Client] ⚡ JSON模式：生成期间已执行 {_spec.consumed_count} 个只读工具，"
+                      f"节省 {_spec_saved:.2f}s")
+            async_tc = [(i, tc) for i, tc in async_tc if exec_results[i] is None]
+            houdini_tc = [(i, tc) for i, tc in houdini_tc if exec_results[i] is None]
+
+            _t_tools = _trace_now()
+            # 并行 async 工具（web + shell，常驻线程池分道 + 按主机限流）
+            if async_tc:
+                async_results = self._run_async_tools(
+                    [(tc['name'], tc['arguments']) for _, tc in async_tc])
+                for (idx, _), res in zip(async_tc, async_results):
+                    exec_results[idx] = res
 
             # Houdini 工具（只读批量 / 写入串行）
             _BATCH_READONLY_JSON = frozenset({
@@ -5072,10 +6200,17 @@ class AIClient:
                         import traceback
                         exec_results[idx] = {"success": False, "error": f"工具执行异常: {str(e)}\n{traceback.format_exc()[:200]}"}
 
+            _tracer.record('tools.execute', _t_tools, cat='tool', iteration=iteration,
+                           calls=len(async_tc) + len(houdini_tc))
+
             # 统一处理结果
             should_break_limit = False
             for i, tc in enumerate(tool_calls):
                 tool_name = tc['name']
+                if tool_name not in _sent_tool_names and tool_name in _all_tool_names:
+                    _sent_tool_names.add(tool_name)
+                    if tool_router is not None:
+                        tool_router.record_miss(tool_name, router_session)
                 arguments = tc['arguments']
                 result = exec_results[i]
 
@@ -5161,18 +6296,20 @@ class AIClient:
             # 注意：部分模型不支持多个 system 消息，此处使用明确的 [TOOL_RESULT] 标记
             # ★ 检查是否有视口截图需要注入
             _viewport_imgs = []
-            if supports_vision:
-                for tc in tool_calls:
-                    _r = exec_results.get(tool_calls.index(tc))
-                    if isinstance(_r, dict) and _r.get('_viewport_image'):
-                        _viewport_imgs.append((_r['_viewport_image'], _r.get('_image_media_type', 'image/jpeg')))
+            for _r in exec_results:
+                _url = self._viewport_attachment(_r, working_messages, supports_vision)
+                if _url:
+                    _viewport_imgs.append(_url)
+                elif supports_vision and isinstance(_r, dict) and _r.get('_viewport_unchanged'):
+                    # ★ 视口未变化且上一张截图仍在上下文中：不重复附加同一张图片
+                    prompt += '|（视口与上一张截图相同，图片见上文，未重复附加）'
             
             if _viewport_imgs:
                 # 多模态消息：文本 + 图片
                 _content_parts = [{"type": "text", "text": f"[TOOL_RESULT]\n{prompt}\n[viewport snapshot attached — please analyze the current viewport state]"}]
-                for _vimg_b64, _vimg_mt in _viewport_imgs:
-                    _content_parts.append({"type": "image_url", "image_url": {"url": f"data:{_vimg_mt};base64,{_vimg_b64}"}})
-                    print(f"[AI Client] 📸 视口截图已注入消息 (JSON mode, {len(_vimg_b64)//1024}KB)")
+                for _vimg_url in _viewport_imgs:
+                    _content_parts.append({"type": "image_url", "image_url": {"url": _vimg_url}})
+                    print(f"[AI Client] 📸 视口截图已注入消息 (JSON mode, {len(_vimg_url)//1024}KB)")
                 working_messages.append({'role': 'user', 'content': _content_parts})
             else:
                 working_messages.append({
@@ -5264,3 +6401,101 @@ class AIClient:
 
 # 兼容旧代码
 OpenAIClient = AIClient
+
+
+# ─────────────────────────────────────────────
+# 对冲搜索验证：python -m houdini_agent.utils.ai_client
+# 两个本地替身服务器分别模拟 Brave / DuckDuckGo 结果页（可配延迟 / 失败）
+# ─────────────────────────────────────────────
+
+def _benchmark():
+    import http.server
+    import tempfile
+    from pathlib import Path
+    os.environ.setdefault('NO_PROXY', '127.0.0.1,localhost')
+
+    class _Engine:
+        def __init__(self, name: str):
+            self.name = name
+            self.delay = 0.0
+            self.fail = False
+            self.hits = 0
+
+        def page(self) -> str:
+            if self.name == 'brave':
+                return ''.join(
+                    f'<div class="snippet svelte-x" data-type="web" data-pos="{i}">'
+                    f'<a href="https://example.com/b{i}"><div class="title search-snippet-title">'
+                    f'Brave result {i}</div></a><div class="snippet-description">brave snippet {i}</div></div>'
+                    for i in range(5))
+            return ''.join(
+                f'<a class="result__a" href="https://example.com/d{i}">DDG result {i}</a>'
+                f'<a class="result__snippet">ddg snippet {i}</a>' for i in range(5))
+
+    def _serve(engine: _Engine):
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def _reply(self):
+                engine.hits += 1
+                time.sleep(engine.delay)
+                body = engine.page().encode('utf-8')
+                self.send_response(500 if engine.fail else 200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = _reply
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    brave, ddg = _Engine('brave'), _Engine('duckduckgo')
+    servers = [_serve(brave), _serve(ddg)]
+    tmp = Path(tempfile.mkdtemp())
+    WebSearcher._search_cache = WebCache('search', 256, 1800, cache_dir=tmp)
+    WebSearcher._page_cache = WebCache('pages', 128, 86400, cache_dir=tmp)
+
+    def _run(label: str, pool: '_AsyncToolPool', b_delay=0.0, b_fail=False, d_delay=0.0,
+             merge=False, in_lane=False):
+        WebSearcher._engine_stats.clear()
+        brave.delay, brave.fail, brave.hits = b_delay, b_fail, 0
+        ddg.delay, ddg.fail, ddg.hits = d_delay, False, 0
+        searcher = WebSearcher(
+            merge=merge, pool_getter=lambda: pool,
+            brave_url=f"http://127.0.0.1:{servers[0].server_address[1]}/search",
+            duckduckgo_url=f"http://127.0.0.1:{servers[1].server_address[1]}/html/")
+        t0 = time.time()
+        if in_lane:
+            r = pool.submit('web', searcher.search, label, 5, 8).result()
+        else:
+            r = searcher.search(label, max_results=5, timeout=8)
+        dt = time.time() - t0
+        print(f"{label:<28} {dt * 1000:7.0f} ms  source={r.get('source', '-'):<18} "
+              f"results={len(r.get('results', []))}  requests brave={brave.hits} ddg={ddg.hits}")
+
+    pool = _AsyncToolPool()
+    try:
+        _run('fast primary', pool, b_delay=0.05)
+        _run('slow primary (hedge wins)', pool, b_delay=3.0, d_delay=0.05)
+        _run('primary fails', pool, b_fail=True)
+        _run('merge', pool, b_delay=0.05, d_delay=0.1, merge=True)
+        busy = _AsyncToolPool(web_workers=1)
+        try:
+            _run('saturated web lane', busy, b_delay=0.05, in_lane=True)
+        finally:
+            busy.shutdown()
+        print("engine stats:", WebSearcher.engine_stats())
+    finally:
+        pool.shutdown()
+        for server in servers:
+            server.shutdown()
+        import shutil
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    _benchmark()
@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+"""
+ConversationIndex — 消息列表的结构索引（轮次 / 工具调用配对 / 图片位置）
+ToolResultDedup   — 内容寻址的重复工具结果去重
+
+上下文压缩的各个阶段（过时标记、图片剥离、分级压缩、按轮裁剪）原本各自
+从头遍历整个消息列表重新发现同样的结构。本索引跨 Agent 迭代常驻，sync() 时：
+  - 只追加了新消息（最常见）→ 增量索引新消息，O(新增)
+  - 列表被重建（压缩 / 裁剪 / 清洗删除了消息）→ 整体重建一次，O(n)
+
+身份校验：记录首条、末条及每个轮次起点消息的 id()。_sanitize_working_messages
+等返回新列表但保留原消息对象时，校验仍然通过，不会触发重建。
+就地修改 content 不影响结构；剥离图片后调用 discard_image() 同步。
+
+轮次划分与 _smart_compress_in_loop / _progressive_trim 完全一致：
+首条 system 消息不计入，正文以 user 消息为分界。
+"""
+
+import difflib
+import hashlib
+import json
+import re
+import time
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+
+class ConversationIndex:
+    """消息列表结构索引（随 sync() 增量维护）"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._size = 0
+        self._first_id: Optional[int] = None
+        self._last_id: Optional[int] = None
+        self.has_system = False
+        self.round_starts: List[int] = []          # 每个轮次首条消息的下标
+        self._round_start_ids: List[int] = []
+        self.user_positions: List[int] = []        # user 消息下标（升序）
+        self.tool_positions: List[int] = []        # tool 消息下标（升序）
+        self.image_positions: List[int] = []       # 含 image_url 的消息下标（升序）
+        self.tool_calls: Dict[str, Tuple[int, str, str]] = {}  # tc_id → (assistant 下标, 工具名, 参数 JSON)
+        self.tool_results: Dict[str, int] = {}     # tc_id → tool 消息下标
+        self._args_cache: Dict[str, dict] = {}
+
+    # ---------- 同步 ----------
+
+    def sync(self, messages: list) -> 'ConversationIndex':
+        """与 messages 对齐：前缀未变则增量追加，否则整体重建"""
+        if not self._prefix_intact(messages):
+            self.reset()
+        for i in range(self._size, len(messages)):
+            self._add(i, messages[i])
+        self._size = len(messages)
+        if messages:
+            self._first_id = id(messages[0])
+            self._last_id = id(messages[-1])
+        return self
+
+    def _prefix_intact(self, messages: list) -> bool:
+        n = self._size
+        if n == 0:
+            return True
+        if len(messages) < n:
+            return False
+        if id(messages[0]) != self._first_id or id(messages[n - 1]) != self._last_id:
+            return False
+        for pos, mid in zip(self.round_starts, self._round_start_ids):
+            if id(messages[pos]) != mid:
+                return False
+        return True
+
+    def _add(self, i: int, msg: dict):
+        role = msg.get('role')
+        if i == 0 and role == 'system':
+            self.has_system = True
+            return
+        body_start = 1 if self.has_system else 0
+        if i == body_start or role == 'user':
+            self.round_starts.append(i)
+            self._round_start_ids.append(id(msg))
+        if role == 'user':
+            self.user_positions.append(i)
+        elif role == 'tool':
+            self.tool_positions.append(i)
+            tc_id = msg.get('tool_call_id', '')
+            if tc_id:
+                self.tool_results[tc_id] = i
+        elif role == 'assistant':
+            for tc in msg.get('tool_calls') or ():
+                tc_id = tc.get('id', '')
+                fn = tc.get('function', {})
+                name = fn.get('name', '')
+                if tc_id and name:
+                    self.tool_calls[tc_id] = (i, name, fn.get('arguments', '{}'))
+        content = msg.get('content')
+        if isinstance(content, list) and any(
+                isinstance(p, dict) and p.get('type') == 'image_url' for p in content):
+            self.image_positions.append(i)
+
+    # ---------- 查询 ----------
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def n_rounds(self) -> int:
+        return len(self.round_starts)
+
+    def round_of(self, pos: int) -> int:
+        """消息下标所在的轮次（系统消息返回 -1）"""
+        return bisect_right(self.round_starts, pos) - 1
+
+    def round_bounds(self, r: int) -> Tuple[int, int]:
+        """轮次 r 的消息下标区间 [start, end)"""
+        end = self.round_starts[r + 1] if r + 1 < len(self.round_starts) else self._size
+        return self.round_starts[r], end
+
+    def split(self, messages: list) -> Tuple[Optional[dict], List[list]]:
+        """(系统消息或 None, 轮次列表)，messages 须已 sync"""
+        starts = self.round_starts
+        rounds = [messages[s:e] for s, e in zip(starts, starts[1:] + [len(messages)])]
+        return (messages[0] if self.has_system else None), rounds
+
+    def tool_name(self, tc_id: str) -> str:
+        info = self.tool_calls.get(tc_id)
+        return info[1] if info else ''
+
+    def tool_args(self, tc_id: str) -> dict:
+        """工具调用参数（解析结果按 tc_id 缓存）"""
+        args = self._args_cache.get(tc_id)
+        if args is None:
+            info = self.tool_calls.get(tc_id)
+            try:
+                args = json.loads(info[2]) if info else {}
+            except Exception:
+                args = {}
+            if not isinstance(args, dict):
+                args = {}
+            self._args_cache[tc_id] = args
+        return args
+
+    def recent_user_positions(self, n: int) -> List[int]:
+        return self.user_positions[-n:] if n > 0 else []
+
+    def discard_image(self, pos: int):
+        """图片已被剥离（content 转为纯文本）"""
+        try:
+            self.image_positions.remove(pos)
+        except ValueError:
+            pass
+
+    def round_token_counts(self, messages: list, count_fn) -> List[int]:
+        """每个轮次的 token 数（count_fn(消息列表) → int，须可按消息相加）"""
+        starts = self.round_starts
+        return [count_fn(messages[s:e]) for s, e in zip(starts, starts[1:] + [len(messages)])]
+
+
+# get_network_structure 结果末尾的快照令牌行（见 HoudiniMCP._network_structure_response）
+_SNAPSHOT_TRAILER = re.compile(r'\n\n\[snapshot: [^\]\n]+\][^\n]*\Z')
+
+
+class ToolResultDedup:
+    """内容寻址的工具结果去重（同一 Agent 循环内常驻）
+
+    Agent 经常反复调用同一个查询工具（如对同一网络 get_network_structure），
+    每份完整结果都留在上下文里直到被分级压缩。本类按内容哈希登记 tool 消息：
+      - 新结果与上下文中较早的某份完全相同 → 新结果写为 "[Same] 见之前的结果"
+      - 同名工具的新结果与旧副本近似（行级 diff 足够小）→ 新结果写为相对旧副本的 diff
+    只改写尚未加入上下文的新消息：较早的消息（可能已持久化到会话历史、
+    位于提示词缓存前缀中）保持不变。旧副本的内容已不是登记时的原字符串
+    （被压缩改写过）时不再作为引用目标。
+
+    结果末尾的 "[snapshot: …]" 行（get_network_structure 增量令牌，每次都不同）
+    不参与比较，改写后原样保留在新消息末尾。
+
+    ★ 被引用的旧副本（基准消息）是引用消息唯一的数据来源：
+      - protected_ids(): 仍被有效引用的基准消息，过时标记 / 分级压缩须跳过
+      - repair(): 压缩 / 裁剪后基准消息被改写或移出上下文时，把引用消息还原为完整内容
+    """
+
+    MIN_CHARS = 400            # 太短的结果改写收益不大
+    MAX_DIFF_CHARS = 20000     # 超长结果不做 diff（控制 difflib 开销）
+    DIFF_MAX_RATIO = 0.4       # diff 不超过新结果 40% 才替换
+    DIFF_CANDIDATES = 3        # 每个工具只与最近几份完整结果比较
+
+    def __init__(self):
+        self._by_hash: Dict[str, Tuple[dict, str, str]] = {}        # sha1 → (tool 消息, 登记时的内容, 工具名)
+        self._by_tool: Dict[str, List[Tuple[dict, str, str]]] = {}  # 工具名 → [(消息, 内容, sha1)]
+        # id(基准消息) → (基准消息, 登记时的内容, [(引用消息, 原始完整内容, 改写后内容, 工具名)])
+        self._refs: Dict[int, Tuple[dict, str, List[Tuple[dict, str, str, str]]]] = {}
+        self.same = 0
+        self.diffs = 0
+        self.saved_chars = 0
+
+    def seed(self, messages: list, index: 'ConversationIndex'):
+        """登记已有上下文中的 tool 消息（历史轮次），不做改写"""
+        index.sync(messages)
+        for i in index.tool_positions:
+            msg = messages[i]
+            content = msg.get('content')
+            if isinstance(content, str) and len(content) >= self.MIN_CHARS:
+                self._register(msg, content, index.tool_name(msg.get('tool_call_id', '')))
+
+    def add(self, msg: dict, tool_name: str) -> int:
+        """登记新 tool 消息（须在加入上下文之前调用）
+
+        与较早的完整副本相同 / 近似时把新消息的 content 改写为引用或 diff，
+        返回节省的字符数；否则登记为完整副本，返回 0。
+        """
+        content = msg.get('content')
+        if not isinstance(content, str) or len(content) < self.MIN_CHARS:
+            return 0
+        body, trailer = self._split_trailer(content)
+        h = self._hash(body)
+
+        prev = self._by_hash.get(h)
+        base = None
+        if prev is not None and prev[0] is not msg and prev[0].get('content') is prev[1]:
+            msg['content'] = (f"[Same] 此结果与之前的 {self._ref(prev[0], prev[2] or tool_name)} "
+                              f"结果完全相同，请参考该结果。{trailer}")
+            saved = len(content) - len(msg['content'])
+            base = prev[:2]
+            self.same += 1
+        elif tool_name and len(body) <= self.MAX_DIFF_CHARS:
+            saved, base = self._diff_against_candidates(msg, body, trailer, tool_name)
+        else:
+            saved = 0
+
+        if saved <= 0:
+            if base is not None:
+                msg['content'] = content
+            self._register(msg, content, tool_name, h)
+            return 0
+        entry = self._refs.setdefault(id(base[0]), (base[0], base[1], []))
+        entry[2].append((msg, content, msg['content'], tool_name))
+        self.saved_chars += saved
+        return saved
+
+    def protected_ids(self) -> Set[int]:
+        """仍被有效引用（引用消息尚未被改写）的基准消息 id()"""
+        return {key for key, (base, base_content, refs) in self._refs.items()
+                if base.get('content') is base_content
+                and any(ref.get('content') is rewritten for ref, _, rewritten, _ in refs)}
+
+    def repair(self, messages: list) -> int:
+        """压缩 / 裁剪之后调用：基准消息已被改写或不在上下文中时，引用消息还原为完整内容
+
+        还原后的消息重新登记为完整副本；不在上下文中的消息从登记表移除。
+        返回还原的消息数。
+        """
+        present = {id(m) for m in messages}
+        restored = 0
+        for key, (base, base_content, refs) in list(self._refs.items()):
+            if key in present and base.get('content') is base_content:
+                continue
+            del self._refs[key]
+            for ref, original, rewritten, tool_name in refs:
+                if id(ref) in present and ref.get('content') is rewritten:
+                    ref['content'] = original
+                    self._register(ref, original, tool_name)
+                    restored += 1
+        for h, (msg, _, _) in list(self._by_hash.items()):
+            if id(msg) not in present:
+                del self._by_hash[h]
+        for tool_name, lst in list(self._by_tool.items()):
+            lst[:] = [e for e in lst if id(e[0]) in present]
+        return restored
+
+    # ---------- 内部 ----------
+
+    @staticmethod
+    def _split_trailer(content: str) -> Tuple[str, str]:
+        """(正文, 末尾的快照令牌行)；无令牌行时后者为空串"""
+        m = _SNAPSHOT_TRAILER.search(content)
+        if m is None:
+            return content, ''
+        return content[:m.start()], content[m.start():]
+
+    @staticmethod
+    def _hash(content: str) -> str:
+        return hashlib.sha1(content.encode('utf-8', 'replace')).hexdigest()
+
+    @staticmethod
+    def _ref(msg: dict, tool_name: str) -> str:
+        return f"{tool_name}（tool_call_id={msg.get('tool_call_id', '')}）"
+
+    def _register(self, msg: dict, content: str, tool_name: str, h: Optional[str] = None):
+        h = h or self._hash(self._split_trailer(content)[0])
+        self._by_hash[h] = (msg, content, tool_name)
+        if tool_name:
+            lst = self._by_tool.setdefault(tool_name, [])
+            lst.append((msg, content, h))
+            if len(lst) > self.DIFF_CANDIDATES:
+                del lst[0]
+
+    def _diff_against_candidates(self, msg: dict, content: str, trailer: str,
+                                 tool_name: str) -> Tuple[int, Optional[Tuple[dict, str]]]:
+        """(节省字符数, (基准消息, 其登记内容))；无合适基准时返回 (0, None)"""
+        new_lines = content.splitlines()
+        for old_msg, old_content, _ in reversed(self._by_tool.get(tool_name, [])):
+            if old_msg is msg or old_msg.get('content') is not old_content:
+                continue
+            old_body = self._split_trailer(old_content)[0]
+            if len(old_body) > self.MAX_DIFF_CHARS:
+                continue
+            old_lines = old_body.splitlines()
+            sm = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+            if sm.real_quick_ratio() < 0.6 or sm.quick_ratio() < 0.6:
+                continue
+            diff = [ln for ln in difflib.unified_diff(old_lines, new_lines, n=0, lineterm='')
+                    if not ln.startswith(('---', '+++'))]
+            body = '\n'.join(diff)
+            if len(body) > len(content) * self.DIFF_MAX_RATIO:
+                continue
+            msg['content'] = (
+                f"[Diff] 此结果与之前的 {self._ref(old_msg, tool_name)} 结果仅有以下差异"
+                f"（- 为该结果中的行，+ 为此结果中的行）:\n{body}{trailer}"
+            )
+            self.diffs += 1
+            return len(content) + len(trailer) - len(msg['content']), (old_msg, old_content)
+        return 0, None
+
+    def stats(self) -> Dict[str, int]:
+        return {'same': self.same, 'diffs': self.diffs, 'saved_chars': self.saved_chars}
+
+
+# ─────────────────────────────────────────────
+# 基准测试：python -m houdini_agent.utils.conversation_index
+# ─────────────────────────────────────────────
+
+def _benchmark(n_rounds: int = 250, repeat: int = 20):
+    """模拟 2000+ 条消息的长会话：每轮 user + assistant(tool_calls) + 5 × tool + assistant"""
+    messages: List[Dict[str, Any]] = [{'role': 'system', 'content': 'sys'}]
+
+    def _append_round(r: int):
+        messages.append({'role': 'user', 'content': [
+            {'type': 'text', 'text': f'round {r}'},
+            {'type': 'image_url', 'image_url': {'url': 'data:image/png;base64,AAAA'}},
+        ] if r % 10 == 0 else f'round {r}'})
+        tcs = [{'id': f'c{r}_{k}', 'type': 'function', 'function': {
+            'name': 'get_node_parameters', 'arguments': json.dumps({'node_path': f'/obj/n{k}'})}}
+            for k in range(5)]
+        messages.append({'role': 'assistant', 'content': None, 'tool_calls': tcs})
+        for tc in tcs:
+            messages.append({'role': 'tool', 'tool_call_id': tc['id'], 'content': 'x' * 800})
+        messages.append({'role': 'assistant', 'content': 'done'})
+
+    for r in range(n_rounds):
+        _append_round(r)
+    print(f"messages={len(messages)}, rounds={n_rounds}")
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        ConversationIndex().sync(messages)
+    full = (time.perf_counter() - t0) / repeat
+
+    idx = ConversationIndex().sync(messages)
+    t0 = time.perf_counter()
+    for r in range(n_rounds, n_rounds + repeat):
+        _append_round(r)
+        idx.sync(messages)
+    incr = (time.perf_counter() - t0) / repeat
+
+    # 按轮裁剪：逐轮重新估算 vs 每轮 token 数预先计算后相减
+    def _count(msgs):
+        return sum(len(m.get('content') or '') // 3 + 4 for m in msgs
+                   if not isinstance(m.get('content'), list))
+
+    keep = 2
+    t0 = time.perf_counter()
+    _, rounds = idx.split(messages)
+    while len(rounds) > keep:
+        rounds.pop(0)
+        _count([m for rnd in rounds for m in rnd])
+    rescan = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    per_round = idx.round_token_counts(messages, _count)
+    total = sum(per_round)
+    for c in per_round[:-keep]:
+        total -= c
+    subtract = time.perf_counter() - t0
+
+    print(f"full rebuild      : {full * 1000:.2f} ms")
+    print(f"incremental sync  : {incr * 1000:.3f} ms (+1 round)")
+    print(f"round trim rescan : {rescan * 1000:.1f} ms")
+    print(f"round trim indexed: {subtract * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    _benchmark()
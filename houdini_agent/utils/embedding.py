@@ -11,6 +11,7 @@
 
 import os
 import hashlib
+import threading
 import numpy as np
 from pathlib import Path
 from typing import List, Optional, Union
@@ -30,6 +31,7 @@ _MODEL_CACHE_DIR = Path(__file__).parent.parent.parent / "cache" / "memory" / "e
 # 全局单例
 # ============================================================
 _embedder_instance = None
+_embedder_lock = threading.Lock()  # ★ 路由预热线程与 agent 线程可能同时首次获取，只允许加载一次模型
 
 
 class LocalEmbedder:
@@ -49,6 +51,7 @@ class LocalEmbedder:
         self._backend = "none"  # "sentence-transformers" | "fallback"
         self._encode_cache = {}  # 小型内存缓存: hash -> vector
         self._max_cache = 2000
+        self._cache_lock = threading.Lock()  # ★ 多线程共用单例，缓存读写与淘汰需互斥
 
         self._try_load_model()
 
@@ -102,8 +105,10 @@ class LocalEmbedder:
 
         # 内存缓存
         cache_key = hashlib.md5(text.encode('utf-8', errors='ignore')).hexdigest()
-        if cache_key in self._encode_cache:
-            return self._encode_cache[cache_key]
+        with self._cache_lock:
+            cached = self._encode_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
         if self._backend == "sentence-transformers":
             vec = self._encode_st(text)
@@ -117,12 +122,13 @@ class LocalEmbedder:
         vec = vec.astype(np.float32)
 
         # 写入缓存（LRU 风格限制大小）
-        if len(self._encode_cache) >= self._max_cache:
-            # 删除最早的 20%
-            keys = list(self._encode_cache.keys())
-            for k in keys[:len(keys) // 5]:
-                del self._encode_cache[k]
-        self._encode_cache[cache_key] = vec
+        with self._cache_lock:
+            if len(self._encode_cache) >= self._max_cache:
+                # 删除最早的 20%
+                keys = list(self._encode_cache.keys())
+                for k in keys[:len(keys) // 5]:
+                    del self._encode_cache[k]
+            self._encode_cache[cache_key] = vec
 
         return vec
 
@@ -249,5 +255,12 @@ def get_embedder(model_name: str = DEFAULT_MODEL) -> LocalEmbedder:
     """获取全局 Embedding 编码器实例（单例）"""
     global _embedder_instance
     if _embedder_instance is None:
-        _embedder_instance = LocalEmbedder(model_name)
+        with _embedder_lock:
+            if _embedder_instance is None:
+                _embedder_instance = LocalEmbedder(model_name)
+    return _embedder_instance
+
+
+def get_embedder_if_loaded() -> Optional[LocalEmbedder]:
+    """已初始化则返回单例，否则返回 None（不触发模型加载，供热路径使用）"""
     return _embedder_instance
@@ -109,6 +109,10 @@ class HookManager:
                 (p, cb) for p, cb in self._hooks[event] if cb is not callback
             ]
 
+    def has_hooks(self, *events: str) -> bool:
+        """任一事件是否注册了回调"""
+        return any(self._hooks.get(e) for e in events)
+
     def unregister_all(self, plugin_name: str = ""):
         """注销所有钩子（或指定插件的钩子）
 
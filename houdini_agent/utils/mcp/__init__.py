@@ -7,12 +7,24 @@
     server.py    → FastMCP HTTP 服务器，面向外部 MCP 客户端
     settings.py  → MCPSettings 配置数据类
     logger.py    → 日志工具
+    scene_events.py → 场景版本号 + hou 事件监听（工具结果缓存失效）
+    scene_mirror.py → 事件驱动的节点图镜像（只读结构查询脱离主线程）
+    param_search.py → find_nodes_by_param 的参数值谓词（等于 / 正则 / 数值范围）
+    page_cache.py   → 工具结果分页缓存（字节预算 LRU + TTL）
+    node_catalog.py → 持久化节点类型目录（词法 + 向量排序的节点搜索）
+    exec_watchdog.py → execute_python 的看门狗超时中断（替代 sys.settrace）
+    output_stream.py → shell / python 输出的流式推送与有界头尾缓冲
+    geo_reader.py   → 几何属性批量读取 + numpy 分块统计（几何信息 / 几何类 Skill 共用）
+    viewport_capture.py → 视口截图的 token 预算降采样 / 后台编码 / 帧缓存
 
 Public APIs:
 - HoudiniMCP: UI-side helper client
 - ensure_mcp_running / stop_mcp_server / get_mcp_status: server lifecycle
 - MCPSettings / read_settings / get_logger: config and logging
 - hou_core: shared Houdini operation primitives
+- SceneMonitor / get_scene_monitor: scene version counter driven by hou events
+- SceneMirror / get_scene_mirror: in-memory node graph mirror for off-main-thread reads
+- NodeTypeCatalog / get_node_catalog: persistent node-type catalog for ranked node search
 """
 from __future__ import annotations
 
@@ -20,6 +32,9 @@ from .settings import MCPSettings, read_settings
 from .logger import get_logger
 from .client import HoudiniMCP
 from .server import ensure_mcp_running, stop_mcp_server, get_mcp_status
+from .scene_events import SceneMonitor, get_scene_monitor
+from .scene_mirror import SceneMirror, get_scene_mirror
+from .node_catalog import NodeTypeCatalog, get_node_catalog
 from . import hou_core
 
 __all__ = [
@@ -31,4 +46,10 @@ __all__ = [
     "stop_mcp_server",
     "get_mcp_status",
     "hou_core",
+    "SceneMonitor",
+    "get_scene_monitor",
+    "SceneMirror",
+    "get_scene_mirror",
+    "NodeTypeCatalog",
+    "get_node_catalog",
 ]
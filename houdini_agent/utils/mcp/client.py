@@ -10,6 +10,8 @@ import sys
 import re
 import time
 import json
+import threading
+from collections import OrderedDict
 from typing import Any, Optional, Dict, List, Tuple
 from pathlib import Path
 
@@ -38,6 +40,12 @@ except ImportError:
     requests = None  # type: ignore
 
 from .settings import read_settings
+from .scene_events import get_scene_monitor
+from .scene_mirror import get_scene_mirror
+from .param_search import ParamPredicate
+from .page_cache import PagedText, ToolPageCache
+from .node_catalog import get_node_catalog
+from ..tracer import get_tracer
 
 # 导入 RAG 检索系统
 try:
@@ -86,6 +94,63 @@ if not HAS_SKILLS:
     print("[MCP Client] Skill 系统未加载，run_skill/list_skills 不可用")
 
 
+_WRANGLE_KEYWORDS = ('wrangle', 'snippet', 'vopnet')
+_PYTHON_CODE_PARMS = ('python', 'code', 'script')
+
+
+class NodeTypeMeta:
+    """节点类型级常量（类别 / 描述 / 输入标签 / 代码参数），由 HoudiniMCP.node_type_meta 缓存"""
+
+    __slots__ = ('type_key', 'type_name', 'type_label', 'code_parm', 'code_kind',
+                 '_node_type', '_input_labels')
+
+    def __init__(self, node_type: Any):
+        try:
+            category = node_type.category().name()
+        except Exception:
+            category = "Unknown"
+        self.type_name = node_type.name()
+        self.type_key = f"{category.lower()}/{self.type_name}"
+        try:
+            self.type_label = node_type.description() or ""
+        except Exception:
+            self.type_label = ""
+        # 代码参数分类：wrangle → snippet (VEX)，python 节点 → python/code/script
+        lower = self.type_name.lower()
+        if any(kw in lower for kw in _WRANGLE_KEYWORDS):
+            self.code_kind, self.code_parm = "vex_code", ("snippet",)
+        elif 'python' in lower:
+            self.code_kind, self.code_parm = "python_code", _PYTHON_CODE_PARMS
+        else:
+            self.code_kind, self.code_parm = None, ()
+        self._node_type = node_type
+        self._input_labels: Dict[int, str] = {}
+
+    def input_label(self, idx: int) -> str:
+        """输入端口标签（按索引惰性缓存；merge 等节点的最大输入数可达上千）"""
+        label = self._input_labels.get(idx)
+        if label is None:
+            try:
+                label = self._node_type.inputLabel(idx) or ""
+            except Exception:
+                label = ""
+            self._input_labels[idx] = label
+        return label
+
+    def read_code(self, node: Any) -> Optional[str]:
+        """读取节点实例的代码参数（非代码节点直接返回 None）"""
+        for pname in self.code_parm:
+            try:
+                parm = node.parm(pname)
+                if parm:
+                    code = parm.eval()
+                    if code and code.strip():
+                        return code.strip()
+            except Exception:
+                return None
+        return None
+
+
 class HoudiniMCP:
     """Houdini 节点操作客户端
     
@@ -98,17 +163,30 @@ class HoudiniMCP:
     _node_types_cache_time: float = 0  # 缓存时间
     _common_node_inputs_cache: Dict[str, str] = {}  # 常见节点输入信息缓存
     _ats_cache: Dict[str, Dict[str, Any]] = {}  # ATS缓存: {node_type_key: ats_data}
+    _type_meta_cache: Dict[str, NodeTypeMeta] = {}  # 节点类型元数据: {nameWithCategory: meta}
+    _type_meta_listening = False  # 是否已订阅 HDA 事件（定义重载时清空上述类型缓存）
 
     # perfMon 性能分析：当前活跃的 profile 对象
     _active_perf_profile: Any = None
 
-    # 通用工具结果分页缓存：key = "tool_name:unique_key" → 完整文本
-    _tool_page_cache: Dict[str, str] = {}
+    # 通用工具结果分页缓存：key = "tool_name:unique_key" → 完整文本（字节预算 LRU + TTL）
+    _tool_page_cache = ToolPageCache()
     _TOOL_PAGE_LINES = 50  # 每页行数
 
+    # get_network_structure 增量模式：按 (会话, 网络, box) 分组保存快照指纹（见 _put_net_snapshot）
+    _NET_SNAPSHOT_PER_SCOPE = 4      # 每个 (会话, 网络, box) 保留的快照数
+    _NET_SNAPSHOT_SCOPES = 64        # 最多保留的 (会话, 网络, box) 组数
+    _NET_SNAPSHOT_MAX_NODES = 20000  # 超过此节点数的网络不保存快照（总是返回完整结构）
+
     def __init__(self):
         import threading
         self._stop_event: Optional[threading.Event] = None
+        self._output_callback = None
+        self._session_id = ''
+        self._net_snapshots: "OrderedDict[tuple, OrderedDict[str, Dict[str, Any]]]" = OrderedDict()
+        self._net_snapshot_scope: Dict[str, tuple] = {}   # 令牌 → (会话, 网络, box)
+        self._net_snapshot_lock = threading.Lock()
+        self._net_snapshot_seq = 0
 
     def set_stop_event(self, event):
         """设置停止事件（从 AIClient 传入，用于检测用户中断）
@@ -117,6 +195,18 @@ class HoudiniMCP:
         """
         self._stop_event = event
 
+    def set_session(self, session_id: str):
+        """设置当前 Agent 会话（get_network_structure 快照按会话隔离）"""
+        self._session_id = session_id or ''
+
+    def set_output_stream_callback(self, callback):
+        """设置增量输出回调（UI 用于实时显示 shell / python 输出）
+        
+        callback(kind, source, event, payload)，见 output_stream 模块说明。
+        在生产输出的线程中调用（shell: 后台线程；python: 主线程），回调需自行跨线程转发。
+        """
+        self._output_callback = callback
+
     @classmethod
     def _paginate_tool_result(cls, text: str, cache_key: str, tool_hint: str,
                               page: int = 1, page_lines: int = 0) -> str:
@@ -129,20 +219,36 @@ class HoudiniMCP:
             page: 页码（从 1 开始）
             page_lines: 每页行数，0 表示使用默认值
         """
+        entry = cls._tool_page_cache.put(cache_key, text)
+        return cls._render_page(entry, tool_hint, page, page_lines)
+
+    @classmethod
+    def _cached_page(cls, cache_key: str, tool_hint: str,
+                     page: int, page_lines: int = 0) -> Optional[str]:
+        """翻页快速路径：缓存命中时直接切出第 page 页，未命中 / 已过期返回 None"""
+        entry = cls._tool_page_cache.get(cache_key)
+        if entry is None:
+            return None
+        return cls._render_page(entry, tool_hint, page, page_lines)
+
+    @classmethod
+    def get_page_cache_stats(cls) -> Dict[str, Any]:
+        """分页缓存命中 / 淘汰统计"""
+        return cls._tool_page_cache.stats()
+
+    @classmethod
+    def _render_page(cls, entry: PagedText, tool_hint: str, page: int, page_lines: int = 0) -> str:
         if not page_lines:
             page_lines = cls._TOOL_PAGE_LINES
 
-        cls._tool_page_cache[cache_key] = text
-
-        lines = text.split('\n')
-        total_lines = len(lines)
+        total_lines = entry.line_count
         total_pages = max(1, (total_lines + page_lines - 1) // page_lines)
 
         page = max(1, min(page, total_pages))
 
         start = (page - 1) * page_lines
         end = min(start + page_lines, total_lines)
-        page_text = '\n'.join(lines[start:end])
+        page_text = entry.lines(start, end)
 
         if total_pages == 1:
             return page_text
@@ -217,10 +323,10 @@ class HoudiniMCP:
             
             for node in children:
                 try:
-                    node_type = node.type()
-                    category = node_type.category().name() if node_type else "Unknown"
-                    type_name = node_type.name() if node_type else "unknown"
-                    
+                    # 类型级常量来自缓存，循环内只读取实例状态
+                    meta = self.node_type_meta(node.type())
+                    node_path = node.path()
+
                     # 获取位置
                     pos = node.position()
                     position = [pos[0], pos[1]] if pos else [0, 0]
@@ -235,37 +341,19 @@ class HoudiniMCP:
                     
                     node_info = {
                         "name": node.name(),
-                        "path": node.path(),
-                        "type": f"{category.lower()}/{type_name}",
-                        "type_label": node_type.description() if node_type else "",
+                        "path": node_path,
+                        "type": meta.type_key if meta else "unknown/unknown",
+                        "type_label": meta.type_label if meta else "",
                         "is_displayed": node.isDisplayFlagSet() if hasattr(node, 'isDisplayFlagSet') else False,
                         "has_errors": has_errors,
                         "position": position
                     }
                     
-                    # 检测 wrangle 类型节点，提取 VEX 代码
-                    _wrangle_keywords = ('wrangle', 'snippet', 'vopnet')
-                    if any(kw in type_name.lower() for kw in _wrangle_keywords):
-                        try:
-                            snippet = node.parm("snippet")
-                            if snippet:
-                                code = snippet.eval()
-                                if code and code.strip():
-                                    node_info["vex_code"] = code.strip()
-                        except Exception:
-                            pass
-                    # 也检测 python 脚本节点
-                    if 'python' in type_name.lower():
-                        try:
-                            for pname in ("python", "code", "script"):
-                                parm = node.parm(pname)
-                                if parm:
-                                    code = parm.eval()
-                                    if code and code.strip():
-                                        node_info["python_code"] = code.strip()
-                                        break
-                        except Exception:
-                            pass
+                    # wrangle 节点提取 VEX 代码，python 脚本节点提取 Python 代码
+                    if meta and meta.code_kind:
+                        code = meta.read_code(node)
+                        if code:
+                            node_info[meta.code_kind] = code
                     
                     nodes_data.append(node_info)
                     
@@ -274,16 +362,12 @@ class HoudiniMCP:
                         if input_node is not None:
                             conn_info = {
                                 "from": input_node.path(),
-                                "to": node.path(),
+                                "to": node_path,
                                 "input_index": input_idx,
                             }
-                            # 尝试获取输入端口标签
-                            try:
-                                input_label = node_type.inputLabel(input_idx)
-                                if input_label:
-                                    conn_info["input_label"] = input_label
-                            except Exception:
-                                pass
+                            input_label = meta.input_label(input_idx) if meta else ""
+                            if input_label:
+                                conn_info["input_label"] = input_label
                             connections_data.append(conn_info)
                 except Exception:
                     continue
@@ -318,17 +402,21 @@ class HoudiniMCP:
             return False, {"error": f"读取网络结构失败: {str(e)}"}
 
     def get_network_structure_text(self, network_path: Optional[str] = None,
-                                   box_name: Optional[str] = None) -> Tuple[bool, str]:
+                                   box_name: Optional[str] = None,
+                                   data: Optional[Dict[str, Any]] = None) -> Tuple[bool, str]:
         """获取节点网络结构的文本描述（适合 AI 阅读）
         
         三种模式：
         1. 无 box_name 且网络有 NetworkBox → 概览模式（折叠 box，省 token）
         2. 有 box_name → 钻入模式（只展示该 box 内节点）
         3. 无 box_name 且网络无 NetworkBox → 传统全展开模式
+        
+        data: 已获取的结构数据（如 SceneMirror 提供），传入时不再读取 hou
         """
-        ok, data = self.get_network_structure(network_path)
-        if not ok:
-            return False, data.get("error", "未知错误")
+        if data is None:
+            ok, data = self.get_network_structure(network_path)
+            if not ok:
+                return False, data.get("error", "未知错误")
         
         boxes = data.get("network_boxes", [])
         boxed_paths = set(data.get("boxed_node_paths", []))
@@ -519,6 +607,39 @@ class HoudiniMCP:
             port_str = str(idx)
         return f"{prefix}{from_name} → {to_name}[{port_str}]"
 
+    # ========================================
+    # 节点类型元数据缓存
+    # ========================================
+
+    @classmethod
+    def node_type_meta(cls, node_type: Any) -> Optional[NodeTypeMeta]:
+        """节点类型级常量（惰性填充，HDA 定义重载时清空）"""
+        if node_type is None:
+            return None
+        try:
+            key = node_type.nameWithCategory()
+        except Exception:
+            return NodeTypeMeta(node_type)  # 无法生成缓存键：不缓存
+        meta = cls._type_meta_cache.get(key)
+        if meta is None:
+            meta = cls._type_meta_cache[key] = NodeTypeMeta(node_type)
+            if not cls._type_meta_listening:
+                cls._type_meta_listening = True
+                get_scene_monitor().add_listener(cls._on_scene_event)
+        return meta
+
+    @classmethod
+    def invalidate_node_type_caches(cls):
+        """清空节点类型相关缓存（元数据 / ATS / 类型列表）"""
+        cls._type_meta_cache.clear()
+        cls._ats_cache.clear()
+        cls._node_types_cache = None
+
+    @classmethod
+    def _on_scene_event(cls, source: str, event_type: Any, kwargs: dict):
+        if source == 'hda':
+            cls.invalidate_node_type_caches()
+
     # ========================================
     # ATS (Abstract Type System) 构建
     # ========================================
@@ -908,11 +1029,13 @@ class HoudiniMCP:
         except Exception as e:
             return False, {"error": f"检查错误失败: {str(e)}"}
     
-    def check_node_errors_text(self, node_path: Optional[str] = None) -> Tuple[bool, str]:
-        """获取错误检查的文本描述"""
-        ok, data = self.check_node_errors(node_path)
-        if not ok:
-            return False, data.get("error", "未知错误")
+    def check_node_errors_text(self, node_path: Optional[str] = None,
+                               data: Optional[Dict[str, Any]] = None) -> Tuple[bool, str]:
+        """获取错误检查的文本描述（data 已由 SceneMirror 提供时不再读取 hou）"""
+        if data is None:
+            ok, data = self.check_node_errors(node_path)
+            if not ok:
+                return False, data.get("error", "未知错误")
         
         lines = [
             f"## 错误检查报告",
@@ -1032,120 +1155,31 @@ class HoudiniMCP:
     def semantic_search_nodes(self, description: str, category: str = "sop") -> Tuple[bool, str]:
         """语义搜索节点 - 通过自然语言描述找到合适的节点
         
-        内置常用节点的语义映射
+        基于 NodeTypeCatalog：类型名 / 显示名 / 文档描述的词法索引 + 同义词表，
+        embedder 就绪时融合向量相似度；覆盖自定义 HDA。
         """
         if hou is None:
             return False, "未检测到 Houdini API"
-        
-        # 语义映射表：描述关键词 -> 节点类型
-        # 格式: "关键词": ["节点1", "节点2", ...]
-        semantic_map = {
-            # 点操作
-            "分布点": ["scatter", "pointsfromvolume"],
-            "撒点": ["scatter"],
-            "随机点": ["scatter", "add"],
-            "删除点": ["blast", "delete"],
-            "合并点": ["fuse"],
-            "点云": ["scatter"],
-            
-            # 复制操作
-            "复制到点": ["copytopoints"],
-            "实例化": ["copytopoints"],
-            "复制物体": ["copytopoints"],
-            "克隆": ["copytopoints"],
-            "instance": ["copytopoints"],
-            
-            # 变形操作
-            "噪波": ["mountain"],
-            "noise": ["mountain", "attribnoise"],
-            "变形": ["transform", "bend", "twist"],
-            "平滑": ["smooth", "relax"],
-            "挤出": ["polyextrude"],
-            "细分": ["subdivide", "remesh"],
-            
-            # 创建几何体
-            "盒子": ["box"],
-            "box": ["box"],
-            "球": ["sphere"],
-            "圆柱": ["tube"],
-            "平面": ["grid"],
-            "grid": ["grid"],
-            "曲线": ["curve", "line"],
-            
-            # ⭐ 地形相关（常见需求，详细映射）
-            "地形": ["grid", "mountain"],  # 地形 = grid + mountain
-            "terrain": ["grid", "mountain"],
-            "地面": ["grid"],
-            "山": ["mountain"],
-            "起伏": ["mountain"],
-            "高度场": ["heightfield"],
-            "heightfield": ["heightfield"],
-            
-            # 属性操作
-            "设置属性": ["attribwrangle"],
-            "颜色": ["color", "attribwrangle"],
-            "法线": ["normal"],
-            "UV": ["uvproject", "uvunwrap"],
-            
-            # 连接操作
-            "合并": ["merge"],
-            "merge": ["merge"],
-            "分离": ["split", "blast"],
-            "布尔": ["boolean"],
-            "交集": ["boolean"],
-            
-            # 模拟相关
-            "刚体": ["rbdmaterialfracture"],
-            "破碎": ["voronoifracture"],
-            "流体": ["flip", "pyro"],
-            "布料": ["vellum"],
-            "毛发": ["hairgen"],
-        }
-        
-        desc_lower = description.lower()
+
+        catalog = get_node_catalog()
+        with get_tracer().span('node_catalog.search', cat='tool'):
+            if not catalog.ensure_ready():
+                return False, "节点类型目录构建失败"
+            hits = catalog.search(description, category)
+
+        if not hits:
+            return False, f"未找到匹配 '{description}' 的节点"
+
         results = []
-        scores = {}
-        
-        # 匹配语义映射
-        for keywords, nodes in semantic_map.items():
-            if any(k in desc_lower for k in keywords.split()):
-                for node in nodes:
-                    if node not in scores:
-                        scores[node] = 0
-                    scores[node] += 1
-        
-        # 获取匹配的节点详情
-        cat_filter = category.lower() if category != "all" else None
-        
-        for node_name in sorted(scores.keys(), key=lambda x: -scores[x])[:10]:
-            for cat_name, cat in hou.nodeTypeCategories().items():
-                if cat_filter and cat_name.lower() != cat_filter:
-                    continue
-                for type_name, node_type in cat.nodeTypes().items():
-                    if node_name in type_name.lower():
-                        desc = node_type.description()
-                        results.append(f"- `{cat_name.lower()}/{type_name}` — {desc}")
-                        break
-        
-        # 如果语义匹配没找到，尝试直接关键词搜索
-        if not results:
-            for cat_name, cat in hou.nodeTypeCategories().items():
-                if cat_filter and cat_name.lower() != cat_filter:
-                    continue
-                for type_name, node_type in cat.nodeTypes().items():
-                    desc = node_type.description().lower()
-                    if any(w in desc or w in type_name.lower() for w in desc_lower.split()):
-                        results.append(f"- `{cat_name.lower()}/{type_name}` — {node_type.description()}")
-                        if len(results) >= 10:
-                            break
-                if len(results) >= 10:
-                    break
-        
-        if results:
-            result_text = f"根据 '{description}' 找到以下节点:\n" + "\n".join(results[:10])
-            return True, result_text
-        
-        return False, f"未找到匹配 '{description}' 的节点"
+        for entry, _score in hits:
+            line = f"- `{entry.key}` — {entry.label}"
+            if entry.is_hda:
+                line += " [HDA]"
+            if entry.doc:
+                doc = entry.doc if len(entry.doc) <= 80 else entry.doc[:80] + "…"
+                line += f"：{doc}"
+            results.append(line)
+        return True, f"根据 '{description}' 找到以下节点:\n" + "\n".join(results)
 
     def list_children(self, network_path: Optional[str] = None, 
                       recursive: bool = False, 
@@ -1164,21 +1198,11 @@ class HoudiniMCP:
                 return False, "未找到当前网络"
         
         def format_node(node, indent=0):
-            prefix = "  " * indent
-            flags = ""
-            if show_flags:
-                parts = []
-                if hasattr(node, 'isDisplayFlagSet') and node.isDisplayFlagSet():
-                    parts.append("[disp]")
-                if hasattr(node, 'isRenderFlagSet') and node.isRenderFlagSet():
-                    parts.append("🎬")
-                if hasattr(node, 'isBypassed') and node.isBypassed():
-                    parts.append("⏸")
-                if parts:
-                    flags = f" [{' '.join(parts)}]"
-            
-            node_type = node.type().name() if node.type() else "unknown"
-            return f"{prefix}- {node.name()} ({node_type}){flags}"
+            return self._format_child_line(
+                node.name(), node.type().name() if node.type() else "unknown", indent, show_flags,
+                hasattr(node, 'isDisplayFlagSet') and node.isDisplayFlagSet(),
+                hasattr(node, 'isRenderFlagSet') and node.isRenderFlagSet(),
+                hasattr(node, 'isBypassed') and node.isBypassed())
         
         lines = [f"## {network.path()}"]
         
@@ -1195,8 +1219,34 @@ class HoudiniMCP:
         
         return True, "\n".join(lines)
 
-    def get_geometry_info(self, node_path: str, output_index: int = 0) -> Tuple[bool, str]:
-        """获取几何体信息"""
+    @staticmethod
+    def _format_child_line(name: str, type_name: str, indent: int, show_flags: bool,
+                           display: bool, render: bool, bypass: bool) -> str:
+        """list_children 的单行格式（HOM 与 SceneMirror 两条路径共用）"""
+        flags = ""
+        if show_flags:
+            parts = []
+            if display:
+                parts.append("[disp]")
+            if render:
+                parts.append("🎬")
+            if bypass:
+                parts.append("⏸")
+            if parts:
+                flags = f" [{' '.join(parts)}]"
+        return f"{'  ' * indent}- {name} ({type_name}){flags}"
+
+    _GEO_STATS_MAX_ATTRIBS = 12     # 每个类别最多统计的数值属性数
+
+    def get_geometry_info(self, node_path: str, output_index: int = 0,
+                          attrib_stats: bool = False) -> Tuple[bool, str]:
+        """获取几何体信息
+        
+        ★ 统计部分走 GeoReader（AsString 批量读取 + numpy 分块向量化）：
+        包围盒、数值属性范围 / NaN / Inf、分组大小。
+        属性范围需全量读取数值属性（主线程执行），只在 attrib_stats=True 时统计；
+        numpy 不可用时只输出属性列表。
+        """
         if hou is None:
             return False, "未检测到 Houdini API"
         
@@ -1245,10 +1295,65 @@ class HoudiniMCP:
             if not any([point_attrs, vertex_attrs, prim_attrs, detail_attrs]):
                 lines.append("（无自定义属性）")
             
+            lines.extend(self._geometry_stats_lines(geo, info, attrib_stats))
             return True, "\n".join(lines)
         except Exception as e:
             return False, f"获取几何体信息失败: {str(e)}"
 
+    def _geometry_stats_lines(self, geo, counts: Dict[str, int],
+                              attrib_stats: bool) -> List[str]:
+        """get_geometry_info 的统计段落：包围盒 / 属性范围 / 分组"""
+        from .geo_reader import GeoReader
+        if not GeoReader.available:
+            return []
+
+        def _fmt(v):
+            if v is None:
+                return "-"
+            if isinstance(v, list):
+                return "(" + ", ".join(_fmt(x) for x in v) + ")"
+            if float(v).is_integer() and abs(v) < 1e9:
+                return str(int(v))
+            return f"{v:.4g}"
+
+        reader = GeoReader(geo)
+        lines: List[str] = []
+        bounds = reader.bounds()
+        if bounds:
+            lines += ["", "### 包围盒",
+                      f"- min: {_fmt(bounds['min'])}  max: {_fmt(bounds['max'])}",
+                      f"- 尺寸: {_fmt(bounds['size'])}  中心: {_fmt(bounds['center'])}"]
+
+        if attrib_stats:
+            range_lines = []
+            for cls, label in (('point', '点'), ('prim', '图元'), ('vertex', '顶点')):
+                attribs = reader.numeric_attribs(cls)
+                for a in attribs[:self._GEO_STATS_MAX_ATTRIBS]:
+                    st = reader.attrib_stats(cls, a.name())
+                    if not st or not st['count']:
+                        continue
+                    line = f"- {label} {st['name']}[{st['size']}]: {_fmt(st['min'])} ~ {_fmt(st['max'])}"
+                    if st['nan_count'] or st['inf_count']:
+                        line += f"  ⚠ NaN {st['nan_count']}, Inf {st['inf_count']}"
+                    range_lines.append(line)
+                if len(attribs) > self._GEO_STATS_MAX_ATTRIBS:
+                    range_lines.append(f"- （{label}属性另有 {len(attribs) - self._GEO_STATS_MAX_ATTRIBS} 个未统计）")
+            if range_lines:
+                lines += ["", "### 数值属性范围"] + range_lines
+        else:
+            lines += ["", f"（未统计属性范围：{max(counts.values()):,} 个元素；"
+                          f"read_selection 传 attrib_stats=true 统计）"]
+
+        groups = reader.group_sizes()
+        if groups:
+            lines += ["", "### 分组"]
+            for cls, label in (('point', '点组'), ('prim', '图元组')):
+                if cls in groups:
+                    items = [f"{name} ({n})" if n is not None else name
+                             for name, n in groups[cls].items()]
+                    lines.append(f"{label}: {', '.join(items)}")
+        return lines
+
     def set_display_flag(self, node_path: str, display: bool = True, 
                          render: bool = True) -> Tuple[bool, str]:
         """设置显示/渲染标志"""
@@ -1343,8 +1448,11 @@ class HoudiniMCP:
 
     def find_nodes_by_param(self, param_name: str, value: Any = None,
                             network_path: Optional[str] = None,
-                            recursive: bool = True) -> Tuple[bool, str]:
-        """按参数值搜索节点"""
+                            recursive: bool = True,
+                            pattern: Optional[str] = None,
+                            min_value: Optional[float] = None,
+                            max_value: Optional[float] = None) -> Tuple[bool, str]:
+        """按参数值搜索节点（allSubChildren() 一次遍历，查询时求值）"""
         if hou is None:
             return False, "未检测到 Houdini API"
         
@@ -1354,28 +1462,36 @@ class HoudiniMCP:
                 return False, f"未找到网络: {network_path}"
         else:
             network = self._current_network() or hou.node('/obj')
-        
+
+        try:
+            predicate = ParamPredicate(value, pattern, min_value, max_value)
+        except re.error as e:
+            return False, f"无效的正则表达式 '{pattern}': {e}"
+
         results = []
-        
-        def search_in(parent):
-            for node in parent.children():
-                parm = node.parm(param_name)
-                if parm:
-                    parm_value = parm.eval()
-                    if value is None or str(parm_value) == str(value):
-                        results.append(f"- {node.path()}: {param_name}={parm_value}")
-                if recursive and hasattr(node, 'children'):
-                    search_in(node)
-        
-        search_in(network)
+        with get_tracer().span('find_nodes_by_param.scan', cat='tool', param=param_name):
+            nodes = network.allSubChildren() if recursive else network.children()
+            for node in nodes:
+                try:
+                    parm = node.parm(param_name)
+                    if parm:
+                        parm_value = parm.eval()
+                        if predicate.match(parm_value):
+                            results.append((node.path(), parm_value))
+                except Exception:
+                    continue
+        results.sort(key=lambda r: r[0])
         
         if results:
             header = f"找到 {len(results)} 个节点包含参数 '{param_name}'"
-            if value is not None:
-                header += f" = {value}"
-            return True, header + ":\n" + "\n".join(results[:50])
+            if not predicate.is_empty:
+                header += f" {predicate.describe()}"
+            lines = [f"- {path}: {param_name}={parm_value}" for path, parm_value in results]
+            return True, header + ":\n" + "\n".join(lines)
         
-        return False, f"未找到包含参数 '{param_name}' 的节点"
+        if predicate.is_empty:
+            return False, f"未找到包含参数 '{param_name}' 的节点"
+        return False, f"未找到参数 '{param_name}' {predicate.describe()} 的节点"
 
     def save_hip(self, file_path: Optional[str] = None) -> Tuple[bool, str]:
         """保存 HIP 文件"""
@@ -2236,11 +2352,12 @@ class HoudiniMCP:
         - 此功能允许执行任意代码，应谨慎使用
         - 危险操作（如删除文件）需要用户确认
         
-        ★ 超时保护（v1.4.5）：
-        使用 sys.settrace 在每行 Python 代码执行前检查超时和停止标志。
-        超时或用户停止时抛出 _ExecInterrupt 中断代码执行，防止卡死主线程。
+        ★ 超时保护：
+        看门狗线程每 0.1s 检查超时和停止标志，触发时向执行线程注入
+        _ExecInterrupt（见 exec_watchdog.ExecWatchdog），执行期间不安装 trace 回调，
+        紧密循环不再被逐行回调拖慢；无法注入异步异常时回退 sys.settrace 方案。
         注意：对 C 扩展内部的阻塞（如 hou.node.cook）无法中断，
-        但能在 C 调用返回后的下一行 Python 代码处中断。
+        但能在 C 调用返回后的下一条 Python 字节码处中断。
         """
         if hou is None:
             return False, {"error": "未检测到 Houdini API"}
@@ -2248,41 +2365,24 @@ class HoudiniMCP:
         if not code or not code.strip():
             return False, {"error": "代码为空"}
         
-        import io
         import sys
         import traceback
-        import threading
+        
+        from .exec_watchdog import make_exec_guard
+        from .output_stream import OutputStreamer, StreamWriter
         
         start_time = time.time()
-        _stop_event = self._stop_event  # 缓存引用
-        _deadline = start_time + max(timeout, 5)  # 最少 5 秒
-        _check_interval = 0.5  # 每 0.5s 检查一次（避免过于频繁）
-        _last_check = [start_time]  # 用列表以便在闭包中修改
-        
-        def _trace_timeout(frame, event, arg):
-            """sys.settrace 回调：每行代码执行前检查超时和停止标志"""
-            now = time.time()
-            # 降低检查频率：距上次检查不足 _check_interval 则跳过
-            if now - _last_check[0] < _check_interval:
-                return _trace_timeout
-            _last_check[0] = now
-            # 检查停止标志
-            if _stop_event and _stop_event.is_set():
-                raise HoudiniMCP._ExecInterrupt("用户已停止执行")
-            # 检查超时
-            if now > _deadline:
-                raise HoudiniMCP._ExecInterrupt(
-                    f"代码执行超时（{timeout}s），已中断。"
-                    f"如需更长时间，请增加 timeout 参数。"
-                )
-            return _trace_timeout
+        # 最少 5 秒
+        guard = make_exec_guard(HoudiniMCP._ExecInterrupt, max(timeout, 5),
+                                self._stop_event, start=start_time)
         
         # 捕获输出
         old_stdout = sys.stdout
         old_stderr = sys.stderr
-        old_trace = sys.gettrace()
-        captured_output = io.StringIO()
-        captured_error = io.StringIO()
+        # ★ 输出边执行边推送给 UI；内存中只保留头尾（超长输出不再整段驻留）
+        streamer = OutputStreamer('python', code, getattr(self, '_output_callback', None))
+        captured_output = StreamWriter(streamer, 'stdout')
+        captured_error = StreamWriter(streamer, 'stderr')
         
         result = {
             "output": "",
@@ -2291,6 +2391,7 @@ class HoudiniMCP:
             "execution_time": 0.0
         }
         
+        streamer.start()
         try:
             sys.stdout = captured_output
             sys.stderr = captured_error
@@ -2302,23 +2403,26 @@ class HoudiniMCP:
             }
             exec_locals = {}
             
-            # ★ 安装超时 trace
-            sys.settrace(_trace_timeout)
-            
-            # 尝试作为表达式求值（返回最后一个值）
+            # ★ 启动超时看门狗；disarm 放在内层 finally，
+            #   执行结束前刚送达的中断仍由下面的 except _ExecInterrupt 接住
+            guard.arm()
             try:
-                # 先尝试 eval（单个表达式）
-                return_value = eval(code.strip(), exec_globals, exec_locals)
-                result["return_value"] = self._safe_repr(return_value)
-            except SyntaxError:
-                # 不是单个表达式，用 exec 执行
-                exec(code, exec_globals, exec_locals)
-                
-                # 尝试获取最后一个赋值的值
-                if exec_locals:
-                    last_var = list(exec_locals.keys())[-1]
-                    if not last_var.startswith('_'):
-                        result["return_value"] = self._safe_repr(exec_locals[last_var])
+                # 尝试作为表达式求值（返回最后一个值）
+                try:
+                    # 先尝试 eval（单个表达式）
+                    return_value = eval(code.strip(), exec_globals, exec_locals)
+                    result["return_value"] = self._safe_repr(return_value)
+                except SyntaxError:
+                    # 不是单个表达式，用 exec 执行
+                    exec(code, exec_globals, exec_locals)
+                    
+                    # 尝试获取最后一个赋值的值
+                    if exec_locals:
+                        last_var = list(exec_locals.keys())[-1]
+                        if not last_var.startswith('_'):
+                            result["return_value"] = self._safe_repr(exec_locals[last_var])
+            finally:
+                guard.disarm()
             
             result["output"] = captured_output.getvalue()
             
@@ -2331,7 +2435,9 @@ class HoudiniMCP:
             return True, result
         
         except HoudiniMCP._ExecInterrupt as e:
-            result["error"] = str(e)
+            guard.disarm()
+            # 异步注入的异常不带消息，原因记录在 guard 上
+            result["error"] = guard.reason or str(e)
             result["output"] = captured_output.getvalue()
             result["execution_time"] = time.time() - start_time
             return False, result
@@ -2343,10 +2449,12 @@ class HoudiniMCP:
             return False, result
             
         finally:
-            # ★ 必须恢复原始 trace，否则影响后续所有 Python 执行
-            sys.settrace(old_trace)
+            # ★ 必须停止看门狗 / 恢复原始 trace，否则影响后续所有 Python 执行
+            guard.disarm()
             sys.stdout = old_stdout
             sys.stderr = old_stderr
+            result["output_bytes"] = streamer.total_bytes
+            streamer.end()
     
     def _safe_repr(self, value: Any, max_length: int = 1000) -> str:
         """安全地获取对象的字符串表示"""
@@ -2404,28 +2512,191 @@ class HoudiniMCP:
     def _tool_get_network_structure(self, args: Dict[str, Any]) -> Dict[str, Any]:
         network_path = args.get("network_path")
         box_name = args.get("box_name")  # NetworkBox 钻入参数
+        since = args.get("since")        # 增量模式：上次结果中的快照令牌
         page = int(args.get("page", 1))
 
-        # 分页快速路径（box_name 也参与缓存键）
-        cache_suffix = f":{box_name}" if box_name else ""
-        cache_key = f"get_network_structure:{network_path or '_current'}{cache_suffix}"
-        if page > 1 and cache_key in self._tool_page_cache:
-            np_arg = f'network_path="{network_path}", ' if network_path else ''
-            bx_arg = f'box_name="{box_name}", ' if box_name else ''
-            hint = f'get_network_structure({np_arg}{bx_arg}page={page})'
-            return {"success": True, "result": self._paginate_tool_result(
-                self._tool_page_cache[cache_key], cache_key, hint, page)}
+        # 分页快速路径（box_name / since 也参与缓存键）
+        cache_key, hint = self._network_structure_page_key(network_path, box_name, since, page)
+        if page > 1:
+            cached = self._cached_page(cache_key, hint, page)
+            if cached is not None:
+                return {"success": True, "result": cached}
 
         ok, data = self.get_network_structure(network_path)
         if ok:
-            _, text = self.get_network_structure_text(network_path, box_name=box_name)
-            np_arg = f'network_path="{network_path}", ' if network_path else ''
-            bx_arg = f'box_name="{box_name}", ' if box_name else ''
-            hint = f'get_network_structure({np_arg}{bx_arg}page={page})'
-            return {"success": True, "result": self._paginate_tool_result(
-                text, cache_key, hint, page)}
+            return self._network_structure_response(args, data)
         return {"success": False, "error": data.get("error", "未知错误")}
 
+    @staticmethod
+    def _network_structure_page_key(network_path: Optional[str], box_name: Optional[str],
+                                    since: Optional[str], page: int) -> Tuple[str, str]:
+        """分页缓存键与翻页提示"""
+        cache_suffix = f":{box_name}" if box_name else ""
+        if since:
+            cache_suffix += f":since={since}"
+        cache_key = f"get_network_structure:{network_path or '_current'}{cache_suffix}"
+        np_arg = f'network_path="{network_path}", ' if network_path else ''
+        bx_arg = f'box_name="{box_name}", ' if box_name else ''
+        sn_arg = f'since="{since}", ' if since else ''
+        return cache_key, f'get_network_structure({np_arg}{bx_arg}{sn_arg}page={page})'
+
+    def _network_structure_response(self, args: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
+        """由结构数据生成工具结果（HOM 与 SceneMirror 两条路径共用）
+
+        since 为有效快照令牌时只返回相对该快照的变化；否则返回完整结构。
+        新快照令牌放在结果末尾单独一行（工具结果去重忽略该行，内容相同的结果仍可去重）。
+        page > 1 是翻页（缓存已过期时重新生成），不签发新令牌。
+        """
+        network_path = args.get("network_path")
+        box_name = args.get("box_name")
+        since = args.get("since")
+        page = int(args.get("page", 1))
+        cache_key, hint = self._network_structure_page_key(network_path, box_name, since, page)
+
+        scope = (self._session_id, data["network_path"], box_name or "")
+        fingerprint = self._network_fingerprint(data, box_name)
+        base = self._get_net_snapshot(since, scope) if since else None
+        if base is not None:
+            if base["nodes"] == fingerprint["nodes"] and base["connections"] == fingerprint["connections"] \
+                    and base["boxes"] == fingerprint["boxes"]:
+                where = f"{data['network_path']} 的 NetworkBox {box_name}" if box_name else data['network_path']
+                return {"success": True,
+                        "result": f"网络 {where} 自快照 {since} 以来无变化"}
+            text = self._format_network_delta(data, base, fingerprint, since, box_name)
+        else:
+            ok, text = self.get_network_structure_text(network_path, box_name=box_name, data=data)
+            if not ok:
+                return {"success": False, "error": text}
+            if since:
+                text = f"（快照 {since} 已过期或不属于该网络，返回完整结构）\n{text}"
+        result = self._paginate_tool_result(text, cache_key, hint, page)
+        token = self._put_net_snapshot(scope, fingerprint) if page == 1 else ""
+        if token:
+            result += f"\n\n[snapshot: {token}] 下次传入 since=\"{token}\" 只获取变化"
+        return {"success": True, "result": result}
+
+    @staticmethod
+    def _network_fingerprint(data: Dict[str, Any], box_name: Optional[str] = None) -> Dict[str, Any]:
+        """增量比较用的网络指纹（节点 → 可见属性元组，连接集合，NetworkBox 列表）
+
+        box_name 给定时只覆盖该 box 内的节点、与其相关的连接和该 box 本身。
+        """
+        boxes = data.get("network_boxes", [])
+        members = None
+        if box_name:
+            target = next((b for b in boxes if b["name"] == box_name), None)
+            members = set(target["nodes"]) if target else set()
+            boxes = [target] if target else []
+        nodes = {
+            n["path"]: (n["name"], n["type"], bool(n.get("is_displayed")), bool(n.get("has_errors")),
+                        n.get("vex_code") or "", n.get("python_code") or "")
+            for n in data.get("nodes", [])
+            if members is None or n["path"] in members
+        }
+        connections = frozenset(
+            (c["from"], c["to"], c["input_index"], c.get("input_label", ""))
+            for c in data.get("connections", [])
+            if members is None or c["from"] in members or c["to"] in members
+        )
+        boxes = tuple((b["name"], b["comment"], tuple(b["nodes"])) for b in boxes)
+        return {"network_path": data["network_path"], "nodes": nodes,
+                "connections": connections, "boxes": boxes}
+
+    def _put_net_snapshot(self, scope: tuple, fingerprint: Dict[str, Any]) -> str:
+        """保存快照并返回令牌（网络过大时不保存，返回空串）
+
+        scope = (会话, 网络路径, box)：每组保留最近几份，组之间按 LRU 淘汰。
+        """
+        if len(fingerprint["nodes"]) > self._NET_SNAPSHOT_MAX_NODES:
+            return ""
+        with self._net_snapshot_lock:
+            self._net_snapshot_seq += 1
+            token = f"ns{self._net_snapshot_seq}"
+            group = self._net_snapshots.pop(scope, None) or OrderedDict()
+            group[token] = fingerprint
+            self._net_snapshot_scope[token] = scope
+            while len(group) > self._NET_SNAPSHOT_PER_SCOPE:
+                old, _ = group.popitem(last=False)
+                self._net_snapshot_scope.pop(old, None)
+            self._net_snapshots[scope] = group
+            while len(self._net_snapshots) > self._NET_SNAPSHOT_SCOPES:
+                _, evicted = self._net_snapshots.popitem(last=False)
+                for old in evicted:
+                    self._net_snapshot_scope.pop(old, None)
+        return token
+
+    def _get_net_snapshot(self, token: str, scope: tuple) -> Optional[Dict[str, Any]]:
+        """令牌对应的快照（不属于该会话 / 网络 / box 时返回 None）"""
+        with self._net_snapshot_lock:
+            if self._net_snapshot_scope.get(token) != scope:
+                return None
+            self._net_snapshots.move_to_end(scope)
+            return self._net_snapshots[scope].get(token)
+
+    def _format_network_delta(self, data: Dict[str, Any], base: Dict[str, Any],
+                              current: Dict[str, Any], since: str,
+                              box_name: Optional[str] = None) -> str:
+        """相对快照的变化：新增 / 删除 / 修改的节点与连接"""
+        old_nodes, new_nodes = base["nodes"], current["nodes"]
+        scoped = [n for n in data["nodes"] if n["path"] in new_nodes]
+        added = [n for n in scoped if n["path"] not in old_nodes]
+        removed = [p for p in old_nodes if p not in new_nodes]
+        field_names = ("名称", "类型", "显示标志", "错误状态", "VEX代码", "Python代码")
+        modified = []
+        for n in scoped:
+            old = old_nodes.get(n["path"])
+            if old is not None and old != new_nodes[n["path"]]:
+                changed = [field_names[i] for i, (a, b) in enumerate(zip(old, new_nodes[n["path"]])) if a != b]
+                modified.append((n, changed))
+        conn_added = current["connections"] - base["connections"]
+        conn_removed = base["connections"] - current["connections"]
+
+        title = f"{data['network_path']} / NetworkBox {box_name}" if box_name else data['network_path']
+        total = len(new_nodes) if box_name else data['node_count']
+        lines = [
+            f"## 网络结构增量: {title}（相对快照 {since}）",
+            f"节点总数: {total}（新增 {len(added)} / 删除 {len(removed)} / 修改 {len(modified)}）",
+        ]
+        wrangle_details: List[str] = []
+        if added:
+            lines += ["", "### 新增节点:"]
+            self._format_node_list(added, lines, wrangle_details)
+        if removed:
+            lines += ["", "### 删除节点:"]
+            lines += [f"- `{p.split('/')[-1]}` ({old_nodes[p][1]})" for p in removed]
+        if modified:
+            lines += ["", "### 修改节点:"]
+            code_changed = []
+            for n, changed in modified:
+                status = []
+                if n.get("is_displayed"):
+                    status.append("显示")
+                if n.get("has_errors"):
+                    status.append("错误")
+                status_str = f" [{', '.join(status)}]" if status else ""
+                lines.append(f"- `{n['name']}` ({n['type']}){status_str}: {', '.join(changed)} 已变化")
+                if "VEX代码" in changed or "Python代码" in changed:
+                    code_changed.append(n)
+            if code_changed:
+                self._format_node_list(code_changed, [], wrangle_details)
+        for title, conns in (("新增连接", conn_added), ("删除连接", conn_removed)):
+            if conns:
+                lines += ["", f"### {title}:"]
+                for frm, to, idx, label in sorted(conns, key=lambda c: (c[1], c[2])):
+                    conn = {"from": frm, "to": to, "input_index": idx}
+                    if label:
+                        conn["input_label"] = label
+                    lines.append(self._format_connection(conn))
+        if base["boxes"] != current["boxes"]:
+            lines += ["", "### NetworkBox 分组已变化:"]
+            for name, comment, paths in current["boxes"]:
+                lines.append(f"📦 **{name}**: {comment or '(无注释)'} — {len(paths)} 个节点")
+        if wrangle_details:
+            lines += ["", "### 新增/修改节点的代码:"]
+            lines += wrangle_details
+        lines.append("\n💡 需要完整结构时不传 since 即可")
+        return "\n".join(lines)
+
     def _tool_get_node_parameters(self, args: Dict[str, Any]) -> Dict[str, Any]:
         """获取节点的所有可用参数（名称、类型、默认值、当前值），支持分页"""
         node_path = args.get("node_path", "")
@@ -2438,10 +2709,11 @@ class HoudiniMCP:
 
         # 分页快速路径：缓存中已有完整结果
         cache_key = f"get_node_parameters:{node_path}"
-        if page > 1 and cache_key in self._tool_page_cache:
+        if page > 1:
             hint = f'get_node_parameters(node_path="{node_path}", page={page})'
-            return {"success": True, "result": self._paginate_tool_result(
-                self._tool_page_cache[cache_key], cache_key, hint, page)}
+            cached = self._cached_page(cache_key, hint, page)
+            if cached is not None:
+                return {"success": True, "result": cached}
 
         node = hou.node(node_path)
         if node is None:
@@ -2654,11 +2926,12 @@ class HoudiniMCP:
 
         # 分页快速路径
         cache_key = f"list_children:{network_path or '_current'}:r={recursive}"
-        if page > 1 and cache_key in self._tool_page_cache:
+        if page > 1:
             np_arg = f'network_path="{network_path}", ' if network_path else ''
             hint = f'list_children({np_arg}recursive={recursive}, page={page})'
-            return {"success": True, "result": self._paginate_tool_result(
-                self._tool_page_cache[cache_key], cache_key, hint, page)}
+            cached = self._cached_page(cache_key, hint, page)
+            if cached is not None:
+                return {"success": True, "result": cached}
 
         ok, msg = self.list_children(network_path, recursive, args.get("show_flags", True))
         if not ok:
@@ -2679,11 +2952,12 @@ class HoudiniMCP:
     def _tool_read_selection(self, args: Dict[str, Any]) -> Dict[str, Any]:
         include_params = args.get("include_params", True)
         include_geometry = args.get("include_geometry", False)
+        attrib_stats = bool(args.get("attrib_stats", False))
         ok, msg = self.describe_selection(limit=5, include_all_params=include_params)
         if ok and include_geometry and hou:
             nodes = hou.selectedNodes()
             for node in nodes[:3]:
-                geo_ok, geo_msg = self.get_geometry_info(node.path())
+                geo_ok, geo_msg = self.get_geometry_info(node.path(), attrib_stats=attrib_stats)
                 if geo_ok:
                     msg += f"\n\n{geo_msg}"
         return {"success": ok, "result": msg if ok else "", "error": "" if ok else msg}
@@ -2721,10 +2995,31 @@ class HoudiniMCP:
         param_name = args.get("param_name", "")
         if not param_name:
             return {"success": False, "error": "缺少 param_name 参数"}
+        network_path = args.get("network_path")
+        value = args.get("value")
+        pattern = args.get("pattern")
+        min_value = args.get("min")
+        max_value = args.get("max")
+        recursive = args.get("recursive", True)
+        page = int(args.get("page", 1))
+
+        filters = ", ".join(f'{k}={json.dumps(v, ensure_ascii=False)}'
+                            for k, v in (("value", value), ("pattern", pattern),
+                                         ("min", min_value), ("max", max_value)) if v is not None)
+        cache_key = f"find_nodes_by_param:{network_path or '_current'}:{param_name}:{filters}:{recursive}"
+        np_arg = f'network_path="{network_path}", ' if network_path else ''
+        ft_arg = f'{filters}, ' if filters else ''
+        hint = f'find_nodes_by_param({np_arg}param_name="{param_name}", {ft_arg}page={page})'
+        if page > 1:
+            cached = self._cached_page(cache_key, hint, page)
+            if cached is not None:
+                return {"success": True, "result": cached}
+
         ok, msg = self.find_nodes_by_param(
-            param_name, args.get("value"),
-            args.get("network_path"), args.get("recursive", True))
-        return {"success": ok, "result": msg if ok else "", "error": "" if ok else msg}
+            param_name, value, network_path, recursive, pattern, min_value, max_value)
+        if not ok:
+            return {"success": False, "error": msg}
+        return {"success": True, "result": self._paginate_tool_result(msg, cache_key, hint, page)}
 
     def _tool_save_hip(self, args: Dict[str, Any]) -> Dict[str, Any]:
         ok, msg = self.save_hip(args.get("file_path"))
@@ -2748,10 +3043,14 @@ class HoudiniMCP:
         import hashlib
         code_hash = hashlib.md5(code.encode()).hexdigest()[:12]
         cache_key = f"execute_python:{code_hash}"
-        if page > 1 and cache_key in self._tool_page_cache:
+        if page > 1:
             hint = f'execute_python(code="...同上...", page={page})'
-            return {"success": True, "result": self._paginate_tool_result(
-                self._tool_page_cache[cache_key], cache_key, hint, page)}
+            cached = self._cached_page(cache_key, hint, page)
+            if cached is not None:
+                return {"success": True, "result": cached}
+            # ★ 缓存未命中（过期 / 淘汰 / 超长未缓存）不重新执行：有副作用的代码不能因翻页再跑一遍
+            return {"success": False,
+                    "error": "分页输出已过期，请用 page=1 重新执行（注意：会再次运行代码）"}
 
         # 安全检查：检测危险操作
         security_msg = self._check_code_security(code)
@@ -2844,7 +3143,10 @@ class HoudiniMCP:
         ★ v1.4.4 改进：使用 Popen + 轮询替代 subprocess.run
         - 支持用户通过停止按钮中断正在执行的命令
         - Windows 上正确杀死整个进程树（不只是 cmd.exe 父进程）
-        - 防止 pipe buffer 满导致的死锁（使用 communicate 分块读取）
+
+        ★ 流式输出：stdout / stderr 各由一个读线程分块读取（不会因 pipe buffer 满而死锁），
+        边读边推送给 UI（set_output_stream_callback），内存中只保留头尾；
+        等待循环直接阻塞在停止事件上，点击停止立即杀死进程树。
         """
         import subprocess
         import hashlib
@@ -2859,10 +3161,14 @@ class HoudiniMCP:
         # 分页快速路径
         cmd_hash = hashlib.md5(command.encode()).hexdigest()[:12]
         cache_key = f"shell:{cmd_hash}"
-        if page > 1 and cache_key in self._tool_page_cache:
+        if page > 1:
             hint = f'execute_shell(command="...同上...", page={page})'
-            return {"success": True, "result": self._paginate_tool_result(
-                self._tool_page_cache[cache_key], cache_key, hint, page)}
+            cached = self._cached_page(cache_key, hint, page)
+            if cached is not None:
+                return {"success": True, "result": cached}
+            # ★ 缓存未命中（过期 / 淘汰 / 超长未缓存）不重新执行：有副作用的代码不能因翻页再跑一遍
+            return {"success": False,
+                    "error": "分页输出已过期，请用 page=1 重新执行（注意：会再次运行命令）"}
 
         # 安全检查
         security_msg = self._check_shell_security(command)
@@ -2878,12 +3184,16 @@ class HoudiniMCP:
             return {"success": False, "error": f"工作目录不存在: {cwd}"}
 
         # ★ 获取停止事件引用（从 AIClient 传入，用于检测用户中断）
-        stop_event = getattr(self, '_stop_event', None)
+        stop_event = getattr(self, '_stop_event', None) or threading.Event()
+
+        from .output_stream import OutputStreamer
+        streamer = OutputStreamer('shell', command, getattr(self, '_output_callback', None))
 
         start_time = time.time()
         proc = None
+        readers = []
         try:
-            # 启动子进程（非阻塞）
+            # 启动子进程（非阻塞，二进制管道，由读线程增量解码）
             popen_kwargs = dict(
                 shell=True,
                 stdout=subprocess.PIPE,
@@ -2892,21 +3202,25 @@ class HoudiniMCP:
             )
             if sys.platform == 'win32':
                 popen_kwargs.update(
-                    encoding='utf-8',
-                    errors='replace',
                     env={**os.environ, 'PYTHONIOENCODING': 'utf-8'},
                     creationflags=subprocess.CREATE_NO_WINDOW | subprocess.CREATE_NEW_PROCESS_GROUP,
                 )
             else:
-                popen_kwargs.update(text=True)
+                # 独立进程组：_kill_process_tree 的 killpg 只作用于命令自身的进程树
+                popen_kwargs.update(start_new_session=True)
             
             proc = subprocess.Popen(command, **popen_kwargs)
+            streamer.start(cwd=cwd)
+            readers = [
+                self._start_pipe_reader(proc.stdout, streamer, 'stdout'),
+                self._start_pipe_reader(proc.stderr, streamer, 'stderr'),
+            ]
             
-            # ★ 轮询等待：每 0.5s 检查一次停止标志和超时
+            # ★ 等待循环：阻塞在停止事件上（点击停止立即唤醒），每 0.05s 检查一次进程状态
             deadline = start_time + timeout
             while proc.poll() is None:
                 # 检查用户中断
-                if stop_event and stop_event.is_set():
+                if stop_event.wait(0.05):
                     self._kill_process_tree(proc)
                     elapsed = time.time() - start_time
                     return {"success": False, "error": f"命令被用户中断\n命令: {command}\n已运行: {elapsed:.1f}s"}
@@ -2917,23 +3231,22 @@ class HoudiniMCP:
                     elapsed = time.time() - start_time
                     return {"success": False, "error": f"命令超时（{timeout}s 限制）\n命令: {command}\n耗时: {elapsed:.2f}s"}
                 
-                # 短暂等待避免 CPU 空转
-                try:
-                    proc.wait(timeout=0.5)
-                except subprocess.TimeoutExpired:
-                    pass
+                streamer.flush_if_due()
             
-            # 进程已结束，读取输出
-            stdout, stderr = proc.communicate(timeout=5)
+            # 进程已结束，等读线程把管道里剩余的输出读完
+            for t in readers:
+                t.join(timeout=5)
             elapsed = time.time() - start_time
 
-            # 组装输出
+            # 组装输出（超长时为 头 + 省略提示 + 尾）
             parts = []
-            if stdout:
+            stdout = streamer.rings['stdout'].render()
+            stderr = streamer.rings['stderr'].render()
+            if stdout.strip():
                 parts.append(stdout.rstrip())
-            if stderr:
+            if stderr.strip():
                 parts.append(f"[stderr]\n{stderr.rstrip()}")
-            parts.append(f"[退出码: {proc.returncode}, 耗时: {elapsed:.2f}s]")
+            parts.append(f"[退出码: {proc.returncode}, 耗时: {elapsed:.2f}s, 输出: {streamer.total_bytes} 字节]")
             full_text = "\n".join(parts)
 
             success = proc.returncode == 0
@@ -2945,6 +3258,35 @@ class HoudiniMCP:
             if proc and proc.poll() is None:
                 self._kill_process_tree(proc)
             return {"success": False, "error": f"Shell 执行失败: {e}"}
+        finally:
+            if proc is not None:
+                streamer.end()
+
+    @staticmethod
+    def _start_pipe_reader(pipe, streamer, stream: str) -> threading.Thread:
+        """后台线程：分块读取子进程管道，增量 UTF-8 解码后写入 streamer"""
+        import codecs
+
+        def _read():
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            try:
+                while True:
+                    data = pipe.read1(65536) if hasattr(pipe, 'read1') else pipe.read(4096)
+                    if not data:
+                        break
+                    streamer.write(stream, decoder.decode(data))
+                streamer.write(stream, decoder.decode(b'', final=True))
+            except (OSError, ValueError):
+                pass  # 进程被杀 / 管道已关闭
+            finally:
+                try:
+                    pipe.close()
+                except Exception:
+                    pass
+
+        t = threading.Thread(target=_read, daemon=True, name=f'shell-{stream}')
+        t.start()
+        return t
 
     @staticmethod
     def _kill_process_tree(proc):
@@ -3366,7 +3708,7 @@ class HoudiniMCP:
 
     # 工具用法提示：参数缺失或调用出错时附带正确调用方式
     _TOOL_USAGE: Dict[str, str] = {
-        "get_network_structure": 'get_network_structure(network_path="/obj/geo1", page=1)',
+        "get_network_structure": 'get_network_structure(network_path="/obj/geo1", page=1) 或 get_network_structure(network_path="/obj/geo1", since="ns3")',
         "get_node_parameters": 'get_node_parameters(node_path="/obj/geo1/box1", page=1)',
         "set_node_parameter": 'set_node_parameter(node_path="/obj/geo1/box1", param_name="sizex", value=2.0)',
         "create_node": 'create_node(parent_path="/obj/geo1", node_type="box", node_name="box1")',
@@ -3381,7 +3723,7 @@ class HoudiniMCP:
         "set_display_flag": 'set_display_flag(node_path="/obj/geo1/box1")',
         "copy_node": 'copy_node(source_path="/obj/geo1/box1", dest_parent="/obj/geo1", new_name="box1_copy")',
         "batch_set_parameters": 'batch_set_parameters(node_path="/obj/geo1/box1", parameters={"sizex":2,"sizey":3})',
-        "find_nodes_by_param": 'find_nodes_by_param(network_path="/obj/geo1", param_name="file", param_value="*.bgeo")',
+        "find_nodes_by_param": 'find_nodes_by_param(network_path="/obj/geo1", param_name="file", pattern="\\.bgeo$")',
         "save_hip": 'save_hip(file_path="C:/path/to/file.hip")',
         "undo_redo": 'undo_redo(action="undo")',
         "execute_python": 'execute_python(code="import hou; print(hou.node(\\"/obj\\").children())")',
@@ -3499,6 +3841,17 @@ class HoudiniMCP:
 
         return "\n\n".join(parts)
 
+    # 不修改场景的工具：执行后无需递增场景版本号
+    # （其余工具——包括 execute_python / execute_shell / run_skill——一律视为可能修改场景）
+    _SCENE_READONLY_TOOLS: frozenset = frozenset({
+        'get_network_structure', 'get_node_parameters', 'list_children',
+        'read_selection', 'search_node_types', 'semantic_search_nodes',
+        'find_nodes_by_param', 'get_node_inputs', 'check_errors',
+        'search_local_doc', 'get_houdini_node_doc', 'list_skills',
+        'get_node_positions', 'list_network_boxes', 'perf_stop_and_report',
+        'search_memory', 'capture_viewport',
+    })
+
     def execute_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
         """执行工具调用 - AI Agent 的统一工具入口（基于分派表）
         
@@ -3509,6 +3862,105 @@ class HoudiniMCP:
         Returns:
             {"success": bool, "result": str, "error": str}
         """
+        try:
+            self._focus_tool_scope(tool_name, arguments)
+            with get_tracer().span(f"tool.{tool_name}", cat='tool'):
+                return self._dispatch_tool(tool_name, arguments)
+        finally:
+            # ★ 可能修改场景的工具执行后递增场景版本号 → 只读工具缓存失效
+            if tool_name not in self._SCENE_READONLY_TOOLS:
+                monitor = get_scene_monitor()
+                monitor.bump(tool_name)
+                if threading.current_thread() is threading.main_thread():
+                    monitor.note_undo_state()   # Agent 自己的修改不算界面中的手动修改
+
+    _FOCUS_PATH_KEYS = ('network_path', 'parent_path', 'node_path',
+                        'from_path', 'to_path', 'source_path')
+
+    def _focus_tool_scope(self, tool_name: str, arguments: Dict[str, Any]):
+        """★ 工具涉及的网络挂上节点级事件回调（SceneMonitor.focus）
+
+        之后这些网络中的手动修改才会递增场景版本号、同步到镜像 / 参数索引；
+        未给出路径的工具（默认作用于当前网络）关注 Network Editor 所在网络。
+        hou 回调只能在主线程挂载，后台线程执行的工具（execute_shell 等）跳过。
+        """
+        monitor = get_scene_monitor()
+        if not monitor.is_live or threading.current_thread() is not threading.main_thread():
+            return
+        try:
+            recursive = tool_name == 'check_errors' or (
+                tool_name == 'list_children' and bool(arguments.get('recursive'))) or (
+                tool_name == 'find_nodes_by_param' and bool(arguments.get('recursive', True)))
+            paths = [arguments.get(k) for k in self._FOCUS_PATH_KEYS]
+            node_paths = arguments.get('node_paths')
+            if isinstance(node_paths, list):
+                paths.extend(node_paths)
+            paths = [p for p in paths if isinstance(p, str) and p]
+            for p in paths:
+                monitor.focus_path(p, recursive)
+            if not paths:
+                monitor.focus_editor_networks()
+        except Exception as e:
+            print(f"[MCP Client] 关注网络失败: {e}")
+
+    def execute_mirrored_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """★ 用 SceneMirror 在调用线程直接应答只读结构查询（不访问 hou，无主线程往返）
+
+        ★ 插件注册了 on_before_tool / on_after_tool 时不走镜像：钩子成对地在主线程触发
+          （与 execute_tool → _dispatch_tool 一致），插件代码无需考虑后台线程。
+
+        Returns:
+            工具结果；镜像无法应答时返回 None（调用方回退主线程执行 execute_tool）
+        """
+        try:
+            from ..hooks import get_hook_manager as _ghm
+            if _ghm().has_hooks('on_before_tool', 'on_after_tool'):
+                return None
+        except Exception:
+            pass
+        mirror = get_scene_mirror()
+        if not mirror.can_serve(tool_name, arguments):
+            return None
+        with get_tracer().span(f"tool.{tool_name}", cat='tool', mirrored=True):
+            if tool_name == 'get_network_structure':
+                result = self._mirror_get_network_structure(mirror, arguments)
+            elif tool_name == 'list_children':
+                result = self._mirror_list_children(mirror, arguments)
+            else:
+                data = mirror.error_report(arguments.get("node_path", ""))
+                if data is None:
+                    return None
+                _, text = self.check_node_errors_text(data=data)
+                result = {"success": True, "result": text, "error": ""}
+        return result
+
+    def _mirror_get_network_structure(self, mirror, args: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        data = mirror.network_structure(args.get("network_path"))
+        if data is None:
+            return None
+        return self._network_structure_response(args, data)
+
+    def _mirror_list_children(self, mirror, args: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        network_path = args.get("network_path")
+        recursive = args.get("recursive", False)
+        show_flags = args.get("show_flags", True)
+        page = int(args.get("page", 1))
+        listing = mirror.children_listing(network_path, recursive)
+        if listing is None:
+            return None
+        lines = [f"## {network_path}"]
+        lines.extend(self._format_child_line(r.name, r.type_name, depth, show_flags,
+                                             r.display, r.render, r.bypass)
+                     for depth, r in listing)
+        if len(lines) == 1:
+            lines.append("（空网络）")
+        cache_key = f"list_children:{network_path}:r={recursive}"
+        hint = f'list_children(network_path="{network_path}", recursive={recursive}, page={page})'
+        return {"success": True, "result": self._paginate_tool_result(
+            "\n".join(lines), cache_key, hint, page)}
+
+    def _dispatch_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """按分派表执行工具（内部分派表 → 插件工具 → ToolRegistry）"""
         print(f"[MCP Client] 执行工具: {tool_name}, 参数: {list(arguments.keys())}")
         
         # ★ Hook: on_before_tool — 允许插件拦截/审计/修改参数
@@ -3654,21 +4106,27 @@ class HoudiniMCP:
         
         使用 flipbook 机制截取当前帧的单帧图片，供 AI 视觉分析节点运行结果。
         ★ 必须在主线程执行（涉及 hou UI 操作）。
+        ★ 主线程只负责渲染与读回原始字节；降采样到 max_tokens 预算、JPEG 重编码、
+          保存 output_path 均在 viewport_capture 的 worker 线程完成，
+          结果带 _viewport_pending，由调用线程经 resolve_deferred_result() 取回。
+        ★ 视口 / 帧 / 场景版本号 / 相机均未变化时直接复用缓存帧，不再渲染；
+          结果带 _viewport_unchanged，上一张截图仍在上下文中时 Agent 循环不再重复附加图片。
         """
         if hou is None:
             return {"success": False, "error": "Houdini 环境不可用"}
         
+        from .viewport_capture import get_viewport_capture, DEFAULT_TOKEN_BUDGET, MIN_TOKEN_BUDGET
+        
         width = args.get("width", 960)
         height = args.get("height", 540)
         output_path = args.get("output_path", "")
+        budget = args.get("max_tokens") or DEFAULT_TOKEN_BUDGET
         # 限制分辨率范围
         width = max(160, min(width, 1920))
         height = max(120, min(height, 1080))
+        budget = max(MIN_TOKEN_BUDGET, int(budget))
         
         try:
-            import tempfile
-            import base64
-            
             # 获取 Scene Viewer
             viewer = None
             try:
@@ -3689,96 +4147,95 @@ class HoudiniMCP:
             
             # 获取当前帧
             current_frame = int(hou.frame())
-            
-            # 生成临时文件路径
-            tmp_dir = tempfile.gettempdir()
-            tmp_file = os.path.join(tmp_dir, f"houdini_viewport_{int(time.time() * 1000)}.jpg")
-            
-            # 使用 flipbook 截取单帧
-            try:
-                flip_settings = viewer.flipbookSettings().stash()
-                flip_settings.output(tmp_file)
-                flip_settings.frameRange((current_frame, current_frame))
-                flip_settings.resolution((width, height))
-                flip_settings.outputToMPlay(False)
-                
-                # 执行单帧截图
-                viewport = viewer.curViewport()
-                viewer.flipbook(viewport, flip_settings)
-            except Exception as e:
-                # 某些 Houdini 版本可能不支持 flipbook API
-                return {"success": False, "error": f"Flipbook 截图失败: {e}"}
-            
-            # 读取生成的图片
-            if not os.path.exists(tmp_file):
-                # flipbook 可能使用帧号作为文件名后缀
-                import glob
-                pattern = tmp_file.replace('.jpg', '*.jpg')
-                candidates = sorted(glob.glob(pattern))
-                if candidates:
-                    tmp_file = candidates[0]
-                else:
-                    return {"success": False, "error": "截图文件未生成，请检查视口状态"}
-            
-            # 读取并编码
-            with open(tmp_file, 'rb') as f:
-                img_bytes = f.read()
-            
-            if len(img_bytes) == 0:
-                return {"success": False, "error": "截图文件为空"}
-            
-            b64_data = base64.b64encode(img_bytes).decode('utf-8')
-            
-            # 清理临时文件
-            try:
-                os.remove(tmp_file)
-            except Exception:
-                pass
+            viewport = viewer.curViewport()
             
             # 获取视口信息
             viewport_name = ""
             try:
-                viewport_name = viewer.curViewport().name()
+                viewport_name = viewport.name()
             except Exception:
                 pass
             
             cam_info = ""
+            cam_key: Any = None
             try:
-                vp = viewer.curViewport()
-                cam = vp.camera()
+                cam = viewport.camera()
                 if cam:
                     cam_info = f", camera={cam.path()}"
+                    cam_key = cam.path()
+                else:
+                    # 自由视角：以视图矩阵区分（旋转 / 平移视口后缓存失效）
+                    cam_key = tuple(round(v, 4) for v in viewport.viewTransform().asTuple())
             except Exception:
                 pass
             
-            size_kb = len(img_bytes) / 1024
+            if output_path:
+                # 支持 $HIP 等 Houdini 变量展开（hou.text 只能在主线程调用）
+                try:
+                    output_path = hou.text.expandString(output_path) if hasattr(hou, 'text') else output_path
+                except Exception:
+                    pass
             
-            result_msg = (
-                f"已截取视口快照: {width}x{height}, frame={current_frame}, "
-                f"viewport={viewport_name}{cam_info}, "
-                f"size={size_kb:.1f}KB"
-            )
+            pipeline = get_viewport_capture()
+            head = (f"已截取视口快照: {width}x{height}, frame={current_frame}, "
+                    f"viewport={viewport_name}{cam_info}")
+            
+            # ★ 帧缓存：仅在 hou 事件已挂载时可信（否则版本号感知不到手动修改）
+            cache_key = None
+            monitor = get_scene_monitor()
+            if monitor.is_live and cam_key is not None:
+                cache_key = (viewer.name(), viewport_name, hou.frame(), monitor.version,
+                             cam_key, width, height, budget)
+                frame = pipeline.cache.get(cache_key)
+                if frame is not None:
+                    result = {
+                        "success": True,
+                        "result": f"{head}（视口自上次截图后未变化）",
+                        "_image_media_type": "image/jpeg",
+                        "_viewport_unchanged": True,
+                    }
+                    if output_path:
+                        result["_viewport_pending"] = pipeline.submit_cached(frame, output_path)
+                        result["_viewport_output_path"] = output_path
+                    else:
+                        result["result"] += "\n" + pipeline.describe(frame)
+                        result["_viewport_image"] = frame.b64
+                    return result
             
-            # 如果指定了 output_path，保存到文件
-            if output_path:
+            # 使用 flipbook 截取单帧（写入私有临时目录，读回后立即删除）
+            tmp_file = pipeline.temp.new_file('.jpg')
+            try:
                 try:
-                    # 支持 $HIP 等 Houdini 变量展开
-                    expanded_path = hou.text.expandString(output_path) if hasattr(hou, 'text') else output_path
-                    save_dir = os.path.dirname(expanded_path)
-                    if save_dir and not os.path.exists(save_dir):
-                        os.makedirs(save_dir, exist_ok=True)
-                    with open(expanded_path, 'wb') as f:
-                        f.write(img_bytes)
-                    result_msg += f"\n截图已保存到: {expanded_path}"
+                    flip_settings = viewer.flipbookSettings().stash()
+                    flip_settings.output(tmp_file)
+                    flip_settings.frameRange((current_frame, current_frame))
+                    flip_settings.resolution((width, height))
+                    flip_settings.outputToMPlay(False)
+                    viewer.flipbook(viewport, flip_settings)
                 except Exception as e:
-                    result_msg += f"\n保存到 {output_path} 失败: {e}"
+                    # 某些 Houdini 版本可能不支持 flipbook API
+                    return {"success": False, "error": f"Flipbook 截图失败: {e}"}
+                
+                # flipbook 可能使用帧号作为文件名后缀
+                actual = pipeline.temp.find_output(tmp_file)
+                if actual is None:
+                    return {"success": False, "error": "截图文件未生成，请检查视口状态"}
+                with open(actual, 'rb') as f:
+                    img_bytes = f.read()
+            finally:
+                pipeline.temp.remove(tmp_file)
+            
+            if len(img_bytes) == 0:
+                return {"success": False, "error": "截图文件为空"}
             
             return {
                 "success": True,
-                "result": result_msg,
-                # ★ 特殊字段：包含 base64 图片数据，
-                # agent_loop_stream 中检测到此字段会将图片注入消息
-                "_viewport_image": b64_data,
+                "result": head,
+                # ★ 特殊字段：_viewport_pending 由 resolve_deferred_result() 换成 _viewport_image，
+                # agent_loop_stream 中检测到 _viewport_image 会将图片注入消息
+                "_viewport_pending": pipeline.submit(cache_key, img_bytes, (width, height),
+                                                     budget, output_path),
+                "_viewport_output_path": output_path,
                 "_image_media_type": "image/jpeg",
             }
             
@@ -3787,6 +4244,17 @@ class HoudiniMCP:
             traceback.print_exc()
             return {"success": False, "error": f"视口截图失败: {str(e)}"}
 
+    @staticmethod
+    def resolve_deferred_result(result: Dict[str, Any]) -> Dict[str, Any]:
+        """取回主线程工具结果中的后台任务（目前只有 capture_viewport 的编码）
+        
+        在调用线程（Agent 后台线程）中调用，不阻塞主线程；普通结果原样返回。
+        """
+        if isinstance(result, dict) and '_viewport_pending' in result:
+            from .viewport_capture import get_viewport_capture
+            return get_viewport_capture().resolve(result)
+        return result
+
     def _tool_unknown(self, tool_name: str) -> Dict[str, Any]:
         """处理未知工具名称，提供建议"""
         available = list(self._TOOL_DISPATCH.keys())
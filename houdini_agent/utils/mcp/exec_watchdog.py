@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+ExecWatchdog — execute_python 的低开销超时 / 停止中断
+
+旧方案用 sys.settrace 在每行 Python 代码执行前回调检查超时与停止标志：
+即使检查本身被节流，trace 回调仍在每一行触发，遍历点的紧密循环会慢数倍。
+
+本模块改用看门狗线程：
+  - 执行线程只负责 arm() / disarm()，执行期间不安装任何 trace 回调
+  - 看门狗每 POLL_INTERVAL 秒检查一次超时与停止事件，触发时通过
+    PyThreadState_SetAsyncExc 向执行线程注入异常（在下一个字节码检查点抛出）
+  - 用户代码吞掉异常（except Exception: pass）时每 REINJECT_INTERVAL 秒重新注入
+  - disarm() 在锁内关闭注入并清除尚未送达的异常，保证执行结束后不会误伤调用方
+  - 与 settrace 一样，无法打断阻塞在 C 扩展内部的调用（如 cook），在其返回后中断
+
+非 CPython（无 ctypes.pythonapi）时退化为 sys.settrace 方案（TraceGuard）。
+
+基准测试（1M 次迭代循环）：python -m houdini_agent.utils.mcp.exec_watchdog
+"""
+
+import sys
+import threading
+import time
+from typing import Callable, Optional, Type
+
+try:
+    import ctypes
+    _set_async_exc = ctypes.pythonapi.PyThreadState_SetAsyncExc
+except Exception:
+    _set_async_exc = None
+
+
+class ExecWatchdog:
+    """看门狗线程：超时或停止时向执行线程注入异常"""
+
+    POLL_INTERVAL = 0.1        # 检查超时 / 停止标志的间隔（秒）
+    REINJECT_INTERVAL = 0.5    # 注入后仍未结束时的重新注入间隔（秒）
+
+    available = _set_async_exc is not None
+
+    def __init__(self, exc_type: Type[BaseException], deadline: float, timeout: float,
+                 stop_event: Optional[threading.Event] = None):
+        self._exc_type = exc_type
+        self._deadline = deadline
+        self._timeout = timeout
+        self._stop_event = stop_event
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._active = False
+        self._tid = 0
+        self._thread: Optional[threading.Thread] = None
+        self.reason = ""
+        self.injections = 0
+
+    def arm(self):
+        """在执行线程中调用：开始监视当前线程"""
+        self._tid = threading.get_ident()
+        self._active = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name='exec-watchdog')
+        self._thread.start()
+
+    def disarm(self):
+        """在执行线程中调用（finally 第一句）：停止注入并清除未送达的异常"""
+        with self._lock:
+            if not self._active:
+                return
+            self._active = False
+            if self.injections:
+                # exc=NULL 清除尚未送达的异步异常
+                _set_async_exc(ctypes.c_ulong(self._tid), None)
+        self._done.set()
+
+    def _check(self) -> str:
+        if self._stop_event is not None and self._stop_event.is_set():
+            return "用户已停止执行"
+        if time.time() > self._deadline:
+            return (f"代码执行超时（{self._timeout}s），已中断。"
+                    f"如需更长时间，请增加 timeout 参数。")
+        return ""
+
+    def _run(self):
+        wait = self.POLL_INTERVAL
+        while not self._done.wait(wait):
+            reason = self._check()
+            if not reason:
+                continue
+            with self._lock:
+                if not self._active:
+                    return
+                self.reason = reason
+                self.injections += 1
+                _set_async_exc(ctypes.c_ulong(self._tid), ctypes.py_object(self._exc_type))
+            wait = self.REINJECT_INTERVAL
+
+
+class TraceGuard:
+    """sys.settrace 方案（旧实现，无法注入异步异常时的回退）"""
+
+    CHECK_INTERVAL = 0.5
+
+    def __init__(self, exc_type: Type[BaseException], deadline: float, timeout: float,
+                 stop_event: Optional[threading.Event] = None):
+        self._exc_type = exc_type
+        self._deadline = deadline
+        self._timeout = timeout
+        self._stop_event = stop_event
+        self._last_check = time.time()
+        self._old_trace: Optional[Callable] = None
+        self.reason = ""
+
+    def _trace(self, frame, event, arg):
+        now = time.time()
+        # 降低检查频率：距上次检查不足 CHECK_INTERVAL 则跳过
+        if now - self._last_check < self.CHECK_INTERVAL:
+            return self._trace
+        self._last_check = now
+        if self._stop_event is not None and self._stop_event.is_set():
+            self.reason = "用户已停止执行"
+            raise self._exc_type(self.reason)
+        if now > self._deadline:
+            self.reason = (f"代码执行超时（{self._timeout}s），已中断。"
+                           f"如需更长时间，请增加 timeout 参数。")
+            raise self._exc_type(self.reason)
+        return self._trace
+
+    def arm(self):
+        self._old_trace = sys.gettrace()
+        sys.settrace(self._trace)
+
+    def disarm(self):
+        # ★ 必须恢复原始 trace，否则影响后续所有 Python 执行
+        sys.settrace(self._old_trace)
+
+
+def make_exec_guard(exc_type: Type[BaseException], timeout: float,
+                    stop_event: Optional[threading.Event] = None, start: Optional[float] = None):
+    """创建 execute_python 的中断守卫（优先看门狗，回退 settrace）"""
+    start = time.time() if start is None else start
+    deadline = start + timeout
+    cls = ExecWatchdog if ExecWatchdog.available else TraceGuard
+    return cls(exc_type, deadline, timeout, stop_event)
+
+
+# ─────────────────────────────────────────────
+# 基准测试
+# ─────────────────────────────────────────────
+
+def _benchmark(iterations: int = 1_000_000):
+    """1M 次迭代的紧密循环：无守卫 / settrace / 看门狗，以及两种方案的中断延迟"""
+
+    class _Interrupt(Exception):
+        pass
+
+    code = compile(
+        "acc = 0.0\n"
+        "for i in range(n):\n"
+        "    p = (i * 0.5, i * 0.25, 1.0)\n"
+        "    acc += p[0] * p[1] + p[2]\n",
+        "<bench>", "exec")
+
+    def run(guard_cls) -> float:
+        guard = guard_cls(_Interrupt, time.time() + 3600, 3600) if guard_cls else None
+        t0 = time.perf_counter()
+        if guard:
+            guard.arm()
+        try:
+            exec(code, {'n': iterations})
+        finally:
+            if guard:
+                guard.disarm()
+        return time.perf_counter() - t0
+
+    def interrupt_latency(guard_cls) -> float:
+        guard = guard_cls(_Interrupt, time.time() + 0.3, 0.3)
+        t0 = time.time()
+        guard.arm()
+        try:
+            try:
+                exec("while True:\n    x = 1 + 1\n", {})
+            finally:
+                guard.disarm()
+        except _Interrupt:
+            pass
+        return time.time() - t0 - 0.3
+
+    base = min(run(None) for _ in range(3))
+    traced = min(run(TraceGuard) for _ in range(3))
+    print(f"[ExecWatchdog] {iterations:,} 次迭代循环:")
+    print(f"  无守卫:          {base * 1000:8.1f} ms")
+    print(f"  sys.settrace:    {traced * 1000:8.1f} ms  ({traced / base:.2f}x)")
+    if ExecWatchdog.available:
+        watched = min(run(ExecWatchdog) for _ in range(3))
+        print(f"  看门狗线程:      {watched * 1000:8.1f} ms  ({watched / base:.2f}x)")
+        print(f"  超时中断延迟:    settrace {interrupt_latency(TraceGuard) * 1000:.0f} ms, "
+              f"看门狗 {interrupt_latency(ExecWatchdog) * 1000:.0f} ms")
+    else:
+        print("  看门狗不可用（无 ctypes.pythonapi）")
+
+
+if __name__ == '__main__':
+    _benchmark()
@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+"""
+GeoReader — 批量几何属性读取 + 向量化统计
+
+get_geometry_info 与几何类 Skill（analyze_geometry_attribs / analyze_normals）
+原先通过 pointFloatAttribValues 等返回 tuple 的 API 读取属性：每个分量都要
+创建一个 Python float，千万级点的 P 就是数千万个对象，随后再 np.array 复制一遍。
+
+本模块统一改为：
+  - 读取:  *AttribValuesAsString → np.frombuffer（零拷贝视图，float32 / int32）
+  - 统计:  按 CHUNK_ROWS 行分块计算 min / max / mean / std / NaN / Inf，
+           各块结果按 Chan 并行方差公式合并；中间数组（float64 转换、掩码）
+           只占一个块的内存，5000 万点的几何体也不会成倍放大峰值内存
+  - 直方图: 第一遍取有限值范围，第二遍分块累计固定区间的计数
+  - 包围盒: 由 P 的有限值统计得出（与 NaN 处理保持一致）
+  - 分组:   各组元素数（逐元素 API，超过 GROUP_COUNT_LIMIT 的几何体跳过）
+
+numpy 不可用时 GeoReader.available 为 False，调用方自行回退。
+可以传入任何实现了相同 HOM 方法子集的对象（见 _StubGeometry），便于脱离 Houdini 测试。
+
+基准测试：python -m houdini_agent.utils.mcp.geo_reader
+"""
+
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# 属性类别 → (属性列表, 查找属性, 批量读 float, 批量读 int, 元素数 intrinsic)
+_CLASS_API = {
+    'point': ('pointAttribs', 'findPointAttrib',
+              'pointFloatAttribValuesAsString', 'pointIntAttribValuesAsString', 'pointcount'),
+    'prim': ('primAttribs', 'findPrimAttrib',
+             'primFloatAttribValuesAsString', 'primIntAttribValuesAsString', 'primitivecount'),
+    'vertex': ('vertexAttribs', 'findVertexAttrib',
+               'vertexFloatAttribValuesAsString', 'vertexIntAttribValuesAsString', 'vertexcount'),
+}
+
+_NUMERIC_TYPES = ('Float', 'Int')
+
+
+def _type_name(attrib) -> str:
+    """hou.attribData → 'Float' / 'Int' / 'String' / 'Dict'"""
+    dt = attrib.dataType()
+    name = getattr(dt, 'name', None)
+    return name() if callable(name) else str(dt).split('.')[-1]
+
+
+class GeoReader:
+    """单个 hou.Geometry 的批量属性读取器（读取结果按 (类别, 属性名) 缓存）"""
+
+    CHUNK_ROWS = 2_000_000          # 分块统计的行数（每块 float64 中间数组约 16MB × 分量数）
+    GROUP_COUNT_LIMIT = 5_000_000   # 超过此元素数不统计分组大小（需逐元素 API）
+
+    available = np is not None
+
+    def __init__(self, geo, chunk_rows: Optional[int] = None):
+        self.geo = geo
+        self.chunk_rows = chunk_rows or self.CHUNK_ROWS
+        self._arrays: Dict[tuple, Any] = {}
+
+    # ---------- 读取 ----------
+
+    def element_count(self, attrib_class: str) -> int:
+        return int(self.geo.intrinsicValue(_CLASS_API[attrib_class][4]))
+
+    def numeric_attribs(self, attrib_class: str) -> List[Any]:
+        """该类别下的 Float / Int 属性"""
+        attribs = getattr(self.geo, _CLASS_API[attrib_class][0])()
+        return [a for a in attribs if _type_name(a) in _NUMERIC_TYPES]
+
+    def read_array(self, attrib_class: str, name: str):
+        """属性值数组，形状 (元素数, 分量数)；属性不存在或非数值时返回 None
+
+        float → float32，int → int32；数组是 HOM 返回的 bytes 的只读视图。
+        """
+        key = (attrib_class, name)
+        if key in self._arrays:
+            return self._arrays[key]
+        _, find_fn, float_fn, int_fn, _ = _CLASS_API[attrib_class]
+        attrib = getattr(self.geo, find_fn)(name)
+        if attrib is None:
+            return None
+        type_name = _type_name(attrib)
+        if type_name == 'Float':
+            arr = np.frombuffer(getattr(self.geo, float_fn)(name), dtype=np.float32)
+        elif type_name == 'Int':
+            arr = np.frombuffer(getattr(self.geo, int_fn)(name), dtype=np.int32)
+        else:
+            return None
+        arr = arr.reshape((-1, max(attrib.size(), 1)))
+        self._arrays[key] = arr
+        return arr
+
+    def iter_chunks(self, arr) -> Iterator[Any]:
+        """按 chunk_rows 行切分的视图（不复制）"""
+        for start in range(0, arr.shape[0], self.chunk_rows):
+            yield arr[start:start + self.chunk_rows]
+
+    # ---------- 统计 ----------
+
+    def attrib_stats(self, attrib_class: str, name: str) -> Optional[Dict[str, Any]]:
+        """逐分量 min / max / mean / std（仅有限值）+ NaN / Inf 计数"""
+        arr = self.read_array(attrib_class, name)
+        if arr is None:
+            return None
+        is_float = arr.dtype.kind == 'f'
+        k = arr.shape[1]
+        n = np.zeros(k, dtype=np.int64)
+        mean = np.zeros(k)
+        m2 = np.zeros(k)
+        lo = np.full(k, np.inf)
+        hi = np.full(k, -np.inf)
+        nan_count = 0
+        inf_count = 0
+
+        for chunk in self.iter_chunks(arr):
+            finite = np.isfinite(chunk) if is_float else None
+            if finite is None or finite.all():
+                # 常见情况：没有 NaN / Inf，min / max 直接在原精度上算
+                lo = np.minimum(lo, chunk.min(axis=0))
+                hi = np.maximum(hi, chunk.max(axis=0))
+                c = chunk.astype(np.float64)
+                cnt = np.full(k, c.shape[0], dtype=np.int64)
+                c_mean = c.mean(axis=0)
+                c -= c_mean
+                c_m2 = np.einsum('ij,ij->j', c, c)
+            else:
+                nan_mask = np.isnan(chunk)
+                nan_count += int(nan_mask.sum())
+                inf_count += int((~finite & ~nan_mask).sum())
+                c = np.where(finite, chunk.astype(np.float64), np.nan)
+                cnt = finite.sum(axis=0)
+                lo = np.minimum(lo, np.where(finite, chunk, np.inf).min(axis=0))
+                hi = np.maximum(hi, np.where(finite, chunk, -np.inf).max(axis=0))
+                c_mean = np.nansum(c, axis=0) / np.maximum(cnt, 1)
+                c_m2 = np.nansum((c - c_mean) ** 2, axis=0)
+            # Chan 并行合并：(n, mean, m2) ⊕ (cnt, c_mean, c_m2)
+            total = n + cnt
+            safe = np.maximum(total, 1)
+            delta = c_mean - mean
+            mean = mean + delta * cnt / safe
+            m2 = m2 + c_m2 + delta ** 2 * n * cnt / safe
+            n = total
+
+        valid = n > 0
+        std = np.sqrt(m2 / np.maximum(n, 1))
+
+        def _out(v):
+            vals = [float(x) if ok else None for x, ok in zip(v, valid)]
+            return vals[0] if k == 1 else vals
+
+        return {
+            'name': name,
+            'class': attrib_class,
+            'type': 'Float' if is_float else 'Int',
+            'size': k,
+            'count': int(arr.shape[0]),
+            'min': _out(lo),
+            'max': _out(hi),
+            'mean': _out(mean),
+            'std': _out(std),
+            'nan_count': nan_count,
+            'inf_count': inf_count,
+        }
+
+    def bounds(self) -> Optional[Dict[str, List[float]]]:
+        """P 的有限值包围盒"""
+        stats = self.attrib_stats('point', 'P')
+        if not stats or stats['count'] == 0 or None in stats['min']:
+            return None
+        lo, hi = stats['min'][:3], stats['max'][:3]
+        return {
+            'min': lo,
+            'max': hi,
+            'center': [(a + b) / 2 for a, b in zip(lo, hi)],
+            'size': [b - a for a, b in zip(lo, hi)],
+        }
+
+    def histogram(self, attrib_class: str, name: str, bins: int = 16,
+                  component: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """有限值直方图；多分量属性默认统计向量长度，指定 component 则统计该分量"""
+        arr = self.read_array(attrib_class, name)
+        if arr is None or arr.shape[0] == 0:
+            return None
+
+        def _values(chunk):
+            c = chunk.astype(np.float64)
+            if c.shape[1] == 1:
+                v = c[:, 0]
+            elif component is not None:
+                v = c[:, component]
+            else:
+                v = np.sqrt((c * c).sum(axis=1))
+            return v[np.isfinite(v)]
+
+        # 第一遍：范围
+        lo, hi = np.inf, -np.inf
+        for chunk in self.iter_chunks(arr):
+            v = _values(chunk)
+            if v.size:
+                lo = min(lo, float(v.min()))
+                hi = max(hi, float(v.max()))
+        if lo > hi:
+            return None
+        if lo == hi:
+            hi = lo + 1.0
+        # 第二遍：固定区间计数
+        counts = np.zeros(bins, dtype=np.int64)
+        edges = None
+        for chunk in self.iter_chunks(arr):
+            c, edges = np.histogram(_values(chunk), bins=bins, range=(lo, hi))
+            counts += c
+        if arr.shape[1] == 1:
+            value = name
+        elif component is not None:
+            value = f"{name}[{component}]"
+        else:
+            value = f"|{name}|"
+        return {'value': value, 'edges': edges.tolist(), 'counts': counts.tolist()}
+
+    def group_sizes(self) -> Dict[str, Dict[str, Optional[int]]]:
+        """各类别分组的元素数；元素过多时值为 None（未统计）"""
+        result: Dict[str, Dict[str, Optional[int]]] = {}
+        for cls, groups_fn, members_fn in (('point', 'pointGroups', 'points'),
+                                           ('prim', 'primGroups', 'prims')):
+            groups = getattr(self.geo, groups_fn, lambda: ())()
+            if not groups:
+                continue
+            countable = self.element_count(cls) <= self.GROUP_COUNT_LIMIT
+            result[cls] = {
+                g.name(): (len(getattr(g, members_fn)()) if countable else None)
+                for g in groups
+            }
+        return result
+
+
+# ─────────────────────────────────────────────
+# 测试桩 & 基准测试
+# ─────────────────────────────────────────────
+
+class _StubAttribData:
+    """hou.attribData 枚举值的替身"""
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def name(self):
+        return self._name
+
+    def __repr__(self):
+        return f"attribData.{self._name}"
+
+
+class _StubAttrib:
+    def __init__(self, name: str, type_name: str, size: int):
+        self._name, self._type, self._size = name, _StubAttribData(type_name), size
+
+    def name(self):
+        return self._name
+
+    def size(self):
+        return self._size
+
+    def dataType(self):
+        return self._type
+
+
+class _StubGroup:
+    def __init__(self, name: str, members: list):
+        self._name, self._members = name, members
+
+    def name(self):
+        return self._name
+
+    def points(self):
+        return tuple(self._members)
+
+    prims = points
+
+
+class _StubGeometry:
+    """实现 GeoReader / Skill 用到的 hou.Geometry 方法子集（点属性 + 分组）"""
+
+    def __init__(self, attribs: Dict[str, Any], groups: Optional[Dict[str, list]] = None):
+        # attribs: 名称 → numpy 数组 (n, k)，float32 / int32
+        self._data = attribs
+        self._groups = groups or {}
+        self._count = len(next(iter(attribs.values()))) if attribs else 0
+
+    def intrinsicValue(self, name):
+        return {'pointcount': self._count, 'primitivecount': 0, 'vertexcount': 0}[name]
+
+    def _attrib(self, name):
+        arr = self._data[name]
+        return _StubAttrib(name, 'Float' if arr.dtype.kind == 'f' else 'Int', arr.shape[1])
+
+    def pointAttribs(self):
+        return tuple(self._attrib(n) for n in self._data)
+
+    def primAttribs(self):
+        return ()
+
+    vertexAttribs = globalAttribs = primAttribs
+
+    def findPointAttrib(self, name):
+        return self._attrib(name) if name in self._data else None
+
+    def findPrimAttrib(self, name):
+        return None
+
+    findVertexAttrib = findGlobalAttrib = findPrimAttrib
+
+    def pointStringAttribValues(self, name):
+        return ()
+
+    vertexStringAttribValues = primStringAttribValues = pointStringAttribValues
+
+    def pointFloatAttribValuesAsString(self, name):
+        return self._data[name].astype(np.float32).tobytes()
+
+    def pointIntAttribValuesAsString(self, name):
+        return self._data[name].astype(np.int32).tobytes()
+
+    def pointFloatAttribValues(self, name):
+        # HOM 的 tuple 版本：每个分量一个 Python float
+        return tuple(self._data[name].ravel().tolist())
+
+    def pointGroups(self):
+        return tuple(_StubGroup(n, m) for n, m in self._groups.items())
+
+    def primGroups(self):
+        return ()
+
+
+def _build_stub_geometry(points: int = 2_000_000, seed: int = 7) -> _StubGeometry:
+    rng = np.random.default_rng(seed)
+    P = rng.uniform(-10, 10, (points, 3)).astype(np.float32)
+    N = rng.normal(size=(points, 3)).astype(np.float32)
+    N /= np.linalg.norm(N, axis=1, keepdims=True)
+    N[::100_000] = np.nan
+    ids = np.arange(points, dtype=np.int32).reshape(-1, 1)
+    return _StubGeometry({'P': P, 'N': N, 'id': ids},
+                         groups={'top': list(range(0, points, 997))})
+
+
+def _benchmark(points: int = 2_000_000):
+    """tuple API + np.array（旧路径） vs AsString + frombuffer 分块统计"""
+    import time
+
+    if np is None:
+        print("[GeoReader] numpy 不可用，跳过基准测试")
+        return
+    geo = _build_stub_geometry(points)
+
+    t0 = time.perf_counter()
+    vals = np.array(geo.pointFloatAttribValues('N')).reshape((-1, 3))
+    old = (np.nanmin(vals, axis=0), np.nanmax(vals, axis=0), int(np.isnan(vals).sum()))
+    t_old = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    stats = GeoReader(geo).attrib_stats('point', 'N')
+    t_new = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    small = GeoReader(geo, chunk_rows=250_000).attrib_stats('point', 'N')
+    t_chunked = time.perf_counter() - t0
+
+    same = (np.allclose(old[0], stats['min']) and np.allclose(old[1], stats['max'])
+            and old[2] == stats['nan_count'] and np.allclose(small['std'], stats['std']))
+    print(f"[GeoReader] {points:,} 点 N(float×3) 统计:")
+    print(f"  tuple API + np.array:        {t_old * 1000:8.1f} ms")
+    print(f"  AsString + frombuffer:       {t_new * 1000:8.1f} ms  ({t_old / t_new:.1f}x)")
+    print(f"  同上，250k 行分块:           {t_chunked * 1000:8.1f} ms")
+    print(f"  结果一致={same}, NaN={stats['nan_count']}")
+
+
+if __name__ == '__main__':
+    _benchmark()
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+输出流 — execute_shell / execute_python 的增量输出
+
+旧实现把子进程 / 用户代码的全部输出攒在内存里，结束后一次性返回：
+长时间运行的 pip install / ffmpeg / 解算脚本在 UI 上几分钟毫无反应，输出也全部驻留内存。
+
+本模块提供：
+  - OutputRing:     有界输出缓冲，只保留开头 head_chars 与末尾 tail_chars，
+                    中间部分丢弃但计入字节数（最终工具结果 = 头 + 尾 + 字节统计）
+  - OutputStreamer: 生产者侧的节流器，把输出块合并后以 ≤ FLUSH_INTERVAL 的频率
+                    推送给回调（回调负责跨线程转发到 UI）
+  - StreamWriter:   file-like 对象，替换 execute_python 的 sys.stdout / sys.stderr
+
+回调签名：callback(kind, source, event, payload)
+  kind:    'shell' | 'python'
+  source:  命令文本 / 代码文本（UI 据此把流与最终结果对应到同一个控件）
+  event:   'start' | 'chunk' | 'end'
+  payload: chunk → {'stream': 'stdout'|'stderr', 'text': str}
+           start → {'cwd': str}（shell）
+           end   → {'total_bytes': int}
+"""
+
+import io
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+StreamCallback = Callable[[str, str, str, dict], None]
+
+
+class OutputRing:
+    """有界输出缓冲：保留头部与尾部，中间丢弃（线程安全）"""
+
+    def __init__(self, head_chars: int = 8000, tail_chars: int = 24000):
+        self._lock = threading.Lock()
+        self.head_chars = head_chars
+        self.tail_chars = tail_chars
+        self._head: list = []
+        self._head_len = 0
+        self._tail: deque = deque()
+        self._tail_len = 0
+        self.total_bytes = 0      # 写入的全部输出（UTF-8 字节）
+        self.dropped_bytes = 0    # 头尾之间被丢弃的字节
+
+    def append(self, text: str):
+        if not text:
+            return
+        with self._lock:
+            self.total_bytes += len(text.encode('utf-8', 'replace'))
+            # 先填满头部
+            if self._head_len < self.head_chars:
+                room = self.head_chars - self._head_len
+                part = text[:room]
+                self._head.append(part)
+                self._head_len += len(part)
+                text = text[room:]
+                if not text:
+                    return
+            self._tail.append(text)
+            self._tail_len += len(text)
+            # 尾部超出预算：从最旧的块开始丢弃
+            while self._tail_len > self.tail_chars:
+                excess = self._tail_len - self.tail_chars
+                oldest = self._tail[0]
+                if len(oldest) <= excess:
+                    self._tail.popleft()
+                    cut = oldest
+                else:
+                    self._tail[0] = oldest[excess:]
+                    cut = oldest[:excess]
+                self._tail_len -= len(cut)
+                self.dropped_bytes += len(cut.encode('utf-8', 'replace'))
+
+    @property
+    def truncated(self) -> bool:
+        return self.dropped_bytes > 0
+
+    def render(self) -> str:
+        """头 + [省略提示] + 尾"""
+        with self._lock:
+            head = ''.join(self._head)
+            tail = ''.join(self._tail)
+            if not self.dropped_bytes:
+                return head + tail
+            return (f"{head}\n"
+                    f"... [输出共 {self.total_bytes} 字节，已省略中间 {self.dropped_bytes} 字节] ...\n"
+                    f"{tail}")
+
+
+class OutputStreamer:
+    """节流推送：合并小块输出，每 FLUSH_INTERVAL 秒（或积压超过 FLUSH_CHARS）推送一次"""
+
+    FLUSH_INTERVAL = 0.1
+    FLUSH_CHARS = 16000
+
+    def __init__(self, kind: str, source: str, callback: Optional[StreamCallback]):
+        self.kind = kind
+        self.source = source
+        self._callback = callback
+        self._lock = threading.Lock()
+        self._pending: Dict[str, list] = {'stdout': [], 'stderr': []}
+        self._pending_len = 0
+        self._last_flush = time.monotonic()
+        self.rings: Dict[str, OutputRing] = {'stdout': OutputRing(), 'stderr': OutputRing()}
+
+    def start(self, **payload):
+        self._emit('start', payload)
+
+    def write(self, stream: str, text: str):
+        if not text:
+            return
+        self.rings[stream].append(text)
+        if self._callback is None:
+            return
+        with self._lock:
+            self._pending[stream].append(text)
+            self._pending_len += len(text)
+            due = (self._pending_len >= self.FLUSH_CHARS
+                   or time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL)
+        if due:
+            self.flush()
+
+    def flush_if_due(self):
+        """由等待循环定期调用：进程暂时没有新输出时，积压的尾巴也能按时推送"""
+        if self._pending_len and time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self._callback is None:
+            return
+        with self._lock:
+            chunks = [(name, ''.join(parts)) for name, parts in self._pending.items() if parts]
+            for parts in self._pending.values():
+                parts.clear()
+            self._pending_len = 0
+            self._last_flush = time.monotonic()
+        for name, text in chunks:
+            self._emit('chunk', {'stream': name, 'text': text})
+
+    def end(self):
+        self.flush()
+        self._emit('end', {'total_bytes': self.total_bytes})
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(r.total_bytes for r in self.rings.values())
+
+    def _emit(self, event: str, payload: dict):
+        if self._callback is None:
+            return
+        try:
+            self._callback(self.kind, self.source, event, payload)
+        except Exception as e:
+            # 先停用回调：execute_python 中 print 会回到本 streamer，避免递归
+            self._callback = None
+            print(f"[OutputStream] 回调失败，停止推送: {e}")
+
+
+class StreamWriter(io.TextIOBase):
+    """sys.stdout / sys.stderr 替身：写入即进入 OutputStreamer"""
+
+    def __init__(self, streamer: OutputStreamer, stream: str):
+        super().__init__()
+        self._streamer = streamer
+        self._stream = stream
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        self._streamer.write(self._stream, text)
+        return len(text)
+
+    def getvalue(self) -> str:
+        """兼容 StringIO 用法：返回头 + 尾"""
+        return self._streamer.rings[self._stream].render()
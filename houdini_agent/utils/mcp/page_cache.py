@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+ToolPageCache — 工具结果分页缓存（字节预算 LRU + TTL）
+
+HoudiniMCP._paginate_tool_result 把分页工具（get_node_parameters / list_children /
+execute_python / perf 报告 / 文档 ...）的完整文本留在缓存中，供 page>1 翻页：
+  - key:   "tool_name:唯一参数"（由各工具自行构造）
+  - 容量:  按条目实际内存（文本 + 行偏移数组）计的总字节预算，超出时淘汰最久未用的条目；
+           单条超过预算的结果照常分页返回，但不缓存
+  - 过期:  每条目 TTL（从写入起计），过期条目在访问或写入时清理
+  - 翻页:  写入时预计算行起始偏移（array），第 N 页是一次 O(1) 字符串切片，不再整段 split
+"""
+
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class PagedText:
+    """带行偏移索引的完整文本（写入后只读）"""
+
+    __slots__ = ('text', 'offsets', 'nbytes', 'created')
+
+    def __init__(self, text: str):
+        self.text = text
+        # offsets[i] = 第 i 行起始位置；末尾哨兵 = len(text) + 1（虚拟的最后一个换行之后）
+        offsets = array('L', [0])
+        find = text.find
+        pos = find('\n')
+        while pos != -1:
+            offsets.append(pos + 1)
+            pos = find('\n', pos + 1)
+        offsets.append(len(text) + 1)
+        self.offsets = offsets
+        self.nbytes = sys.getsizeof(text) + offsets.itemsize * len(offsets)
+        self.created = time.monotonic()
+
+    @property
+    def line_count(self) -> int:
+        return len(self.offsets) - 1
+
+    def lines(self, start: int, end: int) -> str:
+        """第 [start, end) 行（不含末尾换行）"""
+        return self.text[self.offsets[start]:self.offsets[end] - 1]
+
+
+class ToolPageCache:
+    """分页文本 LRU（线程安全）"""
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, ttl: float = 1800.0):
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, PagedText]" = OrderedDict()
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._oversized = 0
+
+    # ---------- 查询 / 写入 ----------
+
+    def get(self, key: str) -> Optional[PagedText]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry.created > self.ttl:
+                self._drop(key)
+                self._expirations += 1
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry
+
+    def put(self, key: str, text: str) -> PagedText:
+        """写入（同 key 覆盖）并返回条目；超过总预算的单条不缓存"""
+        entry = PagedText(text)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if entry.nbytes > self.max_bytes:
+                self._oversized += 1
+                return entry
+            self._entries[key] = entry
+            self._bytes += entry.nbytes
+            self._expire()
+            while self._bytes > self.max_bytes and self._entries:
+                self._drop(next(iter(self._entries)))
+                self._evictions += 1
+        return entry
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.nbytes
+
+    def _expire(self):
+        """清理全部过期条目"""
+        now = time.monotonic()
+        for key in [k for k, e in self._entries.items() if now - e.created > self.ttl]:
+            self._drop(key)
+            self._expirations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    # ---------- 统计 ----------
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': (self._hits / lookups) if lookups else 0.0,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'oversized': self._oversized,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self._hits = self._misses = 0
+            self._evictions = self._expirations = self._oversized = 0
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+ParamPredicate — find_nodes_by_param 的参数值谓词
+
+等于（字符串 / 数值）、正则、数值范围可以组合；谓词在查询时作用于 parm.eval() 的结果，
+表达式 / 关键帧 / 跨节点引用（ch("../ctrl/x")、npoints()、$F）总是按当前状态求值。
+"""
+from __future__ import annotations
+
+import re
+from typing import Any, Optional
+
+
+class ParamPredicate:
+    """参数值谓词：equals（字符串 / 数值相等）、pattern（正则 search）、min / max（数值范围）"""
+
+    __slots__ = ('equals', 'pattern', 'min', 'max', '_regex', '_equals_num')
+
+    def __init__(self, equals: Any = None, pattern: Optional[str] = None,
+                 min_value: Optional[float] = None, max_value: Optional[float] = None):
+        self.equals = equals
+        self.pattern = pattern
+        self.min = min_value
+        self.max = max_value
+        # 正则无效时抛出 re.error，由调用方转成工具错误
+        self._regex = re.compile(pattern) if pattern else None
+        self._equals_num = self._as_number(equals) if equals is not None else None
+
+    @property
+    def is_empty(self) -> bool:
+        return self.equals is None and self._regex is None and self.min is None and self.max is None
+
+    @staticmethod
+    def _as_number(value: Any) -> Optional[float]:
+        if isinstance(value, bool):
+            return float(value)
+        if isinstance(value, (int, float)):
+            return float(value)
+        try:
+            return float(str(value).strip())
+        except (TypeError, ValueError):
+            return None
+
+    def match(self, value: Any) -> bool:
+        if self.equals is not None:
+            num = self._as_number(value) if self._equals_num is not None else None
+            if num is not None:
+                if num != self._equals_num:
+                    return False
+            elif str(value) != str(self.equals):
+                return False
+        if self._regex is not None and not self._regex.search(str(value)):
+            return False
+        if self.min is not None or self.max is not None:
+            num = self._as_number(value)
+            if num is None:
+                return False
+            if self.min is not None and num < self.min:
+                return False
+            if self.max is not None and num > self.max:
+                return False
+        return True
+
+    def describe(self) -> str:
+        parts = []
+        if self.equals is not None:
+            parts.append(f"= {self.equals}")
+        if self.pattern:
+            parts.append(f"~ /{self.pattern}/")
+        if self.min is not None:
+            parts.append(f">= {self.min}")
+        if self.max is not None:
+            parts.append(f"<= {self.max}")
+        return " 且 ".join(parts)
@@ -0,0 +1,533 @@
+# -*- coding: utf-8 -*-
+"""
+Scene Events — 场景版本号与 hou 事件监听
+
+为只读工具结果缓存提供精确的失效依据：
+  - 节点创建 / 删除 / 改名 / 参数 / 连线 / 标志变化 → 版本号 +1
+  - 场景文件加载 / 清空 / 合并、时间线帧变化         → 版本号 +1
+  - Agent 执行任何可能修改场景的工具                 → 版本号 +1（HoudiniMCP.execute_tool）
+  - 节点错误状态 / NetworkBox 变化                    → 版本号 +1
+  - 节点位置变化                                      → 合并为一次 +1（拖动节点时不逐事件递增）
+  - HDA 定义安装 / 卸载 / 保存                        → 版本号 +1（节点类型元数据缓存随之作废）
+  - 监听器（add_listener）收到全部原始事件，供 SceneMirror 增量维护节点图镜像
+
+回调分两级挂载（大场景上逐节点挂回调会有数万个回调）：
+  - 容器级：场景中每个网络节点只监听子节点增删 / 排序 / NetworkBox / 改名 / 删除，
+            锁定 HDA 内部不下探
+  - 节点级：只对「关注中的网络」（focus）自身及其直接子节点挂全部节点事件（参数 / 标志 / 连线 / 位置 ...）。
+            工具读写某个网络时由 HoudiniMCP.execute_tool 关注它，Network Editor 当前网络在
+            每轮开始时关注；关注集合按 LRU 限制为 MAX_FOCUSED 个网络，
+            被移出的网络摘除节点级回调并递增版本号（之前缓存的该网络结果随之作废）
+  - 关注 / 移出时通知监听器：listener('focus', 'watched' | 'released', {'path': 网络路径})，
+    SceneMirror 据此重新同步该网络，并只对关注中的网络直接应答
+  - 未关注网络中的参数 / 连线 / 标志修改没有回调：每个工具执行后记录撤销栈，
+    用户轮次开始时撤销栈有未记录的变化即视为场景已变化（check_unobserved_edits，版本号 +1）
+
+hou 不可用或回调安装失败时 is_live=False，调用方应退化为按用户轮次失效
+（无法感知用户在 Houdini 界面中的手动修改）。
+
+注意：install() / focus() 必须在 Houdini 主线程调用；bump() / version / is_focused() 线程安全。
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+try:
+    import hou  # type: ignore
+except Exception:
+    hou = None  # type: ignore
+
+
+# 监听的节点事件（按名称获取，兼容不同 Houdini 版本）
+_NODE_EVENT_NAMES = (
+    'ChildCreated', 'ChildDeleted', 'ChildSwitched', 'ChildReordered',
+    'NameChanged', 'ParmTupleChanged', 'InputRearranged', 'FlagChanged',
+    'BeingDeleted', 'PositionChanged', 'AppearanceChanged',
+    'NetworkBoxCreated', 'NetworkBoxChanged', 'NetworkBoxDeleted',
+)
+
+# 容器级事件：挂在每个网络节点上（其余事件只对关注中的网络挂载）
+_CONTAINER_EVENT_NAMES = (
+    'ChildCreated', 'ChildDeleted', 'ChildSwitched', 'ChildReordered',
+    'NameChanged', 'BeingDeleted',
+    'NetworkBoxCreated', 'NetworkBoxChanged', 'NetworkBoxDeleted',
+)
+
+# 场景文件事件：加载 / 清空 / 合并后需要重新挂载回调
+_HIP_RESET_EVENT_NAMES = ('AfterLoad', 'AfterClear', 'AfterMerge')
+
+# HDA 定义变化：节点类型的描述 / 输入标签 / 参数模板可能改变
+_HDA_EVENT_NAMES = ('AssetCreated', 'AssetDeleted', 'AssetSaved',
+                    'LibraryInstalled', 'LibraryUninstalled')
+
+
+class SceneMonitor:
+    """场景版本号 + hou 节点事件监听"""
+
+    MAX_FOCUSED = 48    # 同时挂节点级回调的网络数
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = 0
+        self._live = False
+        self._position_dirty = False
+        self._watched: Dict[int, tuple] = {}              # 节点 sessionId → 已挂载的事件类型
+        self._focused: "OrderedDict[int, str]" = OrderedDict()   # 关注中的网络 sessionId → 路径
+        self._focused_paths: Set[str] = set()
+        self._subnets: Dict[int, List[int]] = {}          # 网络 sessionId → 子网络 sessionId（递归关注用）
+        self._node_event_types: tuple = ()
+        self._container_event_types: tuple = ()
+        self._hda_event_types: tuple = ()
+        self._listeners: List[Callable[..., None]] = []
+        self._undo_state: Any = None                       # 上次记录的撤销栈（note_undo_state）
+
+    # ---------- 版本号 ----------
+
+    @property
+    def version(self) -> int:
+        """当前场景版本号（单调递增）"""
+        if self._position_dirty:
+            # 拖动节点产生的一串 PositionChanged 在下次读取版本号时合并为一次递增
+            with self._lock:
+                if self._position_dirty:
+                    self._position_dirty = False
+                    self._version += 1
+        return self._version
+
+    @property
+    def is_live(self) -> bool:
+        """是否已挂载 hou 事件回调（False 时无法感知界面中的手动修改）"""
+        return self._live
+
+    def bump(self, reason: str = '') -> int:
+        """场景已变化：版本号 +1，返回新版本号"""
+        with self._lock:
+            self._version += 1
+            return self._version
+
+    # ---------- 未关注网络中的修改 ----------
+
+    @staticmethod
+    def _read_undo_state() -> Any:
+        """撤销栈标签（主线程）；读取失败返回 None"""
+        try:
+            return tuple(hou.undos.undoLabels())
+        except Exception:
+            return None
+
+    def note_undo_state(self):
+        """记录当前撤销栈（Agent 工具执行后调用，主线程）：之后的变化来自界面中的手动操作"""
+        if self._live:
+            self._undo_state = self._read_undo_state()
+
+    def check_unobserved_edits(self) -> bool:
+        """用户轮次开始（主线程）：撤销栈自上次记录后变化 → 版本号 +1
+
+        未关注网络没有参数 / 连线 / 标志回调，跨网络的表达式引用（ch("/obj/ctrl/tx")）
+        也会让已关注网络的结果过期；无法读取撤销栈时一律视为已变化。
+        """
+        if not self._live:
+            return False
+        state = self._read_undo_state()
+        changed = state is None or state != self._undo_state
+        self._undo_state = state
+        if changed:
+            self.bump('unobserved')
+        return changed
+
+    # ---------- 事件监听器 ----------
+
+    def add_listener(self, listener: Callable[..., None]):
+        """注册原始事件监听器（主线程调用）
+
+        节点事件: listener('node', event_type, kwargs)
+        场景文件: listener('hip', event_type, {})
+        HDA 定义: listener('hda', event_type, kwargs)
+        网络关注: listener('focus', 'watched' | 'released', {'path': str})
+        """
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[..., None]):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _notify(self, source: str, event_type: Any, kwargs: dict):
+        for listener in list(self._listeners):
+            try:
+                listener(source, event_type, kwargs)
+            except Exception as e:
+                print(f"[SceneEvents] 监听器异常: {e}")
+
+    # ---------- hou 回调安装 ----------
+
+    def install(self) -> bool:
+        """在主线程挂载 hou 事件回调（幂等）"""
+        if self._live:
+            return True
+        if hou is None:
+            return False
+        try:
+            self._node_event_types = tuple(
+                getattr(hou.nodeEventType, n) for n in _NODE_EVENT_NAMES
+                if hasattr(hou.nodeEventType, n)
+            )
+            self._container_event_types = tuple(
+                getattr(hou.nodeEventType, n) for n in _CONTAINER_EVENT_NAMES
+                if hasattr(hou.nodeEventType, n)
+            )
+            hou.hipFile.addEventCallback(self._on_hip_event)
+            try:
+                hou.playbar.addEventCallback(self._on_playbar_event)
+            except Exception:
+                pass  # 无 UI 模式（hython）没有 playbar
+            try:
+                self._hda_event_types = tuple(
+                    getattr(hou.hdaEventType, n) for n in _HDA_EVENT_NAMES
+                    if hasattr(hou.hdaEventType, n)
+                )
+                hou.hda.addEventCallback(self._hda_event_types, self._on_hda_event)
+            except Exception:
+                self._hda_event_types = ()  # 旧版本 Houdini 无 hou.hda 事件
+            self._watch_containers(hou.node('/'))
+            self._live = True
+            self.focus_editor_networks()
+            print(f"[SceneEvents] 已监听 {len(self._watched)} 个节点"
+                  f"（关注网络: {', '.join(self.focused_paths()) or '无'}）")
+        except Exception as e:
+            print(f"[SceneEvents] 回调安装失败（退化为按轮次失效）: {e}")
+            self._live = False
+        return self._live
+
+    def uninstall(self):
+        """移除所有 hou 回调"""
+        if hou is None or not self._live:
+            return
+        try:
+            hou.hipFile.removeEventCallback(self._on_hip_event)
+        except Exception:
+            pass
+        try:
+            hou.playbar.removeEventCallback(self._on_playbar_event)
+        except Exception:
+            pass
+        if self._hda_event_types:
+            try:
+                hou.hda.removeEventCallback(self._hda_event_types, self._on_hda_event)
+            except Exception:
+                pass
+        for sid, types in list(self._watched.items()):
+            node = self._node_by_session_id(sid)
+            if node is not None:
+                try:
+                    node.removeEventCallback(types, self._on_node_event)
+                except Exception:
+                    pass
+        self._watched.clear()
+        self._subnets.clear()
+        with self._lock:
+            self._focused.clear()
+            self._focused_paths.clear()
+        self._live = False
+
+    def _set_watch(self, node: Any, types: tuple, sid: Optional[int] = None):
+        """把节点上的回调调整为 types（空元组 = 摘除）"""
+        sid = _safe_sid(node) if sid is None else sid
+        if sid is None:
+            return
+        old = self._watched.get(sid, ())
+        if old == types:
+            return
+        try:
+            if old:
+                node.removeEventCallback(old, self._on_node_event)
+            if types:
+                node.addEventCallback(types, self._on_node_event)
+                self._watched[sid] = types
+            else:
+                self._watched.pop(sid, None)
+        except Exception:
+            self._watched.pop(sid, None)
+
+    @staticmethod
+    def _is_container(node: Any) -> bool:
+        try:
+            return bool(node.isNetwork())
+        except Exception:
+            try:
+                return bool(node.children())
+            except Exception:
+                return False
+
+    def _types_for(self, node: Any) -> tuple:
+        """节点应挂的事件：自身或父网络关注中 → 全部；否则容器挂容器级事件，叶子不挂"""
+        if _safe_sid(node) in self._focused or _safe_sid(_safe_parent(node)) in self._focused:
+            return self._node_event_types
+        return self._container_event_types if self._is_container(node) else ()
+
+    def _iter_networks(self, root: Any) -> Iterable[Any]:
+        """root 及其子孙中的网络节点（不下探锁定 HDA）"""
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node is None or not self._is_container(node):
+                continue
+            yield node
+            try:
+                if node.isLockedHDA():
+                    continue
+            except Exception:
+                pass
+            try:
+                stack.extend(reversed(node.children()))
+            except Exception:
+                pass
+
+    def _watch_containers(self, root: Any):
+        """给 root 子树中的每个网络节点挂容器级回调，并记录网络层级"""
+        for node in self._iter_networks(root):
+            self._set_watch(node, self._types_for(node))
+            sid = _safe_sid(node)
+            parent_sid = _safe_sid(_safe_parent(node))
+            self._subnets.setdefault(sid, [])
+            if parent_sid is not None:
+                siblings = self._subnets.setdefault(parent_sid, [])
+                if sid not in siblings:
+                    siblings.append(sid)
+
+    def _known_networks(self, root: Any) -> Iterable[Any]:
+        """按已记录的网络层级遍历 root 及其子孙网络（不触碰叶子节点）"""
+        root_sid = _safe_sid(root)
+        if root_sid not in self._subnets:
+            yield from self._iter_networks(root)
+            return
+        stack = [root_sid]
+        while stack:
+            sid = stack.pop()
+            node = root if sid == root_sid else self._node_by_session_id(sid)
+            if node is None:
+                continue
+            yield node
+            kids = self._subnets.get(sid, ())
+            alive = [k for k in kids if self._node_by_session_id(k) is not None]
+            if len(alive) != len(kids):
+                self._subnets[sid] = alive
+            stack.extend(reversed(alive))
+
+    # ---------- 网络关注（节点级回调） ----------
+
+    def is_focused(self, network_path: str) -> bool:
+        """该网络的子节点是否挂了节点级回调（任意线程）"""
+        with self._lock:
+            return network_path in self._focused_paths
+
+    def focused_paths(self) -> List[str]:
+        with self._lock:
+            return sorted(self._focused_paths)
+
+    def focus(self, network: Any) -> bool:
+        """关注网络：给其自身与直接子节点挂全部节点事件（主线程）；返回是否新关注"""
+        if not self._live or network is None:
+            return False
+        sid = _safe_sid(network)
+        try:
+            path = network.path()
+        except Exception:
+            return False
+        evicted = []
+        with self._lock:
+            if sid in self._focused:
+                self._focused.move_to_end(sid)
+                return False
+            self._focused[sid] = path
+            self._focused_paths.add(path)
+            while len(self._focused) > self.MAX_FOCUSED:
+                evicted.append(self._focused.popitem(last=False))
+            if evicted:
+                self._focused_paths = set(self._focused.values())
+        for old_sid, old_path in evicted:
+            self._release(old_sid, old_path)
+        self._set_watch(network, self._node_event_types, sid)
+        try:
+            kids = network.children()
+        except Exception:
+            kids = ()
+        for child in kids:
+            self._set_watch(child, self._node_event_types)
+        self._notify('focus', 'watched', {'path': path})
+        return True
+
+    def focus_path(self, path: str, recursive: bool = False) -> int:
+        """关注 path 所在的网络（path 是叶子节点时关注其父网络）；recursive 时连同全部子网络
+
+        Returns:
+            新关注的网络数
+        """
+        if not self._live or hou is None or not path:
+            return 0
+        try:
+            node = hou.node(path)
+        except Exception:
+            node = None
+        if node is None:
+            return 0
+        if not self._is_container(node):
+            node = _safe_parent(node)
+        if not recursive:
+            return int(self.focus(node))
+        return sum(int(self.focus(net)) for net in self._known_networks(node))
+
+    def focus_editor_networks(self):
+        """关注各 Network Editor 当前所在的网络（用户正在编辑的位置，主线程）"""
+        if not self._live or hou is None:
+            return
+        try:
+            editors = [t for t in hou.ui.paneTabs()
+                       if t.type() == hou.paneTabType.NetworkEditor]
+        except Exception:
+            return
+        for editor in editors:
+            try:
+                self.focus(editor.pwd())
+            except Exception:
+                pass
+
+    def _release(self, sid: int, path: str):
+        """移出关注：恢复为容器级 / 无回调；期间的修改无法感知 → 版本号 +1"""
+        network = self._node_by_session_id(sid)
+        if network is not None:
+            self._set_watch(network, self._types_for(network), sid)
+            try:
+                kids = network.children()
+            except Exception:
+                kids = ()
+            for child in kids:
+                self._set_watch(child, self._types_for(child))
+        self.bump('focus')
+        self._notify('focus', 'released', {'path': path})
+
+    def _refresh_focused_paths(self):
+        """网络改名后重新读取关注网络的路径"""
+        with self._lock:
+            for sid in list(self._focused):
+                node = self._node_by_session_id(sid)
+                if node is None:
+                    del self._focused[sid]
+                else:
+                    self._focused[sid] = node.path()
+            self._focused_paths = set(self._focused.values())
+
+    @staticmethod
+    def _node_by_session_id(sid: int) -> Optional[Any]:
+        try:
+            return hou.nodeBySessionId(sid)
+        except Exception:
+            return None
+
+    # ---------- hou 回调 ----------
+
+    def _on_node_event(self, event_type=None, **kwargs):
+        if event_type is not None and hou is not None:
+            if self._is_cosmetic(event_type, kwargs):
+                # 选中高亮 / 颜色等纯外观变化：不影响任何工具结果
+                return
+            if event_type == getattr(hou.nodeEventType, 'PositionChanged', None):
+                # 拖动节点时逐帧触发：只做标记，下次读取版本号时合并递增
+                self._position_dirty = True
+                self._notify('node', event_type, kwargs)
+                return
+        self.bump('node')
+        if event_type is None or hou is None:
+            return
+        self._notify('node', event_type, kwargs)
+        if event_type == hou.nodeEventType.ChildCreated:
+            child = kwargs.get('child_node')
+            if child is not None:
+                # 父网络关注中 → 新节点挂全部事件；新建的子网络（含粘贴的整棵子树）挂容器级事件
+                self._set_watch(child, self._types_for(child))
+                self._watch_containers(child)
+        elif event_type == hou.nodeEventType.BeingDeleted:
+            sid = _safe_sid(kwargs.get('node'))
+            self._watched.pop(sid, None)
+            self._subnets.pop(sid, None)
+            if sid in self._focused:
+                with self._lock:
+                    self._focused.pop(sid, None)
+                    self._focused_paths = set(self._focused.values())
+        elif event_type == hou.nodeEventType.NameChanged:
+            if self._focused and self._is_container(kwargs.get('node')):
+                self._refresh_focused_paths()
+
+    @staticmethod
+    def _is_cosmetic(event_type, kwargs: dict) -> bool:
+        """AppearanceChanged 中只有错误状态 / 注释变化会影响工具结果"""
+        if event_type != getattr(hou.nodeEventType, 'AppearanceChanged', None):
+            return False
+        change = kwargs.get('change_type')
+        act = getattr(hou, 'appearanceChangeType', None)
+        if change is None or act is None:
+            return False
+        relevant = tuple(getattr(act, n) for n in ('ErrorState', 'Comment', 'Any') if hasattr(act, n))
+        return change not in relevant
+
+    def _on_hip_event(self, event_type=None):
+        self.bump('hip')
+        if hou is None:
+            return
+        reset_types = tuple(
+            getattr(hou.hipFileEventType, n) for n in _HIP_RESET_EVENT_NAMES
+            if hasattr(hou.hipFileEventType, n)
+        )
+        if event_type in reset_types:
+            # 旧节点已销毁，回调随之失效 → 重新挂载容器级回调，关注集合清空
+            self._watched.clear()
+            self._subnets.clear()
+            with self._lock:
+                self._focused.clear()
+                self._focused_paths.clear()
+            self._watch_containers(hou.node('/'))
+            self.focus_editor_networks()
+        self._notify('hip', event_type, {})
+
+    def _on_hda_event(self, event_type=None, **kwargs):
+        self.bump('hda')
+        self._notify('hda', event_type, kwargs)
+
+    def _on_playbar_event(self, event_type=None, frame=None):
+        # 帧变化会改变时间相关参数 / 几何的求值结果
+        if event_type == getattr(getattr(hou, 'playbarEvent', None), 'FrameChanged', None):
+            self.bump('frame')
+
+
+def _safe_sid(node: Any) -> Optional[int]:
+    try:
+        return node.sessionId()
+    except Exception:
+        return None
+
+
+def _safe_parent(node: Any) -> Optional[Any]:
+    try:
+        return node.parent()
+    except Exception:
+        return None
+
+
+# ─────────────────────────────────────────────
+# 全局单例
+# ─────────────────────────────────────────────
+
+_instance: Optional[SceneMonitor] = None
+_instance_lock = threading.Lock()
+
+
+def get_scene_monitor() -> SceneMonitor:
+    """获取 SceneMonitor 全局单例"""
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = SceneMonitor()
+    return _instance
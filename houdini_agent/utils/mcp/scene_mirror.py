@@ -0,0 +1,934 @@
+# -*- coding: utf-8 -*-
+"""
+SceneMirror — 节点图内存镜像（只读结构查询脱离主线程）
+
+get_network_structure / list_children / check_errors 原本必须经
+AITab._execute_tool_in_main_thread 切到 Qt 主线程，再逐节点调用 HOM
+（node.type() / position() / errors() / inputs() / inputLabel ...）。
+本模块在内存中维护整棵节点树的镜像：
+  - 路径 / 类型 / 标志 / 位置 / 输入连接 / 错误与警告 / wrangle 与 python 代码 / NetworkBox
+  - 首次使用时在主线程整树构建一次（ensure_built）
+  - 之后由 SceneMonitor 转发的 hou 节点事件增量维护（创建 / 删除 / 改名 / 标志 / 连线 /
+    位置 / 错误状态 / 代码参数），事件处理失败时整体作废并在下次 ensure_built 重建
+  - 可能触发 cook 的修改工具执行后标记 cook_pending：Manual 保护模式下读取工具需要
+    先在主线程 cook 再读取，此时回退主线程，cook 完成后清除标记
+  - verify() 在主线程对比镜像与真实场景：全量校验不一致时整树重建；
+    每轮开始的抽样校验只覆盖关注中的网络（镜像只应答这些网络），按 VERIFY_INTERVAL 限频，
+    不一致的网络 / 记录就地重新同步，不遍历整个场景
+
+读取方法线程安全，可在 Agent 线程直接调用；构建 / 事件处理只在主线程进行。
+hou 回调未挂载（SceneMonitor.is_live=False）时镜像不可用，调用方照常走主线程。
+节点级事件只对 SceneMonitor 关注中的网络挂载：子节点增删 / 改名在全场景范围内同步，
+参数 / 标志 / 连线 / 错误状态只在关注中的网络内可信，因此镜像只应答关注中的网络，
+网络被关注时重新同步其子节点记录。
+
+基准测试（stub hou，合成 10k 节点网络）：python -m houdini_agent.utils.mcp.scene_mirror
+"""
+from __future__ import annotations
+
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import hou  # type: ignore
+except Exception:
+    hou = None  # type: ignore
+
+from .scene_events import get_scene_monitor
+
+
+# wrangle / 脚本节点代码参数（与 HoudiniMCP.get_network_structure 的检测规则一致）
+_PYTHON_CODE_PARMS = ('python', 'code', 'script')
+_CODE_PARMS = frozenset(('snippet',) + _PYTHON_CODE_PARMS)
+
+# 结构变化事件：重新同步该网络的子节点列表
+_CHILD_EVENT_NAMES = ('ChildCreated', 'ChildDeleted', 'ChildSwitched', 'ChildReordered')
+_BOX_EVENT_NAMES = ('NetworkBoxCreated', 'NetworkBoxChanged', 'NetworkBoxDeleted')
+_HIP_RESET_EVENT_NAMES = ('AfterLoad', 'AfterClear', 'AfterMerge')
+
+
+class NodeRecord:
+    """单个节点的镜像（整条替换，读取方拿到的记录不会被原地修改）"""
+
+    __slots__ = ('sid', 'path', 'name', 'parent', 'type_key', 'type_name', 'type_label',
+                 'display', 'render', 'bypass', 'position', 'inputs',
+                 'errors', 'warnings', 'vex_code', 'python_code')
+
+    def as_tuple(self) -> tuple:
+        return tuple(getattr(self, f) for f in self.__slots__)
+
+
+def _safe(fn, default):
+    try:
+        return fn()
+    except Exception:
+        return default
+
+
+def _read_node(node: Any) -> NodeRecord:
+    """从 HOM 节点读取一条记录（主线程）"""
+    rec = NodeRecord()
+    rec.sid = node.sessionId()
+    rec.path = node.path()
+    rec.name = node.name()
+    parent = _safe(node.parent, None)
+    rec.parent = parent.path() if parent is not None else ''
+    from .client import HoudiniMCP
+    meta = _safe(lambda: HoudiniMCP.node_type_meta(node.type()), None)
+    rec.type_name = meta.type_name if meta else "unknown"
+    rec.type_key = meta.type_key if meta else "unknown/unknown"
+    rec.type_label = meta.type_label if meta else ""
+    rec.display = bool(_safe(node.isDisplayFlagSet, False)) if hasattr(node, 'isDisplayFlagSet') else False
+    rec.render = bool(_safe(node.isRenderFlagSet, False)) if hasattr(node, 'isRenderFlagSet') else False
+    rec.bypass = bool(_safe(node.isBypassed, False)) if hasattr(node, 'isBypassed') else False
+    pos = _safe(node.position, None)
+    rec.position = (pos[0], pos[1]) if pos else (0, 0)
+
+    inputs = []
+    for idx, inp in enumerate(_safe(node.inputs, ()) or ()):
+        if inp is None:
+            continue
+        inputs.append((idx, inp.sessionId(), meta.input_label(idx) if meta else ''))
+    rec.inputs = tuple(inputs)
+
+    rec.errors = tuple(str(e) for e in _safe(node.errors, ()) or ()) if hasattr(node, 'errors') else ()
+    rec.warnings = tuple(str(w) for w in _safe(node.warnings, ()) or ()) if hasattr(node, 'warnings') else ()
+
+    rec.vex_code = rec.python_code = None
+    if meta and meta.code_kind:
+        setattr(rec, meta.code_kind, meta.read_code(node))
+    return rec
+
+
+def _read_boxes(network: Any) -> tuple:
+    """NetworkBox 列表: ((name, comment, (node_path, ...)), ...)"""
+    boxes = []
+    for box in _safe(network.networkBoxes, ()) or ():
+        try:
+            boxes.append((box.name(), box.comment() or "",
+                          tuple(n.path() for n in box.nodes())))
+        except Exception:
+            continue
+    return tuple(boxes)
+
+
+class SceneMirror:
+    """事件驱动的节点图镜像"""
+
+    # 可由镜像应答的只读工具（必须显式指定路径：当前网络取决于主线程的网络编辑器）
+    SERVABLE_TOOLS = {
+        'get_network_structure': 'network_path',
+        'list_children': 'network_path',
+        'check_errors': 'node_path',
+    }
+    VERIFY_SAMPLE = 32           # 每轮开始时抽样校验的节点数
+    VERIFY_INTERVAL = 30.0       # 抽样校验最短间隔（秒）
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._by_path: Dict[str, NodeRecord] = {}
+        self._by_sid: Dict[int, NodeRecord] = {}
+        self._children: Dict[str, List[str]] = {}    # 网络路径 → 有序子节点路径
+        self._boxes: Dict[str, tuple] = {}            # 网络路径 → NetworkBox 列表
+        self._built = False
+        self._cook_pending = False
+        self._attached = False
+        self._served = 0
+        self._fallbacks = 0
+        self._rebuilds = 0
+        self._events = 0
+        self._last_verify = 0.0
+
+    # ---------- 生命周期（主线程） ----------
+
+    def attach(self):
+        """向 SceneMonitor 注册事件监听（幂等）"""
+        if not self._attached:
+            get_scene_monitor().add_listener(self._on_event)
+            self._attached = True
+
+    def ensure_built(self) -> bool:
+        """首次使用 / 作废后在主线程整树构建"""
+        if not get_scene_monitor().is_live or hou is None:
+            return False
+        self.attach()
+        if not self._built:
+            self.rebuild()
+        return self._built
+
+    def rebuild(self):
+        """整树重建（先建新表再整体替换，读取方不会看到半成品）"""
+        root = hou.node('/') if hou is not None else None
+        if root is None:
+            return
+        by_path: Dict[str, NodeRecord] = {}
+        children: Dict[str, List[str]] = {}
+        boxes: Dict[str, tuple] = {}
+        try:
+            self._collect(root, by_path, children, boxes)
+        except Exception as e:
+            print(f"[SceneMirror] 构建失败: {e}")
+            with self._lock:
+                self._built = False
+            return
+        with self._lock:
+            self._by_path = by_path
+            self._by_sid = {r.sid: r for r in by_path.values()}
+            self._children = children
+            self._boxes = boxes
+            self._built = True
+            self._rebuilds += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._built = False
+
+    @staticmethod
+    def _collect(root: Any, by_path: Dict[str, NodeRecord],
+                 children: Dict[str, List[str]], boxes: Dict[str, tuple]):
+        """迭代遍历 root 子树，写入给定的表"""
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            rec = _read_node(node)
+            by_path[rec.path] = rec
+            kids = list(_safe(node.children, ()) or ())
+            if kids:
+                children[rec.path] = [k.path() for k in kids]
+                net_boxes = _read_boxes(node)
+                if net_boxes:
+                    boxes[rec.path] = net_boxes
+                stack.extend(reversed(kids))
+
+    # ---------- cook 状态 ----------
+
+    def mark_cook_pending(self):
+        """可能触发 cook 的修改工具执行后调用（Manual 模式下错误状态尚未刷新）"""
+        self._cook_pending = True
+
+    def clear_cook_pending(self):
+        """主线程 cook 完成后调用（错误状态变化已通过事件同步）"""
+        self._cook_pending = False
+
+    # ---------- 事件处理（主线程） ----------
+
+    def _on_event(self, source: str, event_type: Any, kwargs: dict):
+        if not self._built:
+            return
+        self._events += 1
+        try:
+            if source == 'focus':
+                # 新关注的网络：此前未挂节点级回调，子节点记录可能已过期
+                if event_type == 'watched':
+                    network = hou.node(kwargs.get('path', ''))
+                    if network is not None:
+                        self._resync_children(network)
+                        for child in _safe(network.children, ()) or ():
+                            self._refresh(child)
+                return
+            if source == 'hip':
+                names = tuple(getattr(hou.hipFileEventType, n) for n in _HIP_RESET_EVENT_NAMES
+                              if hasattr(hou.hipFileEventType, n))
+                if event_type in names:
+                    self.invalidate()
+                return
+            if source == 'hda':
+                # HDA 定义重载：类型描述 / 输入标签可能变化
+                self.invalidate()
+                return
+            self._apply_node_event(event_type, kwargs)
+        except Exception as e:
+            print(f"[SceneMirror] 事件同步失败，下次使用时重建: {e}")
+            self.invalidate()
+
+    def _apply_node_event(self, event_type: Any, kwargs: dict):
+        et = hou.nodeEventType
+        node = kwargs.get('node')
+        if node is None:
+            return
+        if event_type in tuple(getattr(et, n) for n in _CHILD_EVENT_NAMES if hasattr(et, n)):
+            self._resync_children(node)
+        elif event_type == getattr(et, 'BeingDeleted', None):
+            rec = self._by_sid.get(_safe(node.sessionId, None))
+            if rec is not None:
+                with self._lock:
+                    self._remove_subtree(rec.path)
+                    siblings = self._children.get(rec.parent)
+                    if siblings and rec.path in siblings:
+                        self._children[rec.parent] = [p for p in siblings if p != rec.path]
+        elif event_type == getattr(et, 'NameChanged', None):
+            self._rename(node)
+        elif event_type in tuple(getattr(et, n) for n in _BOX_EVENT_NAMES if hasattr(et, n)):
+            net_boxes = _read_boxes(node)
+            with self._lock:
+                self._boxes[node.path()] = net_boxes
+        elif event_type == getattr(et, 'ParmTupleChanged', None):
+            parm_tuple = kwargs.get('parm_tuple')
+            name = _safe(parm_tuple.name, '') if parm_tuple is not None else ''
+            if name in _CODE_PARMS:
+                self._refresh(node)
+        elif event_type == getattr(et, 'FlagChanged', None):
+            # 显示 / 渲染标志互斥：原先持有标志的兄弟节点一起刷新
+            self._refresh(node)
+            rec = self._by_sid.get(_safe(node.sessionId, None))
+            for p in (self._children.get(rec.parent, ()) if rec is not None else ()):
+                sib = self._by_path.get(p)
+                if sib is not None and sib is not rec and (sib.display or sib.render):
+                    other = hou.node(p)
+                    if other is not None:
+                        self._refresh(other)
+        elif event_type == getattr(et, 'PositionChanged', None):
+            # 拖动节点时逐帧触发：只替换位置，不重新读取整条记录
+            rec = self._by_sid.get(_safe(node.sessionId, None))
+            pos = _safe(node.position, None)
+            if rec is None or pos is None:
+                return
+            moved = NodeRecord()
+            for f in NodeRecord.__slots__:
+                setattr(moved, f, getattr(rec, f))
+            moved.position = (pos[0], pos[1])
+            with self._lock:
+                self._by_path[rec.path] = moved
+                self._by_sid[rec.sid] = moved
+        else:
+            # InputRearranged / AppearanceChanged（错误状态）
+            self._refresh(node)
+
+    def _refresh(self, node: Any):
+        rec = _read_node(node)
+        with self._lock:
+            old = self._by_path.get(rec.path)
+            if old is not None and old.sid != rec.sid:
+                self._by_sid.pop(old.sid, None)
+            self._by_path[rec.path] = rec
+            self._by_sid[rec.sid] = rec
+
+    def _resync_children(self, network: Any):
+        """对比真实子节点列表与镜像：新增子树、移除消失的子树、更新顺序"""
+        kids = list(_safe(network.children, ()) or ())
+        net_path = network.path()
+        new_paths = [k.path() for k in kids]
+        added = [k for k in kids if k.path() not in self._by_path]
+        by_path: Dict[str, NodeRecord] = {}
+        children: Dict[str, List[str]] = {}
+        boxes: Dict[str, tuple] = {}
+        for k in added:
+            self._collect(k, by_path, children, boxes)
+        net_boxes = _read_boxes(network)
+        with self._lock:
+            keep = set(new_paths)
+            for p in self._children.get(net_path, ()):
+                if p not in keep:
+                    self._remove_subtree(p)
+            self._by_path.update(by_path)
+            for r in by_path.values():
+                self._by_sid[r.sid] = r
+            self._children.update(children)
+            self._boxes.update(boxes)
+            if new_paths:
+                self._children[net_path] = new_paths
+            else:
+                self._children.pop(net_path, None)
+            if net_boxes:
+                self._boxes[net_path] = net_boxes
+            else:
+                self._boxes.pop(net_path, None)
+
+    def _rename(self, node: Any):
+        """改名：子树所有路径变化（连接按 sessionId 存储，下游记录无需修改）"""
+        sid = node.sessionId()
+        old = self._by_sid.get(sid)
+        by_path: Dict[str, NodeRecord] = {}
+        children: Dict[str, List[str]] = {}
+        boxes: Dict[str, tuple] = {}
+        self._collect(node, by_path, children, boxes)
+        new_path = node.path()
+        parent = _safe(node.parent, None)
+        parent_boxes = _read_boxes(parent) if parent is not None else ()
+        with self._lock:
+            if old is not None:
+                self._remove_subtree(old.path)
+                siblings = self._children.get(old.parent)
+                if siblings:
+                    self._children[old.parent] = [new_path if p == old.path else p for p in siblings]
+            self._by_path.update(by_path)
+            for r in by_path.values():
+                self._by_sid[r.sid] = r
+            self._children.update(children)
+            self._boxes.update(boxes)
+            if parent is not None:
+                if parent_boxes:
+                    self._boxes[parent.path()] = parent_boxes
+                else:
+                    self._boxes.pop(parent.path(), None)
+
+    def _remove_subtree(self, path: str):
+        """移除 path 及其全部子孙（调用方持有锁）"""
+        stack = [path]
+        while stack:
+            p = stack.pop()
+            rec = self._by_path.pop(p, None)
+            if rec is not None and self._by_sid.get(rec.sid) is rec:
+                del self._by_sid[rec.sid]
+            stack.extend(self._children.pop(p, ()))
+            self._boxes.pop(p, None)
+
+    # ---------- 一致性校验（主线程） ----------
+
+    def _record_tracked(self, path: str) -> bool:
+        """该记录是否由节点级事件维护（所在网络关注中）；其余记录只保证结构正确"""
+        rec = self._by_path.get(path)
+        return rec is not None and get_scene_monitor().is_focused(rec.parent)
+
+    def verify(self, sample: int = 0) -> List[str]:
+        """对比镜像与真实场景；sample>0 时走 _verify_focused（关注范围内抽样，限频），
+        否则全量对比，不一致则整树重建
+
+        Returns:
+            不一致项描述列表（空列表 = 一致）
+        """
+        if not self._built or hou is None:
+            return []
+        if sample:
+            return self._verify_focused(sample)
+        mismatches: List[str] = []
+        root = hou.node('/')
+        try:
+            by_path: Dict[str, NodeRecord] = {}
+            children: Dict[str, List[str]] = {}
+            boxes: Dict[str, tuple] = {}
+            self._collect(root, by_path, children, boxes)
+            with self._lock:
+                for p in set(by_path) | set(self._by_path):
+                    a, b = by_path.get(p), self._by_path.get(p)
+                    if a is None or b is None:
+                        mismatches.append(f"{p}: {'多余' if a is None else '缺失'}")
+                    elif a.as_tuple() != b.as_tuple() and self._record_tracked(p):
+                        mismatches.append(f"{p}: 记录不一致")
+                for p in set(children) | set(self._children):
+                    if children.get(p, []) != self._children.get(p, []):
+                        mismatches.append(f"{p}: 子节点列表不一致")
+                for p in set(boxes) | set(self._boxes):
+                    if boxes.get(p, ()) != self._boxes.get(p, ()):
+                        mismatches.append(f"{p}: NetworkBox 不一致")
+        except Exception as e:
+            mismatches.append(f"校验异常: {e}")
+        if mismatches:
+            print(f"[SceneMirror] ⚠️ 一致性校验发现 {len(mismatches)} 处不一致，重建镜像: {mismatches[:3]}")
+            self.rebuild()
+        return mismatches
+
+    def _verify_focused(self, sample: int) -> List[str]:
+        """关注中的网络：对比子节点列表 + 抽样对比记录；不一致处就地重新同步
+
+        开销与关注网络数（≤ SceneMonitor.MAX_FOCUSED）及 sample 成正比，与场景规模无关；
+        距上次校验不足 VERIFY_INTERVAL 秒时跳过。
+        """
+        now = time.monotonic()
+        if now - self._last_verify < self.VERIFY_INTERVAL:
+            return []
+        self._last_verify = now
+        mismatches: List[str] = []
+        tracked: List[str] = []
+        try:
+            for net_path in get_scene_monitor().focused_paths():
+                network = hou.node(net_path)
+                if network is None:
+                    continue
+                actual = [k.path() for k in _safe(network.children, ()) or ()]
+                with self._lock:
+                    mirrored = list(self._children.get(net_path, ()))
+                    boxes = self._boxes.get(net_path, ())
+                if actual != mirrored or _read_boxes(network) != boxes:
+                    mismatches.append(f"{net_path}: 子节点列表 / NetworkBox 不一致")
+                    self._resync_children(network)
+                tracked.extend(actual)
+            for p in random.sample(tracked, min(sample, len(tracked))):
+                node = hou.node(p)
+                rec = self._by_path.get(p)
+                if node is None or rec is None:
+                    continue   # 已由上面的子节点列表对比处理
+                if _read_node(node).as_tuple() != rec.as_tuple():
+                    mismatches.append(f"{p}: 记录不一致")
+                    self._refresh(node)
+        except Exception as e:
+            print(f"[SceneMirror] 抽样校验异常，下次使用时重建: {e}")
+            self.invalidate()
+            return [f"校验异常: {e}"]
+        if mismatches:
+            print(f"[SceneMirror] ⚠️ 抽样校验发现 {len(mismatches)} 处不一致，已重新同步: {mismatches[:3]}")
+        return mismatches
+
+    # ---------- 查询（任意线程） ----------
+
+    def can_serve(self, tool_name: str, args: dict) -> bool:
+        """该调用能否直接由镜像应答（涉及的网络都必须在关注中）"""
+        key = self.SERVABLE_TOOLS.get(tool_name)
+        path = args.get(key) if key is not None else None
+        ok = (key is not None and self._built and not self._cook_pending
+              and get_scene_monitor().is_live
+              and bool(path) and path in self._by_path
+              and self._scope_focused(path, tool_name == 'check_errors'
+                                      or (tool_name == 'list_children' and bool(args.get('recursive')))))
+        if key is not None:
+            if ok:
+                self._served += 1
+            else:
+                self._fallbacks += 1
+        return ok
+
+    def _scope_focused(self, path: str, recursive: bool) -> bool:
+        """path 网络（recursive 时连同子孙网络）的子节点记录是否由节点级事件维护"""
+        monitor = get_scene_monitor()
+        with self._lock:
+            if path not in self._children:
+                # 叶子节点（check_errors 只检查自身）或空网络：看其所在网络
+                rec = self._by_path.get(path)
+                return monitor.is_focused(path) or (rec is not None and monitor.is_focused(rec.parent))
+            stack = [path]
+            while stack:
+                p = stack.pop()
+                if not monitor.is_focused(p):
+                    return False
+                if recursive:
+                    stack.extend(c for c in self._children[p] if c in self._children)
+        return True
+
+    def network_structure(self, network_path: str) -> Optional[Dict[str, Any]]:
+        """与 HoudiniMCP.get_network_structure 返回的 data 结构一致"""
+        with self._lock:
+            net = self._by_path.get(network_path)
+            if net is None:
+                return None
+            recs = [self._by_path[p] for p in self._children.get(network_path, ())
+                    if p in self._by_path]
+            by_sid = self._by_sid
+            sid_path = {s: by_sid[s].path for r in recs for _, s, _ in r.inputs if s in by_sid}
+            net_boxes = self._boxes.get(network_path, ())
+        nodes_data = []
+        connections_data = []
+        for r in recs:
+            info = {
+                "name": r.name,
+                "path": r.path,
+                "type": r.type_key,
+                "type_label": r.type_label,
+                "is_displayed": r.display,
+                "has_errors": bool(r.errors),
+                "position": list(r.position),
+            }
+            if r.vex_code:
+                info["vex_code"] = r.vex_code
+            if r.python_code:
+                info["python_code"] = r.python_code
+            nodes_data.append(info)
+            for idx, src_sid, label in r.inputs:
+                src = sid_path.get(src_sid)
+                if src is None:
+                    continue
+                conn = {"from": src, "to": r.path, "input_index": idx}
+                if label:
+                    conn["input_label"] = label
+                connections_data.append(conn)
+        boxes_data = []
+        boxed_node_paths = set()
+        for name, comment, paths in net_boxes:
+            boxed_node_paths.update(paths)
+            boxes_data.append({
+                "name": name, "comment": comment,
+                "node_count": len(paths), "nodes": list(paths),
+            })
+        return {
+            "network_path": net.path,
+            "network_type": net.type_name,
+            "node_count": len(nodes_data),
+            "nodes": nodes_data,
+            "connections": connections_data,
+            "network_boxes": boxes_data,
+            "boxed_node_paths": list(boxed_node_paths),
+        }
+
+    def children_listing(self, network_path: str,
+                         recursive: bool = False) -> Optional[List[Tuple[int, NodeRecord]]]:
+        """[(缩进层级, 记录), ...]，顺序与 HoudiniMCP.list_children 一致"""
+        with self._lock:
+            if network_path not in self._by_path:
+                return None
+            out: List[Tuple[int, NodeRecord]] = []
+            stack = [(0, p) for p in reversed(self._children.get(network_path, ()))]
+            while stack:
+                depth, p = stack.pop()
+                rec = self._by_path.get(p)
+                if rec is None:
+                    continue
+                out.append((depth, rec))
+                if recursive:
+                    stack.extend((depth + 1, c) for c in reversed(self._children.get(p, ())))
+            return out
+
+    def error_report(self, node_path: str) -> Optional[Dict[str, Any]]:
+        """与 HoudiniMCP.check_node_errors 返回的 data 结构一致"""
+        errors: List[dict] = []
+        warnings: List[dict] = []
+        total = 0
+        with self._lock:
+            target = self._by_path.get(node_path)
+            if target is None:
+                return None
+            by_path, children = self._by_path, self._children
+            # 容器节点检查全部子孙（先序，与 allSubChildren 顺序一致），否则只检查自身
+            stack = list(reversed(children.get(node_path, ()))) or [node_path]
+            while stack:
+                p = stack.pop()
+                r = by_path.get(p)
+                if r is None:
+                    continue
+                total += 1
+                if r.errors or r.warnings:
+                    for msg in r.errors:
+                        errors.append({"node_path": r.path, "node_name": r.name,
+                                       "node_type": r.type_name, "message": msg})
+                    for msg in r.warnings:
+                        warnings.append({"node_path": r.path, "node_name": r.name,
+                                         "node_type": r.type_name, "message": msg})
+                kids = children.get(p)
+                if kids and p != node_path:
+                    stack.extend(reversed(kids))
+        return {
+            "checked_path": node_path,
+            "total_nodes": total,
+            "error_count": len(errors),
+            "warning_count": len(warnings),
+            "errors": errors,
+            "warnings": warnings,
+        }
+
+    # ---------- 统计 ----------
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'built': self._built,
+                'nodes': len(self._by_path),
+                'served': self._served,
+                'fallbacks': self._fallbacks,
+                'rebuilds': self._rebuilds,
+                'events': self._events,
+                'cook_pending': self._cook_pending,
+            }
+
+
+# ─────────────────────────────────────────────
+# 全局单例
+# ─────────────────────────────────────────────
+
+_instance: Optional[SceneMirror] = None
+_instance_lock = threading.Lock()
+
+
+def get_scene_mirror() -> SceneMirror:
+    """获取 SceneMirror 全局单例"""
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = SceneMirror()
+    return _instance
+
+
+# ─────────────────────────────────────────────
+# 基准测试（stub hou）
+# ─────────────────────────────────────────────
+
+def _make_stub_hou():
+    """构造最小 hou 替身：节点树 / 类型 / 事件枚举（仅供基准测试与一致性自检）"""
+    import types
+
+    class _Enum:
+        def __init__(self, *names):
+            for n in names:
+                setattr(self, n, n)
+
+    class _Category:
+        def __init__(self, name):
+            self._name = name
+
+        def name(self):
+            return self._name
+
+    class _Type:
+        def __init__(self, name, category, labels=()):
+            self._name, self._category, self._labels = name, category, labels
+
+        def name(self):
+            return self._name
+
+        def category(self):
+            return self._category
+
+        def nameWithCategory(self):
+            return f"{self._category.name()}/{self._name}"
+
+        def description(self):
+            return self._name.title()
+
+        def inputLabel(self, idx):
+            return self._labels[idx] if idx < len(self._labels) else f"Input {idx + 1}"
+
+    class _Parm:
+        def __init__(self, value):
+            self._value = value
+
+        def eval(self):
+            return self._value
+
+    registry: Dict[int, Any] = {}
+
+    class _Node:
+        _next_sid = 1
+
+        def __init__(self, name, node_type, parent=None):
+            self._name, self._type, self._parent = name, node_type, parent
+            self._children: List[_Node] = []
+            self._inputs: List[Optional[_Node]] = []
+            self._parms: Dict[str, _Parm] = {}
+            self._errors: Tuple[str, ...] = ()
+            self._display = False
+            self._pos = (0.0, 0.0)
+            self._sid = _Node._next_sid
+            _Node._next_sid += 1
+            registry[self._sid] = self
+            if parent is not None:
+                parent._children.append(self)
+
+        def sessionId(self):
+            return self._sid
+
+        def name(self):
+            return self._name
+
+        def path(self):
+            if self._parent is None:
+                return '/'
+            base = self._parent.path()
+            return f"{base.rstrip('/')}/{self._name}"
+
+        def parent(self):
+            return self._parent
+
+        def type(self):
+            return self._type
+
+        def children(self):
+            return tuple(self._children)
+
+        def allSubChildren(self):
+            out = []
+            for c in self._children:
+                out.append(c)
+                out.extend(c.allSubChildren())
+            return tuple(out)
+
+        def inputs(self):
+            return tuple(self._inputs)
+
+        def position(self):
+            return self._pos
+
+        def errors(self):
+            return self._errors
+
+        def warnings(self):
+            return ()
+
+        def isDisplayFlagSet(self):
+            return self._display
+
+        def isRenderFlagSet(self):
+            return self._display
+
+        def isBypassed(self):
+            return False
+
+        def parm(self, name):
+            return self._parms.get(name)
+
+        def networkBoxes(self):
+            return ()
+
+    stub = types.ModuleType('hou')
+    stub.nodeEventType = _Enum('ChildCreated', 'ChildDeleted', 'ChildSwitched', 'ChildReordered',
+                               'NameChanged', 'ParmTupleChanged', 'InputRearranged', 'FlagChanged',
+                               'BeingDeleted', 'PositionChanged', 'AppearanceChanged',
+                               'NetworkBoxCreated', 'NetworkBoxChanged', 'NetworkBoxDeleted')
+    stub.hipFileEventType = _Enum('AfterLoad', 'AfterClear', 'AfterMerge')
+    stub._Node, stub._Type, stub._Category, stub._Parm = _Node, _Type, _Category, _Parm
+    stub._registry = registry
+    stub.nodeBySessionId = registry.get
+    return stub
+
+
+def _build_synthetic_scene(stub, containers: int = 10, per_container: int = 1000):
+    obj_cat, sop_cat = stub._Category('Object'), stub._Category('Sop')
+    geo_t = stub._Type('geo', obj_cat)
+    sop_types = [stub._Type(n, sop_cat, ('Input 1', 'Input 2'))
+                 for n in ('box', 'transform', 'merge', 'polyextrude', 'attribwrangle')]
+    root = stub._Node('', stub._Type('root', stub._Category('Manager')))
+    obj = stub._Node('obj', stub._Type('obj', stub._Category('Manager')), root)
+    for g in range(containers):
+        geo = stub._Node(f"geo{g}", geo_t, obj)
+        prev = None
+        for i in range(per_container):
+            t = sop_types[i % len(sop_types)]
+            n = stub._Node(f"{t.name()}{i}", t, geo)
+            n._pos = (i * 0.1, -i * 1.0)
+            if prev is not None:
+                n._inputs = [prev]
+            if t.name() == 'attribwrangle':
+                n._parms['snippet'] = stub._Parm(f"@P.y += {i};")
+            if i % 97 == 0:
+                n._errors = (f"synthetic error {i}",)
+            prev = n
+        prev._display = True
+    return root, obj
+
+
+def _benchmark(containers: int = 10, per_container: int = 1000):
+    """合成 containers × per_container 个 SOP 节点，对比 HOM 遍历与镜像查询"""
+    import time
+    from . import client as _client
+    from . import scene_events as _events
+
+    global hou
+    stub = _make_stub_hou()
+    root, obj = _build_synthetic_scene(stub, containers, per_container)
+    by_path_index = {n.path(): n for n in stub._registry.values()}
+    stub.node = by_path_index.get
+    saved = (hou, _client.hou, _events.hou)
+    hou = _client.hou = _events.hou = stub
+    monitor = get_scene_monitor()
+    saved_live = monitor._live
+    monitor._live = True
+    try:
+        mirror = SceneMirror()
+        t0 = time.perf_counter()
+        mirror.ensure_built()
+        t_build = time.perf_counter() - t0
+        total = len(mirror._by_path)
+
+        mcp = _client.HoudiniMCP()
+        net = '/obj/geo0'
+        rounds = 20
+        t0 = time.perf_counter()
+        for _ in range(rounds):
+            ok, hom_data = mcp.get_network_structure(net)
+        t_hom = (time.perf_counter() - t0) / rounds
+        t0 = time.perf_counter()
+        for _ in range(rounds):
+            mirror_data = mirror.network_structure(net)
+        t_mirror = (time.perf_counter() - t0) / rounds
+        same = hom_data == mirror_data
+
+        t0 = time.perf_counter()
+        for _ in range(rounds):
+            mcp.check_node_errors('/obj')
+        t_err_hom = (time.perf_counter() - t0) / rounds
+        t0 = time.perf_counter()
+        for _ in range(rounds):
+            report = mirror.error_report('/obj')
+        t_err_mirror = (time.perf_counter() - t0) / rounds
+        same_err = mcp.check_node_errors('/obj')[1] == report
+
+        # 增量事件：改名 / 新建 / 删除 / 标志 / 连线，然后全量校验
+        et = stub.nodeEventType
+        geo1 = by_path_index['/obj/geo1']
+        t0 = time.perf_counter()
+        n = geo1._children[5]
+        n._name = 'renamed5'
+        mirror._on_event('node', et.NameChanged, {'node': n})
+        new = stub._Node('added', geo1._children[0]._type, geo1)
+        new._inputs = [n]
+        mirror._on_event('node', et.ChildCreated, {'node': geo1, 'child_node': new})
+        victim = geo1._children[10]
+        mirror._on_event('node', et.BeingDeleted, {'node': victim})
+        geo1._children.remove(victim)
+        mirror._on_event('node', et.ChildDeleted, {'node': geo1, 'child_node': victim})
+        geo1._children[-2]._display, geo1._children[-1]._display = True, False
+        mirror._on_event('node', et.FlagChanged, {'node': geo1._children[-2]})
+        geo1._children[20]._errors = ('cook failed',)
+        mirror._on_event('node', et.AppearanceChanged, {'node': geo1._children[20]})
+        t_events = time.perf_counter() - t0
+        by_path_index.clear()
+        by_path_index.update({x.path(): x for x in stub._registry.values() if x is not victim})
+        t0 = time.perf_counter()
+        mismatches = mirror.verify()
+        t_verify = time.perf_counter() - t0
+
+        # 每轮开始的抽样校验：只覆盖关注中的网络
+        saved_focus = set(monitor._focused_paths)
+        monitor._focused_paths = {'/obj/geo1'}
+        geo1._children[30]._errors = ('stale',)   # 未经事件的修改 → 抽样校验应同步到
+        t0 = time.perf_counter()
+        sampled = mirror.verify(sample=len(geo1._children))
+        t_sample = time.perf_counter() - t0
+        monitor._focused_paths = saved_focus
+
+        print(f"[SceneMirror] 合成场景 {total} 个节点")
+        print(f"  镜像构建:                 {t_build * 1000:8.1f} ms（一次）")
+        print(f"  get_network_structure:    HOM {t_hom * 1000:8.2f} ms  镜像 {t_mirror * 1000:8.2f} ms"
+              f"  ({t_hom / max(t_mirror, 1e-9):.0f}x, 结果一致={same})")
+        print(f"  check_errors(/obj):       HOM {t_err_hom * 1000:8.2f} ms  镜像 {t_err_mirror * 1000:8.2f} ms"
+              f"  ({t_err_hom / max(t_err_mirror, 1e-9):.0f}x, 结果一致={same_err})")
+        print(f"  6 个增量事件:             {t_events * 1000:8.2f} ms")
+        print(f"  全量一致性校验:           {t_verify * 1000:8.1f} ms, 不一致 {len(mismatches)} 处 {mismatches[:3]}")
+        print(f"  关注范围抽样校验(1 个网络): {t_sample * 1000:8.1f} ms, 不一致 {len(sampled)} 处 {sampled[:3]}")
+        print("  （HOM 数值基于 stub，不含真实 HOM 调用与主线程往返开销）")
+    finally:
+        hou, _client.hou, _events.hou = saved
+        monitor._live = saved_live
+
+
+def _benchmark_type_meta(nodes: int = 5000, rounds: int = 20):
+    """单网络 nodes 个节点：逐节点读取类型常量 vs 节点类型元数据缓存"""
+    import time
+    from . import client as _client
+
+    stub = _make_stub_hou()
+    _build_synthetic_scene(stub, 1, nodes)
+    by_path_index = {n.path(): n for n in stub._registry.values()}
+    stub.node = by_path_index.get
+    saved = _client.hou
+    _client.hou = stub
+    mcp_cls = _client.HoudiniMCP
+    cached = mcp_cls.__dict__['node_type_meta']
+    try:
+        mcp = mcp_cls()
+        net = '/obj/geo0'
+        # 基线：每个节点实例都重新计算类型常量（等价于缓存前的逐节点 HOM 调用）
+        mcp_cls.node_type_meta = staticmethod(lambda nt: _client.NodeTypeMeta(nt) if nt else None)
+        t0 = time.perf_counter()
+        for _ in range(rounds):
+            _, base = mcp.get_network_structure(net)
+        t_base = (time.perf_counter() - t0) / rounds
+        mcp_cls.node_type_meta = cached
+        mcp_cls.invalidate_node_type_caches()
+        t0 = time.perf_counter()
+        for _ in range(rounds):
+            _, data = mcp.get_network_structure(net)
+        t_cached = (time.perf_counter() - t0) / rounds
+        print(f"[TypeMeta] 单网络 {nodes} 个节点 get_network_structure:")
+        print(f"  逐节点类型调用 {t_base * 1000:8.2f} ms  类型缓存 {t_cached * 1000:8.2f} ms"
+              f"  ({t_base / max(t_cached, 1e-9):.2f}x, 结果一致={base == data},"
+              f" 缓存类型数={len(mcp_cls._type_meta_cache)})")
+        print("  （stub 的类型方法是纯 Python 调用；真实 HOM 每次调用都要跨 C++ 边界，收益更大）")
+    finally:
+        mcp_cls.node_type_meta = cached
+        mcp_cls.invalidate_node_type_caches()
+        _client.hou = saved
+
+
+if __name__ == '__main__':
+    _benchmark()
+    _benchmark_type_meta()
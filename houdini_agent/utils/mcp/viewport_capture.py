@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+视口截图管线 — capture_viewport 的降采样 / 后台编码 / 帧缓存
+
+旧实现在主线程里完成全部工作：flipbook 写临时 JPEG → 读回 → 整图 base64，
+每次截图都按渲染分辨率（默认 960x540 ≈ 765 tokens）发给模型，场景没变也重新渲染。
+
+本模块提供：
+  - fit_to_token_budget:   按图片 token 预算计算发送尺寸（只缩小不放大）
+  - ViewportFrameCache:    (视口, 帧, 场景版本号, 相机, 尺寸, 预算) → 已编码帧 的 LRU + TTL
+  - CaptureTempDir:        私有临时目录，每帧文件在 finally 中删除（含 flipbook 的帧号后缀文件），
+                           目录本身在进程退出时删除
+  - ViewportCapturePipeline: 单 worker 线程池，负责降采样 + JPEG 重编码 + base64 + 写入 output_path
+
+线程划分：
+  主线程   — 计算缓存键、flipbook 渲染、读回原始字节（hou UI 操作只能在主线程）
+  worker  — QImage 缩放 / 编码（QImage 不依赖 GUI 线程），完成后写入缓存
+  调用线程 — resolve()：等待 worker 结果并填充 _viewport_image（Agent 后台线程）
+
+flipbook 的 HOM 接口只能输出到文件，因此"内存化"从读回原始字节之后开始。
+缓存仅在 SceneMonitor 已挂载 hou 事件时启用（否则版本号感知不到界面中的手动修改）。
+
+基准测试（合成 960x540 帧）：python -m houdini_agent.utils.mcp.viewport_capture
+"""
+
+import atexit
+import base64
+import glob
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+DEFAULT_TOKEN_BUDGET = 425     # 约 2 个 512px tile（旧实现 960x540 ≈ 765 tokens）
+MIN_TOKEN_BUDGET = 85
+MAX_LONG_EDGE = 1568           # 超过此边长模型侧也会再次缩小
+JPEG_QUALITY = 80
+RESOLVE_TIMEOUT = 30.0
+
+
+# ─────────────────────────────────────────────
+# token 预算
+# ─────────────────────────────────────────────
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """图片输入 token 估算：取两种常见计费方式的较大值
+
+    - 按像素：w * h / 750
+    - 按 tile：先缩放到 2048 方框内、短边不超过 768，再按 512px tile 计 85 + 170 * tiles
+    """
+    if width <= 0 or height <= 0:
+        return 0
+    by_pixels = width * height / 750.0
+    w, h = float(width), float(height)
+    scale = min(1.0, 2048.0 / max(w, h))
+    w, h = w * scale, h * scale
+    scale = min(1.0, 768.0 / min(w, h))
+    w, h = w * scale, h * scale
+    by_tiles = 85 + 170 * math.ceil(w / 512.0) * math.ceil(h / 512.0)
+    return int(math.ceil(max(by_pixels, by_tiles)))
+
+
+def fit_to_token_budget(width: int, height: int, budget: int) -> Tuple[int, int]:
+    """保持宽高比缩小到 token 预算内（只缩小不放大；预算低于单 tile 时按单 tile 处理）"""
+    scale = min(1.0, MAX_LONG_EDGE / float(max(width, height)))
+    # 单 tile 是 tile 计费的下限：再小也不会更省
+    floor_scale = min(1.0, 512.0 / float(max(width, height)))
+    while scale > floor_scale:
+        if estimate_image_tokens(int(width * scale), int(height * scale)) <= budget:
+            break
+        scale = max(floor_scale, scale * 0.9)
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+# ─────────────────────────────────────────────
+# 帧缓存
+# ─────────────────────────────────────────────
+
+class EncodedFrame:
+    """已编码的视口帧（写入后只读）"""
+
+    __slots__ = ('b64', 'raw', 'width', 'height', 'src_width', 'src_height',
+                 'tokens', 'created')
+
+    def __init__(self, b64: str, raw: bytes, width: int, height: int,
+                 src_width: int, src_height: int):
+        self.b64 = b64
+        self.raw = raw              # flipbook 原始字节（output_path 保存原分辨率）
+        self.width = width
+        self.height = height
+        self.src_width = src_width
+        self.src_height = src_height
+        self.tokens = estimate_image_tokens(width, height)
+        self.created = time.monotonic()
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.b64) + len(self.raw)
+
+
+class ViewportFrameCache:
+    """已编码视口帧的 LRU（线程安全）
+
+    TTL 兜底场景版本号感知不到的视口变化（着色模式、显示选项等）。
+    """
+
+    def __init__(self, max_entries: int = 8, ttl: float = 300.0):
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, EncodedFrame]" = OrderedDict()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: tuple) -> Optional[EncodedFrame]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry.created > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry
+
+    def put(self, key: tuple, entry: EncodedFrame):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': (self._hits / lookups) if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': sum(e.nbytes for e in self._entries.values()),
+            }
+
+
+# ─────────────────────────────────────────────
+# 临时文件
+# ─────────────────────────────────────────────
+
+class CaptureTempDir:
+    """flipbook 输出用的私有临时目录"""
+
+    def __init__(self, prefix: str = 'houdini_viewport_'):
+        self._prefix = prefix
+        self._lock = threading.Lock()
+        self._path: Optional[str] = None
+
+    @property
+    def path(self) -> str:
+        with self._lock:
+            if self._path is None or not os.path.isdir(self._path):
+                self._path = tempfile.mkdtemp(prefix=self._prefix)
+                atexit.register(shutil.rmtree, self._path, True)
+            return self._path
+
+    def new_file(self, ext: str = '.jpg') -> str:
+        return os.path.join(self.path, f"frame_{int(time.time() * 1000)}_{threading.get_ident()}{ext}")
+
+    @staticmethod
+    def find_output(path: str) -> Optional[str]:
+        """flipbook 可能在文件名后追加帧号：返回实际生成的文件"""
+        if os.path.exists(path):
+            return path
+        stem, ext = os.path.splitext(path)
+        candidates = sorted(glob.glob(f"{glob.escape(stem)}*{ext}"))
+        return candidates[0] if candidates else None
+
+    @staticmethod
+    def remove(path: str):
+        """删除帧文件及其帧号后缀变体"""
+        stem, ext = os.path.splitext(path)
+        for p in [path] + glob.glob(f"{glob.escape(stem)}*{ext}"):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+
+# ─────────────────────────────────────────────
+# 编码管线
+# ─────────────────────────────────────────────
+
+def _encode_frame(raw: bytes, src_size: Tuple[int, int], budget: int) -> EncodedFrame:
+    """降采样到 token 预算并重编码为 JPEG（worker 线程执行）"""
+    src_w, src_h = src_size
+    try:
+        from houdini_agent.qt_compat import QtCore, QtGui
+    except ImportError:
+        # 无 Qt：原样发送
+        return EncodedFrame(base64.b64encode(raw).decode('ascii'), raw, src_w, src_h, src_w, src_h)
+
+    image = QtGui.QImage()
+    if not image.loadFromData(raw):
+        return EncodedFrame(base64.b64encode(raw).decode('ascii'), raw, src_w, src_h, src_w, src_h)
+    src_w, src_h = image.width(), image.height()
+    dst_w, dst_h = fit_to_token_budget(src_w, src_h, budget)
+    if (dst_w, dst_h) == (src_w, src_h):
+        # 尺寸未变：沿用 flipbook 的 JPEG，不做有损二次编码
+        data = raw
+    else:
+        image = image.scaled(dst_w, dst_h, QtCore.Qt.IgnoreAspectRatio, QtCore.Qt.SmoothTransformation)
+        buf = QtCore.QBuffer()
+        buf.open(QtCore.QIODevice.WriteOnly)
+        image.save(buf, 'JPEG', JPEG_QUALITY)
+        data = bytes(buf.data().data())
+        buf.close()
+    return EncodedFrame(base64.b64encode(data).decode('ascii'), raw, dst_w, dst_h, src_w, src_h)
+
+
+def _save_raw(raw: bytes, path: str) -> str:
+    save_dir = os.path.dirname(path)
+    if save_dir and not os.path.exists(save_dir):
+        os.makedirs(save_dir, exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(raw)
+    return path
+
+
+class ViewportCapturePipeline:
+    """capture_viewport 的后台编码 + 帧缓存"""
+
+    def __init__(self):
+        self.cache = ViewportFrameCache()
+        self.temp = CaptureTempDir()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='viewport-encode')
+
+    def submit(self, key: Optional[tuple], raw: bytes, src_size: Tuple[int, int],
+               budget: int, output_path: str = '') -> Future:
+        """提交降采样 / 编码任务（主线程调用，立即返回）"""
+        return self._pool.submit(self._run, key, raw, src_size, budget, output_path)
+
+    def submit_cached(self, frame: EncodedFrame, output_path: str) -> Future:
+        """缓存命中但需要保存 output_path：文件写入同样放到 worker"""
+        return self._pool.submit(self._deliver, frame, output_path)
+
+    def _run(self, key, raw, src_size, budget, output_path):
+        frame = _encode_frame(raw, src_size, budget)
+        if key is not None:
+            self.cache.put(key, frame)
+        return self._deliver(frame, output_path)
+
+    @staticmethod
+    def _deliver(frame: EncodedFrame, output_path: str):
+        saved, save_error = '', ''
+        if output_path:
+            try:
+                saved = _save_raw(frame.raw, output_path)
+            except Exception as e:
+                save_error = str(e)
+        return frame, saved, save_error
+
+    @staticmethod
+    def describe(frame: EncodedFrame) -> str:
+        if (frame.width, frame.height) == (frame.src_width, frame.src_height):
+            size = f"{frame.width}x{frame.height}"
+        else:
+            size = f"{frame.src_width}x{frame.src_height} → {frame.width}x{frame.height}"
+        return f"发送尺寸 {size} (≈{frame.tokens} tokens, {len(frame.b64) * 3 // 4 / 1024:.1f}KB)"
+
+    def resolve(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """等待后台编码完成并填充 _viewport_image（调用线程执行，非截图结果原样返回）"""
+        if not isinstance(result, dict):
+            return result
+        future = result.pop('_viewport_pending', None)
+        if future is None:
+            return result
+        output_path = result.pop('_viewport_output_path', '')
+        try:
+            frame, saved, save_error = future.result(timeout=RESOLVE_TIMEOUT)
+        except Exception as e:
+            print(f"[ViewportCapture] 编码失败: {e}")
+            return {"success": False, "error": f"视口截图编码失败: {e}"}
+        lines = [result.get('result', ''), self.describe(frame)]
+        if saved:
+            lines.append(f"截图已保存到: {saved}")
+        elif save_error:
+            lines.append(f"保存到 {output_path} 失败: {save_error}")
+        result['result'] = '\n'.join(l for l in lines if l)
+        result['_viewport_image'] = frame.b64
+        result.setdefault('_image_media_type', 'image/jpeg')
+        return result
+
+
+# ─────────────────────────────────────────────
+# 全局单例
+# ─────────────────────────────────────────────
+
+_instance: Optional[ViewportCapturePipeline] = None
+_instance_lock = threading.Lock()
+
+
+def get_viewport_capture() -> ViewportCapturePipeline:
+    """获取 ViewportCapturePipeline 全局单例"""
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = ViewportCapturePipeline()
+    return _instance
+
+
+# ─────────────────────────────────────────────
+# 基准测试
+# ─────────────────────────────────────────────
+
+def _benchmark(rounds: int = 20):
+    """合成 960x540 帧：旧实现（整图 base64）vs 降采样编码 vs 缓存命中"""
+    try:
+        from houdini_agent.qt_compat import QtCore, QtGui
+    except ImportError:
+        print("[ViewportCapture] 需要 PySide2 / PySide6 才能运行基准测试")
+        return
+
+    app = QtGui.QGuiApplication.instance() or QtGui.QGuiApplication([])  # noqa: F841
+    image = QtGui.QImage(960, 540, QtGui.QImage.Format_RGB32)
+    painter = QtGui.QPainter(image)
+    grad = QtGui.QLinearGradient(0, 0, 960, 540)
+    grad.setColorAt(0.0, QtGui.QColor(40, 40, 48))
+    grad.setColorAt(1.0, QtGui.QColor(150, 160, 180))
+    painter.fillRect(image.rect(), grad)
+    painter.setBrush(QtGui.QColor(200, 120, 60))
+    painter.drawEllipse(300, 120, 360, 300)
+    painter.end()
+    buf = QtCore.QBuffer()
+    buf.open(QtCore.QIODevice.WriteOnly)
+    image.save(buf, 'JPEG', 90)
+    raw = bytes(buf.data().data())
+
+    pipe = ViewportCapturePipeline()
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        old_b64 = base64.b64encode(raw).decode('ascii')
+    t_old = (time.perf_counter() - t0) / rounds
+
+    t0 = time.perf_counter()
+    for i in range(rounds):
+        frame, _, _ = pipe.submit(('bench', i), raw, (960, 540), DEFAULT_TOKEN_BUDGET).result()
+    t_new = (time.perf_counter() - t0) / rounds
+
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        pipe.cache.get(('bench', 0))
+    t_hit = (time.perf_counter() - t0) / rounds
+
+    print(f"[ViewportCapture] 960x540 合成帧，{rounds} 轮平均:")
+    print(f"  旧实现:   {t_old * 1000:7.2f} ms  base64 {len(old_b64) // 1024}KB, "
+          f"≈{estimate_image_tokens(960, 540)} tokens")
+    print(f"  降采样:   {t_new * 1000:7.2f} ms  base64 {len(frame.b64) // 1024}KB, "
+          f"{frame.width}x{frame.height} ≈{frame.tokens} tokens（worker 线程）")
+    print(f"  缓存命中: {t_hit * 1000:7.3f} ms  （跳过 flipbook 渲染与编码）")
+
+
+if __name__ == '__main__':
+    _benchmark()
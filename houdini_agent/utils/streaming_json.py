@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming JSON — 可续传的增量 JSON 解析器
+
+流式 tool_call 参数每次只到达一小段 delta。逐次对完整 accumulated 做正则 /
+重新解码是 O(n²)；StreamingJSONParser 在 delta 之间保留解析状态，
+每次 feed() 只处理新到达的字符，并产出字段级事件：
+
+  - START  (path, '{' | '[')   容器开始
+  - KEY    (path, key)         对象键解析完成（path 为该键对应值的路径）
+  - CHUNK  (path, text)        字符串值新增的已解码片段（每次 feed 至多一条）
+  - VALUE  (path, value)       值解析完成（标量 / 字符串 / 完整容器）
+
+path 为键 / 下标组成的元组，例如 ('steps', 0, 'title')。
+
+StreamingToolCallExtractor 则面向 JSON 模式的助手正文：用括号平衡扫描从流式文本中
+逐个切出完整的 {"tool": ..., "args": {...}} 对象，生成结束前即可分派。
+
+用法:
+    p = StreamingJSONParser()
+    for ev in p.feed(delta):
+        if ev.kind == CHUNK and ev.path == ('vex_code',):
+            preview.append_code(ev.value)
+"""
+
+import json
+import re
+from typing import Any, List, NamedTuple, Optional
+
+START = 'start'
+KEY = 'key'
+CHUNK = 'chunk'
+VALUE = 'value'
+
+
+class JSONEvent(NamedTuple):
+    kind: str
+    path: tuple
+    value: Any
+
+
+# 解析模式
+_M_VALUE = 0            # 期望一个值
+_M_VALUE_OR_END = 1     # '[' 之后：值或 ']'
+_M_KEY_OR_END = 2       # '{' 之后：键或 '}'
+_M_KEY = 3              # ',' 之后（对象内）：键
+_M_COLON = 4            # 键之后：':'
+_M_COMMA_OR_END = 5     # 值之后：',' 或容器结束
+_M_STRING = 6           # 字符串内部
+_M_LITERAL = 7          # 数字 / true / false / null
+_M_DONE = 8             # 顶层值已完成
+_M_ERROR = 9
+
+_WS = ' \t\r\n'
+_LITERAL_START = '-0123456789tfn'
+_LITERAL_CHARS = frozenset('-+.0123456789eEtruefalsn')
+_STR_SPECIAL = re.compile(r'["\\]')
+_SIMPLE_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f',
+                   '"': '"', '\\': '\\', '/': '/'}
+
+
+class StreamingJSONParser:
+    """可续传的增量 JSON 解析器（单个顶层值）
+
+    - feed(delta) 返回本段产生的事件列表，工作量与 delta 长度成正比
+    - 顶层值完成后 done=True，result 为解析结果；consumed 为已消费的字符数
+      （之后的字符不再消费，调用方可据此切分后续文本）
+    - 语法错误时 error 非空，后续 feed 不再产生事件
+    """
+
+    def __init__(self):
+        # 栈帧: [is_object, container, path, current_key]
+        self._stack: List[list] = []
+        self._mode = _M_VALUE
+        self._str_parts: List[str] = []
+        self._str_is_key = False
+        self._str_path: tuple = ()
+        self._esc: Optional[str] = None     # None / '' (反斜杠后) / 'uXXXX'
+        self._high_surrogate: Optional[int] = None
+        self._literal: List[str] = []
+        self.consumed = 0
+        self.done = False
+        self.result: Any = None
+        self.error: Optional[str] = None
+
+    # ---------- 公共接口 ----------
+
+    def feed(self, data: str) -> List[JSONEvent]:
+        """消费一段增量文本，返回产生的事件"""
+        events: List[JSONEvent] = []
+        if self._mode in (_M_DONE, _M_ERROR) or not data:
+            return events
+        chunk_from = len(self._str_parts) if self._mode == _M_STRING else 0
+        i, n = 0, len(data)
+        while i < n:
+            mode = self._mode
+            if mode == _M_STRING:
+                i = self._scan_string(data, i, events, chunk_from)
+                chunk_from = 0
+                continue
+            ch = data[i]
+            if mode == _M_LITERAL:
+                if ch in _LITERAL_CHARS:
+                    self._literal.append(ch)
+                    i += 1
+                    continue
+                if not self._finish_literal(events):
+                    break
+                continue  # 当前字符交给新模式处理
+            if ch in _WS:
+                i += 1
+                continue
+            if mode == _M_DONE:
+                break
+            if mode in (_M_VALUE, _M_VALUE_OR_END):
+                if mode == _M_VALUE_OR_END and ch == ']':
+                    self._close(events)
+                elif ch == '{' or ch == '[':
+                    path = self._child_path()
+                    self._stack.append([ch == '{', {} if ch == '{' else [], path, None])
+                    self._mode = _M_KEY_OR_END if ch == '{' else _M_VALUE_OR_END
+                    events.append(JSONEvent(START, path, ch))
+                elif ch == '"':
+                    self._begin_string(is_key=False)
+                    chunk_from = 0
+                elif ch in _LITERAL_START:
+                    self._literal = [ch]
+                    self._mode = _M_LITERAL
+                else:
+                    self._fail(f"unexpected {ch!r} at value")
+                    break
+            elif mode in (_M_KEY_OR_END, _M_KEY):
+                if mode == _M_KEY_OR_END and ch == '}':
+                    self._close(events)
+                elif ch == '"':
+                    self._begin_string(is_key=True)
+                else:
+                    self._fail(f"unexpected {ch!r} at key")
+                    break
+            elif mode == _M_COLON:
+                if ch != ':':
+                    self._fail(f"expected ':' got {ch!r}")
+                    break
+                self._mode = _M_VALUE
+            elif mode == _M_COMMA_OR_END:
+                frame = self._stack[-1]
+                if ch == ',':
+                    self._mode = _M_KEY if frame[0] else _M_VALUE
+                elif ch == ('}' if frame[0] else ']'):
+                    self._close(events)
+                else:
+                    self._fail(f"unexpected {ch!r} after value")
+                    break
+            i += 1
+            if self._mode == _M_DONE:
+                break
+        self.consumed += i
+        return events
+
+    @property
+    def path(self) -> tuple:
+        """当前正在解析的值的路径"""
+        if self._mode == _M_STRING:
+            return self._str_path
+        return self._child_path()
+
+    # ---------- 内部实现 ----------
+
+    def _child_path(self) -> tuple:
+        if not self._stack:
+            return ()
+        is_obj, container, path, key = self._stack[-1]
+        return path + ((key,) if is_obj else (len(container),))
+
+    def _begin_string(self, is_key: bool):
+        self._mode = _M_STRING
+        self._str_is_key = is_key
+        self._str_parts = []
+        self._esc = None
+        self._high_surrogate = None
+        if is_key:
+            self._str_path = self._stack[-1][2]
+        else:
+            self._str_path = self._child_path()
+
+    def _scan_string(self, data: str, i: int, events: List[JSONEvent], chunk_from: int) -> int:
+        """扫描字符串内容直到结束引号或数据末尾，返回新的位置"""
+        parts = self._str_parts
+        n = len(data)
+        while i < n:
+            if self._esc is not None:
+                i = self._scan_escape(data, i)
+                continue
+            m = _STR_SPECIAL.search(data, i)
+            if m is None:
+                parts.append(data[i:])
+                i = n
+                break
+            j = m.start()
+            if j > i:
+                parts.append(data[i:j])
+            if data[j] == '"':
+                # 字符串结束
+                i = j + 1
+                text = ''.join(parts)
+                if self._str_is_key:
+                    self._stack[-1][3] = text
+                    self._mode = _M_COLON
+                    events.append(JSONEvent(KEY, self._child_path(), text))
+                else:
+                    if len(parts) > chunk_from:
+                        events.append(JSONEvent(CHUNK, self._str_path, ''.join(parts[chunk_from:])))
+                    self._complete(text, events)
+                self._str_parts = []
+                return i
+            self._esc = ''
+            i = j + 1
+        # 数据用完，字符串尚未结束
+        if not self._str_is_key and len(parts) > chunk_from:
+            events.append(JSONEvent(CHUNK, self._str_path, ''.join(parts[chunk_from:])))
+        return i
+
+    def _scan_escape(self, data: str, i: int) -> int:
+        ch = data[i]
+        esc = self._esc
+        if esc == '':
+            if ch == 'u':
+                self._esc = 'u'
+                return i + 1
+            self._esc = None
+            self._flush_surrogate()
+            self._str_parts.append(_SIMPLE_ESCAPES.get(ch, ch))
+            return i + 1
+        # \uXXXX
+        esc += ch
+        if len(esc) < 5:
+            self._esc = esc
+            return i + 1
+        self._esc = None
+        try:
+            code = int(esc[1:], 16)
+        except ValueError:
+            self._str_parts.append(esc[1:])
+            return i + 1
+        if 0xD800 <= code < 0xDC00:
+            self._flush_surrogate()
+            self._high_surrogate = code
+        elif 0xDC00 <= code < 0xE000 and self._high_surrogate is not None:
+            high, self._high_surrogate = self._high_surrogate, None
+            self._str_parts.append(chr(0x10000 + ((high - 0xD800) << 10) + (code - 0xDC00)))
+        else:
+            self._flush_surrogate()
+            self._str_parts.append(chr(code))
+        return i + 1
+
+    def _flush_surrogate(self):
+        if self._high_surrogate is not None:
+            self._str_parts.append(chr(self._high_surrogate))
+            self._high_surrogate = None
+
+    def _finish_literal(self, events: List[JSONEvent]) -> bool:
+        text = ''.join(self._literal)
+        self._literal = []
+        try:
+            value = json.loads(text)
+        except ValueError:
+            self._fail(f"invalid literal {text!r}")
+            return False
+        self._complete(value, events)
+        return True
+
+    def _close(self, events: List[JSONEvent]):
+        _, container, _, _ = self._stack.pop()
+        self._complete(container, events)
+
+    def _complete(self, value: Any, events: List[JSONEvent]):
+        """值完成：发出 VALUE 事件并挂到父容器"""
+        path = self._child_path()
+        events.append(JSONEvent(VALUE, path, value))
+        if not self._stack:
+            self.result = value
+            self.done = True
+            self._mode = _M_DONE
+            return
+        is_obj, container, _, key = self._stack[-1]
+        if is_obj:
+            container[key] = value
+        else:
+            container.append(value)
+        self._mode = _M_COMMA_OR_END
+
+    def _fail(self, msg: str):
+        self.error = msg
+        self._mode = _M_ERROR
+
+
+class StreamingToolCallExtractor:
+    """从流式文本中增量提取 JSON 格式的工具调用（JSON 模式 / 无原生 Function Calling）
+
+    括号平衡扫描：顶层 '{' 开始候选对象，字符串内的括号与转义不计入深度，
+    深度回到 0 即得到完整对象（支持任意嵌套的 args）。对象解析成功且含
+    "tool"/"name" 字段即产出 {'name': ..., 'arguments': {...}}。
+
+    - feed(text) 返回本段文本中新完成的工具调用，可在生成结束前分派
+    - 代码块围栏（```json）和对象外的说明文字直接跳过
+    - '{' 之后第一个非空白字符不是 '"' 时视为普通文本（如 VEX 代码块），不进入候选
+    """
+
+    _TRAILING_COMMA = re.compile(r',\s*([}\]])')
+
+    def __init__(self):
+        self._buf: List[str] = []   # 当前候选对象的文本
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._await_quote = False   # 刚遇到顶层 '{'，等待第一个非空白字符
+        self.calls: List[dict] = []
+
+    def feed(self, text: str) -> List[dict]:
+        found: List[dict] = []
+        buf = self._buf
+        for ch in text:
+            if self._depth == 0:
+                if ch == '{':
+                    self._depth = 1
+                    self._await_quote = True
+                    buf.append(ch)
+                continue
+            buf.append(ch)
+            if self._await_quote:
+                if ch in _WS:
+                    continue
+                self._await_quote = False
+                if ch != '"':
+                    self._reset()
+                    continue
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == '\\':
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+                continue
+            if ch == '"':
+                self._in_str = True
+            elif ch == '{':
+                self._depth += 1
+            elif ch == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    call = self._to_call(''.join(buf))
+                    self._reset()
+                    if call:
+                        found.append(call)
+        self.calls.extend(found)
+        return found
+
+    def _reset(self):
+        self._buf.clear()
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._await_quote = False
+
+    @classmethod
+    def _to_call(cls, block: str) -> Optional[dict]:
+        try:
+            data = json.loads(block)
+        except ValueError:
+            # 修复常见的 JSON 格式错误：末尾多余逗号
+            try:
+                data = json.loads(cls._TRAILING_COMMA.sub(r'\1', block))
+            except ValueError as e:
+                print(f"[AI Client] JSON解析失败: {e}, 内容: {block[:100]}")
+                return None
+        if not isinstance(data, dict):
+            return None
+        if 'tool' in data:
+            name = data['tool']
+            args = data.get('args', data.get('arguments', {}))
+        elif 'name' in data and ('arguments' in data or 'args' in data):
+            # 兼容 {"name": "xxx", "arguments": {...}} 格式
+            name = data['name']
+            args = data.get('arguments', data.get('args', {}))
+        else:
+            return None
+        if not isinstance(name, str) or not name:
+            return None
+        if isinstance(args, str):
+            try:
+                args = json.loads(args)
+            except ValueError:
+                args = {}
+        return {'name': name, 'arguments': args if isinstance(args, dict) else {}}
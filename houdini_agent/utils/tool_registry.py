@@ -7,6 +7,7 @@ ToolRegistry — 统一工具注册中心
   - 统一执行入口
   - 支持工具启用/禁用（持久化到 config/plugins.json）
   - 为 UI 提供工具列表元数据
+  - 单调递增的版本号 + 按版本缓存的工具定义包（精简 / 序列化 / token 估算只在注册表变化后重建）
 """
 
 import json
@@ -34,6 +35,45 @@ class ToolMeta:
     enabled: bool = True                         # 是否启用
 
 
+@dataclass
+class SchemaBundle:
+    """某种请求模式下发送给模型的工具定义包（按注册表版本缓存，调用方不得修改）"""
+    tools: List[dict]                            # 精简后的 schema 列表
+    names: frozenset                             # 工具名集合
+    tokens: int                                  # 估算 token 数
+    version: int                                 # 构建时的注册表版本
+
+
+# ─────────────────────────────────────────────
+# 工具定义 token 估算（与 AIClient._estimate_messages_tokens 一致）
+# ─────────────────────────────────────────────
+
+def estimate_schema_tokens(tool: dict) -> int:
+    """单个工具定义的 token 估算"""
+    fn = tool.get('function', {})
+    params = fn.get('parameters', {})
+    return len(fn.get('description', '')) // 4 + (len(json.dumps(params)) // 4 if params else 0) + 30
+
+
+_tools_tokens_memo: Dict[int, tuple] = {}   # id(工具列表) → (列表引用, token 数, 长度)
+_TOOLS_TOKENS_MEMO_MAX = 16
+
+
+def estimate_tools_tokens(tools: List[dict]) -> int:
+    """工具列表的 token 估算（按列表对象缓存：同一轮迭代反复估算同一列表时不再重复序列化）
+
+    调用方约定：传入的列表发送后不再原地修改（追加工具时创建新列表）。
+    """
+    entry = _tools_tokens_memo.get(id(tools))
+    if entry is not None and entry[0] is tools and len(tools) == entry[2]:
+        return entry[1]
+    total = sum(estimate_schema_tokens(t) for t in tools)
+    if len(_tools_tokens_memo) >= _TOOLS_TOKENS_MEMO_MAX:
+        _tools_tokens_memo.pop(next(iter(_tools_tokens_memo)))
+    _tools_tokens_memo[id(tools)] = (tools, total, len(tools))
+    return total
+
+
 # ─────────────────────────────────────────────
 # 模式推断辅助（仅用于核心工具自动注册）
 # ─────────────────────────────────────────────
@@ -133,6 +173,13 @@ class ToolRegistry:
         self._tools: Dict[str, ToolMeta] = {}       # name -> ToolMeta
         self._disabled_tools: Set[str] = set()       # 持久化禁用列表
         self._initialized = False
+        self._version = 0                            # 工具集合 / 启用状态每次变化 +1
+        self._bundles: Dict[tuple, SchemaBundle] = {}  # 请求模式 key → 当前版本的工具定义包
+
+    @property
+    def version(self) -> int:
+        """单调递增的版本号（供按版本缓存工具 embedding / schema 的调用方使用）"""
+        return self._version
 
     # ---------- 注册 / 注销 ----------
 
@@ -156,11 +203,13 @@ class ToolRegistry:
                 enabled=enabled and (name not in self._disabled_tools),
             )
             self._tools[name] = meta
+            self._version += 1
 
     def unregister(self, name: str):
         """注销工具"""
         with self._lock:
-            self._tools.pop(name, None)
+            if self._tools.pop(name, None) is not None:
+                self._version += 1
 
     def unregister_by_source(self, source: str, plugin_name: str = ""):
         """按来源注销（可指定插件名）"""
@@ -171,6 +220,8 @@ class ToolRegistry:
             ]
             for n in to_remove:
                 del self._tools[n]
+            if to_remove:
+                self._version += 1
 
     # ---------- 查询 ----------
 
@@ -221,6 +272,31 @@ class ToolRegistry:
                 })
             return sorted(result, key=lambda x: (x["source"], x["name"]))
 
+    def schema_bundle(self, key: tuple, build: Callable[[], List[dict]]) -> SchemaBundle:
+        """获取按注册表版本缓存的工具定义包
+
+        key 标识请求模式（如 ('agent', use_web, supports_vision)）；
+        build() 返回精简后的 schema 列表，仅在首次或注册表版本变化后调用。
+        """
+        version = self._version
+        bundle = self._bundles.get(key)
+        if bundle is not None and bundle.version == version:
+            return bundle
+        tools = build()
+        bundle = SchemaBundle(
+            tools=tools,
+            names=frozenset(t.get('function', {}).get('name', '') for t in tools),
+            tokens=estimate_tools_tokens(tools),
+            version=version,
+        )
+        with self._lock:
+            if self._version == version:
+                # 版本变化后旧版本的包全部作废
+                if any(b.version != version for b in self._bundles.values()):
+                    self._bundles.clear()
+                self._bundles[key] = bundle
+        return bundle
+
     # ---------- 执行 ----------
 
     def execute(self, name: str, args: dict) -> dict:
@@ -253,6 +329,7 @@ class ToolRegistry:
                 self._disabled_tools.discard(name)
             else:
                 self._disabled_tools.add(name)
+            self._version += 1
 
     def is_enabled(self, name: str) -> bool:
         """查询工具是否启用"""
@@ -265,6 +342,7 @@ class ToolRegistry:
             self._disabled_tools = set(disabled_list)
             for name, meta in self._tools.items():
                 meta.enabled = name not in self._disabled_tools
+            self._version += 1
 
     def get_disabled_tools(self) -> List[str]:
         """获取当前禁用列表"""
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+ToolResultCache — 会话级只读工具结果缓存
+
+跨 Agent 迭代、跨用户轮次复用只读查询工具（get_network_structure /
+get_node_parameters / check_errors ...）的结果：
+  - key:   "tool_name:sorted_args_json"（与同轮去重签名一致）
+  - 失效:  条目记录写入时的场景版本号，版本号变化即过期
+           （版本号由 hou 节点事件回调和每个可能修改场景的工具递增，见 mcp/scene_events.py；
+            未关注网络中的修改在用户轮次开始时按撤销栈变化整体递增）
+  - 选择集（read_selection）/ 一次性结果（perf_stop_and_report）不进入缓存
+  - 文档 / 节点类型查询与场景无关，不受版本号影响
+  - hou 回调未挂载时（无法感知界面中的手动修改），每个用户轮次开始时清空
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from .mcp.scene_events import get_scene_monitor
+
+
+class ToolResultCache:
+    """按场景版本号精确失效的只读工具结果缓存（LRU，线程安全）"""
+
+    # 结果与场景状态无关的工具（只要参数相同即可复用）
+    _SCENE_INDEPENDENT = frozenset({
+        'search_local_doc', 'get_houdini_node_doc', 'get_node_inputs',
+        'search_node_types', 'semantic_search_nodes', 'list_skills',
+    })
+
+    def __init__(self, max_entries: int = 256):
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # sig -> (version, result)
+        self._max_entries = max_entries
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    @staticmethod
+    def signature(tool_name: str, arguments: dict) -> str:
+        return f"{tool_name}:{json.dumps(arguments, sort_keys=True)}"
+
+    @staticmethod
+    def scene_version() -> int:
+        return get_scene_monitor().version
+
+    # ---------- 查询 / 写入 ----------
+
+    def contains(self, sig: str) -> bool:
+        """是否有仍然有效的条目（不计入命中统计）"""
+        with self._lock:
+            return self._valid_entry(sig) is not None
+
+    def get(self, tool_name: str, arguments: dict) -> Optional[dict]:
+        """查询缓存：命中返回结果，过期 / 未命中返回 None"""
+        sig = self.signature(tool_name, arguments)
+        with self._lock:
+            entry = self._valid_entry(sig)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(sig)
+            self._hits += 1
+            return entry[1]
+
+    def put(self, tool_name: str, arguments: dict, result: dict, version: int):
+        """写入结果；version 为执行前读取的场景版本号"""
+        if not result:
+            return
+        sig = self.signature(tool_name, arguments)
+        with self._lock:
+            self._entries[sig] = (version, result)
+            self._entries.move_to_end(sig)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def _valid_entry(self, sig: str) -> Optional[tuple]:
+        entry = self._entries.get(sig)
+        if entry is None:
+            return None
+        tool_name = sig.split(':', 1)[0]
+        if tool_name in self._SCENE_INDEPENDENT or entry[0] == self.scene_version():
+            return entry
+        # 场景已变化 → 过期条目直接移除
+        del self._entries[sig]
+        self._invalidations += 1
+        return None
+
+    # ---------- 生命周期 ----------
+
+    def begin_turn(self):
+        """用户轮次开始：hou 回调未挂载时无法感知手动修改，只能整体清空"""
+        if not get_scene_monitor().is_live:
+            self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    # ---------- 统计 ----------
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': (self._hits / lookups) if lookups else 0.0,
+                'invalidations': self._invalidations,
+                'entries': len(self._entries),
+                'scene_version': self.scene_version(),
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self._hits = 0
+            self._misses = 0
+            self._invalidations = 0
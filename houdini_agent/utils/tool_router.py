@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+SemanticToolRouter — 基于 embedding 的工具子集选择
+
+40+ 个工具 schema 每次请求要花费数千 prompt tokens。关键词意图匹配
+（ToolRegistry.classify_intent）误判率高，Agent 模式因此一直发送全量工具。
+本路由器：
+  - 每个注册表版本只编码一次各工具的 "名称: 描述"
+  - 以「最近的 user 消息 + 最近使用过的工具」为查询，一次矩阵乘法为全部工具打分
+  - 发送 = 常驻核心工具 + 最近使用过的工具 + 相关性 Top-N
+  - 每个会话的已发送集合只增不减、顺序固定：后续轮次只追加新选中的工具，
+    工具数组前缀不变，提示词缓存不会因逐轮重选而失效
+  - 被省略的工具只列出名称；模型用 [需要工具: 名称] 显式请求（或直接调用）时，
+    该工具加入会话集合并在下一次请求附带定义，记一次 "漏选"（miss）。
+    回复中只是提到工具名不算请求
+
+只有真正的语义模型（sentence-transformers）才做路由：embedder 未加载 / 处于 n-gram
+哈希 fallback / numpy 不可用时发送全量（与原行为一致），未加载时在后台预热。
+会话首轮未路由（embedder 尚未就绪）时，embedder 可用后重新计算一次会话集合。
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .conversation_index import ConversationIndex
+from .tool_registry import estimate_schema_tokens, estimate_tools_tokens
+
+
+def _tool_name(tool: dict) -> str:
+    return tool.get('function', {}).get('name', '')
+
+
+class SemanticToolRouter:
+    """按语义相关性为每个用户轮次挑选工具子集"""
+
+    TOP_N = 12                 # 相关性 Top-N
+    RECENT_CALLS = 12          # 最近 N 次工具调用涉及的工具始终保留
+    MIN_TOOLS_TO_ROUTE = 24    # 工具总数少于此值时不路由
+    TEXT_CHARS = 400           # 每个工具描述参与编码的最大字符数
+    MAX_SESSIONS = 32          # 保留已发送集合的会话数
+
+    # 常驻核心：查询 / 建网 / 校验 / 任务管理，几乎每个任务都会用到
+    CORE_TOOLS = frozenset({
+        'get_network_structure', 'get_node_parameters', 'list_children',
+        'read_selection', 'check_errors', 'verify_and_summarize',
+        'create_node', 'create_nodes_batch', 'connect_nodes',
+        'set_node_parameter', 'execute_python',
+        'add_todo', 'update_todo',
+        'create_plan', 'update_plan_step', 'ask_question',
+    })
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._matrix_key: Optional[tuple] = None
+        self._matrix: Any = None
+        self._warming = False
+        self._requests = 0
+        self._routed = 0
+        self._tokens_full = 0
+        self._tokens_sent = 0
+        self._misses = 0
+        self._grown = 0
+        self._missed_tools: Dict[str, int] = {}
+        # 会话 → (已发送工具名（有序）, 是否经过路由)
+        self._sessions: "OrderedDict[str, Tuple[List[str], bool]]" = OrderedDict()
+
+    # ---------- 选择 ----------
+
+    def select(self, tools: List[dict], messages: list,
+               index: Optional[ConversationIndex] = None,
+               session: str = '') -> Tuple[List[dict], List[str]]:
+        """返回 (要发送的工具 schema, 被省略的工具名)
+
+        session 的已发送集合只增不减：本轮路由结果与之合并，
+        之前发送过的工具保持原顺序在前，新增的追加在后。
+        """
+        full_tokens = estimate_tools_tokens(tools)
+        selected, routed = tools, False
+        if len(tools) >= self.MIN_TOOLS_TO_ROUTE:
+            try:
+                selected, routed = self._route(tools, messages,
+                                               (index or ConversationIndex()).sync(messages))
+            except Exception as e:
+                print(f"[ToolRouter] 路由失败，发送全部工具: {e}")
+                selected, routed = tools, False
+        selected, omitted = self._merge_session(session, tools, selected, routed)
+        sent_tokens = sum(estimate_schema_tokens(t) for t in selected) if omitted else full_tokens
+        with self._lock:
+            self._requests += 1
+            self._tokens_full += full_tokens
+            self._tokens_sent += sent_tokens
+            if omitted:
+                self._routed += 1
+        if omitted:
+            print(f"[ToolRouter] 发送 {len(selected)}/{len(tools)} 个工具 "
+                  f"(~{sent_tokens}/{full_tokens} tokens)")
+        return selected, omitted
+
+    def _route(self, tools: List[dict], messages: list,
+               index: ConversationIndex) -> Tuple[List[dict], bool]:
+        """(选中的工具, 是否经过路由)；无法路由时返回全部工具"""
+        from .embedding import get_embedder_if_loaded
+        embedder = get_embedder_if_loaded()
+        if embedder is None:
+            self._warm_up()
+            return tools, False
+        if not embedder.is_semantic:
+            return tools, False   # n-gram 哈希向量没有语义，路由等于随机丢弃工具
+
+        names = [_tool_name(t) for t in tools]
+        recent = self._recent_tools(messages, index)
+        query = self._query_text(messages, index, recent)
+        if not query.strip():
+            return tools, False
+
+        matrix = self._tool_matrix(embedder, tools, names)
+        scores = embedder.batch_cosine_similarity(embedder.encode(query), matrix)
+        ranked = sorted(range(len(names)), key=lambda i: -float(scores[i]))
+
+        keep = {n for n in names if n in self.CORE_TOOLS or n in recent}
+        added = 0
+        for i in ranked:
+            if added >= self.TOP_N:
+                break
+            if names[i] not in keep:
+                keep.add(names[i])
+                added += 1
+        return [t for t, n in zip(tools, names) if n in keep], True
+
+    def _merge_session(self, session: str, tools: List[dict], selected: List[dict],
+                       routed: bool) -> Tuple[List[dict], List[str]]:
+        """与会话已发送集合合并（只增不减，已发送的顺序不变）
+
+        - 会话之前未经路由（全量）而本轮路由可用：以本轮结果重新开始（只发生一次）
+        - 会话已路由而本轮无法路由（embedder 异常等）：沿用会话集合，不退回全量
+        """
+        by_name = {_tool_name(t): t for t in tools}
+        with self._lock:
+            prev, prev_routed = self._sessions.pop(session, None) or ([], False)
+            if routed and not prev_routed:
+                prev = []
+            elif prev_routed and not routed and prev:
+                selected = []
+            names = [n for n in prev if n in by_name]
+            seen = set(names)
+            added = [_tool_name(t) for t in selected if _tool_name(t) not in seen]
+            if prev and added:
+                self._grown += 1
+            names.extend(added)
+            self._sessions[session] = (names, routed or prev_routed)
+            while len(self._sessions) > self.MAX_SESSIONS:
+                self._sessions.popitem(last=False)
+        kept = set(names)
+        return [by_name[n] for n in names], [n for n in by_name if n not in kept]
+
+    def add_to_session(self, session: str, tool_names: List[str]):
+        """把工具加入会话集合（漏选补发后，之后的轮次继续附带）"""
+        with self._lock:
+            # 只有路由过的会话才会漏选；新建时同样标记为已路由，避免下一轮被当作首轮重算
+            names = self._sessions.setdefault(session, ([], True))[0]
+            names.extend(n for n in tool_names if n not in names)
+
+    def forget_session(self, session: str):
+        with self._lock:
+            self._sessions.pop(session, None)
+
+    def _tool_matrix(self, embedder, tools: List[dict], names: List[str]):
+        """工具描述向量矩阵（按注册表版本 + 工具名序列缓存）"""
+        from .tool_registry import get_tool_registry
+        key = (get_tool_registry().version, tuple(names))
+        with self._lock:
+            if key == self._matrix_key:
+                return self._matrix
+        texts = [f"{n}: {t.get('function', {}).get('description', '')}"[:self.TEXT_CHARS]
+                 for n, t in zip(names, tools)]
+        matrix = embedder.encode_batch(texts)
+        with self._lock:
+            self._matrix_key, self._matrix = key, matrix
+        return matrix
+
+    def _recent_tools(self, messages: list, index: ConversationIndex) -> List[str]:
+        calls = sorted(index.tool_calls.values(), key=lambda c: c[0])
+        return [c[1] for c in calls[-self.RECENT_CALLS:]]
+
+    @staticmethod
+    def _query_text(messages: list, index: ConversationIndex, recent: List[str]) -> str:
+        parts = []
+        if index.user_positions:
+            content = messages[index.user_positions[-1]].get('content') or ''
+            if isinstance(content, list):
+                content = ' '.join(p.get('text', '') for p in content
+                                   if isinstance(p, dict) and p.get('type') == 'text')
+            parts.append(str(content)[:1000])
+        if recent:
+            parts.append(' '.join(dict.fromkeys(recent)))
+        return '\n'.join(parts)
+
+    def _warm_up(self):
+        """后台加载 embedder（模型加载可能需要数秒，不阻塞请求）"""
+        with self._lock:
+            if self._warming:
+                return
+            self._warming = True
+
+        def _load():
+            try:
+                from .embedding import get_embedder
+                get_embedder()
+            except Exception as e:
+                print(f"[ToolRouter] embedder 不可用，保持发送全部工具: {e}")
+
+        threading.Thread(target=_load, daemon=True, name='tool-router-warmup').start()
+
+    # ---------- 漏选记录 ----------
+
+    def record_miss(self, tool_name: str, session: str = ''):
+        """模型需要本轮未发送 schema 的工具（调用了它或用 [需要工具: …] 显式请求）"""
+        with self._lock:
+            self._misses += 1
+            self._missed_tools[tool_name] = self._missed_tools.get(tool_name, 0) + 1
+        self.add_to_session(session, [tool_name])
+        print(f"[ToolRouter] ⚠️ 漏选: {tool_name}（下一次请求附带其定义）")
+
+    _REQUEST_MARKER = re.compile(r'\[(?:需要工具|need tools?)\s*[:：]\s*([^\]\n]+)\]', re.IGNORECASE)
+
+    @classmethod
+    def requested_tools(cls, text: str, omitted: List[str]) -> List[str]:
+        """回复中用 [需要工具: a, b] 显式请求的被省略工具（只提到工具名不算）"""
+        if not text or not omitted:
+            return []
+        names = set()
+        for m in cls._REQUEST_MARKER.finditer(text):
+            names.update(n.strip(' `\'"') for n in re.split(r'[,，、\s]+', m.group(1)))
+        return [n for n in omitted if n in names]
+
+    @staticmethod
+    def omitted_note(omitted: List[str]) -> str:
+        """列出被省略工具名称的提示文本（让模型知道它们存在）"""
+        return (
+            '[工具] 为节省上下文，只附带了与任务最相关的工具定义。'
+            f'其他可用工具: {", ".join(omitted)}。'
+            '需要其中某个工具时，在回复中写 [需要工具: 工具名]，下一次请求会附带其定义。'
+        )
+
+    # ---------- 统计 ----------
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'requests': self._requests,
+                'routed': self._routed,
+                'schema_tokens_full': self._tokens_full,
+                'schema_tokens_sent': self._tokens_sent,
+                'schema_tokens_saved': self._tokens_full - self._tokens_sent,
+                'misses': self._misses,
+                'grown': self._grown,
+                'missed_tools': dict(self._missed_tools),
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self._requests = self._routed = 0
+            self._tokens_full = self._tokens_sent = 0
+            self._misses = self._grown = 0
+            self._missed_tools.clear()
+
+
+# ─────────────────────────────────────────────
+# 全局单例
+# ─────────────────────────────────────────────
+
+_instance: Optional[SemanticToolRouter] = None
+_instance_lock = threading.Lock()
+
+
+def get_tool_router() -> SemanticToolRouter:
+    """获取 SemanticToolRouter 全局单例"""
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = SemanticToolRouter()
+    return _instance
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+Tracer — Agent 轮次耗时追踪（Chrome trace / JSONL 导出）
+
+慢轮次的墙钟时间可能花在：网络首字延迟（TTFT）、token 流式输出、
+主线程工具执行（_execute_tool_in_main_thread 的等待）、上下文压缩、
+长期记忆激活或 RAG 检索。本模块提供一个轻量 span 追踪器：
+  - 关闭时（默认）span() 返回共享的空上下文管理器，record() 只做一次布尔判断
+  - 每个用户轮次（AITab._run_agent）写出一个 trace 文件到 cache/traces/
+      chrome: {"traceEvents": [...]}，可直接拖入 chrome://tracing 或 ui.perfetto.dev
+      jsonl:  每行一个 span
+  - 跨轮次按 span 名称聚合耗时（有界样本），/trace_stats 输出 p50 / p95
+  - 开启方式：/trace 斜杠命令，或环境变量 HOUDINI_AGENT_TRACE=1（=jsonl 时输出 JSONL）
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional
+
+_TRACE_DIR = Path(__file__).parent.parent.parent / "cache" / "traces"
+
+now = time.perf_counter
+
+
+class _NullSpan:
+    """追踪关闭时的空 span（共享单例，无分配）"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('_tracer', '_name', '_cat', '_args', '_start')
+
+    def __init__(self, tracer: 'Tracer', name: str, cat: str, args: dict):
+        self._tracer = tracer
+        self._name = name
+        self._cat = cat
+        self._args = args
+
+    def __enter__(self):
+        self._start = now()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._args['error'] = exc_type.__name__
+        self._tracer.record(self._name, self._start, cat=self._cat, **self._args)
+        return False
+
+    def set(self, **args):
+        """在 span 结束前补充参数（如结果大小）"""
+        self._args.update(args)
+
+
+class Tracer:
+    """按用户轮次收集 span，写出 trace 文件并跨轮次聚合耗时"""
+
+    MAX_EVENTS_PER_TURN = 20000    # 单轮事件上限（防止异常循环撑爆内存）
+    SAMPLES_PER_SPAN = 512         # 每个 span 名称保留的最近耗时样本数
+    MAX_TRACE_FILES = 50           # cache/traces/ 下保留的最近 trace 文件数
+
+    def __init__(self, trace_dir: Optional[Path] = None):
+        env = os.environ.get('HOUDINI_AGENT_TRACE', '').strip().lower()
+        self.enabled: bool = env not in ('', '0', 'false', 'off')
+        self.fmt: str = 'jsonl' if env == 'jsonl' else 'chrome'
+        self._dir = Path(trace_dir or _TRACE_DIR)
+        self._lock = threading.Lock()
+        self._events: List[dict] = []
+        self._threads: Dict[int, str] = {}
+        self._turn_label = ''
+        self._turn_start: Optional[float] = None
+        self._dropped = 0
+        self._samples: Dict[str, Deque[float]] = {}
+        self._last_path: Optional[Path] = None
+
+    # ---------- 开关 ----------
+
+    def set_enabled(self, enabled: bool, fmt: Optional[str] = None):
+        self.enabled = bool(enabled)
+        if fmt in ('chrome', 'jsonl'):
+            self.fmt = fmt
+        if not self.enabled:
+            with self._lock:
+                self._events.clear()
+                self._turn_start = None
+
+    # ---------- 记录 ----------
+
+    def span(self, name: str, cat: str = 'agent', **args):
+        """with tracer.span('memory.activate'): ...（关闭时返回共享空 span）"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, cat, args)
+
+    def record(self, name: str, start: float, end: Optional[float] = None,
+               cat: str = 'agent', **args):
+        """记录一个已完成的 span（start / end 取自 tracer.now()）
+
+        用于无法用 with 包裹的长代码段（如流式请求循环）。
+        """
+        if not self.enabled:
+            return
+        if end is None:
+            end = now()
+        dur = max(0.0, end - start)
+        thread = threading.current_thread()
+        event = {
+            'name': name, 'cat': cat, 'ph': 'X',
+            'ts': round(start * 1e6, 1), 'dur': round(dur * 1e6, 1),
+            'pid': os.getpid(), 'tid': thread.ident,
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.SAMPLES_PER_SPAN)
+            samples.append(dur)
+            if self._turn_start is None:
+                return
+            if len(self._events) >= self.MAX_EVENTS_PER_TURN:
+                self._dropped += 1
+                return
+            self._events.append(event)
+            self._threads.setdefault(thread.ident, thread.name)
+
+    # ---------- 轮次 ----------
+
+    def begin_turn(self, label: str = ''):
+        """用户轮次开始（AITab._run_agent 入口）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._events = []
+            self._threads = {}
+            self._dropped = 0
+            self._turn_label = label
+            self._turn_start = now()
+
+    def end_turn(self, **args) -> Optional[Path]:
+        """用户轮次结束：记录整轮 span 并写出 trace 文件，返回文件路径"""
+        with self._lock:
+            start = self._turn_start
+        if not self.enabled or start is None:
+            return None
+        self.record('turn', start, cat='turn', label=self._turn_label, **args)
+        with self._lock:
+            events, threads, dropped = self._events, self._threads, self._dropped
+            self._events, self._threads, self._turn_start = [], {}, None
+        try:
+            return self._write(events, threads, dropped)
+        except Exception as e:
+            print(f"[Tracer] 写出 trace 失败: {e}")
+            return None
+
+    def _write(self, events: List[dict], threads: Dict[int, str], dropped: int) -> Path:
+        self._dir.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime('%Y%m%d_%H%M%S')
+        suffix = 'jsonl' if self.fmt == 'jsonl' else 'json'
+        path = self._dir / f"turn_{stamp}_{int(time.time() * 1000) % 1000:03d}.{suffix}"
+        pid = os.getpid()
+        meta = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                 'args': {'name': tname}} for tid, tname in threads.items()]
+        with open(path, 'w', encoding='utf-8') as f:
+            if self.fmt == 'jsonl':
+                for e in events:
+                    f.write(json.dumps(e, ensure_ascii=False, default=str) + '\n')
+            else:
+                json.dump({'traceEvents': meta + events,
+                           'otherData': {'dropped_events': dropped}},
+                          f, ensure_ascii=False, default=str)
+        self._last_path = path
+        self._prune()
+        print(f"[Tracer] 本轮 {len(events)} 个 span → {path.name}")
+        return path
+
+    def _prune(self):
+        files = sorted(self._dir.glob('turn_*'), key=lambda p: p.stat().st_mtime)
+        for p in files[:-self.MAX_TRACE_FILES]:
+            try:
+                p.unlink()
+            except OSError:
+                pass
+
+    # ---------- 统计 ----------
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """按 span 名称聚合：{name: {count, p50_ms, p95_ms, max_ms, total_ms}}"""
+        with self._lock:
+            snapshot = {k: sorted(v) for k, v in self._samples.items() if v}
+        result = {}
+        for name, durs in snapshot.items():
+            n = len(durs)
+            result[name] = {
+                'count': n,
+                'p50_ms': durs[(n - 1) // 2] * 1000,
+                'p95_ms': durs[min(n - 1, int(n * 0.95))] * 1000,
+                'max_ms': durs[-1] * 1000,
+                'total_ms': sum(durs) * 1000,
+            }
+        return result
+
+    def format_summary(self) -> str:
+        """Markdown 表格（按累计耗时降序）"""
+        rows = sorted(self.summary().items(), key=lambda kv: -kv[1]['total_ms'])
+        if not rows:
+            return "暂无追踪数据"
+        lines = ["| span | 次数 | p50 ms | p95 ms | max ms | 累计 s |",
+                 "|---|---:|---:|---:|---:|---:|"]
+        for name, s in rows:
+            lines.append(f"| `{name}` | {s['count']} | {s['p50_ms']:.1f} | {s['p95_ms']:.1f} "
+                         f"| {s['max_ms']:.1f} | {s['total_ms'] / 1000:.2f} |")
+        return '\n'.join(lines)
+
+    @property
+    def last_trace_path(self) -> Optional[Path]:
+        return self._last_path
+
+    @property
+    def trace_dir(self) -> Path:
+        return self._dir
+
+    def reset_stats(self):
+        with self._lock:
+            self._samples.clear()
+
+
+# ─────────────────────────────────────────────
+# 全局单例
+# ─────────────────────────────────────────────
+
+_instance: Optional[Tracer] = None
+_instance_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """获取 Tracer 全局单例"""
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = Tracer()
+    return _instance
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+WebCache — 联网搜索 / 网页正文的磁盘持久化缓存
+
+  - 有界 LRU + TTL：超出条目上限淘汰最久未用的，过期条目读取时丢弃
+  - gzip 压缩 JSON 持久化到 cache/web/，跨 Houdini 会话复用
+    （同一工作站反复查阅的文档页直接命中本地，无需再次联网）
+  - 写入节流：脏数据最多每 flush_interval 秒落盘一次，进程退出时再保存一次
+  - 线程安全（搜索 / 抓取在常驻线程池中并发执行）
+"""
+
+import atexit
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional
+
+_WEB_CACHE_DIR = Path(__file__).parent.parent.parent / "cache" / "web"
+
+
+class WebCache:
+    """有界 LRU + TTL 缓存，gzip JSON 持久化"""
+
+    def __init__(self, name: str, max_entries: int, ttl: float,
+                 flush_interval: float = 30.0, cache_dir: Optional[Path] = None):
+        self._path = Path(cache_dir or _WEB_CACHE_DIR) / f"{name}.json.gz"
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, list]" = OrderedDict()  # key -> [timestamp, value]
+        self._loaded = False
+        self._dirty = False
+        # 从构造时刻开始计时：首次 put 不在调用线程同步落盘
+        self._last_flush = time.time()
+        atexit.register(self.flush)
+
+    # ---------- 读写 ----------
+
+    def get(self, key: str) -> Optional[Any]:
+        """命中且未过期返回值，否则 None"""
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] >= self._ttl:
+                del self._entries[key]
+                self._dirty = True
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: str, value: Any):
+        """写入（value 必须可 JSON 序列化），超出上限按 LRU 淘汰"""
+        with self._lock:
+            self._ensure_loaded()
+            self._entries[key] = [time.time(), value]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+            due = time.time() - self._last_flush >= self._flush_interval
+        if due:
+            self.flush()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._loaded = True
+            self._dirty = True
+        self.flush()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._entries)
+
+    # ---------- 持久化 ----------
+
+    def _ensure_loaded(self):
+        """首次访问时从磁盘加载（调用方持有锁）"""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self._path.exists():
+            return
+        try:
+            with gzip.open(self._path, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+            now = time.time()
+            for key, ts, value in data.get('entries', []):
+                if now - ts < self._ttl:
+                    self._entries[key] = [ts, value]
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        except Exception as e:
+            print(f"[WebCache] 加载失败 {self._path.name}: {e}")
+            self._entries.clear()
+
+    def flush(self):
+        """脏数据落盘（原子替换，过期条目不写入）"""
+        tmp = None
+        with self._lock:
+            if not self._dirty:
+                return
+            now = time.time()
+            payload = {
+                'version': 1,
+                'entries': [[k, e[0], e[1]] for k, e in self._entries.items()
+                            if now - e[0] < self._ttl],
+            }
+            self._dirty = False
+            self._last_flush = now
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            # 每次写入使用独立临时文件（同目录，保证 os.replace 原子），并发写者互不覆盖
+            with tempfile.NamedTemporaryFile(dir=self._path.parent, prefix=self._path.name + '.',
+                                             suffix='.tmp', delete=False) as raw:
+                tmp = raw.name
+                with gzip.open(raw, 'wt', encoding='utf-8', compresslevel=6) as f:
+                    json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp, self._path)
+        except Exception as e:
+            print(f"[WebCache] 保存失败 {self._path.name}: {e}")
+            try:
+                os.unlink(tmp)
+            except Exception:
+                pass